@@ -22,6 +22,11 @@ class CodeImportDispatcherScript(LaunchpadScript):
             "--max-jobs", dest="max_jobs", type=int,
             default=config.codeimportdispatcher.max_jobs_per_machine,
             help="The maximum number of jobs to run on this machine.")
+        self.parser.add_option(
+            "--report-capacity", dest="report_capacity",
+            action="store_true",
+            default=config.codeimportdispatcher.report_capacity,
+            help="Report this machine's spare capacity to the scheduler.")
 
     def run(self, use_web_security=False, isolation=None):
         """See `LaunchpadScript.run`.
@@ -34,7 +39,9 @@ class CodeImportDispatcherScript(LaunchpadScript):
     def main(self):
         globalErrorUtility.configure('codeimportdispatcher')
 
-        dispatcher = CodeImportDispatcher(self.logger, self.options.max_jobs)
+        dispatcher = CodeImportDispatcher(
+            self.logger, self.options.max_jobs,
+            report_capacity=self.options.report_capacity)
         dispatcher.findAndDispatchJobs(
             ServerProxy(config.codeimportdispatcher.codeimportscheduler_url))
 
@@ -5,6 +5,7 @@
 
 import _pythonpath
 
+import simplejson
 from zope.component import getUtility
 
 from lp.app.errors import NotFoundError
@@ -17,7 +18,28 @@ from lp.services.database.sqlbase import (
 from lp.services.scripts.base import LaunchpadCronScript
 
 
+# Karma degrades each day, becoming worthless after this interval.
+KARMA_EXPIRES_AFTER = '1 year'
+
+# The GarboJobState entry recording how far incremental updates have got.
+INCREMENTAL_STATE_NAME = u'karma-cache-updater'
+
+
 class KarmaCacheUpdater(LaunchpadCronScript):
+
+    def add_my_options(self):
+        self.parser.add_option(
+            '--incremental', dest='incremental', action='store_true',
+            default=False,
+            help='Only process karma created or expired since the last '
+                 'incremental run, using the running totals in '
+                 'KarmaDecayTotal.')
+        self.parser.add_option(
+            '--lag', dest='lag', type='int', default=60, metavar='MINUTES',
+            help='In incremental mode, only count karma created at least '
+                 'this many minutes ago, so that karma from transactions '
+                 'still in progress is not missed.')
+
     def main(self):
         """Update the KarmaCache table for all valid Launchpad users.
 
@@ -39,7 +61,10 @@ class KarmaCacheUpdater(LaunchpadCronScript):
         # This method ordering needs to be preserved. In particular,
         # C_add_summed_totals method is called last because we don't want to
         # include the values added in our calculation in A_update_karmacache.
-        self.A_update_karmacache()
+        if self.options.incremental:
+            self.A_update_karmacache_incrementally()
+        else:
+            self.A_update_karmacache()
         self.B_update_karmatotalcache()
         self.C_add_karmacache_sums()
 
@@ -52,7 +77,7 @@ class KarmaCacheUpdater(LaunchpadCronScript):
         # worthless after karma_expires_after. This query produces odd results
         # when datecreated is in the future, but there is really no point
         # adding the extra WHEN clause.
-        karma_expires_after = '1 year'
+        karma_expires_after = KARMA_EXPIRES_AFTER
         self.cur.execute("""
             SELECT person, category, product, distribution,
                 ROUND(SUM(
@@ -75,11 +100,286 @@ class KarmaCacheUpdater(LaunchpadCronScript):
 
         # Note that we don't need to commit each iteration because we are
         # running in autocommit mode.
-        scaling = self.calculate_scaling(results)
+        points_per_category = {}
+        for dummy, category, dummy, dummy, points in results:
+            if category not in points_per_category:
+                points_per_category[category] = 0
+            points_per_category[category] += points
+        scaling = self.calculate_scaling(points_per_category)
         for entry in results:
             self.update_one_karma_cache_entry(entry, scaling)
         flush_database_updates()
 
+        self.delete_replaced_karmacache_entries()
+
+        # VACUUM KarmaCache since we have just touched every record in it.
+        self.cur.execute("""VACUUM KarmaCache""")
+
+    def A_update_karmacache_incrementally(self):
+        self.logger.info(
+            "Step A: Incrementally calculating individual KarmaCache entries")
+
+        # KarmaDecayTotal holds, for each (person, category, context), the
+        # sum of points and of points weighted by creation time of all
+        # karma that had not expired as of the last run.  Since karma
+        # decays linearly, that is enough to work out its current value, so
+        # we only need to look at karma created or expired since then.
+        self.cur.execute("""
+            SELECT
+                now, now - %s::interval,
+                now - %s * INTERVAL '1 minute'
+            FROM (SELECT CURRENT_TIMESTAMP AT TIME ZONE 'UTC' AS now) AS t
+            """, (KARMA_EXPIRES_AFTER, self.options.lag))
+        [now, expired_before, counted_before] = self.cur.fetchone()
+        # The running totals and the state recording what they include
+        # must change together, or a failed run would leave the next one
+        # to count some karma twice.
+        self.cur.execute("BEGIN")
+        try:
+            self.update_running_totals(now, expired_before, counted_before)
+        except:
+            self.cur.execute("ROLLBACK")
+            raise
+        self.cur.execute("COMMIT")
+
+        decayed = """
+            SELECT
+                person, category, product, distribution,
+                ROUND(points - (
+                    EXTRACT(EPOCH FROM %(now)s::timestamp) * points -
+                    points_epoch) / EXTRACT(EPOCH FROM %(expiry)s::interval))
+                    AS points
+            FROM KarmaDecayTotal
+            """
+        params = dict(now=now, expiry=KARMA_EXPIRES_AFTER)
+        self.cur.execute("""
+            SELECT category, SUM(points) FROM (%s) AS decayed
+            GROUP BY category
+            """ % decayed, params)
+        points_per_category = dict(self.cur.fetchall())
+        if points_per_category:
+            scaling = self.calculate_scaling(points_per_category)
+            scaled = """
+                SELECT
+                    decayed.person, decayed.category, decayed.product,
+                    decayed.distribution,
+                    TRUNC(decayed.points * scaling.factor)::integer
+                        AS karmavalue
+                FROM (%s) AS decayed
+                JOIN (VALUES %s) AS scaling (category, factor)
+                    ON scaling.category = decayed.category
+                WHERE
+                    decayed.product IS NOT NULL
+                    OR decayed.distribution IS NOT NULL
+                """ % (decayed, ", ".join(
+                    "(%d, %r::double precision)" % (category, float(factor))
+                    for category, factor in sorted(scaling.items())))
+            self.cur.execute("""
+                WITH scaled AS (%s),
+                updated AS (
+                    UPDATE KarmaCache
+                    SET karmavalue = scaled.karmavalue
+                    FROM scaled
+                    WHERE
+                        KarmaCache.person = scaled.person
+                        AND KarmaCache.category = scaled.category
+                        AND KarmaCache.product IS NOT DISTINCT FROM
+                            scaled.product
+                        AND KarmaCache.distribution IS NOT DISTINCT FROM
+                            scaled.distribution
+                        AND KarmaCache.sourcepackagename IS NULL
+                        AND KarmaCache.project IS NULL
+                    RETURNING KarmaCache.id
+                    )
+                INSERT INTO KarmaCache
+                    (person, category, karmavalue, product, distribution,
+                     sourcepackagename, project)
+                SELECT
+                    scaled.person, scaled.category, scaled.karmavalue,
+                    scaled.product, scaled.distribution, NULL, NULL
+                FROM scaled
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM KarmaCache
+                    WHERE
+                        KarmaCache.person = scaled.person
+                        AND KarmaCache.category = scaled.category
+                        AND KarmaCache.product IS NOT DISTINCT FROM
+                            scaled.product
+                        AND KarmaCache.distribution IS NOT DISTINCT FROM
+                            scaled.distribution
+                        AND KarmaCache.sourcepackagename IS NULL
+                        AND KarmaCache.project IS NULL)
+                """ % scaled, params)
+
+        # Entries for which all karma has expired.
+        self.cur.execute("""
+            DELETE FROM KarmaCache
+            WHERE
+                category IS NOT NULL
+                AND project IS NULL
+                AND sourcepackagename IS NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM KarmaDecayTotal
+                    WHERE
+                        KarmaDecayTotal.person = KarmaCache.person
+                        AND KarmaDecayTotal.category = KarmaCache.category
+                        AND KarmaDecayTotal.product IS NOT DISTINCT FROM
+                            KarmaCache.product
+                        AND KarmaDecayTotal.distribution IS NOT DISTINCT FROM
+                            KarmaCache.distribution)
+            """)
+
+        self.delete_replaced_karmacache_entries()
+
+    def update_running_totals(self, now, expired_before, counted_before):
+        """Bring KarmaDecayTotal up to date.
+
+        Karma is counted once it was created before `counted_before`, and
+        until it was created before `expired_before`.  Karma is created
+        with the time its transaction started, so counting lags behind
+        the time of the run to leave transactions that are still in
+        progress time to commit.
+        """
+        # The running totals use the points each action was worth when
+        # its karma was added, so expired karma can only be subtracted
+        # correctly if those haven't changed since.
+        self.cur.execute("SELECT id, points FROM KarmaAction")
+        action_points = dict(
+            (str(action), points) for action, points in self.cur.fetchall())
+        state = self.load_incremental_state()
+        if state is not None and (
+                state.get('action_points') != action_points or
+                'counted_before' not in state):
+            self.logger.info(
+                "Karma action points or the state format have changed")
+            state = None
+        if state is None:
+            self.logger.info(
+                "No usable previous incremental run; starting afresh")
+            self.cur.execute("DELETE FROM KarmaDecayTotal")
+            self.add_to_running_totals("""
+                Karma.datecreated > %(expired_before)s
+                AND Karma.datecreated <= %(counted_before)s
+                """, dict(
+                    expired_before=expired_before,
+                    counted_before=counted_before))
+        else:
+            self.logger.debug(
+                "Last incremental run was at %s (counting karma created "
+                "before %s)", state['last_run'], state['counted_before'])
+            self.cur.execute(
+                "SELECT %s::timestamp - %s::interval",
+                (state['last_run'], KARMA_EXPIRES_AFTER))
+            [previously_expired_before] = self.cur.fetchone()
+            # Counted karma that has expired since the last run.
+            self.add_to_running_totals("""
+                Karma.datecreated > %(previously_expired_before)s
+                AND Karma.datecreated <= %(expired_before)s
+                AND Karma.datecreated <= %(previously_counted_before)s
+                """, dict(
+                    previously_expired_before=previously_expired_before,
+                    expired_before=expired_before,
+                    previously_counted_before=state['counted_before']),
+                subtract=True)
+            # Unexpired karma that has become countable since the last run.
+            self.add_to_running_totals("""
+                Karma.datecreated > %(previously_counted_before)s
+                AND Karma.datecreated > %(expired_before)s
+                AND Karma.datecreated <= %(counted_before)s
+                """, dict(
+                    previously_counted_before=state['counted_before'],
+                    expired_before=expired_before,
+                    counted_before=counted_before))
+            self.cur.execute(
+                "DELETE FROM KarmaDecayTotal WHERE karma_count <= 0")
+        self.save_incremental_state(dict(
+            last_run=now.isoformat(' '),
+            counted_before=counted_before.isoformat(' '),
+            action_points=action_points))
+
+    def add_to_running_totals(self, where, params, subtract=False):
+        """Add the karma matching `where` to KarmaDecayTotal.
+
+        :param where: An SQL condition on Karma, using `params`.
+        :param subtract: If True, take the karma out of the totals instead.
+        """
+        delta = """
+            SELECT
+                person, category, product, distribution,
+                COUNT(*) AS karma_count,
+                SUM(points) AS points,
+                SUM(points * EXTRACT(EPOCH FROM Karma.datecreated))
+                    AS points_epoch
+            FROM Karma
+            JOIN KarmaAction ON action = KarmaAction.id
+            WHERE %s
+            GROUP BY person, category, product, distribution
+            """ % where
+        sign = '-' if subtract else '+'
+        self.cur.execute("""
+            WITH delta AS (%(delta)s),
+            updated AS (
+                UPDATE KarmaDecayTotal
+                SET
+                    karma_count =
+                        KarmaDecayTotal.karma_count %(sign)s delta.karma_count,
+                    points = KarmaDecayTotal.points %(sign)s delta.points,
+                    points_epoch =
+                        KarmaDecayTotal.points_epoch %(sign)s
+                        delta.points_epoch
+                FROM delta
+                WHERE
+                    KarmaDecayTotal.person = delta.person
+                    AND KarmaDecayTotal.category = delta.category
+                    AND KarmaDecayTotal.product IS NOT DISTINCT FROM
+                        delta.product
+                    AND KarmaDecayTotal.distribution IS NOT DISTINCT FROM
+                        delta.distribution
+                RETURNING KarmaDecayTotal.id
+                )
+            INSERT INTO KarmaDecayTotal
+                (person, category, product, distribution, karma_count,
+                 points, points_epoch)
+            SELECT
+                person, category, product, distribution, karma_count,
+                points, points_epoch
+            FROM delta
+            WHERE
+                NOT %(subtract)s
+                AND NOT EXISTS (
+                    SELECT 1 FROM KarmaDecayTotal
+                    WHERE
+                        KarmaDecayTotal.person = delta.person
+                        AND KarmaDecayTotal.category = delta.category
+                        AND KarmaDecayTotal.product IS NOT DISTINCT FROM
+                            delta.product
+                        AND KarmaDecayTotal.distribution IS NOT DISTINCT FROM
+                            delta.distribution)
+            """ % dict(
+                delta=delta, sign=sign,
+                subtract='TRUE' if subtract else 'FALSE'),
+            params)
+
+    def load_incremental_state(self):
+        self.cur.execute(
+            "SELECT json_data FROM GarboJobState WHERE name = %s",
+            (INCREMENTAL_STATE_NAME,))
+        row = self.cur.fetchone()
+        if row is None:
+            return None
+        return simplejson.loads(row[0])
+
+    def save_incremental_state(self, state):
+        json_data = simplejson.dumps(state, ensure_ascii=False)
+        self.cur.execute(
+            "UPDATE GarboJobState SET json_data = %s WHERE name = %s",
+            (json_data, INCREMENTAL_STATE_NAME))
+        if self.cur.rowcount == 0:
+            self.cur.execute(
+                "INSERT INTO GarboJobState (name, json_data) VALUES (%s, %s)",
+                (INCREMENTAL_STATE_NAME, json_data))
+
+    def delete_replaced_karmacache_entries(self):
         # Delete the entries we're going to replace.
         self.cur.execute("DELETE FROM KarmaCache WHERE category IS NULL")
         self.cur.execute("""
@@ -93,9 +393,6 @@ class KarmaCacheUpdater(LaunchpadCronScript):
         # Don't allow our table to bloat with inactive users.
         self.cur.execute("DELETE FROM KarmaCache WHERE karmavalue <= 0")
 
-        # VACUUM KarmaCache since we have just touched every record in it.
-        self.cur.execute("""VACUUM KarmaCache""")
-
     def B_update_karmatotalcache(self):
         self.logger.info("Step B: Rebuilding KarmaTotalCache")
         # Trash old records
@@ -216,8 +513,12 @@ class KarmaCacheUpdater(LaunchpadCronScript):
             GROUP BY person, category, Product.project
             """)
 
-    def calculate_scaling(self, results):
-        """Return a dict of scaling factors keyed on category ID"""
+    def calculate_scaling(self, points_per_category):
+        """Return a dict of scaling factors keyed on category ID.
+
+        :param points_per_category: A dict of the total karma points in
+            each category, keyed on category ID.
+        """
 
         # Get a list of categories, which we will need shortly.
         categories = {}
@@ -229,11 +530,6 @@ class KarmaCacheUpdater(LaunchpadCronScript):
         # category bloat, where translators dominate the top karma rankings.
         # By calculating a scaling factor automatically, this slant will be
         # removed even as more events are added or scoring tweaked.
-        points_per_category = {}
-        for dummy, category, dummy, dummy, points in results:
-            if category not in points_per_category:
-                points_per_category[category] = 0
-            points_per_category[category] += points
         largest_total = max(points_per_category.values())
 
         scaling = {}
@@ -9,10 +9,13 @@
 GRANT SELECT, INSERT, UPDATE, DELETE ON SessionData TO session;
 GRANT SELECT, INSERT, UPDATE, DELETE oN SessionPkgData TO session;
 GRANT SELECT ON Secret TO session;
+GRANT USAGE ON SEQUENCE sessiondata_version_seq TO session;
 
 GRANT EXECUTE ON FUNCTION ensure_session_client_id(text) TO session;
 GRANT EXECUTE ON FUNCTION
     set_session_pkg_data(text, text, text, bytea) TO session;
+GRANT EXECUTE ON FUNCTION
+    set_session_pkg_data_multi(text, text[], text[], bytea[]) TO session;
 
 CREATE TABLE TimeLimitedToken (
     path text NOT NULL,
@@ -0,0 +1,33 @@
+-- Copyright 2019 Canonical Ltd.  This software is licensed under the
+-- GNU Affero General Public License version 3 (see the file LICENSE).
+
+SET client_min_messages=ERROR;
+
+CREATE TABLE KarmaDecayTotal (
+    id serial PRIMARY KEY,
+    person integer NOT NULL REFERENCES Person,
+    category integer NOT NULL REFERENCES KarmaCategory,
+    product integer REFERENCES Product,
+    distribution integer REFERENCES Distribution,
+    karma_count integer NOT NULL,
+    points bigint NOT NULL,
+    points_epoch double precision NOT NULL
+);
+
+CREATE UNIQUE INDEX karmadecaytotal__person__category__context__key
+    ON KarmaDecayTotal (
+        person, category, COALESCE(product, -1), COALESCE(distribution, -1));
+
+-- Used to find karma that has expired since the last incremental update.
+CREATE INDEX karma__datecreated__idx ON Karma (datecreated);
+
+COMMENT ON TABLE KarmaDecayTotal IS 'Running totals of the unexpired karma of a person in a category and context, maintained incrementally by the karma cache updater so that decayed karma can be computed without scanning the Karma table.';
+COMMENT ON COLUMN KarmaDecayTotal.person IS 'The person who earned the karma.';
+COMMENT ON COLUMN KarmaDecayTotal.category IS 'The KarmaCategory of the actions that earned the karma.';
+COMMENT ON COLUMN KarmaDecayTotal.product IS 'The Product on which the actions were performed, if any.';
+COMMENT ON COLUMN KarmaDecayTotal.distribution IS 'The Distribution on which the actions were performed, if any.';
+COMMENT ON COLUMN KarmaDecayTotal.karma_count IS 'The number of unexpired Karma rows in this group.';
+COMMENT ON COLUMN KarmaDecayTotal.points IS 'The sum of the points of all unexpired karma in this group.';
+COMMENT ON COLUMN KarmaDecayTotal.points_epoch IS 'The sum over all unexpired karma in this group of its points multiplied by the epoch of its creation date.  Together with points, this gives the linearly-decayed value of the group at any time.';
+
+INSERT INTO LaunchpadDatabaseRevision VALUES (2210, 02, 0);
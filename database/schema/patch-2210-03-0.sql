@@ -0,0 +1,63 @@
+-- Copyright 2019 Canonical Ltd.  This software is licensed under the
+-- GNU Affero General Public License version 3 (see the file LICENSE).
+
+SET client_min_messages=ERROR;
+
+CREATE TABLE SharedObjectCacheGeneration (
+    table_name text PRIMARY KEY,
+    generation bigint DEFAULT 0 NOT NULL
+);
+
+COMMENT ON TABLE SharedObjectCacheGeneration IS 'Generation counters for the tables whose rows appservers may cache between requests.  Triggers on each table increment its counter whenever it changes, invalidating any cached rows.';
+COMMENT ON COLUMN SharedObjectCacheGeneration.table_name IS 'The name of the table, in lower case.';
+COMMENT ON COLUMN SharedObjectCacheGeneration.generation IS 'Incremented by each statement that changes the table.';
+
+CREATE FUNCTION shared_object_cache_invalidate_trig() RETURNS trigger
+    LANGUAGE plpgsql SECURITY DEFINER
+    SET search_path TO 'public'
+    AS $$
+BEGIN
+    UPDATE SharedObjectCacheGeneration SET generation = generation + 1
+    WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION shared_object_cache_invalidate_trig() IS 'Increment the SharedObjectCacheGeneration of the table being changed.';
+
+INSERT INTO SharedObjectCacheGeneration (table_name) VALUES
+    ('component'),
+    ('distribution'),
+    ('distroarchseries'),
+    ('distroseries'),
+    ('language'),
+    ('pillarname'),
+    ('processor'),
+    ('section');
+
+CREATE TRIGGER component_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Component
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER distribution_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Distribution
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER distroarchseries_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON DistroArchSeries
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER distroseries_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON DistroSeries
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER language_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Language
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER pillarname_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PillarName
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER processor_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Processor
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+CREATE TRIGGER section_shared_object_cache_t
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Section
+    FOR EACH STATEMENT EXECUTE PROCEDURE shared_object_cache_invalidate_trig();
+
+INSERT INTO LaunchpadDatabaseRevision VALUES (2210, 03, 0);
@@ -0,0 +1,80 @@
+-- Copyright 2019 Canonical Ltd.  This software is licensed under the
+-- GNU Affero General Public License version 3 (see the file LICENSE).
+
+SET client_min_messages=ERROR;
+
+CREATE TABLE TranslationSuggestion (
+    id serial PRIMARY KEY,
+    msgid_singular integer NOT NULL REFERENCES POMsgID,
+    language integer NOT NULL REFERENCES Language,
+    in_use boolean NOT NULL,
+    msgstrs integer[] NOT NULL,
+    translationmessage integer NOT NULL
+        REFERENCES TranslationMessage ON DELETE CASCADE,
+    date_created timestamp without time zone NOT NULL
+);
+
+CREATE UNIQUE INDEX translationsuggestion__msgid__language__in_use__msgstrs__key
+    ON TranslationSuggestion (msgid_singular, language, in_use, msgstrs);
+CREATE INDEX translationsuggestion__translationmessage__idx
+    ON TranslationSuggestion (translationmessage);
+
+COMMENT ON TABLE TranslationSuggestion IS 'An index of the distinct translations of each English string in each language, used to offer suggestions from other templates.  Triggers on TranslationMessage keep it up to date, and the garbo rebuilds it from scratch a range of strings at a time to account for changes to SuggestivePOTemplate.';
+COMMENT ON COLUMN TranslationSuggestion.msgid_singular IS 'The English string being translated.';
+COMMENT ON COLUMN TranslationSuggestion.language IS 'The language of the translation.';
+COMMENT ON COLUMN TranslationSuggestion.in_use IS 'Whether translationmessage is current on either side.  Identical used and unused translations have a row each.';
+COMMENT ON COLUMN TranslationSuggestion.msgstrs IS 'The POTranslations of each plural form, or -1 for untranslated forms.';
+COMMENT ON COLUMN TranslationSuggestion.translationmessage IS 'The most recently created TranslationMessage, in a suggestive template, with these translations.';
+COMMENT ON COLUMN TranslationSuggestion.date_created IS 'The creation date of translationmessage.';
+
+CREATE FUNCTION translationsuggestion_maintain() RETURNS trigger
+    LANGUAGE plpgsql SECURITY DEFINER
+    SET search_path TO 'public'
+    AS $$
+DECLARE
+    v_msgid_singular integer;
+BEGIN
+    SELECT POTMsgSet.msgid_singular INTO v_msgid_singular
+    FROM POTMsgSet
+    WHERE
+        POTMsgSet.id = NEW.potmsgset
+        AND EXISTS (
+            SELECT 1
+            FROM TranslationTemplateItem
+            JOIN SuggestivePOTemplate ON
+                SuggestivePOTemplate.potemplate =
+                    TranslationTemplateItem.potemplate
+            WHERE TranslationTemplateItem.potmsgset = NEW.potmsgset);
+    IF NOT FOUND THEN
+        -- Only messages in suggestive templates are offered elsewhere.
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO TranslationSuggestion (
+        msgid_singular, language, in_use, msgstrs, translationmessage,
+        date_created)
+    VALUES (
+        v_msgid_singular, NEW.language,
+        NEW.is_current_ubuntu OR NEW.is_current_upstream,
+        ARRAY[
+            COALESCE(NEW.msgstr0, -1), COALESCE(NEW.msgstr1, -1),
+            COALESCE(NEW.msgstr2, -1), COALESCE(NEW.msgstr3, -1),
+            COALESCE(NEW.msgstr4, -1), COALESCE(NEW.msgstr5, -1)],
+        NEW.id, NEW.date_created)
+    ON CONFLICT (msgid_singular, language, in_use, msgstrs) DO UPDATE
+        SET
+            translationmessage = EXCLUDED.translationmessage,
+            date_created = EXCLUDED.date_created
+        WHERE TranslationSuggestion.date_created <= EXCLUDED.date_created;
+    RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION translationsuggestion_maintain() IS 'Record a new or newly (un)used TranslationMessage in TranslationSuggestion.';
+
+CREATE TRIGGER translationsuggestion_maintain_t
+    AFTER INSERT OR UPDATE OF is_current_ubuntu, is_current_upstream
+    ON TranslationMessage
+    FOR EACH ROW EXECUTE PROCEDURE translationsuggestion_maintain();
+
+INSERT INTO LaunchpadDatabaseRevision VALUES (2210, 04, 0);
@@ -116,7 +116,8 @@ def list_role_members(cur, roles):
 class DbObject(object):
 
     def __init__(
-        self, schema, name, type_, owner, acl, arguments=None, language=None):
+        self, schema, name, type_, owner, acl, arguments=None, language=None,
+        trigger=False):
         self.schema = schema
         self.name = name
         self.type = type_
@@ -124,6 +125,7 @@ class DbObject(object):
         self.acl = acl
         self.arguments = arguments
         self.language = language
+        self.trigger = trigger
 
     def __eq__(self, other):
         return self.schema == other.schema and self.name == other.name
@@ -183,22 +185,24 @@ class DbSchema(dict):
                 pg_catalog.oidvectortypes(p.proargtypes) as "Argument types",
                 u.usename as "owner",
                 p.proacl::text[] as "acl",
-                l.lanname as "language"
+                l.lanname as "language",
+                r.typname = 'trigger' as "trigger"
             FROM pg_catalog.pg_proc p
                 LEFT JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace
                 LEFT JOIN pg_catalog.pg_language l ON l.oid = p.prolang
                 LEFT JOIN pg_catalog.pg_user u ON u.usesysid = p.proowner
                 LEFT JOIN pg_catalog.pg_type r ON r.oid = p.prorettype
             WHERE
-                r.typname NOT IN ('trigger', 'language_handler')
+                r.typname <> 'language_handler'
                 AND n.nspname NOT IN (
                     'pg_catalog', 'pg_toast', 'trgm', 'information_schema',
                     'pgdbr', 'pgdbrdata', 'todrop', '_sl')
                 """)
-        for schema, name, arguments, owner, acl, language in cur.fetchall():
+        for (schema, name, arguments, owner, acl, language,
+             trigger) in cur.fetchall():
             self['%s.%s(%s)' % (schema, name, arguments)] = DbObject(
                     schema, name, 'function', owner, parse_postgres_acl(acl),
-                    arguments, language)
+                    arguments, language, trigger)
 
         # Pull a list of roles
         log.debug("Getting role metadata")
@@ -648,8 +652,10 @@ def reset_permissions(con, config, options):
     for obj in schema.values():
         if obj not in found:
             forgotten.add(obj)
+    # Trigger functions are only listed if their triggers fire for roles
+    # that need to be granted access to them.
     forgotten = [obj.fullname for obj in forgotten
-        if obj.type in ['table', 'function', 'view']]
+        if obj.type in ['table', 'function', 'view'] and not obj.trigger]
     if forgotten:
         log.warn('No permissions specified for %r', forgotten)
 
@@ -14,12 +14,16 @@ COMMENT ON TABLE Secret IS 'The Zope3 session machinery uses a secret to cryptog
 
 INSERT INTO Secret VALUES ('thooper thpetial theqwet');
 
+CREATE SEQUENCE sessiondata_version_seq;
+
 CREATE TABLE SessionData (
     client_id     text PRIMARY KEY,
     created       timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    last_accessed timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+    last_accessed timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version       bigint NOT NULL DEFAULT nextval('sessiondata_version_seq')
     ) WITHOUT OIDS;
 COMMENT ON TABLE SessionData IS 'Stores session tokens (the client_id) and the last accessed timestamp. The precision of the last access time is dependant on configuration in the Z3 application servers.';
+COMMENT ON COLUMN SessionData.version IS 'Changed whenever any SessionPkgData for this session changes, so that application servers can validate their cached copies of it. Values are never reused, even if the session is deleted and recreated.';
 
 CREATE INDEX sessiondata_last_accessed_idx ON SessionData(last_accessed);
 
@@ -54,14 +58,14 @@ BEGIN
             AND product_id = p_product_id
             AND key = p_key;
         IF found THEN
-            RETURN;
+            EXIT;
         END IF;
 
         -- Next try an insert
         BEGIN
             INSERT INTO SessionPkgData (client_id, product_id, key, pickle)
             VALUES (p_client_id, p_product_id, p_key, p_pickle);
-            RETURN;
+            EXIT;
 
         -- If the INSERT fails, another connection did the INSERT before us
         -- so ignore and try update again next loop.
@@ -69,6 +73,63 @@ BEGIN
             -- Do nothing
         END;
     END LOOP;
+
+    -- Invalidate any cached copies of this session.
+    UPDATE SessionData SET version = nextval('sessiondata_version_seq')
+    WHERE client_id = p_client_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Apply a batch of changes to a session in one call.  A NULL pickle
+-- deletes the corresponding key.  The session's version before and after
+-- the changes is returned, so that the caller can tell whether anybody
+-- else changed the session since it last read it.  old_version is NULL
+-- if the session did not previously exist.
+CREATE OR REPLACE FUNCTION set_session_pkg_data_multi(
+    p_client_id text, p_product_ids text[], p_keys text[],
+    p_pickles bytea[], OUT old_version bigint, OUT new_version bigint
+    ) AS $$
+BEGIN
+    SELECT version INTO old_version FROM SessionData
+    WHERE client_id = p_client_id FOR UPDATE;
+    IF NOT FOUND THEN
+        BEGIN
+            INSERT INTO SessionData (client_id) VALUES (p_client_id);
+        EXCEPTION WHEN unique_violation THEN
+            -- Somebody else created the session first.
+            SELECT version INTO old_version FROM SessionData
+            WHERE client_id = p_client_id FOR UPDATE;
+        END;
+    END IF;
+
+    -- The SessionData row is locked, so nobody else can be changing
+    -- this session's data and there is no need for an upsert loop.
+    FOR i IN 1 .. coalesce(array_length(p_keys, 1), 0) LOOP
+        IF p_pickles[i] IS NULL THEN
+            DELETE FROM SessionPkgData
+            WHERE client_id = p_client_id
+                AND product_id = p_product_ids[i]
+                AND key = p_keys[i];
+        ELSE
+            UPDATE SessionPkgData SET pickle = p_pickles[i]
+            WHERE client_id = p_client_id
+                AND product_id = p_product_ids[i]
+                AND key = p_keys[i];
+            IF NOT found THEN
+                INSERT INTO SessionPkgData
+                    (client_id, product_id, key, pickle)
+                VALUES
+                    (p_client_id, p_product_ids[i], p_keys[i], p_pickles[i]);
+            END IF;
+        END IF;
+    END LOOP;
+
+    UPDATE SessionData
+    SET
+        version = nextval('sessiondata_version_seq'),
+        last_accessed = CURRENT_TIMESTAMP
+    WHERE client_id = p_client_id
+    RETURNING version INTO new_version;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -14,13 +14,18 @@ __all__ = [
     'parse_diff',
     're_substitute',
     'split_paragraphs',
+    'text_render_cache',
+    'TextRenderCache',
     ]
 
 from base64 import urlsafe_b64encode
+import hashlib
 from itertools import izip_longest
 import re
 import sys
+import threading
 
+from bzrlib.lru_cache import LRUCache
 from bzrlib.patches import hunk_from_header
 from lxml import html
 import markdown
@@ -36,6 +41,7 @@ from lp.answers.interfaces.faq import IFAQSet
 from lp.registry.interfaces.person import IPersonSet
 from lp.services.config import config
 from lp.services.features import getFeatureFlag
+from lp.services.memcache.interfaces import IMemcacheClient
 from lp.services.utils import (
     obfuscate_email,
     re_email_address,
@@ -299,6 +305,100 @@ def parse_diff(text):
             header_next = False
 
 
+class TextRenderCache:
+    """Rendered HTML of long texts, shared between requests.
+
+    Renderings are keyed by a hash of the text together with the
+    formatter and its options, so they can be shared by every page that
+    shows the same text.  A least-recently-used cache in each process sits
+    in front of memcache.
+
+    Most formatters link OOPS IDs only for Launchpad developers, so their
+    renderings are also keyed by whether the current user is a developer.
+    Formatters that depend on the user in any other way, such as
+    `FormattersAPI.linkify_email` and `FormattersAPI.obfuscate_email`, are
+    not cached; they are applied to the text before or after it passes
+    through this cache.
+    """
+
+    # Increment this when changing the output of a cached formatter, so
+    # that stale renderings in memcache are ignored.
+    VERSION = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = LRUCache()
+        self._size = None
+
+    def _resize(self):
+        """Match the size of the cache to the configuration.
+
+        The caller must hold the lock.
+        """
+        size = config.launchpad.text_render_cache_size
+        if size != self._size:
+            self._entries.resize(size)
+            self._size = size
+
+    def _getKey(self, text, formatter, options, user_dependent):
+        if isinstance(text, unicode):
+            text = text.encode('UTF-8')
+        if user_dependent:
+            options += (bool(getUtility(ILaunchBag).developer),)
+        digest = hashlib.sha1(
+            '%s:%r:' % (formatter, options) + text).hexdigest()
+        return '%s:text-render:%d:%s' % (
+            config.instance_name, self.VERSION, digest)
+
+    def render(self, text, formatter, options, renderer,
+               user_dependent=True):
+        """Return `renderer()`, or a cached copy of it.
+
+        :param text: The text being formatted.
+        :param formatter: The name of the formatter.
+        :param options: A tuple of any options that affect the rendering.
+        :param renderer: A function that renders `text`.
+        :param user_dependent: If True, `renderer` links OOPS IDs for
+            developers.
+        """
+        if (not isinstance(text, basestring) or
+                not config.launchpad.text_render_cache_size or
+                len(text) < config.launchpad.text_render_cache_min_length):
+            return renderer()
+        key = self._getKey(text, formatter, options, user_dependent)
+        with self._lock:
+            self._resize()
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                return rendered
+        use_memcache = not getFeatureFlag(
+            u'app.text_render_cache.disable_memcache')
+        rendered = None
+        if use_memcache:
+            memcache_client = getUtility(IMemcacheClient)
+            rendered = memcache_client.get(key)
+        if rendered is None:
+            rendered = renderer()
+            if use_memcache:
+                memcache_client.set(
+                    key, rendered,
+                    time=config.launchpad.text_render_cache_expiry)
+        self._store(key, rendered)
+        return rendered
+
+    def _store(self, key, rendered):
+        with self._lock:
+            self._resize()
+            self._entries[key] = rendered
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+text_render_cache = TextRenderCache()
+
+
 @implementer(ITraversable)
 class FormattersAPI:
     """Adapter from strings to HTML formatted text."""
@@ -632,6 +732,19 @@ class FormattersAPI:
     def text_to_html(self, linkify_text=True, linkify_substitution=None,
                      last_paragraph_class=None):
         """Quote text according to DisplayingParagraphsOfText."""
+        if linkify_substitution is not None:
+            # We can't tell what other substitutions depend on.
+            return self._text_to_html(
+                linkify_text, linkify_substitution, last_paragraph_class)
+        return text_render_cache.render(
+            self._stringtoformat, 'text_to_html',
+            (linkify_text, last_paragraph_class),
+            lambda: self._text_to_html(
+                linkify_text, None, last_paragraph_class))
+
+    def _text_to_html(self, linkify_text=True, linkify_substitution=None,
+                      last_paragraph_class=None):
+        """See `text_to_html`; this is not cached."""
         # This is based on the algorithm in the
         # DisplayingParagraphsOfText spec, but is a little more
         # complicated.
@@ -681,9 +794,11 @@ class FormattersAPI:
 
         URLs will be linkified with a target="_new" attribute.
         """
-        return self.text_to_html(
-            linkify_text=True,
-            linkify_substitution=self._linkify_substitution_with_target)
+        return text_render_cache.render(
+            self._stringtoformat, 'text_to_html_with_target', (),
+            lambda: self._text_to_html(
+                linkify_text=True,
+                linkify_substitution=self._linkify_substitution_with_target))
 
     def nice_pre(self):
         """<pre>, except the browser knows it is allowed to break long lines
@@ -725,6 +840,11 @@ class FormattersAPI:
         JavaScript may use this markup to control the content's display
         behaviour.
         """
+        return text_render_cache.render(
+            self._stringtoformat, 'email_to_html', (), self._email_to_html)
+
+    def _email_to_html(self):
+        """See `email_to_html`; this is not cached."""
         start_fold_markup = '<span class="foldable">'
         start_fold_quoted_markup = '<span class="foldable-quoted">'
         end_fold_markup = '%s\n</span></p>'
@@ -765,7 +885,7 @@ class FormattersAPI:
                 "The line must end with a paragraph mark (</p>).")
             return line[:-4]
 
-        for line in self.text_to_html().split('\n'):
+        for line in self._text_to_html().split('\n'):
             if 'Desired=<wbr />Unknown/' in line and not in_fold:
                 # When we see a evidence of dpkg output, we switch the
                 # quote matching rules. We do not assume lines that start
@@ -930,6 +1050,12 @@ class FormattersAPI:
 
     def format_diff(self):
         """Format the string as a diff in a table with line numbers."""
+        return text_render_cache.render(
+            self._stringtoformat, 'format_diff', (), self._format_diff,
+            user_dependent=False)
+
+    def _format_diff(self):
+        """See `format_diff`; this is not cached."""
         # Trim off trailing carriage returns.
         text = self._stringtoformat.rstrip('\n')
         if len(text) == 0:
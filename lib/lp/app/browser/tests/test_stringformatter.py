@@ -19,9 +19,11 @@ from lp.app.browser.stringformatter import (
     FormattersAPI,
     linkify_bug_numbers,
     parse_diff,
+    text_render_cache,
     )
 from lp.services.config import config
 from lp.services.features.testing import FeatureFixture
+from lp.services.memcache.testing import MemcacheFixture
 from lp.services.webapp.interfaces import ILaunchBag
 from lp.services.webapp.publisher import canonical_url
 from lp.testing import (
@@ -728,6 +730,68 @@ class TestOOPSFormatter(TestCase):
                 expected_string, formatted_string))
 
 
+class TestTextRenderCache(TestCase):
+    """Tests for the cache of rendered long texts."""
+
+    layer = DatabaseFunctionalLayer
+
+    text = 'See bug 1 and OOPS-1TEST.  ' * 40
+
+    def setUp(self):
+        super(TestTextRenderCache, self).setUp()
+        self.memcache_fixture = self.useFixture(MemcacheFixture())
+        text_render_cache.clear()
+        self.addCleanup(text_render_cache.clear)
+
+    def test_cached_in_process_and_memcache(self):
+        rendered = FormattersAPI(self.text).text_to_html()
+        self.assertIn('<a href="/bugs/1" class="bug-link">', rendered)
+        self.assertEqual(1, len(self.memcache_fixture._cache))
+        [key] = self.memcache_fixture._cache
+        self.memcache_fixture._cache[key] = 'from memcache'
+        self.assertEqual(rendered, FormattersAPI(self.text).text_to_html())
+        text_render_cache.clear()
+        self.assertEqual(
+            'from memcache', FormattersAPI(self.text).text_to_html())
+
+    def test_keyed_by_formatter_and_options(self):
+        formatter = FormattersAPI(self.text)
+        formatter.text_to_html()
+        formatter.text_to_html(last_paragraph_class='last')
+        formatter.text_to_html_with_target()
+        formatter.email_to_html()
+        formatter.format_diff()
+        self.assertEqual(5, len(self.memcache_fixture._cache))
+        self.assertIn(
+            'class="last"',
+            formatter.text_to_html(last_paragraph_class='last'))
+        self.assertIn('target="_new"', formatter.text_to_html_with_target())
+
+    def test_keyed_by_developer(self):
+        # OOPS IDs are only linked for developers, so developers don't
+        # share renderings with other users.
+        oops_url = config.launchpad.oops_root_url + 'OOPS-1TEST'
+        self.assertNotIn(oops_url, FormattersAPI(self.text).email_to_html())
+        getUtility(ILaunchBag).setDeveloper(True)
+        self.assertIn(oops_url, FormattersAPI(self.text).email_to_html())
+
+    def test_short_text_not_cached(self):
+        FormattersAPI('See bug 1.').text_to_html()
+        self.assertEqual({}, self.memcache_fixture._cache)
+
+    def test_disabled(self):
+        self.pushConfig('launchpad', text_render_cache_size=0)
+        FormattersAPI(self.text).text_to_html()
+        self.assertEqual({}, self.memcache_fixture._cache)
+
+    def test_memcache_disabled(self):
+        self.useFixture(FeatureFixture(
+            {'app.text_render_cache.disable_memcache': 'on'}))
+        rendered = FormattersAPI(self.text).text_to_html()
+        self.assertEqual({}, self.memcache_fixture._cache)
+        self.assertEqual(rendered, FormattersAPI(self.text).text_to_html())
+
+
 class MarksDownAs(Matcher):
 
     def __init__(self, expected_html):
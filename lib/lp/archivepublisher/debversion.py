@@ -13,8 +13,10 @@ __metaclass__ = type
 # This code came from sourcerer but has been heavily modified since.
 
 import re
+import string
 
 from debian import changelog
+import six
 
 # Regular expressions make validating things easy
 valid_epoch = re.compile(r'^[0-9]+$')
@@ -85,3 +87,78 @@ class Version(changelog.Version):
         if not valid_upstream.search(self.upstream_version):
             raise BadUpstreamError(
                 "Bad upstream version format %s" % self.upstream_version)
+
+
+# Splits a version fragment into alternating non-digit and digit parts.
+_fragment_parts = re.compile(r'([^0-9]*)([0-9]*)')
+
+
+def _char_weight(code):
+    """The weight of a non-digit character, as in dpkg's verrevcmp.
+
+    "~" sorts before the end of a part (which is u"\x02"), which sorts
+    before letters, which sort before everything else.
+    """
+    char = chr(code)
+    if char == '~':
+        return 0x01
+    elif char in string.ascii_letters:
+        return 0x100 + code
+    else:
+        return 0x200 + code
+
+
+_char_weights = dict(
+    (code, _char_weight(code)) for code in range(0x100)
+    if not chr(code).isdigit())
+
+# The key of a fragment part that compares equal to the end of a fragment.
+_zero_part = (u'\x02', 0)
+
+
+def _fragment_key(fragment):
+    """Return a sort key for an upstream version or Debian revision.
+
+    dpkg compares fragments as if both were padded with an infinite
+    sequence of empty parts: non-digit parts are compared by character
+    weight, and digit parts numerically.  To make plain tuple comparison
+    agree with that, trailing empty parts are dropped, each other part is
+    stored along with the number of empty parts preceding it, and the key
+    ends with a marker that compares greater than any part that sorts
+    before an empty one and less than any part that sorts after it.
+    """
+    key = []
+    zeros = 0
+    weighted = six.text_type(fragment).translate(_char_weights)
+    for non_digits, digits in _fragment_parts.findall(weighted):
+        part = (non_digits + u'\x02', int(digits) if digits else 0)
+        if part == _zero_part:
+            zeros += 1
+        elif part > _zero_part:
+            # Beats an empty part, so the earlier it is the greater.
+            key.append((1, -zeros, part))
+            zeros = 0
+        else:
+            # Loses to an empty part, so the earlier it is the smaller.
+            key.append((-1, zeros, part))
+            zeros = 0
+    key.append((0,))
+    return tuple(key)
+
+
+def version_sort_key(version):
+    """Return a key that sorts Debian version strings by version.
+
+    Keys compare in the same way as the versions do with
+    `apt_pkg.version_compare`, but are computed once per version rather
+    than once per comparison, so sorting n versions needs n key
+    computations rather than O(n log n) comparisons.  Equal versions
+    (such as "1.0" and "0:1.0-0") have equal keys.
+    """
+    epoch, sep, rest = version.partition(':')
+    if not sep:
+        epoch, rest = '0', version
+    upstream, sep, revision = rest.rpartition('-')
+    if not sep:
+        upstream, revision = rest, ''
+    return (int(epoch or 0), _fragment_key(upstream), _fragment_key(revision))
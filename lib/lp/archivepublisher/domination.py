@@ -68,31 +68,42 @@ from storm.expr import (
     And,
     Count,
     Desc,
+    Join,
+    Not,
     Select,
     )
+from storm.info import ClassAlias
 from zope.component import getUtility
 
+from lp.archivepublisher.debversion import version_sort_key
 from lp.registry.model.sourcepackagename import SourcePackageName
 from lp.services.database.bulk import load_related
 from lp.services.database.constants import UTC_NOW
 from lp.services.database.decoratedresultset import DecoratedResultSet
-from lp.services.database.interfaces import IStore
+from lp.services.database.interfaces import (
+    IMasterStore,
+    IStore,
+    )
 from lp.services.database.sqlbase import (
     flush_database_updates,
+    quote,
     sqlvalues,
     )
+from lp.services.database.stormexpr import IsDistinctFrom
 from lp.services.orderingcheck import OrderingCheck
 from lp.soyuz.enums import (
     BinaryPackageFormat,
     PackagePublishingStatus,
     )
 from lp.soyuz.interfaces.publishing import (
+    active_publishing_status,
     inactive_publishing_status,
     IPublishingSet,
     )
 from lp.soyuz.model.binarypackagebuild import BinaryPackageBuild
 from lp.soyuz.model.binarypackagename import BinaryPackageName
 from lp.soyuz.model.binarypackagerelease import BinaryPackageRelease
+from lp.soyuz.model.distroarchseries import DistroArchSeries
 from lp.soyuz.model.publishing import (
     BinaryPackagePublishingHistory,
     SourcePackagePublishingHistory,
@@ -102,8 +113,13 @@ from lp.soyuz.model.sourcepackagerelease import SourcePackageRelease
 # Days before a package will be removed from disk.
 STAY_OF_EXECUTION = 1
 
+# In bulk mode, the maximum number of pending decisions to collect before
+# applying them to the database.
+BULK_BATCH_SIZE = 1000
+
 
-# Ugly, but works
+# Ugly, but works.  Sorting no longer needs apt_pkg, but the publisher
+# scripts and several modules they import rely on this to initialise it.
 apt_pkg.init_system()
 
 
@@ -178,6 +194,7 @@ class GeneralizedPublication:
             self.traits = SourcePublicationTraits
         else:
             self.traits = BinaryPublicationTraits
+        self._version_keys = {}
 
     def getPackageName(self, pub):
         """Get the package's name."""
@@ -193,18 +210,24 @@ class GeneralizedPublication:
         If both publications are for the same version, their creation dates
         break the tie.
         """
-        version_comparison = apt_pkg.version_compare(
-            self.getPackageVersion(pub1), self.getPackageVersion(pub2))
+        return cmp(self.getSortKey(pub1), self.getSortKey(pub2))
 
-        if version_comparison == 0:
-            # Use dates as tie breaker.
-            return cmp(pub1.datecreated, pub2.datecreated)
-        else:
-            return version_comparison
+    def getSortKey(self, pub):
+        """Return a key that orders publications as `compare` does.
+
+        Version keys are cached by version string, since the same version
+        is usually published for several architectures.
+        """
+        version = self.getPackageVersion(pub)
+        version_key = self._version_keys.get(version)
+        if version_key is None:
+            version_key = version_sort_key(version)
+            self._version_keys[version] = version_key
+        return version_key, pub.datecreated
 
     def sortPublications(self, publications):
         """Sort publications from most to least current versions."""
-        return sorted(publications, cmp=self.compare, reverse=True)
+        return sorted(publications, key=self.getSortKey, reverse=True)
 
 
 def find_live_source_versions(sorted_pubs):
@@ -358,15 +381,201 @@ class Dominator:
     Packages are marked as superseded when they become obsolete.
     """
 
-    def __init__(self, logger, archive):
+    def __init__(self, logger, archive, bulk=False):
         """Initialize the dominator.
 
         This process should be run after the publisher has published
         new stuff into the distribution but before the publisher
         creates the file lists for apt-ftparchive.
+
+        :param bulk: If True, collect supersession decisions in memory and
+            apply them with a few set-based updates per batch, rather than
+            updating each publication individually.
         """
         self.logger = logger
         self.archive = archive
+        self.bulk = bulk
+        # Pending bulk decisions, mapping publication IDs to the IDs of
+        # their dominant releases (for sources) or builds (for binaries),
+        # or to None if there is no dominant.
+        self._source_decisions = {}
+        self._binary_decisions = {}
+        # Publications affected by pending decisions, to be invalidated
+        # once the decisions have been applied.
+        self._pending_pubs = []
+        # IDs of publications that bulk mode has made inactive.
+        self._inactive_ids = set()
+
+    def _supersede(self, pub, dominant, generalization):
+        """Supersede `pub` by `dominant`, immediately or in bulk."""
+        if not self.bulk:
+            pub.supersede(dominant, logger=self.logger)
+            return
+        # As in `supersede`, publications that are no longer active may
+        # only be architecture-independent binaries, which are dominated
+        # along with their siblings; they are left alone.
+        if generalization.is_source:
+            decisions = self._source_decisions
+        else:
+            decisions = self._binary_decisions
+        active = (
+            pub.status in active_publishing_status and
+            pub.id not in self._inactive_ids and pub.id not in decisions)
+        if generalization.is_source:
+            assert active, (
+                "Should not dominate unpublished source %s" %
+                pub.sourcepackagerelease.title)
+        elif not active:
+            assert not pub.binarypackagerelease.architecturespecific, (
+                "Should not dominate unpublished architecture specific "
+                "binary %s (%s)" % (
+                    pub.binarypackagerelease.title,
+                    pub.distroarchseries.architecturetag))
+            return
+        self._pending_pubs.append(pub)
+        if generalization.is_source:
+            decisions[pub.id] = (
+                dominant.sourcepackagereleaseID
+                if dominant is not None else None)
+        else:
+            if dominant is not None:
+                # DDEBs cannot themselves be dominant; they are always
+                # dominated by their corresponding DEB.
+                assert not dominant.is_debug, (
+                    "Should not dominate with %s (%s); DDEBs cannot "
+                    "dominate" % (
+                        dominant.binarypackagerelease.title,
+                        dominant.distroarchseries.architecturetag))
+            decisions[pub.id] = (
+                dominant.binarypackagerelease.buildID
+                if dominant is not None else None)
+        if (len(self._source_decisions) + len(self._binary_decisions) >=
+                BULK_BATCH_SIZE):
+            self._applyDecisions()
+
+    def _applyDecisions(self):
+        """Apply any pending bulk supersession decisions."""
+        if self._source_decisions:
+            self._applySupersessions(
+                SourcePackagePublishingHistory, self._source_decisions)
+            self._source_decisions = {}
+        if self._binary_decisions:
+            decisions = self._binary_decisions
+            self._binary_decisions = {}
+            self._addDependentBinaryDecisions(decisions)
+            self._applySupersessions(
+                BinaryPackagePublishingHistory, decisions)
+        # Make sure that the publications we have in memory are reloaded
+        # when next used.
+        store = IMasterStore(BinaryPackagePublishingHistory)
+        for pub in self._pending_pubs:
+            store.invalidate(pub)
+        self._pending_pubs = []
+
+    def _addDependentBinaryDecisions(self, decisions):
+        """Add the binary publications that are superseded alongside others.
+
+        This matches `BinaryPackagePublishingHistory.supersede`: publications
+        of an architecture-independent binary for other architectures with
+        the same overrides are superseded along with it, and DDEBs are
+        superseded along with their corresponding DEBs, all by the same
+        dominant build.  Nothing is superseded along with publications
+        that are no longer active.
+        """
+        BPPH = BinaryPackagePublishingHistory
+        store = IMasterStore(BPPH)
+        other_bpph = ClassAlias(BPPH)
+        das = ClassAlias(DistroArchSeries)
+        other_das = ClassAlias(DistroArchSeries)
+        same_overrides = [
+            BPPH.archiveID == other_bpph.archiveID,
+            BPPH.pocket == other_bpph.pocket,
+            BPPH.componentID == other_bpph.componentID,
+            BPPH.sectionID == other_bpph.sectionID,
+            BPPH.priority == other_bpph.priority,
+            Not(IsDistinctFrom(
+                BPPH.phased_update_percentage,
+                other_bpph.phased_update_percentage)),
+            BPPH.status.is_in(active_publishing_status),
+            other_bpph.status.is_in(active_publishing_status),
+            ]
+        siblings = store.using(
+            BPPH,
+            Join(
+                BinaryPackageRelease,
+                BinaryPackageRelease.id == BPPH.binarypackagereleaseID),
+            Join(das, das.id == BPPH.distroarchseriesID),
+            Join(other_das, other_das.distroseriesID == das.distroseriesID),
+            Join(
+                other_bpph,
+                And(
+                    other_bpph.distroarchseriesID == other_das.id,
+                    other_bpph.binarypackagereleaseID ==
+                        BPPH.binarypackagereleaseID,
+                    other_bpph.id != BPPH.id)),
+            ).find(
+                (BPPH.id, other_bpph),
+                BPPH.id.is_in(list(decisions)),
+                Not(BinaryPackageRelease.architecturespecific),
+                *same_overrides)
+        for pub_id, sibling in siblings:
+            decisions.setdefault(sibling.id, decisions[pub_id])
+            self._pending_pubs.append(sibling)
+        ddebs = store.using(
+            BPPH,
+            Join(
+                BinaryPackageRelease,
+                BinaryPackageRelease.id == BPPH.binarypackagereleaseID),
+            Join(
+                other_bpph,
+                other_bpph.binarypackagereleaseID ==
+                    BinaryPackageRelease.debug_packageID),
+            ).find(
+                (BPPH.id, other_bpph),
+                BPPH.id.is_in(list(decisions)),
+                BPPH.distroarchseriesID == other_bpph.distroarchseriesID,
+                *same_overrides)
+        for pub_id, ddeb in ddebs:
+            decisions.setdefault(ddeb.id, decisions[pub_id])
+            self._pending_pubs.append(ddeb)
+
+    def _applySupersessions(self, pub_class, decisions):
+        """Supersede publications with a single set-based update.
+
+        Publications that are no longer active are left alone, as
+        `supersede` would.
+
+        :param pub_class: `SourcePackagePublishingHistory` or
+            `BinaryPackagePublishingHistory`.
+        :param decisions: A dict mapping publication IDs to the IDs of
+            their dominant releases or builds, or None.
+        """
+        store = IMasterStore(pub_class)
+        store.flush()
+        values = ", ".join(
+            "(%s, %s::integer)" % sqlvalues(pub_id, dominant_id)
+            for pub_id, dominant_id in sorted(decisions.items()))
+        table = pub_class.__storm_table__
+        updated = store.execute("""
+            UPDATE %(table)s AS pub
+            SET
+                status = %(status)s,
+                datesuperseded = CURRENT_TIMESTAMP AT TIME ZONE 'UTC',
+                supersededby = COALESCE(
+                    decisions.supersededby, pub.supersededby)
+            FROM (VALUES %(values)s) AS decisions(id, supersededby)
+            WHERE pub.id = decisions.id AND pub.status IN %(active)s
+            RETURNING pub.id
+            """ % {
+                "table": table,
+                "status": quote(PackagePublishingStatus.SUPERSEDED),
+                "values": values,
+                "active": quote(active_publishing_status),
+                })
+        updated_ids = set(row[0] for row in updated)
+        self._inactive_ids.update(updated_ids)
+        self.logger.debug(
+            "Superseded %d %s record(s).", len(updated_ids), table)
 
     def dominatePackage(self, sorted_pubs, live_versions, generalization,
                         immutable_check=True):
@@ -405,7 +614,8 @@ class Dominator:
             len(sorted_pubs), live_versions)
 
         # Verify that the publications are really sorted properly.
-        check_order = OrderingCheck(cmp=generalization.compare, reverse=True)
+        check_order = OrderingCheck(
+            key=generalization.getSortKey, reverse=True)
 
         current_dominant = None
         dominant_version = None
@@ -423,7 +633,7 @@ class Dominator:
                 # This publication is for a live version, but has been
                 # superseded by a newer publication of the same version.
                 # Supersede it.
-                pub.supersede(current_dominant, logger=self.logger)
+                self._supersede(pub, current_dominant, generalization)
                 self.logger.debug2(
                     "Superseding older publication for version %s.", version)
             elif version in live_versions:
@@ -438,11 +648,13 @@ class Dominator:
                 # newer version to supersede it either.  Therefore it
                 # must be deleted.
                 pub.requestDeletion(None, immutable_check=immutable_check)
+                if self.bulk:
+                    self._inactive_ids.add(pub.id)
                 self.logger.debug2("Deleting version %s.", version)
             else:
                 # This publication is superseded.  This is what we're
                 # here to do.
-                pub.supersede(current_dominant, logger=self.logger)
+                self._supersede(pub, current_dominant, generalization)
                 self.logger.debug2("Superseding version %s.", version)
 
     def _sortPackages(self, publications, generalization):
@@ -502,17 +714,18 @@ class Dominator:
         """
         self.logger.debug("Beginning superseded processing...")
 
+        eligible_binaries = []
         for pub_record in binary_records:
             binpkg_release = pub_record.binarypackagerelease
             self.logger.debug(
                 "%s/%s (%s) has been judged eligible for removal",
                 binpkg_release.binarypackagename.name, binpkg_release.version,
                 pub_record.distroarchseries.architecturetag)
-            self._setScheduledDeletionDate(pub_record)
-            # XXX cprov 20070820: 'datemadepending' is useless, since it's
-            # always equals to "scheduleddeletiondate - quarantine".
-            pub_record.datemadepending = UTC_NOW
+            eligible_binaries.append(pub_record)
+        self._scheduleDeletions(
+            BinaryPackagePublishingHistory, eligible_binaries)
 
+        eligible_sources = []
         for pub_record in source_records:
             srcpkg_release = pub_record.sourcepackagerelease
             # Attempt to find all binaries of this
@@ -556,10 +769,45 @@ class Dominator:
                 "%s/%s (%s) source has been judged eligible for removal",
                 srcpkg_release.sourcepackagename.name, srcpkg_release.version,
                 pub_record.id)
-            self._setScheduledDeletionDate(pub_record)
-            # XXX cprov 20070820: 'datemadepending' is pointless, since it's
-            # always equals to "scheduleddeletiondate - quarantine".
-            pub_record.datemadepending = UTC_NOW
+            eligible_sources.append(pub_record)
+        self._scheduleDeletions(
+            SourcePackagePublishingHistory, eligible_sources)
+
+    def _scheduleDeletions(self, pub_class, pub_records):
+        """Set scheduled deletion dates on publications judged removable.
+
+        In bulk mode, this is a single set-based update.
+        """
+        if not pub_records:
+            return
+        if not self.bulk:
+            for pub_record in pub_records:
+                self._setScheduledDeletionDate(pub_record)
+                # XXX cprov 20070820: 'datemadepending' is pointless, since
+                # it's always equals to "scheduleddeletiondate - quarantine".
+                pub_record.datemadepending = UTC_NOW
+            return
+        store = IMasterStore(pub_class)
+        store.flush()
+        store.execute("""
+            UPDATE %(table)s
+            SET
+                scheduleddeletiondate = CASE
+                    WHEN status = %(deleted)s
+                        THEN CURRENT_TIMESTAMP AT TIME ZONE 'UTC'
+                    ELSE CURRENT_TIMESTAMP AT TIME ZONE 'UTC' +
+                        interval '%(stay)d days'
+                    END,
+                datemadepending = CURRENT_TIMESTAMP AT TIME ZONE 'UTC'
+            WHERE id IN %(ids)s
+            """ % {
+                "table": pub_class.__storm_table__,
+                "deleted": quote(PackagePublishingStatus.DELETED),
+                "stay": STAY_OF_EXECUTION,
+                "ids": quote([pub_record.id for pub_record in pub_records]),
+                })
+        for pub_record in pub_records:
+            store.invalidate(pub_record)
 
     def findBinariesForDomination(self, distroarchseries, pocket):
         """Find binary publications that need dominating.
@@ -615,6 +863,10 @@ class Dominator:
         # published, architecture-independent publications; anything
         # else will have completed domination in the first pass.
         packages_w_arch_indep = set()
+        # In bulk mode, we know exactly which publications the first pass
+        # made inactive, so we can reuse its candidates for the second pass
+        # rather than finding them again.
+        first_pass_bins = {}
 
         for distroarchseries in distroseries.architectures:
             self.logger.info(
@@ -624,6 +876,8 @@ class Dominator:
 
             self.logger.info("Finding binaries...")
             bins = self.findBinariesForDomination(distroarchseries, pocket)
+            if self.bulk:
+                first_pass_bins[distroarchseries] = bins
             sorted_packages = self._sortPackages(bins, generalization)
             self.logger.info("Dominating binaries...")
             for name, pubs in sorted_packages.iteritems():
@@ -633,6 +887,9 @@ class Dominator:
                 self.dominatePackage(pubs, live_versions, generalization)
                 if contains_arch_indep(pubs):
                     packages_w_arch_indep.add(name)
+            # Later architectures' candidates depend on the changes made
+            # here.
+            self._applyDecisions()
 
         packages_w_arch_indep = frozenset(packages_w_arch_indep)
 
@@ -646,7 +903,13 @@ class Dominator:
         reprieve_cache = ArchSpecificPublicationsCache()
         for distroarchseries in distroseries.architectures:
             self.logger.info("Finding binaries...(2nd pass)")
-            bins = self.findBinariesForDomination(distroarchseries, pocket)
+            if self.bulk:
+                bins = [
+                    bpph for bpph in first_pass_bins[distroarchseries]
+                    if bpph.id not in self._inactive_ids]
+            else:
+                bins = self.findBinariesForDomination(
+                    distroarchseries, pocket)
             sorted_packages = self._sortPackages(bins, generalization)
             self.logger.info("Dominating binaries...(2nd pass)")
             for name in packages_w_arch_indep.intersection(sorted_packages):
@@ -656,6 +919,7 @@ class Dominator:
                 live_versions = find_live_binary_versions_pass_2(
                     pubs, reprieve_cache)
                 self.dominatePackage(pubs, live_versions, generalization)
+            self._applyDecisions()
 
     def _composeActiveSourcePubsCondition(self, distroseries, pocket):
         """Compose ORM condition for restricting relevant source pubs."""
@@ -728,6 +992,7 @@ class Dominator:
             live_versions = find_live_source_versions(pubs)
             self.dominatePackage(pubs, live_versions, generalization)
 
+        self._applyDecisions()
         flush_database_updates()
 
     def findPublishedSourcePackageNames(self, distroseries, pocket):
@@ -786,6 +1051,7 @@ class Dominator:
         self.dominatePackage(
             pubs, live_versions, generalization,
             immutable_check=immutable_check)
+        self._applyDecisions()
 
     def judge(self, distroseries, pocket):
         """Judge superseded sources and binaries."""
@@ -715,7 +715,9 @@ class Publisher(object):
     def B_dominate(self, force_domination):
         """Second step in publishing: domination."""
         self.log.debug("* Step B: dominating packages")
-        judgejudy = Dominator(self.log, self.archive)
+        judgejudy = Dominator(
+            self.log, self.archive,
+            bulk=bool(getFeatureFlag("soyuz.publisher.bulk_domination")))
         for distroseries in self.distro.series:
             for pocket in self.archive.getPockets():
                 if not self.isAllowed(distroseries, pocket):
@@ -9,12 +9,16 @@ __metaclass__ = type
 
 # These tests came from sourcerer.
 
+import random
 import unittest
 
+import apt_pkg
+
 from lp.archivepublisher.debversion import (
     BadInputError,
     BadUpstreamError,
     Version,
+    version_sort_key,
     VersionError,
     )
 
@@ -136,3 +140,62 @@ class VersionTests(unittest.TestCase):
         """
         self.assertEqual(Version("1.0"), Version("1.0-0"))
         self.assertTrue(Version("1.0") == Version("1.0-0"))
+
+
+class VersionSortKeyTests(unittest.TestCase):
+
+    def setUp(self):
+        super(VersionSortKeyTests, self).setUp()
+        apt_pkg.init_system()
+
+    def assertAgreesWithApt(self, x, y):
+        expected = cmp(apt_pkg.version_compare(x, y), 0)
+        observed = cmp(version_sort_key(x), version_sort_key(y))
+        self.assertEqual(
+            expected, observed,
+            "%r vs %r: apt_pkg says %d, sort key says %d" % (
+                x, y, expected, observed))
+
+    def testComparisons(self):
+        for x, y in VersionTests.COMPARISONS:
+            self.assertTrue(version_sort_key(x) < version_sort_key(y))
+
+    def testEqualVersions(self):
+        for x, y in (
+                ("1.0", "0:1.0"), ("1.0", "1.0-0"), ("1.0", "1.00"),
+                ("1a", "1a0"), ("01:1.0", "1:1.0")):
+            self.assertEqual(version_sort_key(x), version_sort_key(y))
+
+    def testTildeEdgeCases(self):
+        # A fragment that ends sorts after one that continues with a
+        # tilde, even after intervening zeros.
+        for x, y in (
+                ("1.0", "1.0~"), ("1.0", "1.0-0~1"), ("1a", "1a0~"),
+                ("1.0-1", "1.0-1~a")):
+            self.assertTrue(version_sort_key(y) < version_sort_key(x))
+
+    def testAgreesWithApt(self):
+        # Compare a large number of random versions built from the
+        # characters that matter to the comparison algorithm.
+        rng = random.Random(0)
+
+        def make_fragment(first, chars, max_length):
+            return first + "".join(
+                rng.choice(chars) for _ in range(rng.randint(0, max_length)))
+
+        def make_version():
+            version = make_fragment(rng.choice("0129"), "a~.+0019zB", 5)
+            if rng.random() < 0.5:
+                version += "-" + make_fragment(
+                    rng.choice("a~.+019"), "a~.+019", 2)
+            if rng.random() < 0.2:
+                version = rng.choice(["0", "1", "01"]) + ":" + version
+            return version
+
+        versions = [make_version() for _ in range(300)]
+        for x in versions:
+            for y in rng.sample(versions, 10):
+                self.assertAgreesWithApt(x, y)
+        self.assertEqual(
+            sorted(versions, cmp=apt_pkg.version_compare),
+            sorted(versions, key=version_sort_key))
@@ -15,6 +15,7 @@ from testtools.matchers import LessThan
 from zope.component import getUtility
 from zope.security.proxy import removeSecurityProxy
 
+from lp.archivepublisher import domination
 from lp.archivepublisher.domination import (
     ArchSpecificPublicationsCache,
     contains_arch_indep,
@@ -49,6 +50,13 @@ from lp.testing.matchers import HasQueryCount
 class TestDominator(TestNativePublishingBase):
     """Test Dominator class."""
 
+    bulk = False
+
+    def makeDominator(self, archive=None):
+        if archive is None:
+            archive = self.ubuntutest.main_archive
+        return Dominator(self.logger, archive, bulk=self.bulk)
+
     def createSourceAndBinaries(self, version, with_debug=False,
                                 archive=None):
         """Create a source and binaries with the given version."""
@@ -83,11 +91,12 @@ class TestDominator(TestNativePublishingBase):
     def dominateAndCheck(self, dominant, dominated, supersededby):
         generalization = GeneralizedPublication(
             is_source=ISourcePackagePublishingHistory.providedBy(dominant))
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
 
         pubs = [dominant, dominated]
         live_versions = [generalization.getPackageVersion(dominant)]
         dominator.dominatePackage(pubs, live_versions, generalization)
+        dominator._applyDecisions()
         flush_database_updates()
 
         # The dominant version remains correctly published.
@@ -123,7 +132,7 @@ class TestDominator(TestNativePublishingBase):
         foo_11_source, foo_11_binaries = self.createSourceAndBinaries('1.1')
         foo_12_source, foo_12_binaries = self.createSourceAndBinaries('1.2')
 
-        dominator = Dominator(self.logger, foo_10_source.archive)
+        dominator = self.makeDominator(foo_10_source.archive)
         dominator.judgeAndDominate(
             foo_10_source.distroseries, foo_10_source.pocket)
 
@@ -153,7 +162,7 @@ class TestDominator(TestNativePublishingBase):
         foo_12_source, foo_12_binaries = self.createSourceAndBinaries(
             '1.2', with_debug=True, archive=ppa)
 
-        dominator = Dominator(self.logger, ppa)
+        dominator = self.makeDominator(ppa)
         dominator.judgeAndDominate(
             foo_10_source.distroseries, foo_10_source.pocket)
 
@@ -167,10 +176,64 @@ class TestDominator(TestNativePublishingBase):
             [foo_10_source] + foo_10_binaries,
             PackagePublishingStatus.SUPERSEDED)
 
+    def test_inactive_source_not_dominated(self):
+        # Dominating a source that is no longer active is a bug.
+        dominant, _, dominated, _ = self.createSimpleDominationContext()
+        dominated.setSuperseded()
+        dominator = self.makeDominator()
+        self.assertRaises(
+            AssertionError, dominator._supersede, dominated, dominant,
+            GeneralizedPublication(is_source=True))
+
+    def test_inactive_arch_indep_binary_not_dominated(self):
+        # An architecture-independent binary that is no longer active is
+        # left alone, and so are its publications for other
+        # architectures.
+        foo_10_src = self.getPubSource(
+            sourcename="foo", version="1.0", architecturehintlist="all",
+            status=PackagePublishingStatus.PUBLISHED)
+        [foo_10_bin, foo_10_bin_2] = self.getPubBinaries(
+            binaryname="foo-common", status=PackagePublishingStatus.PUBLISHED,
+            architecturespecific=False, version="1.0", pub_source=foo_10_src)
+        foo_11_src = self.getPubSource(
+            sourcename="foo", version="1.1", architecturehintlist="all",
+            status=PackagePublishingStatus.PUBLISHED)
+        [foo_11_bin, _] = self.getPubBinaries(
+            binaryname="foo-common", status=PackagePublishingStatus.PUBLISHED,
+            architecturespecific=False, version="1.1", pub_source=foo_11_src)
+        foo_10_bin.setSuperseded()
+        dominator = self.makeDominator()
+        dominator._supersede(
+            foo_10_bin, foo_11_bin, GeneralizedPublication(is_source=False))
+        dominator._applyDecisions()
+        flush_database_updates()
+        self.checkPublication(foo_10_bin_2, PackagePublishingStatus.PUBLISHED)
+        self.assertIsNone(foo_10_bin.supersededby)
+
+    def test_inactive_arch_specific_binary_not_dominated(self):
+        # Dominating an architecture-specific binary that is no longer
+        # active is a bug.
+        foo_10_src = self.getPubSource(
+            sourcename="foo", version="1.0", architecturehintlist="i386",
+            status=PackagePublishingStatus.PUBLISHED)
+        [dominated] = self.getPubBinaries(
+            binaryname="foo-bin", status=PackagePublishingStatus.SUPERSEDED,
+            architecturespecific=True, version="1.0", pub_source=foo_10_src)
+        foo_11_src = self.getPubSource(
+            sourcename="foo", version="1.1", architecturehintlist="i386",
+            status=PackagePublishingStatus.PUBLISHED)
+        [dominant] = self.getPubBinaries(
+            binaryname="foo-bin", status=PackagePublishingStatus.PUBLISHED,
+            architecturespecific=True, version="1.1", pub_source=foo_11_src)
+        dominator = self.makeDominator()
+        self.assertRaises(
+            AssertionError, dominator._supersede, dominated, dominant,
+            GeneralizedPublication(is_source=False))
+
     def test_dominateBinaries_rejects_empty_publication_list(self):
         """Domination asserts for non-empty input list."""
         package = self.factory.makeBinaryPackageName()
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
         dominator._sortPackages = FakeMethod({package.name: []})
         # This isn't a really good exception. It should probably be
         # something more indicative of bad input.
@@ -183,7 +246,7 @@ class TestDominator(TestNativePublishingBase):
     def test_dominateSources_rejects_empty_publication_list(self):
         """Domination asserts for non-empty input list."""
         package = self.factory.makeSourcePackageName()
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
         dominator._sortPackages = FakeMethod({package.name: []})
         # This isn't a really good exception. It should probably be
         # something more indicative of bad input.
@@ -226,7 +289,7 @@ class TestDominator(TestNativePublishingBase):
             binaryname="foo-common", status=PackagePublishingStatus.PUBLISHED,
             architecturespecific=False, version="1.1", pub_source=foo_11_src)
 
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
         dominator.judgeAndDominate(
             foo_10_src.distroseries, foo_10_src.pocket)
 
@@ -276,7 +339,7 @@ class TestDominator(TestNativePublishingBase):
             binaryname="foo-bin", status=PackagePublishingStatus.PUBLISHED,
             architecturespecific=False, version="1.1", pub_source=foo_11_src)
 
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
         dominator.judgeAndDominate(
             foo_10_src.distroseries, foo_10_src.pocket)
 
@@ -320,13 +383,60 @@ class TestDominator(TestNativePublishingBase):
             bpr, self.ubuntutest.main_archive, pocket=foo_11_src.pocket,
             status=PackagePublishingStatus.PUBLISHED)
 
-        dominator = Dominator(self.logger, self.ubuntutest.main_archive)
+        dominator = self.makeDominator()
         dominator.judgeAndDominate(foo_10_src.distroseries, foo_10_src.pocket)
 
         self.checkPublications(foo_10_all_bins + [foo_10_i386_bin],
                                PackagePublishingStatus.SUPERSEDED)
 
 
+class TestDominatorBulk(TestDominator):
+    """Test Dominator class in bulk mode."""
+
+    bulk = True
+
+    def test_dominateBinaries_finds_binaries_once(self):
+        # In bulk mode, the second pass reuses the binaries found by the
+        # first pass rather than finding them again.
+        foo_10_source, foo_10_binaries = self.createSourceAndBinaries('1.0')
+        foo_11_source, foo_11_binaries = self.createSourceAndBinaries('1.1')
+        dominator = self.makeDominator()
+        calls = []
+        find_binaries = dominator.findBinariesForDomination
+
+        def record_find_binaries(distroarchseries, pocket):
+            calls.append(distroarchseries)
+            return find_binaries(distroarchseries, pocket)
+
+        dominator.findBinariesForDomination = record_find_binaries
+        distroseries = foo_10_source.distroseries
+        dominator.dominateBinaries(distroseries, foo_10_source.pocket)
+        self.assertEqual(list(distroseries.architectures), calls)
+        self.checkPublications(
+            foo_11_binaries, PackagePublishingStatus.PUBLISHED)
+        self.checkPublications(
+            foo_10_binaries, PackagePublishingStatus.SUPERSEDED)
+
+    def test_decisions_are_batched(self):
+        # Pending decisions are applied once there are enough of them,
+        # without waiting for the end of the distroarchseries.
+        foo_10_source, foo_10_binaries = self.createSourceAndBinaries('1.0')
+        foo_11_source, foo_11_binaries = self.createSourceAndBinaries('1.1')
+        generalization = GeneralizedPublication(is_source=True)
+        live_versions = [generalization.getPackageVersion(foo_11_source)]
+        dominator = self.makeDominator()
+        with monkey_patch(domination, BULK_BATCH_SIZE=1):
+            dominator.dominatePackage(
+                [foo_11_source, foo_10_source], live_versions,
+                generalization)
+        self.assertEqual({}, dominator._source_decisions)
+        self.assertIn(foo_10_source.id, dominator._inactive_ids)
+        self.checkPublication(
+            foo_10_source, PackagePublishingStatus.SUPERSEDED)
+        self.assertEqual(
+            foo_11_source.sourcepackagerelease, foo_10_source.supersededby)
+
+
 class TestDomination(TestNativePublishingBase):
     """Test overall domination procedure."""
 
@@ -559,6 +669,28 @@ class TestGeneralizedPublication(TestCaseWithFactory):
             [spphs[2], spphs[0], spphs[1]],
             sorted(spphs, cmp=GeneralizedPublication().compare))
 
+    def test_sortPublications_matches_apt_pkg(self):
+        # sortPublications uses precomputed sort keys, which order
+        # versions just as apt_pkg does.
+        versions = [
+            '1.1.0', '1.10', '1.1', '1.1ubuntu0', '1:0.9', '1.1~rc1',
+            '1.1-1', '1.1-0ubuntu1', '1.1+dfsg', '1.1a~', '0:1.10-0']
+        spphs = make_spphs_for_versions(self.factory, versions)
+        generalization = GeneralizedPublication()
+        for x in spphs:
+            for y in spphs:
+                x_version = generalization.getPackageVersion(x)
+                y_version = generalization.getPackageVersion(y)
+                self.assertEqual(
+                    cmp(apt_pkg.version_compare(x_version, y_version), 0),
+                    cmp(generalization.getSortKey(x)[0],
+                        generalization.getSortKey(y)[0]),
+                    (x_version, y_version))
+        spphs = make_spphs_for_versions(self.factory, versions[:6])
+        self.assertEqual(
+            ['1:0.9', '1.10', '1.1.0', '1.1ubuntu0', '1.1', '1.1~rc1'],
+            list_source_versions(generalization.sortPublications(spphs)))
+
 
 def jumble(ordered_list):
     """Jumble the elements of `ordered_list` into a weird order.
@@ -0,0 +1,233 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Read Debian binary packages in a single streaming pass.
+
+A .deb is an ar archive containing "debian-binary", "control.tar.*" and
+"data.tar.*" members.  `read_deb` walks the ar container once, streaming
+each tar member through the appropriate decompressor, so that the member
+layout, the control file and the timestamps of every file in the package
+can all be checked without running ar or dpkg-deb and without reading
+the package more than once.
+"""
+
+__metaclass__ = type
+
+__all__ = [
+    'DebContents',
+    'DebFormatError',
+    'read_deb',
+    ]
+
+import bz2
+import tarfile
+import zlib
+
+import six
+
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+AR_FILE_MAGIC = b"`\n"
+
+# How much compressed data to read at once.
+CHUNK_SIZE = 256 * 1024
+
+
+class DebFormatError(Exception):
+    """A .deb could not be read."""
+
+
+# Exceptions that indicate a corrupt tar member.
+_member_errors = (
+    DebFormatError, EnvironmentError, EOFError, tarfile.TarError, zlib.error,
+    lzma.LZMAError)
+
+
+def _make_decompressor(suffix):
+    """Return a decompressor object for a tar member with `suffix`.
+
+    The returned object has a `decompress` method taking compressed data
+    and returning any decompressed data that is available, like
+    `zlib.decompressobj`.
+    """
+    if suffix == "":
+        return None
+    elif suffix == ".gz":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif suffix == ".bz2":
+        return bz2.BZ2Decompressor()
+    elif suffix == ".xz":
+        return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    elif suffix == ".lzma":
+        return lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
+    else:
+        raise DebFormatError("unknown compression %s" % suffix)
+
+
+class _MemberStream:
+    """A file-like object reading a decompressed ar member.
+
+    This reads at most `size` bytes from `fileobj`, and only supports
+    sequential reads, which is all that `tarfile` needs in stream mode.
+    """
+
+    def __init__(self, fileobj, size, suffix):
+        self.fileobj = fileobj
+        self.remaining = size
+        self.decompressor = _make_decompressor(suffix)
+        self.buffer = b""
+        self.offset = 0
+
+    def _fill(self):
+        """Read and decompress another chunk; return False at the end."""
+        if self.remaining <= 0:
+            return False
+        data = self.fileobj.read(min(CHUNK_SIZE, self.remaining))
+        if not data:
+            raise DebFormatError("truncated archive member")
+        self.remaining -= len(data)
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+        self.buffer = self.buffer[self.offset:] + data
+        self.offset = 0
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) - self.offset < size:
+            if not self._fill():
+                break
+        if size < 0:
+            size = len(self.buffer) - self.offset
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def skip(self):
+        """Skip any unread compressed data."""
+        if self.remaining > 0:
+            self.fileobj.seek(self.remaining, 1)
+            self.remaining = 0
+
+
+def _normalise_name(name):
+    """Normalise a tar member name as apt_inst does."""
+    if name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+class DebContents:
+    """What `read_deb` found in a .deb.
+
+    :ivar members: The names of the ar members, in order.
+    :ivar control: The contents of the control file, or None.
+    :ivar control_error: The exception raised while reading the control
+        member, if any.
+    :ivar data_error: The exception raised while reading the data member,
+        if any.
+    """
+
+    def __init__(self):
+        self.members = []
+        self.control = None
+        self.control_error = None
+        self.data_error = None
+
+    def _findMember(self, prefix):
+        for name in self.members:
+            if name.startswith(prefix):
+                return name
+        return None
+
+    @property
+    def control_member(self):
+        return self._findMember("control.tar")
+
+    @property
+    def data_member(self):
+        return self._findMember("data.tar")
+
+
+def _read_tar(stream, contents, tar_member_callback, read_control):
+    tar = tarfile.open(fileobj=stream, mode="r|")
+    for member in tar:
+        name = _normalise_name(member.name)
+        if tar_member_callback is not None:
+            tar_member_callback(name, member.mtime)
+        if read_control and name == "control" and member.isfile():
+            contents.control = tar.extractfile(member).read()
+
+
+def _read_ar_headers(fileobj):
+    """Generate (name, size) for each member of an ar archive.
+
+    The caller must consume or skip exactly `size` bytes of each member
+    before asking for the next one.
+    """
+    if fileobj.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise DebFormatError("not an ar archive")
+    while True:
+        header = fileobj.read(AR_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < AR_HEADER_SIZE or header[58:] != AR_FILE_MAGIC:
+            raise DebFormatError("malformed ar member header")
+        name = header[:16].rstrip(b" ")
+        # GNU ar terminates names with a slash.
+        if name.endswith(b"/") and name != b"/":
+            name = name[:-1]
+        try:
+            size = int(header[48:58])
+        except ValueError:
+            raise DebFormatError("malformed ar member size")
+        yield six.ensure_str(name, "ASCII", "replace"), size
+        # Members are aligned to even offsets.
+        if size % 2:
+            fileobj.read(1)
+
+
+def read_deb(path, tar_member_callback=None, read_data=True):
+    """Read a .deb in a single pass.
+
+    Errors reading the ar container itself are raised as
+    `DebFormatError`.  Errors reading the control or data tarballs are
+    recorded in the returned `DebContents` instead, so that the member
+    layout can still be checked.
+
+    :param path: The path to the .deb.
+    :param tar_member_callback: If not None, called with the name (with
+        any leading "./" removed, as apt_inst does) and modification time
+        of each member of the control and data tarballs.
+    :param read_data: If False, skip over the data tarball rather than
+        decompressing it.
+    :return: A `DebContents`.
+    """
+    contents = DebContents()
+    with open(path, "rb") as fileobj:
+        for name, size in _read_ar_headers(fileobj):
+            contents.members.append(name)
+            is_control = name.startswith("control.tar")
+            is_data = name.startswith("data.tar") and read_data
+            stream = None
+            if is_control or is_data:
+                suffix = name.split(".tar", 1)[1]
+                try:
+                    stream = _MemberStream(fileobj, size, suffix)
+                    _read_tar(
+                        stream, contents, tar_member_callback, is_control)
+                except _member_errors as e:
+                    if is_control:
+                        contents.control_error = e
+                    else:
+                        contents.data_error = e
+            if stream is None:
+                fileobj.seek(size, 1)
+            else:
+                stream.skip()
+    return contents
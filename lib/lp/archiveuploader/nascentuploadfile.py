@@ -19,11 +19,9 @@ __all__ = [
 
 import hashlib
 import os
-import subprocess
 import sys
 import time
 
-import apt_inst
 import apt_pkg
 from debian.deb822 import Deb822Dict
 from zope.component import getUtility
@@ -37,6 +35,10 @@ from lp.archivepublisher.signing import (
     SigningUpload,
     UefiUpload,
     )
+from lp.archiveuploader.debreader import (
+    DebFormatError,
+    read_deb,
+    )
 from lp.archiveuploader.utils import (
     determine_source_file_type,
     prefix_multi_line_string,
@@ -86,13 +88,6 @@ class TarFileDateChecker:
         self.future_files = {}
         self.ancient_files = {}
 
-    def callback(self, member, data):
-        """Callback designed to cope with apt_inst.TarFile.go.
-
-        It check and store timestamp details of the extracted DEB.
-        """
-        self.check_cutoff(member.name, member.mtime)
-
     def check_cutoff(self, name, mtime):
         """Check the timestamp details of the supplied file.
 
@@ -475,6 +470,15 @@ class BaseBinaryUploadFile(PackageUploadFile):
     source_name = None
     source_version = None
 
+    # Whether to read the data member when inspecting the package, so
+    # that the timestamps of its contents can be checked.
+    inspect_data = False
+
+    # Populated by readDeb().
+    _deb_contents = None
+    _deb_error = None
+    tar_checker = None
+
     def __init__(self, filepath, md5, size, component_and_section,
                  priority_name, package, version, changes, policy, logger):
 
@@ -549,12 +553,42 @@ class BaseBinaryUploadFile(PackageUploadFile):
             for error in check():
                 yield error
 
+    def readDeb(self):
+        """Read the package file, caching the result.
+
+        The member layout, the control file and the timestamps of the
+        package's contents are all collected in a single pass, which the
+        individual checks then share.
+
+        :raises DebFormatError: if the package is not a valid ar archive.
+        :return: A `DebContents`.
+        """
+        if self._deb_contents is None and self._deb_error is None:
+            future_cutoff = time.time() + self.policy.future_time_grace
+            earliest_year = time.strptime(
+                str(self.policy.earliest_year), "%Y")
+            past_cutoff = time.mktime(earliest_year)
+            self.tar_checker = TarFileDateChecker(future_cutoff, past_cutoff)
+            try:
+                self._deb_contents = read_deb(
+                    self.filepath,
+                    tar_member_callback=self.tar_checker.check_cutoff,
+                    read_data=self.inspect_data)
+            except DebFormatError as error:
+                self._deb_error = error
+        if self._deb_error is not None:
+            raise self._deb_error
+        return self._deb_contents
+
     def extractAndParseControl(self):
         """Extract and parse control information."""
         try:
-            deb_file = apt_inst.DebFile(self.filepath)
-            control_file = deb_file.control.extractdata("control")
-            control_lines = apt_pkg.TagSection(control_file, bytes=True)
+            contents = self.readDeb()
+            if contents.control_error is not None:
+                raise contents.control_error
+            if contents.control is None:
+                raise DebFormatError("missing control file")
+            control_lines = apt_pkg.TagSection(contents.control, bytes=True)
         except (SystemExit, KeyboardInterrupt):
             raise
         except:
@@ -697,25 +731,23 @@ class BaseBinaryUploadFile(PackageUploadFile):
     def verifyFormat(self):
         """Check if the DEB format is sane.
 
-        Debian packages are in fact 'ar' files. Thus we run '/usr/bin/ar'
-        to look at the contents of the deb files to confirm they make sense.
+        Debian packages are in fact 'ar' files.  We list their members
+        (as 'ar t' would) to confirm they make sense.
         """
-        ar_process = subprocess.Popen(
-            ["/usr/bin/ar", "t", self.filepath],
-            stdout=subprocess.PIPE)
-        output = ar_process.stdout.read()
-        result = ar_process.wait()
-        if result != 0:
+        try:
+            chunks = self.readDeb().members
+        except DebFormatError as error:
             yield UploadError(
                 "%s: 'ar t' invocation failed." % self.filename)
             yield UploadError(
-                prefix_multi_line_string(output, " [ar output:] "))
+                prefix_multi_line_string(str(error), " [ar output:] "))
+            return
 
-        chunks = output.strip().split("\n")
         if len(chunks) != 3:
             yield UploadError(
                 "%s: found %d chunks, expecting 3. %r" % (
                 self.filename, len(chunks), chunks))
+            return
 
         debian_binary, control_tar, data_tar = chunks
         if debian_binary != "debian-binary":
@@ -737,23 +769,31 @@ class BaseBinaryUploadFile(PackageUploadFile):
         """Check specific DEB format timestamp checks."""
         self.logger.debug("Verifying timestamps in %s" % (self.filename))
 
-        future_cutoff = time.time() + self.policy.future_time_grace
-        earliest_year = time.strptime(str(self.policy.earliest_year), "%Y")
-        past_cutoff = time.mktime(earliest_year)
-
-        tar_checker = TarFileDateChecker(future_cutoff, past_cutoff)
-        tar_checker.reset()
         try:
-            deb_file = apt_inst.DebFile(self.filepath)
-        except SystemError as error:
-            # We get an error from the constructor if the .deb does not
-            # contain all the expected top-level members (debian-binary,
-            # control.tar.gz, and data.tar.*).
+            contents = self.readDeb()
+        except DebFormatError as error:
             yield UploadError(str(error))
             return
+        # The .deb must contain all the expected top-level members
+        # (debian-binary, control.tar.*, and data.tar.*).
+        for member, prefix in (
+                (contents.control_member, "control.tar"),
+                (contents.data_member, "data.tar")):
+            if member is None:
+                yield UploadError(
+                    "could not locate member %s.* in %s" % (
+                        prefix, self.filename))
+                return
+        # Errors reading the tarballs are recorded rather than raised, so
+        # that the member layout can still be checked.
+        for error in (contents.control_error, contents.data_error):
+            if error is not None:
+                yield UploadError(
+                    "%s: deb contents timestamp check failed: %s"
+                     % (self.filename, error))
+                return
+        tar_checker = self.tar_checker
         try:
-            deb_file.control.go(tar_checker.callback)
-            deb_file.data.go(tar_checker.callback)
             future_files = tar_checker.future_files.keys()
             if future_files:
                 first_file = future_files[0]
@@ -777,10 +817,10 @@ class BaseBinaryUploadFile(PackageUploadFile):
             raise
         except Exception as error:
             # There is a very large number of places where we
-            # might get an exception while checking the timestamps.
-            # Many of them come from apt_inst/apt_pkg and they are
-            # terrible in giving sane exceptions. We thusly capture
-            # them all and make them into rejection messages instead
+            # might get an exception while checking the timestamps,
+            # from corrupt tarballs to broken compression. We thusly
+            # capture them all and make them into rejection messages
+            # instead.
             yield UploadError("%s: deb contents timestamp check failed: %s"
                  % (self.filename, error))
 
@@ -974,6 +1014,7 @@ class UdebBinaryUploadFile(BaseBinaryUploadFile):
 class DebBinaryUploadFile(BaseBinaryUploadFile):
     """Represents an uploaded binary package file in deb format."""
     format = BinaryPackageFormat.DEB
+    inspect_data = True
 
     @property
     def local_checks(self):
@@ -6,7 +6,12 @@
 __metaclass__ = type
 __all__ = ['ProcessUpload']
 
+import logging
+import optparse
 import os
+import subprocess
+import sys
+import threading
 
 from lp.archiveuploader.uploadpolicy import findPolicyByName
 from lp.archiveuploader.uploadprocessor import UploadProcessor
@@ -18,6 +23,62 @@ from lp.services.scripts.base import (
 from lp.services.timeout import default_timeout
 
 
+def verbosity_args(loglevel):
+    """Return -v/-q options that give a child script `loglevel`.
+
+    This mirrors how `LaunchpadScript` adjusts its log level for each -v
+    or -q option, starting from INFO.
+    """
+    args = []
+    level = logging.INFO
+    while level > loglevel:
+        level -= 10 if level > 10 else 1
+        args.append("-v")
+    while level < loglevel:
+        level += 10 if level >= 10 else 1
+        args.append("-q")
+    return args
+
+
+class UploadWorker:
+    """A long-lived process-upload worker process.
+
+    The worker reads the names of uploads to process from its standard
+    input, one per line, and writes each name back to its standard output
+    once it has processed that upload.
+    """
+
+    def __init__(self, args, results):
+        """Start a worker.
+
+        :param args: The worker's command line.
+        :param results: A `Queue` to put `(worker, None)` on each time the
+            worker finishes an upload, and `(worker, returncode)` when
+            it exits.
+        """
+        self.process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.results = results
+        self.reader = threading.Thread(target=self._readResults)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _readResults(self):
+        for line in iter(self.process.stdout.readline, ""):
+            self.results.put((self, None))
+        self.results.put((self, self.process.wait()))
+
+    def submit(self, upload):
+        """Ask the worker to process `upload`."""
+        self.process.stdin.write(upload + "\n")
+        self.process.stdin.flush()
+
+    def close(self):
+        """Tell the worker to exit once it is idle, and wait for it."""
+        self.process.stdin.close()
+        self.reader.join()
+
+
 class ProcessUpload(LaunchpadCronScript):
     """`LaunchpadScript` wrapper for `UploadProcessor`."""
 
@@ -66,6 +127,25 @@ class ProcessUpload(LaunchpadCronScript):
             "-a", "--announce", action="store", dest="announcelist",
             metavar="ANNOUNCELIST", help="Override the announcement list")
 
+        self.parser.add_option(
+            "--workers", action="store", type="int", dest="workers",
+            default=1, metavar="N",
+            help=("Process up to N uploads in parallel, using a pool of N "
+                  "worker processes."))
+
+        self.parser.add_option(
+            "--workers-per-archive", action="store", type="int",
+            dest="workers_per_archive", default=1, metavar="N",
+            help=("With --workers, process at most N uploads to the same "
+                  "archive in parallel.  Build uploads are only limited "
+                  "per source package."))
+
+        # Internal: run as a worker for a parallel process-upload, which
+        # already holds the main lock, taking uploads from standard input.
+        self.parser.add_option(
+            "--worker", action="store_true", dest="worker", default=False,
+            help=optparse.SUPPRESS_HELP)
+
     def main(self):
         if len(self.args) != 1:
             raise LaunchpadScriptFailure(
@@ -78,6 +158,10 @@ class ProcessUpload(LaunchpadCronScript):
             raise LaunchpadScriptFailure(
                 "%s is not a directory" % self.options.base_fsroot)
 
+        if self.options.workers < 1 or self.options.workers_per_archive < 1:
+            raise LaunchpadScriptFailure(
+                "--workers and --workers-per-archive must be positive.")
+
         self.logger.debug("Initializing connection.")
 
         def getPolicy(distro, build):
@@ -94,8 +178,59 @@ class ProcessUpload(LaunchpadCronScript):
         processor = UploadProcessor(self.options.base_fsroot,
             self.options.dryrun, self.options.nomails, self.options.builds,
             self.options.keep, getPolicy, self.txn, self.logger)
-        with default_timeout(config.uploader.timeout):
-            processor.processUploadQueue(self.options.leafname)
+        if self.options.worker:
+            self.processUploadsFromParent(processor)
+        elif self.options.workers > 1 and self.options.leafname is None:
+            processor.processUploadQueueInParallel(
+                self.startWorker, self.options.workers,
+                workers_per_archive=self.options.workers_per_archive)
+        else:
+            with default_timeout(config.uploader.timeout):
+                processor.processUploadQueue(self.options.leafname)
+
+    def processUploadsFromParent(self, processor):
+        """Process the uploads named on standard input, one by one.
+
+        Each name is written back to standard output once its upload has
+        been processed.  Anything else that would be printed goes to
+        standard error instead, so that the parent only sees the names.
+        """
+        results = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        for line in iter(sys.stdin.readline, ""):
+            leaf_name = line.rstrip("\n")
+            with default_timeout(config.uploader.timeout):
+                processor.processSingleUpload(leaf_name)
+            results.write(leaf_name + "\n")
+            results.flush()
+
+    def getWorkerArgs(self):
+        """Return the command line for a worker process."""
+        args = [
+            sys.executable,
+            os.path.join(config.root, "scripts", "process-upload.py"),
+            "--worker", "-C", self.options.context,
+            "-d", self.options.distro,
+            ]
+        args.extend(verbosity_args(self.options.loglevel))
+        if self.options.dryrun:
+            args.append("-n")
+        if self.options.keep:
+            args.append("-K")
+        if self.options.nomails:
+            args.append("-M")
+        if self.options.builds:
+            args.append("--builds")
+        if self.options.distroseries is not None:
+            args.extend(["-s", self.options.distroseries])
+        if self.options.announcelist is not None:
+            args.extend(["-a", self.options.announcelist])
+        args.append(self.options.base_fsroot)
+        return args
+
+    def startWorker(self, results):
+        """Start a worker process; see `UploadWorker`."""
+        return UploadWorker(self.getWorkerArgs(), results)
 
     @property
     def lockfilename(self):
@@ -103,6 +238,11 @@ class ProcessUpload(LaunchpadCronScript):
 
         Each different p-u policy requires and uses a different lockfile.
         This is because they are run by different users and are independent
-        of each other.
+        of each other.  Parallel workers each use their own lockfile.
         """
+        if self.options.worker:
+            # The parent holds the main lock and hands each upload to a
+            # single worker, so workers only need not to share a lockfile.
+            return "process-upload-%s-worker-%d.lock" % (
+                self.options.context, os.getpid())
         return "process-upload-%s.lock" % self.options.context
@@ -0,0 +1,178 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the single-pass .deb reader."""
+
+__metaclass__ = type
+
+import bz2
+import io
+import os
+import tarfile
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+from lp.archiveuploader.debreader import (
+    DebFormatError,
+    read_deb,
+    )
+from lp.testing import TestCase
+
+
+def make_tar(files, mtime=1000000000):
+    """Return an uncompressed tarball containing `files`.
+
+    :param files: A list of (name, contents) pairs.
+    """
+    buf = io.BytesIO()
+    tar = tarfile.open(fileobj=buf, mode="w")
+    for name, contents in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(contents)
+        info.mtime = mtime
+        tar.addfile(info, io.BytesIO(contents))
+    tar.close()
+    return buf.getvalue()
+
+
+def compress(data, suffix):
+    if suffix == "":
+        return data
+    elif suffix == ".gz":
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    elif suffix == ".bz2":
+        return bz2.compress(data)
+    elif suffix == ".xz":
+        return lzma.compress(data, format=lzma.FORMAT_XZ)
+    elif suffix == ".lzma":
+        return lzma.compress(data, format=lzma.FORMAT_ALONE)
+    raise AssertionError("unknown suffix %s" % suffix)
+
+
+def make_ar(members):
+    """Return an ar archive containing `members`.
+
+    :param members: A list of (name, contents) pairs.
+    """
+    parts = [b"!<arch>\n"]
+    for name, contents in members:
+        parts.append(
+            b"%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (
+                name.encode("ASCII") + b"/", 0, 0, 0, b"100644",
+                len(contents)))
+        parts.append(contents)
+        if len(contents) % 2:
+            parts.append(b"\n")
+    return b"".join(parts)
+
+
+class TestReadDeb(TestCase):
+
+    control = b"Package: foo\nVersion: 1.0\nArchitecture: all\n"
+
+    def writeDeb(self, data):
+        path = os.path.join(self.makeTemporaryDirectory(), "foo_1.0_all.deb")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def makeDeb(self, control_suffix=".gz", data_suffix=".gz", mtime=None):
+        kwargs = {} if mtime is None else {"mtime": mtime}
+        control_tar = make_tar(
+            [("./control", self.control), ("./md5sums", b"")], **kwargs)
+        data_tar = make_tar(
+            [("./usr/share/doc/foo/README", b"foo\n")], **kwargs)
+        return self.writeDeb(make_ar([
+            ("debian-binary", b"2.0\n"),
+            ("control.tar" + control_suffix,
+             compress(control_tar, control_suffix)),
+            ("data.tar" + data_suffix, compress(data_tar, data_suffix)),
+            ]))
+
+    def test_members_and_control(self):
+        contents = read_deb(self.makeDeb())
+        self.assertEqual(
+            ["debian-binary", "control.tar.gz", "data.tar.gz"],
+            contents.members)
+        self.assertEqual("control.tar.gz", contents.control_member)
+        self.assertEqual("data.tar.gz", contents.data_member)
+        self.assertEqual(self.control, contents.control)
+        self.assertIsNone(contents.control_error)
+        self.assertIsNone(contents.data_error)
+
+    def test_compression_formats(self):
+        for control_suffix in ("", ".gz", ".xz"):
+            for data_suffix in ("", ".gz", ".bz2", ".lzma", ".xz"):
+                contents = read_deb(
+                    self.makeDeb(control_suffix, data_suffix),
+                    tar_member_callback=lambda name, mtime: None)
+                self.assertEqual(self.control, contents.control)
+                self.assertIsNone(contents.control_error)
+                self.assertIsNone(contents.data_error)
+
+    def test_tar_member_callback(self):
+        # The callback sees every file in both tarballs, with any leading
+        # "./" removed.
+        seen = []
+        read_deb(
+            self.makeDeb(mtime=1234567890),
+            tar_member_callback=lambda *args: seen.append(args))
+        self.assertEqual(
+            [("control", 1234567890), ("md5sums", 1234567890),
+             ("usr/share/doc/foo/README", 1234567890)],
+            seen)
+
+    def test_skip_data(self):
+        seen = []
+        contents = read_deb(
+            self.makeDeb(),
+            tar_member_callback=lambda name, mtime: seen.append(name),
+            read_data=False)
+        self.assertEqual(["control", "md5sums"], seen)
+        self.assertEqual("data.tar.gz", contents.data_member)
+
+    def test_not_an_ar_archive(self):
+        self.assertRaises(
+            DebFormatError, read_deb, self.writeDeb(b"DUMMY DATA"))
+
+    def test_malformed_member_header(self):
+        self.assertRaises(
+            DebFormatError, read_deb,
+            self.writeDeb(b"!<arch>\ndebian-binary/   garbage\n"))
+
+    def test_missing_members(self):
+        contents = read_deb(self.writeDeb(make_ar([
+            ("debian-binary", b"2.0\n")])))
+        self.assertEqual(["debian-binary"], contents.members)
+        self.assertIsNone(contents.control_member)
+        self.assertIsNone(contents.data_member)
+        self.assertIsNone(contents.control)
+
+    def test_corrupt_tarball(self):
+        # Corrupt tarballs are recorded rather than raised, so that the
+        # member layout can still be checked.
+        contents = read_deb(self.writeDeb(make_ar([
+            ("debian-binary", b"2.0\n"),
+            ("control.tar.gz", b"not gzip"),
+            ("data.tar.xz", b"not xz"),
+            ])))
+        self.assertEqual(
+            ["debian-binary", "control.tar.gz", "data.tar.xz"],
+            contents.members)
+        self.assertIsNotNone(contents.control_error)
+        self.assertIsNotNone(contents.data_error)
+
+    def test_empty_members(self):
+        # Empty tar members are reported as errors, not as missing members.
+        contents = read_deb(self.writeDeb(make_ar([
+            ("debian-binary", b""),
+            ("control.tar.xz", b""),
+            ("data.tar.gz", b""),
+            ])))
+        self.assertEqual("control.tar.xz", contents.control_member)
+        self.assertIsNotNone(contents.control_error)
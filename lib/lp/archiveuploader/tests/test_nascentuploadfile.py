@@ -433,9 +433,19 @@ class DebBinaryUploadFileTests(PackageUploadFileTestCase):
         uploadfile.parseControl(control)
         self.assertEqual([], list(uploadfile.verifyFormat()))
 
+    def test_verifyFormat_not_ar(self):
+        # verifyFormat rejects files that are not ar archives.
+        uploadfile = self.createDebBinaryUploadFile(
+            "foo_0.42_i386.deb", "main/python", "unknown", "mypkg", "0.42",
+            None)
+        self.assertEqual(
+            ["foo_0.42_i386.deb: 'ar t' invocation failed.",
+             " [ar output:] not an ar archive"],
+            ["".join(error.args) for error in uploadfile.verifyFormat()])
+
     def test_verifyDebTimestamp_SystemError(self):
-        # verifyDebTimestamp produces a reasonable error if we provoke a
-        # SystemError from apt_inst.DebFile.
+        # verifyDebTimestamp produces a reasonable error if the .deb lacks
+        # the expected top-level members.
         uploadfile = self.createDebBinaryUploadFile(
             "empty_0.1_all.deb", "main/admin", "extra", "empty", "0.1", None,
             members=[])
@@ -5,7 +5,9 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 
+import logging
 import os
+from Queue import Queue
 import shutil
 import subprocess
 import sys
@@ -14,6 +16,11 @@ import unittest
 
 from zope.component import getUtility
 
+from lp.archiveuploader.scripts.processupload import (
+    ProcessUpload,
+    UploadWorker,
+    verbosity_args,
+    )
 from lp.services.config import config
 from lp.services.scripts.interfaces.scriptactivity import IScriptActivitySet
 from lp.testing.layers import LaunchpadZopelessLayer
@@ -77,3 +84,54 @@ class TestProcessUpload(unittest.TestCase):
 
         # Explicitly mark the database dirty.
         self.layer.force_dirty_database()
+
+
+class TestProcessUploadWorkers(unittest.TestCase):
+    """Test the worker options of process-upload.py."""
+    layer = LaunchpadZopelessLayer
+
+    def makeScript(self, args):
+        return ProcessUpload(
+            "process-upload", test_args=args + ["/srv/upload"])
+
+    def test_verbosity_args(self):
+        self.assertEqual([], verbosity_args(logging.INFO))
+        self.assertEqual(["-v", "-v"], verbosity_args(logging.DEBUG - 1))
+        self.assertEqual(["-q"], verbosity_args(logging.WARNING))
+
+    def test_worker_lockfilename(self):
+        # Workers don't take the main lock, which their parent holds.
+        script = self.makeScript(["-C", "buildd"])
+        self.assertEqual("process-upload-buildd.lock", script.lockfilename)
+        script = self.makeScript(["-C", "buildd", "--worker"])
+        self.assertEqual(
+            "process-upload-buildd-worker-%d.lock" % os.getpid(),
+            script.lockfilename)
+
+    def test_getWorkerArgs(self):
+        script = self.makeScript(
+            ["-C", "buildd", "--builds", "-v", "--workers", "4"])
+        args = script.getWorkerArgs()
+        self.assertEqual(
+            ["--worker", "-C", "buildd", "-d", "ubuntu", "-v", "--builds",
+             "/srv/upload"],
+            args[2:])
+        worker = ProcessUpload("process-upload", test_args=args[2:])
+        self.assertTrue(worker.options.worker)
+        self.assertTrue(worker.options.builds)
+
+    def test_UploadWorker(self):
+        # An UploadWorker reports each upload its process has finished,
+        # and the process's exit once it is closed.
+        results = Queue()
+        worker = UploadWorker(
+            [sys.executable, "-c",
+             "import sys\n"
+             "for line in iter(sys.stdin.readline, ''):\n"
+             "    sys.stdout.write(line)\n"
+             "    sys.stdout.flush()\n"],
+            results)
+        worker.submit("leaf")
+        self.assertEqual((worker, None), results.get(timeout=30))
+        worker.close()
+        self.assertEqual((worker, 0), results.get(timeout=30))
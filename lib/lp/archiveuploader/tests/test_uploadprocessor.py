@@ -12,6 +12,7 @@ __all__ = [
     ]
 
 import os
+from Queue import Queue
 import shutil
 from StringIO import StringIO
 import tempfile
@@ -2556,6 +2557,169 @@ class TestUploadHandler(TestUploadProcessorBase):
             shutil.rmtree(testdir)
 
 
+class FakeWorker:
+    """A fake worker process that finishes each upload straight away."""
+
+    def __init__(self, results, running, returncodes):
+        self.results = results
+        self.running = running
+        self.returncodes = returncodes
+        self.uploads = []
+        self.closed = False
+
+    def submit(self, upload):
+        self.uploads.append(upload)
+        self.running.append(upload)
+        self.results.put((self, self.returncodes.get(upload)))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeResults(Queue):
+    """A queue of worker results that notes when each upload is done."""
+
+    def __init__(self, running):
+        Queue.__init__(self)
+        self.running = running
+
+    def get(self):
+        worker, returncode = Queue.get(self)
+        self.running.remove(worker.uploads[-1])
+        return worker, returncode
+
+
+class TestParallelUploadQueue(TestUploadProcessorBase):
+    """Tests for `UploadProcessor.processUploadQueueInParallel`."""
+
+    def setUp(self):
+        super(TestParallelUploadQueue, self).setUp()
+        self.workers = []
+        self.running = []
+        self.started = []
+        self.concurrency = []
+        self.returncodes = {}
+        self.useFixture(MonkeyPatch(
+            'lp.archiveuploader.uploadprocessor.Queue',
+            lambda: FakeResults(self.running)))
+
+    def queueUploads(self, archive_keys):
+        """Queue empty uploads with the given archive keys."""
+        for upload in archive_keys:
+            os.mkdir(os.path.join(self.incoming_folder, upload))
+        self.useFixture(MonkeyPatch(
+            'lp.archiveuploader.uploadprocessor.UploadHandler.'
+            'getArchiveKeys',
+            lambda handler: archive_keys[handler.upload]))
+
+    def startWorker(self, results):
+        test = self
+
+        class RecordingWorker(FakeWorker):
+            def submit(self, upload):
+                test.started.append(upload)
+                super(RecordingWorker, self).submit(upload)
+                test.concurrency.append(sorted(test.running))
+
+        worker = RecordingWorker(results, self.running, self.returncodes)
+        self.workers.append(worker)
+        return worker
+
+    def processQueue(self, workers, workers_per_archive=1):
+        processor = self.getUploadProcessor(self.layer.txn)
+        processor.processUploadQueueInParallel(
+            self.startWorker, workers,
+            workers_per_archive=workers_per_archive)
+
+    def test_limits_workers(self):
+        self.queueUploads({"a": set([1]), "b": set([2]), "c": set([3])})
+        self.processQueue(2)
+        self.assertEqual(["a", "b", "c"], self.started)
+        self.assertEqual(2, max(len(running) for running in self.concurrency))
+        self.assertEqual([], self.running)
+
+    def test_reuses_workers(self):
+        # Workers are started once and given one upload after another.
+        self.queueUploads(
+            dict((upload, set([upload])) for upload in "abcde"))
+        self.processQueue(2)
+        self.assertEqual(2, len(self.workers))
+        self.assertEqual(
+            ["a", "b", "c", "d", "e"],
+            sorted(sum((worker.uploads for worker in self.workers), [])))
+        self.assertTrue(all(worker.closed for worker in self.workers))
+
+    def test_limits_workers_per_archive(self):
+        # A later upload to another archive can overtake an earlier
+        # upload that is waiting for its archive.
+        self.queueUploads({"a": set([1]), "b": set([1]), "c": set([2])})
+        self.processQueue(3)
+        self.assertEqual(["a", "c", "b"], self.started)
+        for running in self.concurrency:
+            self.assertFalse("a" in running and "b" in running)
+
+    def test_workers_per_archive(self):
+        self.queueUploads({"a": set([1]), "b": set([1]), "c": set([1])})
+        self.processQueue(3, workers_per_archive=2)
+        self.assertEqual(2, max(len(running) for running in self.concurrency))
+
+    def test_failed_worker_is_logged_and_replaced(self):
+        self.queueUploads({"a": set([1]), "b": set([2])})
+        self.returncodes["a"] = 1
+        self.processQueue(1)
+        self.assertEqual(["a", "b"], self.started)
+        self.assertEqual(2, len(self.workers))
+        self.assertLogContains("Worker for upload a exited with status 1")
+
+    def test_skips_uploads_without_builds(self):
+        # Build uploads whose builds can't be found are skipped, as with
+        # serial processing.
+        os.mkdir(os.path.join(self.incoming_folder, "bar"))
+        processor = self.getUploadProcessor(self.layer.txn, builds=True)
+        processor.processUploadQueueInParallel(self.startWorker, 2)
+        self.assertEqual([], self.workers)
+        self.assertEqual([], self.started)
+        self.assertLogContains(
+            "Unable to extract build id from leaf name bar, skipping.")
+
+    def test_getArchiveKeys(self):
+        processor = self.getUploadProcessor(self.layer.txn)
+        self.queueUpload("bar_1.0-1", relative_path="ubuntu")
+        self.queueUpload(
+            "bar_1.0-1", relative_path="nonexistent", queue_entry="bad")
+        ubuntu = getUtility(IDistributionSet).getByName("ubuntu")
+        self.assertEqual(
+            set([ubuntu.main_archive.id]),
+            UploadHandler(
+                processor, self.incoming_folder, "bar_1.0-1").getArchiveKeys())
+        self.assertEqual(
+            set([None]),
+            UploadHandler(
+                processor, self.incoming_folder, "bad").getArchiveKeys())
+
+    def test_getArchiveKeys_builds(self):
+        # Uploads from builds of different packages to the same archive
+        # don't hold each other up; builds of the same source package do.
+        processor = self.getUploadProcessor(self.layer.txn, builds=True)
+        archive = self.factory.makeArchive()
+        spr = self.factory.makeSourcePackageRelease(archive=archive)
+        builds = [
+            self.factory.makeBinaryPackageBuild(
+                source_package_release=spr, archive=archive),
+            self.factory.makeBinaryPackageBuild(
+                source_package_release=spr, archive=archive),
+            self.factory.makeBinaryPackageBuild(archive=archive),
+            self.factory.makeSourcePackageRecipeBuild(archive=archive),
+            ]
+        keys = [
+            BuildUploadHandler(
+                processor, self.incoming_folder, "leaf",
+                build).getArchiveKeys()
+            for build in builds]
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(3, len(set(frozenset(key) for key in keys)))
+
+
 class ParseBuildUploadLeafNameTests(TestCase):
     """Tests for parse_build_upload_leaf_name."""
 
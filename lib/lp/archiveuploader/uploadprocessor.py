@@ -47,8 +47,10 @@ above, failed being worst).
 
 __metaclass__ = type
 
+from collections import defaultdict
 import os
 import shutil
+from Queue import Queue
 import sys
 
 import scandir
@@ -84,6 +86,7 @@ from lp.soyuz.interfaces.archive import (
     IArchiveSet,
     NoSuchPPA,
     )
+from lp.soyuz.interfaces.binarypackagebuild import IBinaryPackageBuild
 from lp.soyuz.interfaces.livefsbuild import ILiveFSBuild
 
 
@@ -175,33 +178,142 @@ class UploadProcessor:
         """
         try:
             self.log.debug("Beginning processing")
-
-            for subdir in ["incoming", "accepted", "rejected", "failed"]:
-                full_subdir = os.path.join(self.base_fsroot, subdir)
-                if not os.path.exists(full_subdir):
-                    self.log.debug("Creating directory %s" % full_subdir)
-                    os.mkdir(full_subdir)
-
-            fsroot = os.path.join(self.base_fsroot, "incoming")
-            uploads_to_process = self.locateDirectories(fsroot)
-            self.log.debug("Checked in %s, found %s"
-                           % (fsroot, uploads_to_process))
+            fsroot, uploads_to_process = self._prepareQueue()
             for upload in uploads_to_process:
                 self.log.debug("Considering upload %s" % upload)
                 if leaf_name is not None and upload != leaf_name:
                     self.log.debug("Skipping %s -- does not match %s" % (
                         upload, leaf_name))
                     continue
+                self._processUpload(fsroot, upload)
+        finally:
+            self.log.debug("Rolling back any remaining transactions.")
+            self.ztm.abort()
+
+    def processSingleUpload(self, leaf_name):
+        """Process the upload called `leaf_name` in the 'incoming' directory.
+
+        This is what the workers started by `processUploadQueueInParallel`
+        do with each upload they are given.  Unlike `processUploadQueue`,
+        it doesn't look at the rest of the queue.
+        """
+        try:
+            fsroot = os.path.join(self.base_fsroot, "incoming")
+            if not os.path.isdir(os.path.join(fsroot, leaf_name)):
+                self.log.debug("Skipping %s -- no longer queued" % leaf_name)
+                return
+            self._processUpload(fsroot, leaf_name)
+        finally:
+            self.log.debug("Rolling back any remaining transactions.")
+            self.ztm.abort()
+
+    def _processUpload(self, fsroot, upload):
+        try:
+            handler = UploadHandler.forProcessor(self, fsroot, upload)
+        except CannotGetBuild as e:
+            self.log.warn(e)
+        else:
+            handler.process()
+
+    def _prepareQueue(self):
+        """Create the queue directories if necessary, and find uploads.
+
+        :return: A tuple of the 'incoming' directory and a sorted list of
+            the upload directories in it.
+        """
+        for subdir in ["incoming", "accepted", "rejected", "failed"]:
+            full_subdir = os.path.join(self.base_fsroot, subdir)
+            if not os.path.exists(full_subdir):
+                self.log.debug("Creating directory %s" % full_subdir)
+                os.mkdir(full_subdir)
+
+        fsroot = os.path.join(self.base_fsroot, "incoming")
+        uploads_to_process = self.locateDirectories(fsroot)
+        self.log.debug("Checked in %s, found %s"
+                       % (fsroot, uploads_to_process))
+        return fsroot, uploads_to_process
+
+    def processUploadQueueInParallel(self, start_worker, workers,
+                                     workers_per_archive=1):
+        """Search for uploads, and process them in worker processes.
+
+        Uploads are handed out to a pool of long-lived worker processes,
+        so that independent uploads (such as build uploads during a mass
+        rebuild) don't have to wait for a slow one.  The workers move the
+        uploads to the 'accepted', 'rejected' or 'failed' directories
+        exactly as `processUploadQueue` would.
+
+        :param start_worker: A callable taking a `Queue`, which starts a
+            worker process and returns an object with `submit(upload)` and
+            `close()` methods.  `submit` asks the worker to process the
+            named upload directory using `processSingleUpload`; `close`
+            tells it to exit once it is idle, and waits for it to do so.
+            The worker must put `(worker, None)` on the queue each time it
+            finishes an upload, and `(worker, returncode)` if it exits.
+        :param workers: The maximum number of worker processes.
+        :param workers_per_archive: The maximum number of uploads with the
+            same key from `UploadHandler.getArchiveKeys` to process at
+            once, so that uploads that might touch the same files in an
+            archive can be kept from racing with each other.
+        """
+        try:
+            self.log.debug("Beginning parallel processing")
+            fsroot, uploads_to_process = self._prepareQueue()
+            pending = []
+            for upload in uploads_to_process:
                 try:
                     handler = UploadHandler.forProcessor(self, fsroot, upload)
                 except CannotGetBuild as e:
                     self.log.warn(e)
                 else:
-                    handler.process()
+                    pending.append((upload, handler.getArchiveKeys()))
         finally:
-            self.log.debug("Rolling back any remaining transactions.")
+            # Don't hold a transaction open while the workers run.
             self.ztm.abort()
 
+        results = Queue()
+        idle = [
+            start_worker(results)
+            for i in range(min(workers, len(pending)))]
+        busy = {}
+        archive_workers = defaultdict(int)
+        try:
+            while pending or busy:
+                for item in list(pending):
+                    if not idle:
+                        break
+                    upload, archive_keys = item
+                    if any(archive_workers[key] >= workers_per_archive
+                           for key in archive_keys):
+                        continue
+                    pending.remove(item)
+                    self.log.debug("Handing upload %s to a worker" % upload)
+                    worker = idle.pop(0)
+                    busy[worker] = item
+                    for key in archive_keys:
+                        archive_workers[key] += 1
+                    worker.submit(upload)
+                worker, returncode = results.get()
+                item = busy.pop(worker, None)
+                if item is not None:
+                    for key in item[1]:
+                        archive_workers[key] -= 1
+                if returncode is None:
+                    idle.append(worker)
+                    continue
+                # The worker exited; replace it if there is more to do.
+                if worker in idle:
+                    idle.remove(worker)
+                if item is not None:
+                    self.log.warn(
+                        "Worker for upload %s exited with status %d" %
+                        (item[0], returncode))
+                if pending and len(idle) + len(busy) < workers:
+                    idle.append(start_worker(results))
+        finally:
+            for worker in idle + busy.keys():
+                worker.close()
+
     def locateDirectories(self, fsroot):
         """Return a list of upload directories in a given queue.
 
@@ -477,6 +589,26 @@ class UploadHandler:
             (self.upload_path, target_path))
         shutil.move(self.upload_path, target_path)
 
+    def getArchiveKeys(self):
+        """Return keys for the parts of archives that this upload targets.
+
+        This is used to limit how many uploads that might touch the same
+        files are processed concurrently.  User uploads are keyed by the
+        IDs of their target archives.  Uploads whose target can't be
+        determined are all treated as targeting the same unknown archive,
+        None.
+        """
+        archive_keys = set()
+        for changes_file in self.locateChangesFiles():
+            try:
+                _, _, archive = parse_upload_path(
+                    os.path.dirname(changes_file))
+            except (UploadPathError, PPAUploadPathError):
+                archive_keys.add(None)
+            else:
+                archive_keys.add(archive.id)
+        return archive_keys or set([None])
+
     @staticmethod
     def orderFilenames(fnames):
         """Order filenames, sorting *_source.changes before others.
@@ -566,6 +698,23 @@ class BuildUploadHandler(UploadHandler):
     def _getPolicyForDistro(self, distribution):
         return self.processor._getPolicyForDistro(distribution, self.build)
 
+    def getArchiveKeys(self):
+        """See `UploadHandler`.
+
+        Uploads from different builds don't touch the same files, except
+        for binary package builds of the same source package, which may
+        all publish its architecture-independent binaries.  So only those
+        are keyed alike.
+        """
+        if self.build is None:
+            return set([None])
+        if IBinaryPackageBuild.providedBy(self.build):
+            source_package_name = (
+                self.build.source_package_release.sourcepackagename)
+            return set([(self.build.archive.id, source_package_name.id)])
+        return set([
+            (self.build.archive.id, self.build.job_type, self.build.id)])
+
     def _processUpload(self, upload):
         upload.process(self.build)
 
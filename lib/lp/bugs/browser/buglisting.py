@@ -724,7 +724,8 @@ class BugListingBatchNavigator(TableBatchNavigator):
         self.field_visibility = None
         self._setFieldVisibility()
         TableBatchNavigator.__init__(
-            self, tasks, request, columns_to_show=columns_to_show, size=size)
+            self, tasks, request, columns_to_show=columns_to_show, size=size,
+            keyset=True)
 
     @cachedproperty
     def bug_badge_properties(self):
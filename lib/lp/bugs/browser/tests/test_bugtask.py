@@ -2055,7 +2055,10 @@ class TestBugTaskSearchListingView(BrowserTestCase):
         self.factory.makeBugTask(target=task.target)
         view = self.makeView(task, size=1)
         cache = IJSONRequestCache(view.request)
-        self.assertEqual({'memo': '1', 'start': 1}, cache.objects.get('next'))
+        # Bug listings are batched by their sort keys.
+        memo = simplejson.dumps(
+            [task.importance.value, task.bug.id, task.id])
+        self.assertEqual({'memo': memo, 'start': 1}, cache.objects.get('next'))
 
     def test_prev_for_multiple_batch(self):
         """The IJSONRequestCache should contain data about the next batch.
@@ -2428,6 +2431,19 @@ class TestBugListingBatchNavigator(TestCaseWithFactory):
         self.assertNotIn('<', navigator.mustache_listings)
         self.assertNotIn('>', navigator.mustache_listings)
 
+    def test_batches_by_sort_keys(self):
+        # Bug listings are batched by their sort keys, even if keyset
+        # batching is turned off elsewhere.
+        self.pushConfig('launchpad', keyset_batching=False)
+        task = self.factory.makeBugTask()
+        self.factory.makeBugTask(target=task.target)
+        navigator = BugListingBatchNavigator(
+            task.target.searchTasks(None), LaunchpadTestRequest(), [], 1)
+        self.assertEqual([task], list(navigator.currentBatch()))
+        self.assertEqual(
+            [task.importance.value, task.bug.id, task.id],
+            simplejson.loads(navigator.batch.nextBatch().range_memo))
+
 
 class TestBugTaskListingItem(TestCaseWithFactory):
 
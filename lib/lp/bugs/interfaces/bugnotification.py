@@ -84,7 +84,11 @@ class IBugNotificationSet(Interface):
         `BugNotificationRecipient` objects.
         """
 
-    def getRecipientFilterData(bug, recipient_to_sources, notifications):
+    def getMutedPersonIds(bug):
+        """Return the set of IDs of the people who have muted `bug`."""
+
+    def getRecipientFilterData(bug, recipient_to_sources, notifications,
+                               muted_person_ids=None):
         """Get non-muted recipients mapped to sources & filter descriptions.
 
         :param bug:
@@ -94,6 +98,8 @@ class IBugNotificationSet(Interface):
             (BugNotificationRecipients) that represent the subscriptions that
             caused the notifications to be sent.
         :param notifications: the notifications that are being communicated.
+        :param muted_person_ids: the IDs of the people who have muted the
+            bug, if already known; otherwise they are looked up.
 
         The dict of recipients may have fewer recipients than were
         provided if those users muted all of the subscription filters
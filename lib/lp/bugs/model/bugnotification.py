@@ -194,18 +194,20 @@ class BugNotificationSet:
 
         return bug_notification
 
+    def getMutedPersonIds(self, bug):
+        """Return the IDs of the people who have muted `bug`."""
+        from lp.bugs.model.bug import BugMute
+        return set(IStore(BugMute).find(BugMute.person_id, BugMute.bug == bug))
+
     def getRecipientFilterData(self, bug, recipient_to_sources,
-                               notifications):
+                               notifications, muted_person_ids=None):
         """See `IBugNotificationSet`."""
         if not notifications or not recipient_to_sources:
             # This is a shortcut that will remove some error conditions.
             return {}
         # Collect bug mute information.
-        from lp.bugs.model.bug import BugMute
-        store = IStore(BugMute)
-        muted_person_ids = set(list(
-            store.find(BugMute.person_id,
-                       BugMute.bug == bug)))
+        if muted_person_ids is None:
+            muted_person_ids = self.getMutedPersonIds(bug)
         # This makes two calls to the database to get all the
         # information we need. The first call gets the filter ids and
         # descriptions for each recipient, and then we divide up the
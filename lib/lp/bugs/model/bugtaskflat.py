@@ -27,18 +27,18 @@ class BugTaskFlat(Storm):
 
     bugtask_id = Int(name='bugtask', primary=True)
     bugtask = Reference(bugtask_id, 'BugTask.id')
-    bug_id = Int(name='bug')
+    bug_id = Int(name='bug', allow_none=False)
     bug = Reference(bug_id, 'Bug.id')
     datecreated = DateTime()
     latest_patch_uploaded = DateTime()
     date_closed = DateTime()
-    date_last_updated = DateTime()
+    date_last_updated = DateTime(allow_none=False)
     duplicateof_id = Int(name='duplicateof')
     duplicateof = Reference(duplicateof_id, 'Bug.id')
-    bug_owner_id = Int(name='bug_owner')
+    bug_owner_id = Int(name='bug_owner', allow_none=False)
     bug_owner = Reference(bug_owner_id, 'Person.id')
-    information_type = EnumCol(enum=InformationType)
-    heat = Int()
+    information_type = EnumCol(enum=InformationType, notNull=True)
+    heat = Int(allow_none=False)
     product_id = Int(name='product')
     product = Reference(product_id, 'Product.id')
     productseries_id = Int(name='productseries')
@@ -50,14 +50,15 @@ class BugTaskFlat(Storm):
     sourcepackagename_id = Int(name='sourcepackagename')
     sourcepackagename = Reference(
         sourcepackagename_id, 'SourcePackageName.id')
-    status = EnumCol(schema=(BugTaskStatus, BugTaskStatusSearch))
-    importance = EnumCol(schema=BugTaskImportance)
+    status = EnumCol(
+        schema=(BugTaskStatus, BugTaskStatusSearch), notNull=True)
+    importance = EnumCol(schema=BugTaskImportance, notNull=True)
     assignee_id = Int(name='assignee')
     assignee = Reference(assignee_id, 'Person.id')
     milestone_id = Int(name='milestone')
     milestone = Reference(milestone_id, 'Milestone.id')
-    owner_id = Int(name='owner')
+    owner_id = Int(name='owner', allow_none=False)
     owner = Reference(owner_id, 'Person.id')
-    active = Bool()
+    active = Bool(allow_none=False)
     access_grants = List(type=Int())
     access_policies = List(type=Int())
@@ -207,19 +207,21 @@ def search_bugs(pre_iter_hook, alternatives, just_bug_ids=False):
     orderby_expression, orderby_joins = _process_order_by(alternatives[0])
     decorators = []
 
-    # Normally we just return the ID -- the DecoratedResultSet will turn
-    # it into the actual BugTask. But the caller can also request to
+    # Normally we return the BugTaskFlat rows -- the DecoratedResultSet
+    # will turn them into the actual BugTasks, and the rows' sort keys let
+    # batch navigators batch by them. But the caller can also request to
     # just get the bug IDs back, in which case we don't use DRS.
     start = BugTaskFlat
     if just_bug_ids:
         want = BugTaskFlat.bug_id
     else:
-        want = BugTaskFlat.bugtask_id
-        decorators.append(lambda id: IStore(BugTask).get(BugTask, id))
+        want = BugTaskFlat
+        decorators.append(
+            lambda flat: IStore(BugTask).get(BugTask, flat.bugtask_id))
         orig_pre_iter_hook = pre_iter_hook
 
         def pre_iter_hook(rows):
-            rows = load(BugTask, rows)
+            rows = load(BugTask, [flat.bugtask_id for flat in rows])
             if orig_pre_iter_hook:
                 orig_pre_iter_hook(rows)
 
@@ -824,13 +826,17 @@ def _process_order_by(params):
 
     if ambiguous:
         if in_unique_context:
-            disambiguator = BugTaskFlat.bug_id
+            # The bug ID is unique here, but also sorting by the BugTask
+            # ID, which doesn't change the order, lets batch navigators
+            # batch by the sort keys.
+            disambiguators = [BugTaskFlat.bug_id, BugTaskFlat.bugtask_id]
         else:
-            disambiguator = BugTaskFlat.bugtask_id
+            disambiguators = [BugTaskFlat.bugtask_id]
 
         if orderby_arg and not isinstance(orderby_arg[0], Desc):
-            disambiguator = Desc(disambiguator)
-        orderby_arg.append(disambiguator)
+            disambiguators = [
+                Desc(disambiguator) for disambiguator in disambiguators]
+        orderby_arg.extend(disambiguators)
 
     return tuple(orderby_arg), extra_joins
 
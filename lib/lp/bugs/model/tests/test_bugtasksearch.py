@@ -127,9 +127,11 @@ class TestProcessOrderBy(TestCase):
         # The tiebreaker is Bug.id if the context is unique, so we'll
         # find no more than a single task for each bug. This applies to
         # searches within a product, distribution source package, or
-        # source package.
+        # source package. BugTask.id follows it so that the results can
+        # be batched by their sort keys.
         self.assertOrderForParams(
-            'BugTaskFlat.importance DESC, BugTaskFlat.bug',
+            'BugTaskFlat.importance DESC, BugTaskFlat.bug, '
+            'BugTaskFlat.bugtask',
             orderby='-importance',
             product='foo')
 
@@ -137,7 +139,8 @@ class TestProcessOrderBy(TestCase):
         # If the context can have multiple tasks for a single bug, we
         # still use BugTask.id.
         self.assertOrderForParams(
-            'BugTaskFlat.importance DESC, BugTaskFlat.bug',
+            'BugTaskFlat.importance DESC, BugTaskFlat.bug, '
+            'BugTaskFlat.bugtask',
             orderby='-importance',
             distribution='foo')
 
@@ -6,9 +6,11 @@
 __metaclass__ = type
 
 __all__ = [
+    "BugNotificationRecipientCache",
     "construct_email_notifications",
     "get_email_notifications",
     "process_deferred_notifications",
+    "requeue_notifications",
     ]
 
 from itertools import groupby
@@ -30,12 +32,18 @@ from lp.bugs.mail.bugnotificationbuilder import (
     BugNotificationBuilder,
     get_bugmail_from_address,
     )
+from lp.bugs.mail.bugnotificationrecipients import BugNotificationRecipients
 from lp.bugs.mail.newbug import generate_bug_add_email
 from lp.registry.model.person import get_recipients
 from lp.services.database.constants import UTC_NOW
 from lp.services.mail.helpers import get_email_template
 from lp.services.mail.mailwrapper import MailWrapper
-from lp.services.mail.sendmail import sendmail
+from lp.services.mail.sendmail import (
+    get_pooled_smtp_delivery,
+    sendmail,
+    sendmail_many,
+    set_immediate_mail_delivery,
+    )
 from lp.services.scripts.base import LaunchpadCronScript
 from lp.services.scripts.logger import log
 from lp.services.webapp import canonical_url
@@ -76,12 +84,75 @@ def get_activity_key(notification):
         return key
 
 
-def construct_email_notifications(bug_notifications):
+class BugNotificationRecipientCache:
+    """Memoize recipient computations across notification batches.
+
+    Consecutive batches in one run are often for the same bug, or for
+    bugs whose targets share the same structural subscribers, so the
+    same team expansions and bug mutes would otherwise be looked up again
+    for every batch.  Only these are cached: which structural
+    subscription filters match depends on the changes in each batch, so
+    filter matches and the resulting recipients are still worked out
+    for every batch.
+
+    A cache should only live for a single run.  `get_email_notifications`
+    drops the mutes of each bug once it moves on to the next one, so a
+    mute is at most as old as the first batch for its bug; team
+    memberships that change during a run take effect on the next run.
+    Anything computed in a transaction that is aborted must be dropped
+    with `invalidate`.
+    """
+
+    def __init__(self):
+        self._recipients = {}
+        self._muted_person_ids = {}
+
+    def getRecipients(self, person):
+        """Return the people who get email for `person`.
+
+        See `lp.registry.model.person.get_recipients`.
+        """
+        recipients = self._recipients.get(person.id)
+        if recipients is None:
+            recipients = list(get_recipients(person))
+            self._recipients[person.id] = recipients
+        return recipients
+
+    def getMutedPersonIds(self, bug):
+        """Return the IDs of the people who have muted `bug`."""
+        muted_person_ids = self._muted_person_ids.get(bug.id)
+        if muted_person_ids is None:
+            muted_person_ids = getUtility(
+                IBugNotificationSet).getMutedPersonIds(bug)
+            self._muted_person_ids[bug.id] = muted_person_ids
+        return muted_person_ids
+
+    def invalidate(self, bug=None, person=None):
+        """Forget cached data for `bug` and/or `person`.
+
+        With no arguments, forget everything.  Since team expansions are
+        transitive, invalidating any person drops all cached expansions.
+        """
+        if bug is None and person is None:
+            self._recipients.clear()
+            self._muted_person_ids.clear()
+        if bug is not None:
+            self._muted_person_ids.pop(bug.id, None)
+        if person is not None:
+            self._recipients.clear()
+
+
+def construct_email_notifications(bug_notifications, recipient_cache=None):
     """Construct an email from a list of related bug notifications.
 
     The person and bug has to be the same for all notifications, and
     there can be only one comment.
+
+    :param recipient_cache: A `BugNotificationRecipientCache` to share
+        recipient computations with other batches in the same run.
     """
+    if recipient_cache is None:
+        recipient_cache = BugNotificationRecipientCache()
     first_notification = bug_notifications[0]
     bug = first_notification.bug
     actor = first_notification.message.owner
@@ -119,7 +190,7 @@ def construct_email_notifications(bug_notifications):
             # We will report this notification.
             filtered_notifications.append(notification)
             for subscription_source in notification.recipients:
-                for recipient in get_recipients(
+                for recipient in recipient_cache.getRecipients(
                     subscription_source.person):
                     # The subscription_source.person may be a person or a
                     # team.  The get_recipients function gives us everyone
@@ -188,7 +259,8 @@ def construct_email_notifications(bug_notifications):
     from_address = get_bugmail_from_address(actor, bug)
     bug_notification_builder = BugNotificationBuilder(bug, actor)
     recipients = getUtility(IBugNotificationSet).getRecipientFilterData(
-        bug, recipients, filtered_notifications)
+        bug, recipients, filtered_notifications,
+        muted_person_ids=recipient_cache.getMutedPersonIds(bug))
     sorted_recipients = sorted(
         recipients.items(), key=lambda t: t[0].preferredemail.email)
 
@@ -288,7 +360,7 @@ def notification_batches(notifications):
             yield [notification for (comment_group, notification) in batch]
 
 
-def get_email_notifications(bug_notifications):
+def get_email_notifications(bug_notifications, recipient_cache=None):
     """Return the email notifications pending to be sent.
 
     The intention of this code is to ensure that as many notifications
@@ -297,18 +369,34 @@ def get_email_notifications(bug_notifications):
         - Must share the same owner.
         - Must be related to the same bug.
         - Must contain at most one comment.
+
+    Recipient computations are shared between batches through
+    `recipient_cache`, which defaults to a new
+    `BugNotificationRecipientCache`.
     """
+    if recipient_cache is None:
+        recipient_cache = BugNotificationRecipientCache()
+    previous_bug = None
     for batch in notification_batches(bug_notifications):
+        bug = batch[0].bug
+        if previous_bug is not None and bug != previous_bug:
+            # Notifications are ordered by bug, so the mutes of the
+            # previous bug won't be needed again.
+            recipient_cache.invalidate(bug=previous_bug)
+        previous_bug = bug
         # We don't want bugs preventing all bug notifications from
         # being sent, so catch and log all exceptions.
         try:
-            yield construct_email_notifications(batch)
+            yield construct_email_notifications(
+                batch, recipient_cache=recipient_cache)
         except (KeyboardInterrupt, SystemExit, GeneratorExit):
             raise
         except:
             log.exception("Error while building email notifications.")
             transaction.abort()
             transaction.begin()
+            # Don't trust anything computed in the aborted transaction.
+            recipient_cache.invalidate()
 
 
 def process_deferred_notifications(bug_notifications):
@@ -339,52 +427,153 @@ def process_deferred_notifications(bug_notifications):
             activity=activity)
 
 
+def requeue_notifications(bug_notifications, addresses,
+                          recipient_cache=None):
+    """Queue `bug_notifications` again, for some of their recipients only.
+
+    This is used when the messages for a batch of notifications could be
+    sent to some recipients but not to others.  New pending notifications
+    are added for the people at `addresses`, so that the batch can be
+    recorded as sent without mailing anyone twice.
+
+    :param addresses: The email addresses of the recipients to notify.
+    :param recipient_cache: A `BugNotificationRecipientCache`.
+    """
+    if recipient_cache is None:
+        recipient_cache = BugNotificationRecipientCache()
+    bug_notification_set = getUtility(IBugNotificationSet)
+    for notification in bug_notifications:
+        recipients = BugNotificationRecipients()
+        for subscription_source in notification.recipients:
+            for recipient in recipient_cache.getRecipients(
+                subscription_source.person):
+                if recipient.preferredemail.email in addresses:
+                    # Keep the reason that the original message gave.
+                    recipients.add(
+                        recipient, subscription_source.reason_body,
+                        subscription_source.reason_header)
+        recipients.subscription_filters.update(notification.bug_filters)
+        bug_notification_set.addNotification(
+            bug=notification.bug, is_comment=notification.is_comment,
+            message=notification.message, recipients=recipients,
+            activity=notification.activity)
+
+
 class SendBugNotifications(LaunchpadCronScript):
+
+    def add_my_options(self):
+        self.parser.add_option(
+            "--bulk-delivery", dest="bulk_delivery", action="store_true",
+            default=False,
+            help="Send each batch of notifications concurrently over a "
+                 "pool of persistent SMTP connections.")
+
+    def reportDeliveryFailure(self, message, exc_info):
+        """Log an OOPS for a message that could not be sent."""
+        request = ScriptRequest([
+            ("script_name", self.name),
+            ("path", sys.argv[0]),
+            ])
+        error_utility = getUtility(IErrorReportingUtility)
+        oops_vars = {
+            "message_id": message.get("Message-Id"),
+            "notification_type": "bug",
+            "recipient": message["To"],
+            "subject": message["Subject"],
+            }
+        with error_utility.oopsMessage(oops_vars):
+            error_utility.raising(exc_info, request)
+        self.logger.info(request.oopsid)
+
+    def sendMessages(self, bug_notifications, messages):
+        """Send the messages for one batch of notifications.
+
+        :return: True if all the messages were sent.
+        """
+        for message in messages:
+            try:
+                self.logger.info("Notifying %s about bug %d." % (
+                    message['To'], bug_notifications[0].bug.id))
+                sendmail(message)
+                self.logger.debug(message.as_string())
+            except SMTPException:
+                self.reportDeliveryFailure(message, sys.exc_info())
+                return False
+        return True
+
+    def sendMessagesInBulk(self, bug_notifications, messages):
+        """Send the messages for one batch of notifications at once.
+
+        :return: The email addresses of the recipients whose messages
+            could not be sent.
+        """
+        for message in messages:
+            self.logger.info("Notifying %s about bug %d." % (
+                message['To'], bug_notifications[0].bug.id))
+        failures = sendmail_many(messages, delivery=self.smtp_delivery)
+        for message, exc_info in failures:
+            self.reportDeliveryFailure(message, exc_info)
+        failed = set(id(message) for message, _ in failures)
+        for message in messages:
+            if id(message) not in failed:
+                self.logger.debug(message.as_string())
+        return set(message['To'] for message, _ in failures)
+
+    def markBatchSent(self, bug_notifications, omitted_notifications):
+        for notification in bug_notifications:
+            notification.date_emailed = UTC_NOW
+            notification.status = BugNotificationStatus.SENT
+        for notification in omitted_notifications:
+            notification.date_emailed = UTC_NOW
+            notification.status = BugNotificationStatus.OMITTED
+
     def main(self):
+        if self.options.bulk_delivery:
+            set_immediate_mail_delivery(True)
+            # Reuse the same SMTP connections for every batch.
+            self.smtp_delivery = get_pooled_smtp_delivery()
+            try:
+                self.sendNotifications()
+            finally:
+                self.smtp_delivery.close()
+        else:
+            self.sendNotifications()
+
+    def sendNotifications(self):
         notifications_sent = False
         bug_notification_set = getUtility(IBugNotificationSet)
         deferred_notifications = \
             bug_notification_set.getDeferredNotifications()
         process_deferred_notifications(deferred_notifications)
+        recipient_cache = BugNotificationRecipientCache()
         pending_notifications = get_email_notifications(
-            bug_notification_set.getNotificationsToSend())
+            bug_notification_set.getNotificationsToSend(),
+            recipient_cache=recipient_cache)
         for (bug_notifications,
              omitted_notifications,
              messages) in pending_notifications:
-            try:
-                for message in messages:
-                    try:
-                        self.logger.info("Notifying %s about bug %d." % (
-                            message['To'], bug_notifications[0].bug.id))
-                        sendmail(message)
-                        self.logger.debug(message.as_string())
-                    except SMTPException:
-                        request = ScriptRequest([
-                            ("script_name", self.name),
-                            ("path", sys.argv[0]),
-                            ])
-                        error_utility = getUtility(IErrorReportingUtility)
-                        oops_vars = {
-                            "message_id": message.get("Message-Id"),
-                            "notification_type": "bug",
-                            "recipient": message["To"],
-                            "subject": message["Subject"],
-                            }
-                        with error_utility.oopsMessage(oops_vars):
-                            error_utility.raising(sys.exc_info(), request)
-                        self.logger.info(request.oopsid)
-                        self.txn.abort()
-                        # Re-raise to get out of this loop and go to the
-                        # next iteration of the outer loop.
-                        raise
-            except SMTPException:
+            if self.options.bulk_delivery:
+                failed_addresses = self.sendMessagesInBulk(
+                    bug_notifications, messages)
+                if failed_addresses:
+                    # The other recipients already have their messages,
+                    # so retrying the whole batch would mail them again.
+                    # Split off the failed recipients into new pending
+                    # notifications to be retried on the next run.
+                    requeue_notifications(
+                        bug_notifications, failed_addresses,
+                        recipient_cache=recipient_cache)
+                self.markBatchSent(bug_notifications, omitted_notifications)
+                notifications_sent = True
+                self.txn.commit()
+                continue
+            if not self.sendMessages(bug_notifications, messages):
+                # Leave the whole batch pending so that it is retried on
+                # the next run.
+                self.txn.abort()
+                recipient_cache.invalidate()
                 continue
-            for notification in bug_notifications:
-                notification.date_emailed = UTC_NOW
-                notification.status = BugNotificationStatus.SENT
-            for notification in omitted_notifications:
-                notification.date_emailed = UTC_NOW
-                notification.status = BugNotificationStatus.OMITTED
+            self.markBatchSent(bug_notifications, omitted_notifications)
             notifications_sent = True
             # Commit after each batch of email sent, so that we won't
             # re-mail the notifications in case of something going wrong
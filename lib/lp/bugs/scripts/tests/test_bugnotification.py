@@ -14,9 +14,11 @@ from smtplib import SMTPException
 import StringIO
 import unittest
 
+from fixtures import MonkeyPatch
 import pytz
 from storm.store import Store
 from testtools.matchers import (
+    Equals,
     MatchesRegex,
     Not,
     )
@@ -63,6 +65,7 @@ from lp.bugs.model.bugnotification import (
 from lp.bugs.model.bugsubscriptionfilter import BugSubscriptionFilterMute
 from lp.bugs.model.bugtask import BugTask
 from lp.bugs.scripts.bugnotification import (
+    BugNotificationRecipientCache,
     construct_email_notifications,
     get_activity_key,
     get_email_notifications,
@@ -73,6 +76,7 @@ from lp.bugs.scripts.bugnotification import (
     )
 from lp.registry.interfaces.person import IPersonSet
 from lp.registry.interfaces.product import IProductSet
+from lp.registry.model.person import get_recipients
 from lp.services.config import config
 from lp.services.database.interfaces import IStore
 from lp.services.database.sqlbase import (
@@ -90,6 +94,7 @@ from lp.services.propertycache import cachedproperty
 from lp.testing import (
     login,
     person_logged_in,
+    StormStatementRecorder,
     TestCase,
     TestCaseWithFactory,
     )
@@ -99,7 +104,10 @@ from lp.testing.dbuser import (
     )
 from lp.testing.fixture import ZopeUtilityFixture
 from lp.testing.layers import LaunchpadZopelessLayer
-from lp.testing.matchers import Contains
+from lp.testing.matchers import (
+    Contains,
+    HasQueryCount,
+    )
 
 
 @implementer(IBug)
@@ -199,8 +207,11 @@ class FakeNotification:
 class FakeBugNotificationSetUtility:
     """A notification utility used for testing."""
 
+    def getMutedPersonIds(self, bug):
+        return set()
+
     def getRecipientFilterData(self, bug, recipient_to_sources,
-                               notifications):
+                               notifications, muted_person_ids=None):
         return dict(
             (recipient, {'sources': sources, 'filter descriptions': []})
             for recipient, sources in recipient_to_sources.items())
@@ -1318,6 +1329,97 @@ class TestDeferredNotifications(TestCaseWithFactory):
         self.assertEqual(0, deferred.count())
 
 
+class TestBugNotificationRecipientCache(TestCaseWithFactory):
+
+    layer = LaunchpadZopelessLayer
+
+    def setUp(self):
+        super(TestBugNotificationRecipientCache, self).setUp()
+        self.notification_set = getUtility(IBugNotificationSet)
+        for notification in self.notification_set.getNotificationsToSend():
+            notification.destroySelf()
+        # A team without a contact address, so that its members are
+        # looked up to find the recipients.
+        self.team = self.factory.makeTeam()
+        for i in range(3):
+            self.team.addMember(self.factory.makePerson(), self.team.teamowner)
+
+    def test_recipients_cached(self):
+        cache = BugNotificationRecipientCache()
+        recipients = cache.getRecipients(self.team)
+        self.assertContentEqual(get_recipients(self.team), recipients)
+        with StormStatementRecorder() as recorder:
+            self.assertEqual(recipients, cache.getRecipients(self.team))
+        self.assertThat(recorder, HasQueryCount(Equals(0)))
+
+    def test_invalidate_person(self):
+        cache = BugNotificationRecipientCache()
+        cache.getRecipients(self.team)
+        new_member = self.factory.makePerson()
+        self.team.addMember(new_member, self.team.teamowner)
+        self.assertNotIn(new_member, cache.getRecipients(self.team))
+        cache.invalidate(person=new_member)
+        self.assertIn(new_member, cache.getRecipients(self.team))
+
+    def test_invalidate_bug(self):
+        bug = self.factory.makeBug()
+        cache = BugNotificationRecipientCache()
+        self.assertEqual(set(), cache.getMutedPersonIds(bug))
+        with StormStatementRecorder() as recorder:
+            cache.getMutedPersonIds(bug)
+        self.assertThat(recorder, HasQueryCount(Equals(0)))
+        with person_logged_in(bug.owner):
+            bug.mute(bug.owner, bug.owner)
+        self.assertEqual(set(), cache.getMutedPersonIds(bug))
+        cache.invalidate(bug=bug)
+        self.assertEqual(set([bug.owner.id]), cache.getMutedPersonIds(bug))
+
+    def test_constant_query_count_per_batch(self):
+        # Once the recipients of a bug have been worked out, each further
+        # batch of notifications for it costs the same number of queries.
+        bug = self.factory.makeBug()
+        bug.default_bugtask.target.addSubscription(
+            self.team, self.team.teamowner)
+        ten_minutes_ago = datetime.now(pytz.UTC) - timedelta(minutes=10)
+        for i in range(4):
+            message = getUtility(IMessageSet).fromText(
+                "subject", "comment %d" % i, bug.owner,
+                datecreated=ten_minutes_ago)
+            bug.addCommentNotification(message)
+        switch_dbuser(config.malone.bugnotification_dbuser)
+        email_notifications = get_email_notifications(
+            self.notification_set.getNotificationsToSend())
+        query_counts = []
+        for i in range(4):
+            with StormStatementRecorder() as recorder:
+                next(email_notifications)
+            query_counts.append(recorder.count)
+        self.assertEqual(1, len(set(query_counts[1:])), query_counts)
+        self.assertTrue(query_counts[0] > query_counts[1], query_counts)
+
+    def test_mutes_dropped_for_previous_bug(self):
+        # Mutes are only remembered while batches for the same bug are
+        # being built, so a bug muted later in the run is not mailed
+        # according to stale data.
+        bugs = [self.factory.makeBug() for i in range(2)]
+        ten_minutes_ago = datetime.now(pytz.UTC) - timedelta(minutes=10)
+        for bug in bugs:
+            message = getUtility(IMessageSet).fromText(
+                "subject", "a comment.", bug.owner,
+                datecreated=ten_minutes_ago)
+            bug.addCommentNotification(message)
+        cache = BugNotificationRecipientCache()
+        switch_dbuser(config.malone.bugnotification_dbuser)
+        email_notifications = get_email_notifications(
+            self.notification_set.getNotificationsToSend(),
+            recipient_cache=cache)
+        first_bug = next(email_notifications)[0][0].bug
+        self.assertEqual([first_bug.id], list(cache._muted_person_ids))
+        second_bug = next(email_notifications)[0][0].bug
+        self.assertNotEqual(first_bug, second_bug)
+        self.assertEqual([second_bug.id], list(cache._muted_person_ids))
+
+
 class BrokenMailer(TestMailer):
     """A mailer that raises an exception for certain recipient addresses."""
 
@@ -1330,6 +1432,22 @@ class BrokenMailer(TestMailer):
         return super(BrokenMailer, self).send(from_addr, to_addrs, message)
 
 
+class BrokenSMTP:
+    """An SMTP connection that refuses certain recipient addresses."""
+
+    def __init__(self, broken, sent):
+        self.broken = broken
+        self.sent = sent
+
+    def sendmail(self, from_addr, to_addrs, raw_message):
+        if any(to_addr in self.broken for to_addr in to_addrs):
+            raise SMTPException("test requested delivery failure")
+        self.sent.extend(to_addrs)
+
+    def quit(self):
+        pass
+
+
 class TestSendBugNotifications(TestCaseWithFactory):
 
     layer = LaunchpadZopelessLayer
@@ -1342,10 +1460,7 @@ class TestSendBugNotifications(TestCaseWithFactory):
             notification.destroySelf()
         self.ten_minutes_ago = datetime.now(pytz.UTC) - timedelta(minutes=10)
 
-    def test_oops_on_failed_delivery(self):
-        # If one notification fails to send, it logs an OOPS and doesn't get
-        # in the way of sending other notifications.
-        set_immediate_mail_delivery(False)
+    def makeCommentNotifications(self):
         subscribers = []
         for i in range(3):
             bug = self.factory.makeBug()
@@ -1360,23 +1475,108 @@ class TestSendBugNotifications(TestCaseWithFactory):
         notifications = list(get_email_notifications(
             self.notification_set.getNotificationsToSend()))
         self.assertEqual(3, len(notifications))
+        return subscribers, notifications
+
+    def runScript(self, *args):
+        switch_dbuser(config.malone.bugnotification_dbuser)
+        script = SendBugNotifications(
+            "send-bug-notifications", config.malone.bugnotification_dbuser,
+            ["-q"] + list(args))
+        script.txn = self.layer.txn
+        script.main()
+
+    def test_oops_on_failed_delivery(self):
+        # If one notification fails to send, it logs an OOPS and doesn't get
+        # in the way of sending other notifications.
+        set_immediate_mail_delivery(False)
+        subscribers, notifications = self.makeCommentNotifications()
 
         mailer = BrokenMailer([subscribers[1]])
         with ZopeUtilityFixture(mailer, IMailDelivery, "Mail"):
-            switch_dbuser(config.malone.bugnotification_dbuser)
-            script = SendBugNotifications(
-                "send-bug-notifications", config.malone.bugnotification_dbuser,
-                ["-q"])
-            script.txn = self.layer.txn
-            script.main()
+            self.runScript()
+
+        self.assertFailedBatchIsPending(notifications, 1)
+
+    def useBrokenSMTP(self, broken):
+        """Send bulk mail over SMTP connections that refuse `broken`.
+
+        :return: A list of the addresses that mail was sent to.
+        """
+        self.addCleanup(set_immediate_mail_delivery, False)
+        sent = []
+        self.useFixture(MonkeyPatch(
+            "lp.services.mail.sendmail.config.isTestRunner", lambda: False))
+        self.useFixture(MonkeyPatch(
+            "lp.services.mail.sendmail.SMTP",
+            lambda host, port: BrokenSMTP(broken, sent)))
+        return sent
+
+    def test_failed_bulk_delivery_retried(self):
+        # With bulk delivery, a batch that fails to send is reported and
+        # sent again on the next run.
+        subscribers, notifications = self.makeCommentNotifications()
+        broken = [subscribers[1]]
+        sent = self.useBrokenSMTP(broken)
+        self.runScript("--bulk-delivery")
 
+        self.assertEqual(1, len(self.oopses))
+        self.assertIn(
+            "SMTPException: test requested delivery failure",
+            self.oopses[0]["tb_text"])
+        self.assertNotIn(subscribers[1], sent)
+        self.assertEqual(
+            1, len(list(self.notification_set.getNotificationsToSend())))
+
+        del broken[:]
+        self.runScript("--bulk-delivery")
+        for subscriber in subscribers:
+            self.assertEqual(1, sent.count(subscriber))
+        self.assertEqual(
+            [], list(self.notification_set.getNotificationsToSend()))
+
+    def test_failed_bulk_delivery_not_repeated(self):
+        # When only some of the messages for a batch fail to send, only
+        # those are sent again on the next run; the other recipients
+        # aren't mailed twice.
+        bug = self.factory.makeBug()
+        subscribers = []
+        for i in range(2):
+            subscriber = self.factory.makePerson()
+            subscribers.append(subscriber.preferredemail.email)
+            bug.default_bugtask.target.addSubscription(subscriber, subscriber)
+        message = getUtility(IMessageSet).fromText(
+            "subject", "a comment.", bug.owner,
+            datecreated=self.ten_minutes_ago)
+        bug.addCommentNotification(message)
+        notification = self.notification_set.getNotificationsToSend()[0]
+        broken = [subscribers[1]]
+        sent = self.useBrokenSMTP(broken)
+        self.runScript("--bulk-delivery")
+
+        self.assertEqual(1, len(self.oopses))
+        self.assertEqual(BugNotificationStatus.SENT, notification.status)
+        [retry] = self.notification_set.getNotificationsToSend()
+        self.assertEqual(message, retry.message)
+        self.assertEqual(
+            [subscribers[1]],
+            [recipient.person.preferredemail.email
+             for recipient in retry.recipients])
+
+        del broken[:]
+        self.runScript("--bulk-delivery")
+        self.assertEqual(sorted(set(sent)), sorted(sent))
+        for subscriber in subscribers:
+            self.assertIn(subscriber, sent)
+        self.assertEqual(BugNotificationStatus.SENT, retry.status)
+
+    def assertFailedBatchIsPending(self, notifications, failed_index):
         self.assertEqual(1, len(self.oopses))
         self.assertIn(
             "SMTPException: test requested delivery failure",
             self.oopses[0]["tb_text"])
         for i, (bug_notifications, _, messages) in enumerate(notifications):
             for bug_notification in bug_notifications:
-                if i == 1:
+                if i == failed_index:
                     self.assertEqual(
                         BugNotificationStatus.PENDING, bug_notification.status)
                 else:
@@ -147,3 +147,17 @@ class IBuildQueueSet(Interface):
 
     def preloadForBuildFarmJobs(builds):
         """Preload buildqueue_record for the given IBuildFarmJobs."""
+
+    def getEstimatedJobStartTimes(buildqueues):
+        """Get the estimated start times for several pending jobs at once.
+
+        This is equivalent to calling
+        `IBuildQueue.getEstimatedJobStartTime` on each of the given jobs,
+        but uses a constant number of queries.
+
+        :return: a dictionary mapping each of the given `IBuildQueue`s to
+            its estimated start time, or to None if no estimate is
+            available.
+        :raise: AssertionError when any of the build jobs is not in the
+            `JobStatus.WAITING` state.
+        """
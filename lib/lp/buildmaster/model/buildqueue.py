@@ -286,3 +286,13 @@ class BuildQueueSet(object):
                 removeSecurityProxy(build).build_farm_job_id)
             get_property_cache(build).buildqueue_record = bq
         return bqs
+
+    def getEstimatedJobStartTimes(self, buildqueues, now=None):
+        """See `IBuildQueueSet`."""
+        from lp.buildmaster.queuedepth import estimate_job_start_times
+        buildqueues = list(buildqueues)
+        estimates = estimate_job_start_times(
+            [removeSecurityProxy(bq) for bq in buildqueues],
+            now or BuildQueue._now())
+        return dict(
+            (bq, estimates[removeSecurityProxy(bq)]) for bq in buildqueues)
@@ -5,6 +5,7 @@ __metaclass__ = type
 
 __all__ = [
     'estimate_job_start_time',
+    'estimate_job_start_times',
     ]
 
 from collections import defaultdict
@@ -328,3 +329,199 @@ def estimate_job_start_time(bq, now=None):
     start_time = max(5, min_wait_time + sum_of_delays)
     result = (now or datetime.now(utc)) + timedelta(seconds=start_time)
     return result
+
+
+def get_builder_availability(now=None):
+    """How many builders are free, and when will busy ones become free?
+
+    This is the batch counterpart of `get_free_builders_count` and
+    `estimate_time_to_next_builder`: it loads the state of all working
+    builders in two queries and summarises it per platform.
+
+    :return: A (free_builders, next_builder_delays) tuple of dictionaries
+        keyed by (processor, virtualized) platforms, where a processor of
+        None stands for any processor.  `free_builders` holds the number
+        of idle builders for each platform and `next_builder_delays` holds
+        the number of seconds until the first running job on a builder
+        for that platform is expected to finish.
+    """
+    now = now or datetime.now(utc)
+    builder_query = """
+        SELECT
+            Builder.id,
+            Builder.virtualized,
+            BuildQueue.id,
+            CASE WHEN BuildQueue.status = %s THEN
+                CASE WHEN
+                EXTRACT(EPOCH FROM
+                    (BuildQueue.estimated_duration -
+                    (((%s AT TIME ZONE 'UTC') - BuildQueue.date_started))))
+                    >= 0
+                THEN
+                EXTRACT(EPOCH FROM
+                    (BuildQueue.estimated_duration -
+                    (((%s AT TIME ZONE 'UTC') - BuildQueue.date_started))))
+                ELSE
+                -- See estimate_time_to_next_builder.
+                120
+                END
+            END
+        FROM Builder
+        LEFT OUTER JOIN BuildQueue ON BuildQueue.builder = Builder.id
+        WHERE
+            Builder.builderok = TRUE
+            AND Builder.manual = FALSE
+        """ % sqlvalues(BuildQueueStatus.RUNNING, now, now)
+    builders = IStore(BuildQueue).execute(builder_query).get_all()
+    builder_processors = defaultdict(list)
+    for builder_id, processor_id in IStore(Builder).find(
+            (BuilderProcessor.builder_id, BuilderProcessor.processor_id),
+            BuilderProcessor.builder_id == Builder.id,
+            Builder._builderok == True, Builder.manual == False):
+        builder_processors[builder_id].append(processor_id)
+
+    free_builders = defaultdict(int)
+    next_builder_delays = {}
+    for builder_id, virtualized, bq_id, delay in builders:
+        platforms = [(None, virtualized)] + [
+            (processor_id, virtualized)
+            for processor_id in builder_processors[builder_id]]
+        for platform in platforms:
+            if bq_id is None:
+                free_builders[platform] += 1
+            elif delay is not None:
+                next_builder_delays[platform] = min(
+                    next_builder_delays.get(platform, delay), delay)
+    return free_builders, next_builder_delays
+
+
+def estimate_job_start_times(bqs, now=None):
+    """Estimate the start times of several pending `IBuildQueue`s at once.
+
+    This gives the same results as calling `estimate_job_start_time` for
+    each of the given jobs, but it runs a fixed number of queries no
+    matter how many jobs are passed in.  The pending queue is loaded once
+    in dispatch order and walked while keeping per-platform cumulative
+    sums of the estimated durations seen so far, so that the delay caused
+    by the jobs ahead of each job of interest can be read off directly.
+
+    :param bqs: An iterable of pending `IBuildQueue`s.
+    :return: A dictionary mapping each of the given `IBuildQueue`s to its
+        estimated start time, or to None if no estimate is available.
+    :raise: AssertionError when any of the jobs is not pending.
+    """
+    bqs = list(bqs)
+    for bq in bqs:
+        if bq.status != BuildQueueStatus.WAITING:
+            raise AssertionError(
+                "The start time is only estimated for pending jobs.")
+    if not bqs:
+        return {}
+
+    now = now or datetime.now(utc)
+    builder_stats = get_builder_data()
+    free_builders, next_builder_delays = get_builder_availability(now=now)
+
+    wanted = dict((bq.id, bq) for bq in bqs)
+    # Jobs without a score never compete with anything; see
+    # get_pending_jobs_clauses.
+    query = """
+        SELECT
+            id,
+            processor,
+            virtualized,
+            CAST(EXTRACT(EPOCH FROM estimated_duration) AS INTEGER)
+        FROM BuildQueue
+        WHERE
+            status = %s
+            AND lastscore IS NOT NULL
+            AND virtualized IN %s
+        ORDER BY lastscore DESC, id
+        """ % sqlvalues(
+            BuildQueueStatus.WAITING,
+            set(bq.virtualized for bq in bqs))
+    pending = IStore(BuildQueue).execute(query).get_all()
+
+    # Per-platform (job count, sum of estimated durations) for all jobs
+    # seen so far, i.e. the jobs ahead of the one currently being looked
+    # at.
+    job_counts = defaultdict(int)
+    delays = defaultdict(int)
+    # The position and platform of the first job, of the first
+    # processor-independent job and of the first job for each processor,
+    # used to find the head job for each job of interest.
+    first_jobs = {}
+    first_unbound_jobs = {}
+    first_bound_jobs = {}
+    head_job_platforms = {}
+    sums_of_delays = {}
+
+    def head_job_platform(platform):
+        processor, virtualized = platform
+        if processor is None:
+            # Every job ahead competes with a processor-independent job.
+            candidates = [first_jobs.get(virtualized)]
+        else:
+            candidates = [
+                first_unbound_jobs.get(virtualized),
+                first_bound_jobs.get(platform),
+                ]
+        candidates = [
+            candidate for candidate in candidates if candidate is not None]
+        if not candidates:
+            return platform
+        return min(candidates)[1]
+
+    def sum_of_delays(my_platform):
+        my_processor, my_virtualized = my_platform
+        total = 0
+        for platform, duration in delays.iteritems():
+            processor, virtualized = platform
+            if virtualized != my_virtualized:
+                continue
+            if (my_processor is not None and processor is not None and
+                    processor != my_processor):
+                continue
+            builders = builder_stats.get(platform, 0)
+            if builders == 0:
+                continue
+            jobs = job_counts[platform]
+            denominator = (jobs if jobs < builders else builders)
+            if denominator > 1:
+                duration = int(duration / float(denominator))
+            total += duration
+        return total
+
+    for position, (bq_id, processor, virtualized, duration) in enumerate(
+            pending):
+        platform = (processor, virtualized)
+        if bq_id in wanted:
+            head_job_platforms[bq_id] = head_job_platform(platform)
+            sums_of_delays[bq_id] = sum_of_delays(platform)
+        job_counts[platform] += 1
+        delays[platform] += duration or 0
+        first_jobs.setdefault(virtualized, (position, platform))
+        if processor is None:
+            first_unbound_jobs.setdefault(virtualized, (position, platform))
+        else:
+            first_bound_jobs.setdefault(platform, (position, platform))
+
+    estimates = {}
+    for bq in bqs:
+        platform = (bq.processorID, bq.virtualized)
+        if builder_stats[platform] == 0:
+            # No builders that can run the job at hand
+            #   -> no dispatch time estimation available.
+            estimates[bq] = None
+            continue
+        head_platform = head_job_platforms.get(bq.id, platform)
+        if free_builders[head_platform] > 0:
+            min_wait_time = 0
+        else:
+            min_wait_time = int(next_builder_delays.get(head_platform, 0))
+        # A job will not get dispatched in less than 5 seconds no matter
+        # what.
+        start_time = max(
+            5, min_wait_time + sums_of_delays.get(bq.id, 0))
+        estimates[bq] = now + timedelta(seconds=start_time)
+    return estimates
@@ -10,11 +10,16 @@ from datetime import (
     )
 
 from pytz import utc
+from testtools.matchers import Equals
 from zope.component import getUtility
 from zope.security.proxy import removeSecurityProxy
 
-from lp.buildmaster.enums import BuildStatus
+from lp.buildmaster.enums import (
+    BuildQueueStatus,
+    BuildStatus,
+    )
 from lp.buildmaster.interfaces.builder import IBuilderSet
+from lp.buildmaster.interfaces.buildqueue import IBuildQueueSet
 from lp.buildmaster.interfaces.processor import IProcessorSet
 from lp.buildmaster.model.buildqueue import BuildQueue
 from lp.buildmaster.queuedepth import (
@@ -31,8 +36,12 @@ from lp.soyuz.enums import (
     )
 from lp.soyuz.model.binarypackagebuild import BinaryPackageBuild
 from lp.soyuz.tests.test_publishing import SoyuzTestPublisher
-from lp.testing import TestCaseWithFactory
+from lp.testing import (
+    StormStatementRecorder,
+    TestCaseWithFactory,
+    )
 from lp.testing.layers import LaunchpadZopelessLayer
+from lp.testing.matchers import HasQueryCount
 
 
 def check_mintime_to_builder(test, bq, min_time):
@@ -1047,3 +1056,51 @@ class TestJobDispatchTimeEstimation(MultiArchBuildsBase):
         assign_to_builder(self, 'xxr-daptup', 2, None)
         postgres_build, postgres_job = find_job(self, 'postgres', '386')
         check_estimate(self, postgres_job, 120)
+
+    def assertBatchEstimatesMatch(self):
+        # The batch estimator agrees with the per-job estimator for every
+        # pending job.
+        now = datetime.now(utc)
+        pending_jobs = [
+            build.buildqueue_record for build in self.builds
+            if build.buildqueue_record.status == BuildQueueStatus.WAITING]
+        estimates = getUtility(IBuildQueueSet).getEstimatedJobStartTimes(
+            pending_jobs, now=now)
+        self.assertContentEqual(pending_jobs, estimates.keys())
+        for bq in pending_jobs:
+            self.assertEqual(
+                bq.getEstimatedJobStartTime(now=now), estimates[bq])
+
+    def test_batch_estimates(self):
+        self.assertBatchEstimatesMatch()
+
+    def test_batch_estimates_with_busy_builders(self):
+        disable_builders(self, '386', True)
+        builder = self.builders[(self.x86_proc.id, True)][0]
+        builder.builderok = True
+        assign_to_builder(self, 'gedit', 1, '386')
+        assign_to_builder(self, 'xxr-daptup', 2, None)
+        self.assertBatchEstimatesMatch()
+
+    def test_batch_estimates_no_builder(self):
+        disable_builders(self, '386', True)
+        vim_build, vim_job = find_job(self, 'vim', '386')
+        estimates = getUtility(IBuildQueueSet).getEstimatedJobStartTimes(
+            [vim_job])
+        self.assertEqual({vim_job: None}, estimates)
+
+    def test_batch_estimates_pending_jobs_only(self):
+        assign_to_builder(self, 'gedit', 1, 'hppa')
+        gedit_build, gedit_job = find_job(self, 'gedit', 'hppa')
+        self.assertRaises(
+            AssertionError,
+            getUtility(IBuildQueueSet).getEstimatedJobStartTimes,
+            [gedit_job])
+
+    def test_batch_estimates_query_count(self):
+        # The number of queries does not depend on the number of jobs.
+        pending_jobs = [build.buildqueue_record for build in self.builds]
+        with StormStatementRecorder() as recorder:
+            getUtility(IBuildQueueSet).getEstimatedJobStartTimes(
+                pending_jobs)
+        self.assertThat(recorder, HasQueryCount(Equals(5)))
@@ -111,6 +111,7 @@ from lp.services.feeds.browser import (
     ProjectBranchesFeedLink,
     ProjectRevisionsFeedLink,
     )
+from lp.services.memcache.fragmentcache import FragmentCache
 from lp.services.propertycache import cachedproperty
 from lp.services.webapp import (
     ApplicationMenu,
@@ -210,6 +211,19 @@ class BranchListingItem(BzrIdentityMixin, BranchBadges):
         return '<BranchListingItem %r (%d)>' % (self.unique_name, self.id)
 
 
+class BranchListingRowView(LaunchpadView):
+    """A row of a branch listing."""
+
+    template = ViewPageTemplateFile('../templates/branch-listing-row.pt')
+
+    def __init__(self, context, request, navigator):
+        super(BranchListingRowView, self).__init__(context, request)
+        self.navigator = navigator
+
+
+branch_listing_rows = FragmentCache('branch-listing-row', 1)
+
+
 class PersonBranchCategory(EnumeratedType):
     """Choices for filtering lists of branches related to people."""
 
@@ -418,7 +432,7 @@ class BranchListingBatchNavigator(TableBatchNavigator,
         TableBatchNavigator.__init__(
             self, view.getVisibleBranchesForUser(), view.request,
             columns_to_show=view.extra_columns,
-            size=config.launchpad.branchlisting_batch_size)
+            size=config.launchpad.branchlisting_batch_size, keyset=True)
         BranchListingItemsMixin.__init__(self, view.user)
         self.view = view
         self.column_count = 4 + len(view.extra_columns)
@@ -439,6 +453,32 @@ class BranchListingBatchNavigator(TableBatchNavigator,
         """Return a list of BranchListingItems."""
         return self.decoratedBranches(self.visible_branches_for_view)
 
+    @staticmethod
+    def _getRowStamp(item):
+        """Return what may change the row for `item` without an event."""
+        return (
+            item.date_last_modified, item.last_scanned_id,
+            item.revision_count, item.mirror_failures,
+            item.show_bug_badge, item.show_blueprint_badge,
+            item.show_merge_proposals,
+            [series.id for series in item.active_series])
+
+    @property
+    def cache_rows(self):
+        """Whether rows are cached, so must not show relative dates."""
+        return config.launchpad.fragment_cache
+
+    @cachedproperty
+    def rendered_rows(self):
+        """The HTML of each row of the listing."""
+        return branch_listing_rows.renderMany(
+            self.branches,
+            lambda item: BranchListingRowView(item, self.request, self)(),
+            get_object=attrgetter('context'), get_stamp=self._getRowStamp,
+            variant=(
+                self.view.show_series_links, sorted(self.show_column),
+                self.has_multiple_pages))
+
     @property
     def table_class(self):
         # XXX: MichaelHudson 2007-10-18 bug=153894: This means there are two
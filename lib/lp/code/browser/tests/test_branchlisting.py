@@ -14,6 +14,7 @@ import re
 
 from lazr.uri import URI
 from lxml import html
+import simplejson
 import soupmatchers
 from testtools.matchers import Not
 from zope.component import getUtility
@@ -35,6 +36,7 @@ from lp.registry.interfaces.person import IPerson
 from lp.registry.interfaces.personproduct import IPersonProductFactory
 from lp.registry.interfaces.pocket import PackagePublishingPocket
 from lp.services.features.testing import FeatureFixture
+from lp.services.memcache.testing import MemcacheFixture
 from lp.services.webapp import canonical_url
 from lp.services.webapp.servers import LaunchpadTestRequest
 from lp.testing import (
@@ -177,6 +179,31 @@ class TestPersonOwnedBranchesView(TestCaseWithFactory,
             view.branches().tip_revisions,
             tip_revisions)
 
+    def test_batches_by_sort_keys(self):
+        # Branch listings are batched by their sort keys, even if keyset
+        # batching is turned off elsewhere.
+        self.pushConfig('launchpad', keyset_batching=False)
+        view = create_initialized_view(
+            self.barney, name="+branches", rootsite='code')
+        navigator = view.branches()
+        self.assertEqual(
+            self.branches[:6], list(navigator.currentBatch()))
+        last = self.branches[5]
+        self.assertEqual(
+            [last.date_last_modified.isoformat(), last.id],
+            simplejson.loads(navigator.batch.nextBatch().range_memo))
+
+    def test_cached_rows_show_absolute_dates(self):
+        # Cached rows would show stale relative dates, so they show
+        # absolute ones for the browser to make relative.
+        self.pushConfig('launchpad', fragment_cache=True)
+        self.useFixture(MemcacheFixture())
+        view = create_initialized_view(
+            self.barney, name="+branches", rootsite='code')
+        rows = view.branches().rendered_rows
+        self.assertNotIn('ago', ''.join(rows))
+        self.assertIn('class="approximatedate"', rows[0])
+
     def test_search_batch_request(self):
         # A search request with a 'batch_request' query parameter causes the
         # view to just render the next batch of results.
@@ -835,6 +835,14 @@ class CodeImportEventDataType(DBEnumeratedType):
     The database id of the reclaimed code import job.
     """)
 
+    # Data related to start events
+
+    QUEUE_WAIT = DBItem(610, """Queue Wait
+
+    The number of seconds between the job becoming due and it being
+    started.
+    """)
+
 
 class CodeImportJobState(DBEnumeratedType):
     """Values that ICodeImportJob.state can take."""
@@ -146,11 +146,13 @@ class ICodeImportEventSet(Interface):
         :return: `CodeImportEvent` of QUIESCE type.
         """
 
-    def newStart(code_import, machine):
+    def newStart(code_import, machine, queue_wait=None):
         """Record that a machine is about to start working on a code import.
 
         :param code_import: The `CodeImport` which is about to be worked on.
         :param machine: `CodeImportMachine` which is about to start the job.
+        :param queue_wait: If not None, the number of seconds that the job
+            waited after becoming due before being started.
         :return: `CodeImportEvent` of START type.
         """
 
@@ -128,7 +128,7 @@ class ICodeImportJobSetPublic(Interface):
     # we implement endpoint specific authentication for the private xml-rpc
     # server.
 
-    def getJobForMachine(hostname, worker_limit):
+    def getJobForMachine(hostname, worker_limit, capacity=None):
         """Select a job for the given machine to run and mark it as started.
 
         If there is not already a CodeImportMachine with the given hostname,
@@ -137,6 +137,13 @@ class ICodeImportJobSetPublic(Interface):
         This method selects a job that is due to be run for running on the
         given machine and calls ICodeImportJobWorkflowPublic.startJob() on it.
         It will return None if there is no such job.
+
+        :param capacity: If not None, a dict describing the machine's spare
+            capacity, with the optional keys 'cpus', 'load_average',
+            'memory_available_mb' and 'disk_available_mb'.  Jobs are then
+            costed using the recent history of their imports, so that heavy
+            imports are spread across machines and light Git imports are
+            packed several to a worker slot.
         """
 
 
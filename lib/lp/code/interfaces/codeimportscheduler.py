@@ -27,12 +27,15 @@ class ICodeImportScheduler(Interface):
     when they need more work to do.
     """
 
-    def getJobForMachine(hostname, worker_limit):
+    def getJobForMachine(hostname, worker_limit, capacity=None):
         """Get a job to run on the slave 'hostname'.
 
         This method selects the most appropriate job for the machine,
         mark it as having started on said machine and return its id,
         or 0 if there are no jobs pending.
+
+        :param capacity: If not None, a dict describing the machine's spare
+            capacity; see `ICodeImportJobSetPublic.getJobForMachine`.
         """
 
     def getImportDataForJobID(job_id):
@@ -46,11 +46,25 @@ class IGitHostingClient(Interface):
             they point to.
         """
 
+    def iterRefs(path, exclude_prefixes=None):
+        """Iterate over all refs in this repository.
+
+        Unlike `getRefs`, this parses the response incrementally, so the
+        refs of a very large repository need not all be held in memory at
+        once.
+
+        :param path: Physical path of the repository on the hosting service.
+        :param exclude_prefixes: An optional list of ref prefixes to exclude.
+        :return: An iterator of (ref path, dict) pairs, where the dicts
+            represent the objects the refs point to.
+        """
+
     def getCommits(path, commit_oids, logger=None):
         """Get details of a list of commits.
 
         :param path: Physical path of the repository on the hosting service.
-        :param commit_oids: A list of commit OIDs.
+        :param commit_oids: A list of commit OIDs.  Long lists are split
+            into several requests.
         :param logger: An optional logger.
         :return: A list of dicts each of which represents one of the
             requested commits.  Non-existent commits will be omitted.
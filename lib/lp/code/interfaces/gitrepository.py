@@ -316,6 +316,28 @@ class IGitRepositoryView(IHasRecipes):
             paths to remove.
         """
 
+    def iterRefChanges(hosting_path, chunk_size, start_after=None,
+                       logger=None):
+        """Plan ref changes in bounded chunks, ordered by ref path.
+
+        This is like `planRefChanges`, but for repositories with too many
+        refs to handle in one go.  Refs from the hosting service and from
+        the database are merged in path order, so each chunk may be
+        synchronised and committed before the next is planned.
+
+        :param hosting_path: A path on the hosting service.
+        :param chunk_size: The maximum number of refs to create, update or
+            remove in each chunk.
+        :param start_after: If not None, only consider refs whose paths sort
+            after this one; this allows resuming an interrupted scan.
+        :param logger: An optional logger.
+
+        :return: An iterator of (refs_to_upsert, refs_to_remove, cursor)
+            tuples, where the first two elements are as for
+            `planRefChanges` and `cursor` is the path of the last ref
+            considered so far.
+        """
+
     def fetchRefCommits(hosting_path, refs, logger=None):
         """Fetch commit information from the hosting service for a set of refs.
 
@@ -74,6 +74,15 @@ tests.suite.add(new Y.Test.Case({
         Y.Assert.isFalse(try_again_link.hasClass('hidden'));
         Y.Assert.isTrue(
             Y.one('[id="tryagain.actions.tryagain"]').hasClass('hidden'));
+    },
+
+    test_showApproximateDates: function() {
+        this._setup_fixture('#approximate-dates');
+        var date = new Date((new Date()).valueOf() - 5 * 60000);
+        var node = Y.one('.approximatedate');
+        node.setAttribute('data-date', date.toISOString());
+        module.showApproximateDates(this.fixture);
+        Y.Assert.areEqual('5 minutes ago', node.get('text'));
     }
 
 }));
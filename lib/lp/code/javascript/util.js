@@ -4,7 +4,7 @@
  * Control enabling/disabling form elements on Code domain pages.
  *
  * @module Y.lp.code.util
- * @requires node
+ * @requires node, lp.app.date
  */
 YUI.add('lp.code.util', function(Y) {
 var ns = Y.namespace('lp.code.util');
@@ -40,8 +40,18 @@ var hookUpRetryImportSubmission = function() {
     Y.one('[id="tryagain.actions.tryagain"]').addClass('hidden');
 };
 
+var showApproximateDates = function(container) {
+    // Cached listing rows show absolute dates, since relative ones would
+    // go stale.  Show them relative to now instead.
+    container.all('.approximatedate').each(function(node) {
+        var date = Y.lp.app.date.parse_date(node.getAttribute('data-date'));
+        node.set('text', Y.lp.app.date.approximatedate(date));
+    });
+};
+
 ns.hookUpBranchFilterSubmission = hookUpBranchFilterSubmission;
 ns.hookUpMergeProposalFilterSubmission = hookUpMergeProposalFilterSubmission;
 ns.hookUpRetryImportSubmission = hookUpRetryImportSubmission;
+ns.showApproximateDates = showApproximateDates;
 
-}, "0.1", {"requires": ["node", "dom"]});
+}, "0.1", {"requires": ["node", "dom", "lp.app.date"]});
@@ -301,9 +301,21 @@ class GenericBranchCollection:
             BranchListingSort.OLDEST_FIRST: (Asc, Branch.date_created),
             }
 
+        DATE_SORTS = [
+            BranchListingSort.MOST_RECENTLY_CHANGED_FIRST,
+            BranchListingSort.LEAST_RECENTLY_CHANGED_FIRST,
+            BranchListingSort.NEWEST_FIRST,
+            BranchListingSort.OLDEST_FIRST,
+            ]
+
         order_by = map(
             LISTING_SORT_TO_COLUMN.get, DEFAULT_BRANCH_LISTING_SORT)
 
+        if sort_by in DATE_SORTS:
+            # Ties between timestamps are rare enough to break by id alone,
+            # which lets batch navigators batch by the sort keys.
+            direction, column = LISTING_SORT_TO_COLUMN[sort_by]
+            return [direction(column), direction(Branch.id)]
         if sort_by is not None and sort_by != BranchListingSort.DEFAULT:
             direction, column = LISTING_SORT_TO_COLUMN[sort_by]
             order_by = (
@@ -180,13 +180,18 @@ class CodeImportEventSet:
         self._recordMessage(event, message)
         return event
 
-    def newStart(self, code_import, machine):
+    def newStart(self, code_import, machine, queue_wait=None):
         """See `ICodeImportEventSet`."""
         assert code_import is not None, "code_import must not be None"
         assert machine is not None, "machine must not be None"
-        return CodeImportEvent(
+        event = CodeImportEvent(
             event_type=CodeImportEventType.START,
             code_import=code_import, machine=machine)
+        if queue_wait is not None:
+            _CodeImportEventData(
+                event=event, data_type=CodeImportEventDataType.QUEUE_WAIT,
+                data_value=str(queue_wait))
+        return event
 
     def newFinish(self, code_import, machine):
         """See `ICodeImportEventSet`."""
@@ -12,12 +12,14 @@ __all__ = [
 
 import datetime
 
+import pytz
 from sqlobject import (
     ForeignKey,
     IntCol,
     SQLObjectNotFound,
     StringCol,
     )
+from storm.expr import SQL
 from zope.component import getUtility
 from zope.interface import implementer
 from zope.security.proxy import removeSecurityProxy
@@ -183,29 +185,131 @@ class CodeImportJobSet(object):
         except SQLObjectNotFound:
             return None
 
-    def getJobForMachine(self, hostname, worker_limit):
+    def getJobForMachine(self, hostname, worker_limit, capacity=None):
         """See `ICodeImportJobSet`."""
         job_workflow = getUtility(ICodeImportJobWorkflow)
         for job in self.getReclaimableJobs():
             job_workflow.reclaimJob(job)
+        if capacity is None:
+            job_limit = worker_limit
+        else:
+            # Light imports may be packed more densely than one per
+            # worker; _selectJobForCapacity enforces the real limit.
+            job_limit = worker_limit * config.codeimport.light_imports_per_slot
         machine = getUtility(ICodeImportMachineSet).getByHostname(hostname)
         if machine is None:
             machine = getUtility(ICodeImportMachineSet).new(
                 hostname, CodeImportMachineState.ONLINE)
-        elif not machine.shouldLookForJob(worker_limit):
+        elif not machine.shouldLookForJob(job_limit):
             return None
-        job = CodeImportJob.selectOne(
-            """id IN (SELECT id FROM CodeImportJob
-               WHERE date_due <= %s AND state = %s
-               ORDER BY requesting_user IS NULL, date_due
-               LIMIT 1)"""
-            % sqlvalues(UTC_NOW, CodeImportJobState.PENDING))
+        if capacity is None:
+            job = CodeImportJob.selectOne(
+                """id IN (SELECT id FROM CodeImportJob
+                   WHERE date_due <= %s AND state = %s
+                   ORDER BY requesting_user IS NULL, date_due
+                   LIMIT 1)"""
+                % sqlvalues(UTC_NOW, CodeImportJobState.PENDING))
+        else:
+            job = self._selectJobForCapacity(machine, worker_limit, capacity)
         if job is not None:
             job_workflow.startJob(job, machine)
             return job
         else:
             return None
 
+    def _getRecentDurations(self, code_import_ids):
+        """Return the mean duration of recent runs of some code imports.
+
+        :return: A dict mapping code import IDs to their mean duration in
+            seconds over the last `config.codeimport.duration_history_days`
+            days.  Imports that have not run in that time are omitted.
+        """
+        if not code_import_ids:
+            return {}
+        rows = IStore(CodeImportResult).execute("""
+            SELECT code_import,
+                   EXTRACT(EPOCH FROM AVG(date_created - date_job_started))
+            FROM CodeImportResult
+            WHERE code_import IN %s AND date_created > %s + '-%s days'
+            GROUP BY code_import
+            """ % sqlvalues(
+                set(code_import_ids), UTC_NOW,
+                config.codeimport.duration_history_days))
+        return dict(rows)
+
+    def _getJobCost(self, job, duration):
+        """Estimate the cost of running `job`.
+
+        Costs are measured in fractions of a worker slot: there are
+        `config.codeimport.light_imports_per_slot` units in each slot.
+
+        :param duration: The mean duration in seconds of recent runs of
+            `job`'s import, or None if it has not run recently.
+        :return: A (units, heavy) tuple.
+        """
+        units_per_slot = config.codeimport.light_imports_per_slot
+        if duration is None:
+            return units_per_slot, False
+        elif duration >= config.codeimport.heavy_import_duration:
+            return units_per_slot, True
+        elif (job.code_import.rcs_type == RevisionControlSystems.GIT and
+              duration <= config.codeimport.light_import_duration):
+            return 1, False
+        else:
+            return units_per_slot, False
+
+    def _selectJobForCapacity(self, machine, worker_limit, capacity):
+        """Select a pending job that fits on `machine`.
+
+        Jobs are considered in the usual order, but each is costed using
+        the history of its import: at most one heavy import runs on a
+        machine at a time, while several light Git imports share a worker
+        slot.  A machine short of memory or CPU only takes light imports,
+        and a machine short of disk space takes nothing.
+
+        :param capacity: A dict describing the machine's spare capacity, as
+            reported by the code import dispatcher.
+        """
+        if (capacity.get('disk_available_mb') is not None and
+                capacity['disk_available_mb'] <
+                    config.codeimport.min_free_disk_mb):
+            return None
+        constrained = (
+            (capacity.get('memory_available_mb') is not None and
+             capacity['memory_available_mb'] <
+                config.codeimport.min_free_memory_mb) or
+            (capacity.get('cpus') and capacity.get('load_average') and
+             capacity['load_average'] >= capacity['cpus']))
+        candidates = list(IStore(CodeImportJob).find(
+            CodeImportJob,
+            "date_due <= %s AND state = %s"
+            % sqlvalues(UTC_NOW, CodeImportJobState.PENDING)).order_by(
+                SQL("requesting_user IS NULL"), CodeImportJob.date_due,
+                CodeImportJob.id)[:config.codeimport.scheduling_candidates])
+        running = list(machine.current_jobs)
+        durations = self._getRecentDurations(
+            [job.code_importID for job in candidates + running])
+
+        units_per_slot = config.codeimport.light_imports_per_slot
+        free_units = worker_limit * units_per_slot
+        heavy_running = False
+        for job in running:
+            units, heavy = self._getJobCost(
+                job, durations.get(job.code_importID))
+            free_units -= units
+            heavy_running = heavy_running or heavy
+        for job in candidates:
+            units, heavy = self._getJobCost(
+                job, durations.get(job.code_importID))
+            if units > free_units:
+                continue
+            if heavy and heavy_running:
+                continue
+            if constrained and units >= units_per_slot:
+                continue
+            return job
+        return None
+
     def getReclaimableJobs(self):
         """See `ICodeImportJobSet`."""
         return IStore(CodeImportJob).find(
@@ -303,8 +407,10 @@ class CodeImportJobWorkflow:
         naked_job.logtail = u''
         naked_job.machine = machine
         naked_job.state = CodeImportJobState.RUNNING
+        queue_wait = datetime.datetime.now(pytz.UTC) - naked_job.date_due
         getUtility(ICodeImportEventSet).newStart(
-            import_job.code_import, machine)
+            import_job.code_import, machine,
+            queue_wait=max(0, int(queue_wait.total_seconds())))
 
     def updateHeartbeat(self, import_job, logtail):
         """See `ICodeImportJobWorkflow`."""
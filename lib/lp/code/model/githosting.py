@@ -9,8 +9,10 @@ __all__ = [
     ]
 
 import base64
+import codecs
 import json
 import sys
+from threading import local
 from urllib import quote
 from urlparse import urljoin
 
@@ -30,6 +32,7 @@ from lp.services.config import config
 from lp.services.timeline.requesttimeline import get_request_timeline
 from lp.services.timeout import (
     get_default_timeout_function,
+    make_url_session,
     TimeoutError,
     urlfetch,
     )
@@ -39,38 +42,168 @@ class RequestExceptionWrapper(requests.RequestException):
     """A non-requests exception that occurred during a request."""
 
 
+class JSONObjectStream:
+    """Incrementally parse a JSON object from a sequence of text chunks.
+
+    Iterating over this yields the (key, value) pairs of the top-level
+    object as soon as each value is complete, so a large response never
+    needs to be held in memory all at once.
+    """
+
+    whitespace = " \t\r\n"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+
+    def _readMore(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or "" at EOF."""
+        while True:
+            while (self.pos < len(self.buf) and
+                   self.buf[self.pos] in self.whitespace):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._readMore():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(
+                "Expected one of %r at offset %d" % (chars, self.pos))
+        self.pos += 1
+        return char
+
+    def _readValue(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                end = None
+            # A value that runs to the end of the buffer may be a truncated
+            # number, so only accept it once we've seen what follows.
+            if end is not None and end < len(self.buf):
+                self.pos = end
+                return value
+            if not self._readMore():
+                if end is None:
+                    raise ValueError("Truncated JSON object")
+                self.pos = end
+                return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                key = self._readValue()
+                if not isinstance(key, basestring):
+                    raise ValueError("Expected a string key, got %r" % key)
+                self._expect(":")
+                yield key, self._readValue()
+                if self._expect(",}") == "}":
+                    break
+        if self._peek():
+            raise ValueError("Extra data after JSON object")
+
+
+def decode_chunks(chunks, encoding="UTF-8"):
+    """Decode a sequence of byte strings, which may split characters."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
 @implementer(IGitHostingClient)
 class GitHostingClient:
     """A client for the internal API provided by the Git hosting system."""
 
     def __init__(self):
         self.endpoint = config.codehosting.internal_git_api_endpoint
+        # Each thread keeps its own session, so that requests to the
+        # hosting service reuse keep-alive connections.
+        self._local = local()
 
-    def _request(self, method, path, **kwargs):
-        """Make a request to the Git hosting API."""
+    def _getSession(self):
+        """Return this thread's persistent session for the hosting API."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = make_url_session()
+            if not config.codehosting.internal_git_api_gzip:
+                session.headers["Accept-Encoding"] = "identity"
+            self._local.session = session
+        return session
+
+    def _discardSession(self):
+        """Stop using this thread's session, e.g. after a timeout."""
+        session = getattr(self._local, "session", None)
+        if session is not None:
+            session.close()
+            self._local.session = None
+
+    def _makeRequest(self, method, path, stream=False, **kwargs):
+        """Make a request to the Git hosting API, returning the response.
+
+        :param stream: If True, don't consume the response content; the
+            caller must iterate over it.  The default timeout is applied to
+            each socket operation rather than to the whole response.
+        """
         # Fetch the current timeout before starting the timeline action,
         # since making a database query inside this action will result in an
         # OverlappingActionError.
-        get_default_timeout_function()()
+        timeout = get_default_timeout_function()()
+        if stream:
+            kwargs["stream"] = True
+            kwargs.setdefault("timeout", timeout)
         timeline = get_request_timeline(get_current_browser_request())
         action = timeline.start(
             "git-hosting-%s" % method, "%s %s" % (path, json.dumps(kwargs)))
         try:
-            response = urlfetch(
-                urljoin(self.endpoint, path), method=method, **kwargs)
+            return urlfetch(
+                urljoin(self.endpoint, path), method=method,
+                session=self._getSession(), **kwargs)
         except TimeoutError:
+            # The timed-out request's connections have been shut down.
             # Re-raise this directly so that it can be handled specially by
             # callers.
+            self._discardSession()
+            raise
+        except requests.ConnectionError:
+            self._discardSession()
             raise
         except requests.RequestException:
             raise
         except Exception:
+            self._discardSession()
             _, val, tb = sys.exc_info()
             reraise(
                 RequestExceptionWrapper, RequestExceptionWrapper(*val.args),
                 tb)
         finally:
             action.finish()
+
+    def _request(self, method, path, **kwargs):
+        """Make a request to the Git hosting API."""
+        response = self._makeRequest(method, path, **kwargs)
         if response.content:
             return response.json()
         else:
@@ -126,14 +259,34 @@ class GitHostingClient:
             raise GitRepositoryScanFault(
                 "Failed to get refs from Git repository: %s" % unicode(e))
 
+    def iterRefs(self, path, exclude_prefixes=None):
+        """See `IGitHostingClient`."""
+        try:
+            response = self._makeRequest(
+                "get", "/repo/%s/refs" % path,
+                params={"exclude_prefix": exclude_prefixes}, stream=True)
+            chunks = decode_chunks(response.iter_content(chunk_size=65536))
+            for ref_path, info in JSONObjectStream(chunks):
+                yield ref_path, info
+        except (requests.RequestException, ValueError) as e:
+            raise GitRepositoryScanFault(
+                "Failed to get refs from Git repository: %s" % unicode(e))
+
     def getCommits(self, path, commit_oids, logger=None):
         """See `IGitHostingClient`."""
         commit_oids = list(commit_oids)
+        batch_size = config.codehosting.internal_git_api_commits_batch_size
+        batches = [
+            commit_oids[start:start + batch_size]
+            for start in range(0, len(commit_oids), batch_size)]
+        commits = []
         try:
-            if logger is not None:
-                logger.info("Requesting commit details for %s" % commit_oids)
-            return self._post(
-                "/repo/%s/commits" % path, json={"commits": commit_oids})
+            for batch in batches or [[]]:
+                if logger is not None:
+                    logger.info("Requesting commit details for %s" % batch)
+                commits.extend(self._post(
+                    "/repo/%s/commits" % path, json={"commits": batch}))
+            return commits
         except requests.RequestException as e:
             raise GitRepositoryScanFault(
                 "Failed to get commit details from Git repository: %s" %
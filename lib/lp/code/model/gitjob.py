@@ -25,6 +25,7 @@ from storm.locals import (
     SQL,
     Store,
     )
+import transaction
 from zope.component import getUtility
 from zope.interface import (
     implementer,
@@ -221,9 +222,18 @@ class GitRefScanJob(GitJobDerived):
 
     @staticmethod
     def composeWebhookPayload(repository, refs_to_upsert, refs_to_remove):
-        old_refs = {ref.path: ref for ref in repository.refs}
+        from lp.code.model.gitref import GitRef
+        paths = refs_to_upsert.keys() + list(refs_to_remove)
+        # Only load the refs that are changing, since the repository may
+        # have very many others.
+        old_refs = {
+            ref.path: ref
+            for ref in IStore(GitRef).find(
+                GitRef,
+                GitRef.repository_id == repository.id,
+                GitRef.path.is_in(paths))}
         ref_changes = {}
-        for ref in refs_to_upsert.keys() + list(refs_to_remove):
+        for ref in paths:
             old = (
                 {"commit_sha1": old_refs[ref].commit_sha1}
                 if ref in old_refs else None)
@@ -240,6 +250,39 @@ class GitRefScanJob(GitJobDerived):
             "ref_changes": ref_changes,
             }
 
+    def _synchroniseRefs(self, hosting_path, refs_to_upsert, refs_to_remove):
+        self.repository.fetchRefCommits(
+            hosting_path, refs_to_upsert, logger=log)
+        # The webhook delivery includes old ref information, so prepare it
+        # before we actually execute the changes.
+        if getFeatureFlag('code.git.webhooks.enabled'):
+            payload = self.composeWebhookPayload(
+                self.repository, refs_to_upsert, refs_to_remove)
+            getUtility(IWebhookSet).trigger(
+                self.repository, 'git:push:0.1', payload)
+        self.repository.synchroniseRefs(
+            refs_to_upsert, refs_to_remove, logger=log)
+
+    def _scanChunked(self, hosting_path, chunk_size):
+        """Synchronise refs a chunk at a time, committing after each one.
+
+        The path of the last ref handled is saved in the job's metadata
+        with each commit, so a retried job carries on where it left off.
+        """
+        changes = self.repository.iterRefChanges(
+            hosting_path, chunk_size,
+            start_after=self.metadata.get("ref_scan_cursor"), logger=log)
+        for refs_to_upsert, refs_to_remove, cursor in changes:
+            self._synchroniseRefs(
+                hosting_path, refs_to_upsert, refs_to_remove)
+            self.context.metadata = dict(
+                self.metadata, ref_scan_cursor=cursor)
+            transaction.commit()
+        if "ref_scan_cursor" in self.metadata:
+            metadata = dict(self.metadata)
+            del metadata["ref_scan_cursor"]
+            self.context.metadata = metadata
+
     def run(self):
         """See `IGitRefScanJob`."""
         try:
@@ -247,19 +290,15 @@ class GitRefScanJob(GitJobDerived):
                     LockType.GIT_REF_SCAN, self.repository.id,
                     Store.of(self.repository)):
                 hosting_path = self.repository.getInternalPath()
-                refs_to_upsert, refs_to_remove = (
-                    self.repository.planRefChanges(hosting_path, logger=log))
-                self.repository.fetchRefCommits(
-                    hosting_path, refs_to_upsert, logger=log)
-                # The webhook delivery includes old ref information, so
-                # prepare it before we actually execute the changes.
-                if getFeatureFlag('code.git.webhooks.enabled'):
-                    payload = self.composeWebhookPayload(
-                        self.repository, refs_to_upsert, refs_to_remove)
-                    getUtility(IWebhookSet).trigger(
-                        self.repository, 'git:push:0.1', payload)
-                self.repository.synchroniseRefs(
-                    refs_to_upsert, refs_to_remove, logger=log)
+                chunk_size = config.codehosting.git_ref_scan_chunk_size
+                if chunk_size:
+                    self._scanChunked(hosting_path, chunk_size)
+                else:
+                    refs_to_upsert, refs_to_remove = (
+                        self.repository.planRefChanges(
+                            hosting_path, logger=log))
+                    self._synchroniseRefs(
+                        hosting_path, refs_to_upsert, refs_to_remove)
                 props = getUtility(IGitHostingClient).getProperties(
                     hosting_path)
                 # We don't want ref canonicalisation, nor do we want to send
@@ -18,7 +18,6 @@ from datetime import (
     timedelta,
     )
 import email
-from fnmatch import fnmatch
 from functools import partial
 from itertools import (
     chain,
@@ -139,6 +138,7 @@ from lp.code.model.gitref import (
     GitRefDefault,
     )
 from lp.code.model.gitrule import (
+    get_ref_matcher,
     GitRule,
     GitRuleGrant,
     )
@@ -678,6 +678,36 @@ class GitRepository(StormBase, WebhookTargetMixin, GitIdentityMixin):
             GitRef.repository == self, GitRef.path.is_in(paths)).remove()
         self.date_last_modified = UTC_NOW
 
+    @staticmethod
+    def _isRefChanged(info, current_ref):
+        """Does a ref from the hosting service need to be created or updated?
+
+        :param info: A dict of {"sha1": sha1, "type": `GitObjectType`}.
+        :param current_ref: None if the ref does not exist in the
+            database, or a tuple of (commit_sha1, object_type,
+            has_commit_details) for the existing `GitRef`.
+        """
+        if (current_ref is None or
+                info["sha1"] != current_ref[0] or
+                info["type"] != current_ref[1]):
+            return True
+        # Only request detailed commit metadata for refs that point to
+        # commits.
+        return info["type"] == GitObjectType.COMMIT and not current_ref[2]
+
+    def _findCurrentRefs(self, *clauses):
+        # GitRef rows can be large (especially commit_message), and we don't
+        # need the whole thing.
+        return Store.of(self).find(
+            (GitRef.path, GitRef.commit_sha1, GitRef.object_type,
+             And(
+                 GitRef.author_id != None,
+                 GitRef.author_date != None,
+                 GitRef.committer_id != None,
+                 GitRef.committer_date != None,
+                 GitRef.commit_message != None)),
+            GitRef.repository_id == self.id, *clauses)
+
     def planRefChanges(self, hosting_path, logger=None):
         """See `IGitRepository`."""
         hosting_client = getUtility(IGitHostingClient)
@@ -691,33 +721,88 @@ class GitRepository(StormBase, WebhookTargetMixin, GitIdentityMixin):
                 if logger is not None:
                     logger.warning(
                         "Unconvertible ref %s %s: %s" % (path, info, e))
-        # GitRef rows can be large (especially commit_message), and we don't
-        # need the whole thing.
-        current_refs = {
-            ref[0]: ref[1:]
-            for ref in Store.of(self).find(
-                (GitRef.path, GitRef.commit_sha1, GitRef.object_type,
-                 And(
-                     GitRef.author_id != None,
-                     GitRef.author_date != None,
-                     GitRef.committer_id != None,
-                     GitRef.committer_date != None,
-                     GitRef.commit_message != None)),
-                GitRef.repository_id == self.id)}
+        current_refs = {ref[0]: ref[1:] for ref in self._findCurrentRefs()}
         refs_to_upsert = {}
         for path, info in new_refs.items():
-            current_ref = current_refs.get(path)
-            if (current_ref is None or
-                    info["sha1"] != current_ref[0] or
-                    info["type"] != current_ref[1]):
-                refs_to_upsert[path] = info
-            elif info["type"] == GitObjectType.COMMIT and not current_ref[2]:
-                # Only request detailed commit metadata for refs that point
-                # to commits.
+            if self._isRefChanged(info, current_refs.get(path)):
                 refs_to_upsert[path] = info
         refs_to_remove = set(current_refs) - set(new_refs)
         return refs_to_upsert, refs_to_remove
 
+    def _iterCurrentRefs(self, batch_size, start_after=None):
+        """Iterate over this repository's refs in path order, in batches.
+
+        Each batch is a separate query keyed on the last path seen, so
+        changes committed to earlier refs between batches don't disturb
+        the iteration.  Launchpad's databases use the C locale, so this
+        ordering matches Python's ordering of unicode strings.
+        """
+        while True:
+            clauses = []
+            if start_after is not None:
+                clauses.append(GitRef.path > start_after)
+            batch = list(self._findCurrentRefs(*clauses).order_by(
+                GitRef.path)[:batch_size])
+            for ref in batch:
+                yield ref
+            if len(batch) < batch_size:
+                break
+            start_after = batch[-1][0]
+
+    def iterRefChanges(self, hosting_path, chunk_size, start_after=None,
+                       logger=None):
+        """See `IGitRepository`."""
+        hosting_client = getUtility(IGitHostingClient)
+        new_refs = []
+        exclude_prefixes = config.codehosting.git_exclude_ref_prefixes.split()
+        for path, info in hosting_client.iterRefs(
+                hosting_path, exclude_prefixes=exclude_prefixes):
+            if start_after is not None and path <= start_after:
+                continue
+            try:
+                info = self._convertRefInfo(info)
+            except ValueError as e:
+                if logger is not None:
+                    logger.warning(
+                        "Unconvertible ref %s %s: %s" % (path, info, e))
+                continue
+            # Plain tuples are much smaller than the dicts we'll eventually
+            # need, so only build those a chunk at a time.
+            new_refs.append((path, info["sha1"], info["type"]))
+        new_refs.sort()
+        new_refs = iter(new_refs)
+        current_refs = self._iterCurrentRefs(
+            chunk_size, start_after=start_after)
+
+        refs_to_upsert = {}
+        refs_to_remove = set()
+        new_ref = next(new_refs, None)
+        current_ref = next(current_refs, None)
+        while new_ref is not None or current_ref is not None:
+            if current_ref is None or (
+                    new_ref is not None and new_ref[0] < current_ref[0]):
+                path = new_ref[0]
+                refs_to_upsert[path] = {
+                    "sha1": new_ref[1], "type": new_ref[2]}
+                new_ref = next(new_refs, None)
+            elif new_ref is None or current_ref[0] < new_ref[0]:
+                path = current_ref[0]
+                refs_to_remove.add(path)
+                current_ref = next(current_refs, None)
+            else:
+                path = new_ref[0]
+                info = {"sha1": new_ref[1], "type": new_ref[2]}
+                if self._isRefChanged(info, current_ref[1:]):
+                    refs_to_upsert[path] = info
+                new_ref = next(new_refs, None)
+                current_ref = next(current_refs, None)
+            if len(refs_to_upsert) + len(refs_to_remove) >= chunk_size:
+                yield refs_to_upsert, refs_to_remove, path
+                refs_to_upsert = {}
+                refs_to_remove = set()
+        if refs_to_upsert or refs_to_remove:
+            yield refs_to_upsert, refs_to_remove, path
+
     @staticmethod
     def fetchRefCommits(hosting_path, refs, logger=None):
         """See `IGitRepository`."""
@@ -1333,7 +1418,8 @@ class GitRepository(StormBase, WebhookTargetMixin, GitIdentityMixin):
         # The individual moves and adds above should have resulted in
         # correct rule ordering, but check this.
         requested_rule_order = list(new_rules)
-        observed_rule_order = [rule.ref_pattern for rule in self.rules]
+        observed_rule_order = [
+            observed_rule.ref_pattern for observed_rule in self.rules]
         if requested_rule_order != observed_rule_order:
             raise AssertionError(
                 "setRules failed to establish requested rule order %s "
@@ -1345,6 +1431,7 @@ class GitRepository(StormBase, WebhookTargetMixin, GitIdentityMixin):
         result = {}
 
         rules = list(self.rules)
+        matcher = get_ref_matcher([rule.ref_pattern for rule in rules])
         grants_for_user = defaultdict(list)
         grants = EmptyResultSet()
         is_owner = False
@@ -1360,42 +1447,61 @@ class GitRepository(StormBase, WebhookTargetMixin, GitIdentityMixin):
         for grant in grants:
             grants_for_user[grant.rule].append(grant)
 
+        # Many refs typically match the same set of rules (e.g. everything
+        # under refs/heads/), so only work out the permissions for each
+        # distinct set of matching rules once.
+        permissions_for_matches = {}
         for ref_path in ref_paths:
-            matching_rules = [
-                rule for rule in rules if fnmatch(
-                    six.ensure_binary(ref_path),
-                    rule.ref_pattern.encode("UTF-8"))]
-            if is_owner and not matching_rules:
-                # If there are no matching rules, then the repository owner
-                # can do anything.
-                result[ref_path] = {
-                    GitPermissionType.CAN_CREATE, GitPermissionType.CAN_PUSH,
-                    GitPermissionType.CAN_FORCE_PUSH,
-                    }
-                continue
-
-            seen_grantees = set()
-            union_permissions = set()
-            for rule in matching_rules:
-                for grant in grants_for_user[rule]:
-                    if (grant.grantee, grant.grantee_type) in seen_grantees:
-                        continue
-                    union_permissions.update(grant.permissions)
-                    seen_grantees.add((grant.grantee, grant.grantee_type))
-
-            owner_type = (None, GitGranteeType.REPOSITORY_OWNER)
-            if is_owner and owner_type not in seen_grantees:
-                union_permissions.update(
-                    {GitPermissionType.CAN_CREATE, GitPermissionType.CAN_PUSH})
-
-            # Permission to force-push implies permission to push.
-            if GitPermissionType.CAN_FORCE_PUSH in union_permissions:
-                union_permissions.add(GitPermissionType.CAN_PUSH)
-
-            result[ref_path] = union_permissions
+            matches = matcher.match(ref_path)
+            union_permissions = permissions_for_matches.get(matches)
+            if union_permissions is None:
+                union_permissions = self._getPermissionsForRules(
+                    [rules[index] for index in matches], grants_for_user,
+                    is_owner)
+                permissions_for_matches[matches] = union_permissions
+            result[ref_path] = set(union_permissions)
 
         return result
 
+    @staticmethod
+    def _getPermissionsForRules(matching_rules, grants_for_user, is_owner):
+        """Work out the permissions granted by a set of matching rules.
+
+        :param matching_rules: A list of `IGitRule`s matching a ref path,
+            in order.
+        :param grants_for_user: A dictionary mapping rules to the grants
+            that apply to the user in question.
+        :param is_owner: True if the user is the repository owner.
+        :return: A set of `GitPermissionType`s.
+        """
+        if is_owner and not matching_rules:
+            # If there are no matching rules, then the repository owner can
+            # do anything.
+            return {
+                GitPermissionType.CAN_CREATE, GitPermissionType.CAN_PUSH,
+                GitPermissionType.CAN_FORCE_PUSH,
+                }
+
+        seen_grantees = set()
+        union_permissions = set()
+        for rule in matching_rules:
+            for grant in grants_for_user[rule]:
+                if (grant.grantee, grant.grantee_type) in seen_grantees:
+                    continue
+                union_permissions.update(grant.permissions)
+                seen_grantees.add((grant.grantee, grant.grantee_type))
+
+        owner_type = (None, GitGranteeType.REPOSITORY_OWNER)
+        if is_owner and owner_type not in seen_grantees:
+            union_permissions.update(
+                {GitPermissionType.CAN_CREATE, GitPermissionType.CAN_PUSH})
+
+        # Permission to force-push implies permission to push.
+        if GitPermissionType.CAN_FORCE_PUSH in union_permissions:
+            union_permissions.add(GitPermissionType.CAN_PUSH)
+
+        return union_permissions
+
     def api_checkRefPermissions(self, person, paths):
         """See `IGitRepository`."""
         return {
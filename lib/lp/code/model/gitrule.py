@@ -7,6 +7,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'get_ref_matcher',
+    'GitRefMatcher',
     'GitRule',
     'GitRuleGrant',
     ]
@@ -15,6 +17,10 @@ from collections import (
     defaultdict,
     OrderedDict,
     )
+import re
+from threading import Lock
+
+from bzrlib.lru_cache import LRUCache
 
 from lazr.enum import DBItem
 from lazr.restful.interfaces import (
@@ -23,6 +29,7 @@ from lazr.restful.interfaces import (
     )
 from lazr.restful.utils import get_current_browser_request
 import pytz
+import six
 from storm.locals import (
     Bool,
     DateTime,
@@ -88,6 +95,111 @@ def git_rule_modified(rule, event):
         removeSecurityProxy(rule).date_last_modified = UTC_NOW
 
 
+def _glob_to_regex(pattern):
+    """Translate a UTF-8-encoded glob pattern into an unanchored regex.
+
+    This follows the same rules as `fnmatch.translate`, but leaves out the
+    trailing anchor and flags so that several patterns can be combined
+    into a single alternation.
+    """
+    i, n = 0, len(pattern)
+    regex = b""
+    while i < n:
+        c = pattern[i:i + 1]
+        i += 1
+        if c == b"*":
+            regex += b".*"
+        elif c == b"?":
+            regex += b"."
+        elif c == b"[":
+            j = i
+            if pattern[j:j + 1] == b"!":
+                j += 1
+            if pattern[j:j + 1] == b"]":
+                j += 1
+            while j < n and pattern[j:j + 1] != b"]":
+                j += 1
+            if j >= n:
+                regex += b"\\["
+            else:
+                stuff = pattern[i:j].replace(b"\\", b"\\\\")
+                i = j + 1
+                if stuff[:1] == b"!":
+                    stuff = b"^" + stuff[1:]
+                elif stuff[:1] == b"^":
+                    stuff = b"\\" + stuff
+                regex += b"[" + stuff + b"]"
+        else:
+            regex += re.escape(c)
+    return regex
+
+
+class GitRefMatcher:
+    """Match ref paths against an ordered list of ref patterns.
+
+    This gives the same results as calling `fnmatch.fnmatch` with each
+    pattern in turn, but translates the patterns only once.  Patterns
+    without glob metacharacters are looked up in a dictionary; the rest
+    are bucketed by their literal prefix and guarded by a single combined
+    regex, so that ref paths matching no wildcard rule are rejected in
+    one step.
+    """
+
+    def __init__(self, ref_patterns):
+        self.ref_patterns = tuple(ref_patterns)
+        self._exact = {}
+        self._wildcards = []
+        for index, ref_pattern in enumerate(self.ref_patterns):
+            pattern = ref_pattern.encode("UTF-8")
+            prefix = re.split(br"[*?[]", pattern, 1)[0]
+            if prefix == pattern:
+                self._exact.setdefault(pattern, []).append(index)
+            else:
+                self._wildcards.append(
+                    (index, prefix,
+                     re.compile(_glob_to_regex(pattern) + b"\\Z", re.S)))
+        if self._wildcards:
+            self._combined = re.compile(
+                b"(?:" +
+                b"|".join(regex.pattern for _, _, regex in self._wildcards) +
+                b")", re.S)
+        else:
+            self._combined = None
+
+    def match(self, ref_path):
+        """Return the indexes of the patterns matching `ref_path`.
+
+        :return: A tuple of indexes into `ref_patterns`, in order.
+        """
+        ref_path = six.ensure_binary(ref_path)
+        indexes = self._exact.get(ref_path, [])
+        if self._combined is not None and self._combined.match(ref_path):
+            indexes = indexes + [
+                index for index, prefix, regex in self._wildcards
+                if ref_path.startswith(prefix) and regex.match(ref_path)]
+            indexes.sort()
+        return tuple(indexes)
+
+
+# Compiled matchers keyed by their ordered tuple of ref patterns.  Any
+# change to a repository's rules changes its key, so entries never need
+# to be invalidated explicitly; they just fall out of the cache.
+_ref_matcher_cache = LRUCache(1000, 700)
+_ref_matcher_cache_lock = Lock()
+
+
+def get_ref_matcher(ref_patterns):
+    """Return a (possibly cached) `GitRefMatcher` for `ref_patterns`."""
+    key = tuple(ref_patterns)
+    with _ref_matcher_cache_lock:
+        matcher = _ref_matcher_cache.get(key)
+    if matcher is None:
+        matcher = GitRefMatcher(key)
+        with _ref_matcher_cache_lock:
+            _ref_matcher_cache[key] = matcher
+    return matcher
+
+
 @implementer(IGitRule, IJSONPublishable)
 class GitRule(StormBase):
     """See `IGitRule`."""
@@ -1445,15 +1445,16 @@ class TestBranchCollectionConvertListingSortToOrderBy(TestCase):
              Asc(Owner.name),
              Asc(Branch.name)], lifecycle_order)
 
-    def test_sort_on_column_not_in_default_sort_order(self):
-        """Test with an option that's not part of the default sort.
+    def test_sort_on_date(self):
+        """Test with a date option, which isn't part of the default sort.
 
-        This should put the passed option first in the list, but leave the
-        rest the same.
+        Ties are broken by the branch id alone, in the same direction.
         """
-        registrant_order = (
+        self.assertSortsEqual(
+            [Asc(Branch.date_created), Asc(Branch.id)],
             GenericBranchCollection._convertListingSortToOrderBy(
                 BranchListingSort.OLDEST_FIRST))
         self.assertSortsEqual(
-            [Asc(Branch.date_created)] + self.DEFAULT_BRANCH_LISTING_SORT,
-            registrant_order)
+            [Desc(Branch.date_last_modified), Desc(Branch.id)],
+            GenericBranchCollection._convertListingSortToOrderBy(
+                BranchListingSort.MOST_RECENTLY_CHANGED_FIRST))
@@ -11,7 +11,10 @@ __all__ = [
     'NewEvents',
     ]
 
-from datetime import datetime
+from datetime import (
+    datetime,
+    timedelta,
+    )
 import StringIO
 
 from pymacaroons import Macaroon
@@ -30,6 +33,7 @@ from zope.security.proxy import removeSecurityProxy
 
 from lp.app.enums import InformationType
 from lp.code.enums import (
+    CodeImportEventDataType,
     CodeImportEventType,
     CodeImportJobState,
     CodeImportResultStatus,
@@ -343,6 +347,95 @@ class TestCodeImportJobSetGetJobForMachine(TestCaseWithFactory):
         self.assertNoJobSelected()
 
 
+class TestCodeImportJobSetGetJobForMachineCapacity(TestCaseWithFactory):
+    """Tests for getJobForMachine when the machine reports its capacity."""
+
+    layer = DatabaseFunctionalLayer
+
+    def setUp(self):
+        super(TestCodeImportJobSetGetJobForMachineCapacity, self).setUp()
+        login_for_code_imports()
+        for job in CodeImportJob.select():
+            job.destroySelf()
+        self.machine = self.factory.makeCodeImportMachine(set_online=True)
+        self.pushConfig(
+            'codeimport', heavy_import_duration=3600,
+            light_import_duration=300, light_imports_per_slot=4,
+            min_free_memory_mb=1024, min_free_disk_mb=1024)
+
+    def makeJob(self, duration, date_due_delta=-1, git=False):
+        """Make a pending job whose import recently took `duration` seconds.
+
+        If `duration` is None, the import has no recent history.
+        """
+        if git:
+            code_import = self.factory.makeCodeImport(
+                git_repo_url=self.factory.getUniqueURL(),
+                review_status=CodeImportReviewStatus.NEW)
+        else:
+            code_import = self.factory.makeCodeImport(
+                review_status=CodeImportReviewStatus.NEW)
+        if duration is not None:
+            date_finished = datetime.now(UTC) - timedelta(days=1)
+            self.factory.makeCodeImportResult(
+                code_import=code_import,
+                date_started=date_finished - timedelta(seconds=duration),
+                date_finished=date_finished)
+        job = self.factory.makeCodeImportJob(code_import)
+        removeSecurityProxy(job).date_due = (
+            UTC_NOW + '%d days' % date_due_delta)
+        return job
+
+    def getJob(self, worker_limit=2, **capacity):
+        capacity.setdefault('cpus', 4)
+        capacity.setdefault('load_average', 0.0)
+        return getUtility(ICodeImportJobSet).getJobForMachine(
+            self.machine.hostname, worker_limit, capacity=capacity)
+
+    def test_heavy_imports_kept_apart(self):
+        # While a heavy import is running on a machine, other heavy imports
+        # are passed over in favour of lighter ones.
+        heavy = self.makeJob(7200, -3)
+        other_heavy = self.makeJob(7200, -2)
+        medium = self.makeJob(1000, -1)
+        self.assertEqual(heavy, self.getJob())
+        self.assertEqual(medium, self.getJob())
+        self.assertIsNone(self.getJob())
+        self.assertEqual(CodeImportJobState.PENDING, other_heavy.state)
+
+    def test_light_imports_packed(self):
+        # Several light Git imports share a single worker slot.
+        jobs = [self.makeJob(60, git=True) for _ in range(5)]
+        selected = [self.getJob(worker_limit=1) for _ in range(5)]
+        self.assertEqual(jobs[:4], sorted(selected[:4], key=jobs.index))
+        self.assertIsNone(selected[4])
+
+    def test_unknown_imports_take_a_slot(self):
+        # Imports without recent history are assumed to need a whole slot.
+        self.makeJob(None, git=True)
+        self.makeJob(None, git=True)
+        self.assertIsNotNone(self.getJob(worker_limit=1))
+        self.assertIsNone(self.getJob(worker_limit=1))
+
+    def test_low_disk(self):
+        # A machine short of disk space is given nothing.
+        self.makeJob(60, git=True)
+        self.assertIsNone(self.getJob(disk_available_mb=10))
+
+    def test_low_memory(self):
+        # A machine short of memory is only given light imports.
+        self.makeJob(1000, -2)
+        light = self.makeJob(60, -1, git=True)
+        self.assertEqual(light, self.getJob(memory_available_mb=10))
+        self.assertIsNone(self.getJob(memory_available_mb=10))
+
+    def test_overloaded(self):
+        # A machine whose load exceeds its CPU count is only given light
+        # imports.
+        self.makeJob(1000)
+        self.assertIsNone(self.getJob(cpus=2, load_average=3.0))
+
+
 class ReclaimableJobTests(TestCaseWithFactory):
     """Helpers for tests that need to create reclaimable jobs."""
 
@@ -792,6 +885,22 @@ class TestCodeImportJobWorkflowStartJob(TestCaseWithFactory,
         self.assertEqual(machine, job.machine)
         self.assertEqual(CodeImportJobState.RUNNING, job.state)
 
+    def test_records_queue_wait(self):
+        # startJob records how long the job waited after it was due.
+        code_import = self.factory.makeCodeImport()
+        machine = self.factory.makeCodeImportMachine(set_online=True)
+        job = self.factory.makeCodeImportJob(code_import)
+        removeSecurityProxy(job).date_due = (
+            datetime.now(UTC) - timedelta(hours=1))
+        getUtility(ICodeImportJobWorkflow).startJob(job, machine)
+        start_event = list(
+            getUtility(ICodeImportEventSet).getEventsForCodeImport(
+                code_import))[-1]
+        self.assertEqual(CodeImportEventType.START, start_event.event_type)
+        [(data_type, value)] = start_event.items()
+        self.assertEqual(CodeImportEventDataType.QUEUE_WAIT, data_type)
+        self.assertTrue(3600 <= int(value) < 3700)
+
     def test_offlineMachine(self):
         # Calling startJob with a machine which is not ONLINE is an error.
         machine = self.factory.makeCodeImportMachine()
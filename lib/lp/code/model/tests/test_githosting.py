@@ -20,6 +20,7 @@ import json
 import re
 
 from lazr.restful.utils import get_current_browser_request
+import requests
 import responses
 from testtools.matchers import MatchesStructure
 from zope.component import getUtility
@@ -163,6 +164,34 @@ class TestGitHostingClient(TestCase):
                 "400 Client Error: Bad Request",
                 self.client.getRefs, "123")
 
+    def test_iterRefs(self):
+        refs = {
+            "refs/heads/master": {"object": {"sha1": "a" * 40}},
+            "refs/tags/1.0": {"object": {"sha1": "b" * 40}},
+            }
+        with self.mockRequests("GET", json=refs):
+            observed = list(self.client.iterRefs(
+                "123", exclude_prefixes=["refs/changes/"]))
+        self.assertEqual(refs, dict(observed))
+        self.assertRequest(
+            "repo/123/refs?exclude_prefix=refs%2Fchanges%2F", method="GET")
+
+    def test_iterRefs_failure(self):
+        with self.mockRequests("GET", status=400):
+            self.assertRaisesWithContent(
+                GitRepositoryScanFault,
+                "Failed to get refs from Git repository: "
+                "400 Client Error: Bad Request",
+                list, self.client.iterRefs("123"))
+
+    def test_iterRefs_truncated(self):
+        with self.mockRequests("GET", body='{"refs/heads/master": {'):
+            self.assertRaisesWithContent(
+                GitRepositoryScanFault,
+                "Failed to get refs from Git repository: "
+                "Truncated JSON object",
+                list, self.client.iterRefs("123"))
+
     def test_getCommits(self):
         with self.mockRequests("POST", json=[{"sha1": "0"}]):
             commits = self.client.getCommits("123", ["0"])
@@ -170,6 +199,17 @@ class TestGitHostingClient(TestCase):
         self.assertRequest(
             "repo/123/commits", method="POST", json_data={"commits": ["0"]})
 
+    def test_getCommits_batches(self):
+        # Long lists of commits are requested in batches.
+        self.pushConfig(
+            "codehosting", internal_git_api_commits_batch_size=2)
+        with self.mockRequests("POST", json=[{"sha1": "0"}]):
+            commits = self.client.getCommits("123", ["0", "1", "2"])
+        self.assertEqual([{"sha1": "0"}, {"sha1": "0"}], commits)
+        self.assertEqual(
+            [{"commits": ["0", "1"]}, {"commits": ["2"]}],
+            [json.loads(request.body) for request in self.requests])
+
     def test_getCommits_failure(self):
         with self.mockRequests("POST", status=400):
             self.assertRaisesWithContent(
@@ -370,6 +410,34 @@ class TestGitHostingClient(TestCase):
                 " (256 vs 0)",
                 self.client.getBlob, "123", "dir/path/file/name")
 
+    def test_session_reused(self):
+        # Requests from the same thread share a persistent session.
+        client = removeSecurityProxy(self.client)
+        with self.mockRequests("GET", json={}):
+            self.client.getProperties("123")
+            session = client._getSession()
+            self.client.getProperties("123")
+        self.assertIs(session, client._getSession())
+
+    def test_session_discarded_after_connection_error(self):
+        client = removeSecurityProxy(self.client)
+        session = client._getSession()
+        with self.mockRequests(
+                "GET", body=requests.ConnectionError("Connection refused")):
+            self.assertRaises(
+                GitRepositoryScanFault, self.client.getProperties, "123")
+        self.assertIsNot(session, client._getSession())
+
+    def test_gzip_disabled(self):
+        self.pushConfig("codehosting", internal_git_api_gzip=False)
+        client = removeSecurityProxy(self.client)
+        client._discardSession()
+        self.addCleanup(client._discardSession)
+        with self.mockRequests("GET", json={}):
+            self.client.getProperties("123")
+        self.assertEqual(
+            "identity", self.requests[0].headers["Accept-Encoding"])
+
     def test_works_in_job(self):
         # `GitHostingClient` is usable from a running job.
         @implementer(IRunnableJob)
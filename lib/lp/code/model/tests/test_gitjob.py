@@ -51,6 +51,7 @@ from lp.code.tests.helpers import GitHostingFixture
 from lp.services.config import config
 from lp.services.database.constants import UTC_NOW
 from lp.services.features.testing import FeatureFixture
+from lp.services.job.interfaces.job import JobStatus
 from lp.services.job.runner import JobRunner
 from lp.services.utils import seconds_since_epoch
 from lp.services.webapp import canonical_url
@@ -164,6 +165,42 @@ class TestGitRefScanJob(TestCaseWithFactory):
         self.assertRefsMatch(repository.refs, repository, paths)
         self.assertEqual("refs/heads/master", repository.default_branch)
 
+    def test_run_chunked(self):
+        # If configured to do so, the job synchronises refs in chunks,
+        # giving the same result.
+        self.pushConfig("codehosting", git_ref_scan_chunk_size=2)
+        repository = self.factory.makeGitRepository()
+        self.factory.makeGitRefs(
+            repository=repository, paths=("refs/heads/old",))
+        job = GitRefScanJob.create(repository)
+        paths = (
+            "refs/heads/a", "refs/heads/b", "refs/heads/master",
+            "refs/tags/1.0", "refs/tags/2.0")
+        author = repository.owner
+        author_date_start = datetime(2015, 1, 1, tzinfo=pytz.UTC)
+        author_date_gen = time_counter(author_date_start, timedelta(days=1))
+        self.useFixture(GitHostingFixture(
+            refs=self.makeFakeRefs(paths),
+            commits=self.makeFakeCommits(author, author_date_gen, paths)))
+        with dbuser("branchscanner"):
+            JobRunner([job]).runAll()
+        self.assertEqual(JobStatus.COMPLETED, job.job.status)
+        self.assertRefsMatch(repository.refs, repository, paths)
+        self.assertNotIn("ref_scan_cursor", job.metadata)
+
+    def test_run_chunked_resumes(self):
+        # A chunked scan resumes from the cursor left by an earlier attempt.
+        self.pushConfig("codehosting", git_ref_scan_chunk_size=2)
+        repository = self.factory.makeGitRepository()
+        job = GitRefScanJob.create(repository)
+        removeSecurityProxy(job).context.metadata = dict(
+            job.metadata, ref_scan_cursor="refs/heads/b")
+        paths = ("refs/heads/a", "refs/heads/b", "refs/heads/c")
+        self.useFixture(GitHostingFixture(refs=self.makeFakeRefs(paths)))
+        with dbuser("branchscanner"):
+            JobRunner([job]).runAll()
+        self.assertRefsMatch(repository.refs, repository, ["refs/heads/c"])
+
     def test_logs_bad_ref_info(self):
         repository = self.factory.makeGitRepository()
         job = GitRefScanJob.create(repository)
@@ -1634,6 +1634,75 @@ class TestGitRepositoryRefs(TestCaseWithFactory):
             [{"exclude_prefixes": ["refs/changes/", "refs/pull/"]}],
             hosting_fixture.getRefs.extract_kwargs())
 
+    def test_iterRefChanges(self):
+        # iterRefChanges plans the same changes as planRefChanges, split
+        # into chunks in ref path order.
+        repository = self.factory.makeGitRepository()
+        paths = (
+            "refs/heads/bar", "refs/heads/baz", "refs/heads/foo",
+            "refs/heads/master")
+        self.factory.makeGitRefs(repository=repository, paths=paths)
+        master_sha1 = repository.getRefByPath("refs/heads/master").commit_sha1
+        foo_sha1 = repository.getRefByPath("refs/heads/foo").commit_sha1
+        self.useFixture(GitHostingFixture(refs={
+            "refs/heads/master": {
+                "object": {"sha1": "1" * 40, "type": "commit"},
+                },
+            "refs/heads/foo": {
+                "object": {"sha1": foo_sha1, "type": "commit"},
+                },
+            "refs/heads/quux": {
+                "object": {"sha1": master_sha1, "type": "commit"},
+                },
+            "refs/tags/1.0": {
+                "object": {"sha1": master_sha1, "type": "commit"},
+                },
+            }))
+        expected_upsert = {
+            "refs/heads/master": {
+                "sha1": "1" * 40, "type": GitObjectType.COMMIT},
+            "refs/heads/foo": {
+                "sha1": foo_sha1, "type": GitObjectType.COMMIT},
+            "refs/heads/quux": {
+                "sha1": master_sha1, "type": GitObjectType.COMMIT},
+            "refs/tags/1.0": {
+                "sha1": master_sha1, "type": GitObjectType.COMMIT},
+            }
+        self.assertEqual(
+            (expected_upsert, {"refs/heads/bar", "refs/heads/baz"}),
+            repository.planRefChanges("dummy"))
+        self.assertEqual([
+            ({}, {"refs/heads/bar", "refs/heads/baz"}, "refs/heads/baz"),
+            ({"refs/heads/foo": expected_upsert["refs/heads/foo"],
+              "refs/heads/master": expected_upsert["refs/heads/master"]},
+             set(), "refs/heads/master"),
+            ({"refs/heads/quux": expected_upsert["refs/heads/quux"],
+              "refs/tags/1.0": expected_upsert["refs/tags/1.0"]},
+             set(), "refs/tags/1.0"),
+            ], list(repository.iterRefChanges("dummy", 2)))
+
+    def test_iterRefChanges_start_after(self):
+        # iterRefChanges can resume from a cursor, ignoring refs on either
+        # side that sort before it.
+        repository = self.factory.makeGitRepository()
+        self.factory.makeGitRefs(
+            repository=repository,
+            paths=("refs/heads/bar", "refs/heads/foo"))
+        self.useFixture(GitHostingFixture(refs={
+            "refs/heads/baz": {
+                "object": {"sha1": "1" * 40, "type": "commit"},
+                },
+            "refs/tags/1.0": {
+                "object": {"sha1": "2" * 40, "type": "commit"},
+                },
+            }))
+        self.assertEqual([
+            ({"refs/tags/1.0": {
+                "sha1": "2" * 40, "type": GitObjectType.COMMIT}},
+             {"refs/heads/foo"}, "refs/tags/1.0"),
+            ], list(repository.iterRefChanges(
+                "dummy", 10, start_after="refs/heads/baz")))
+
     def test_fetchRefCommits(self):
         # fetchRefCommits fetches detailed tip commit metadata for the
         # requested refs.
@@ -7,6 +7,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 
+from fnmatch import fnmatch
+
 from storm.store import Store
 from testtools.matchers import (
     Equals,
@@ -30,10 +32,15 @@ from lp.code.interfaces.gitrule import (
     IGitRuleGrant,
     is_rule_exact,
     )
+from lp.code.model.gitrule import (
+    get_ref_matcher,
+    GitRefMatcher,
+    )
 from lp.services.database.sqlbase import get_transaction_timestamp
 from lp.services.webapp.snapshot import notify_modified
 from lp.testing import (
     person_logged_in,
+    TestCase,
     TestCaseWithFactory,
     verifyObject,
     )
@@ -742,3 +749,58 @@ class TestGitRuleGrant(TestCaseWithFactory):
         with person_logged_in(rule.repository.owner):
             grants[1].destroySelf(rule.repository.owner)
         self.assertThat(rule.grants, MatchesSetwise(Equals(grants[0])))
+
+
+class TestGitRefMatcher(TestCase):
+
+    ref_patterns = [
+        "refs/heads/master",
+        "refs/heads/*",
+        "refs/heads/stable/*",
+        "refs/heads/stable/1.?",
+        "refs/tags/v[0-9]*",
+        "refs/tags/[!v]*",
+        "refs/heads/[unterminated",
+        "refs/heads/m\xe4ster",
+        "*",
+        "refs/heads/master",
+        ]
+
+    ref_paths = [
+        "refs/heads/master",
+        "refs/heads/main",
+        "refs/heads/stable/1.0",
+        "refs/heads/stable/1.10",
+        "refs/heads/stable/",
+        "refs/heads/feature\nnewline",
+        "refs/tags/v1.0",
+        "refs/tags/release-1.0",
+        "refs/tags/v",
+        "refs/heads/[unterminated",
+        "refs/heads/m\xe4ster",
+        b"refs/heads/m\xc3\xa4ster",
+        "refs/notes/commits",
+        "",
+        ]
+
+    def test_matches_fnmatch(self):
+        # GitRefMatcher returns the same matches as fnmatch, in order.
+        matcher = GitRefMatcher(self.ref_patterns)
+        for ref_path in self.ref_paths:
+            expected = tuple(
+                index for index, ref_pattern in enumerate(self.ref_patterns)
+                if fnmatch(
+                    ref_path if isinstance(ref_path, bytes)
+                    else ref_path.encode("UTF-8"),
+                    ref_pattern.encode("UTF-8")))
+            self.assertEqual(
+                expected, matcher.match(ref_path), "ref_path=%r" % ref_path)
+
+    def test_no_rules(self):
+        self.assertEqual((), GitRefMatcher([]).match("refs/heads/master"))
+
+    def test_get_ref_matcher_caches(self):
+        # Matchers are cached by their sequence of patterns.
+        matcher = get_ref_matcher(self.ref_patterns)
+        self.assertIs(matcher, get_ref_matcher(list(self.ref_patterns)))
+        self.assertIsNot(matcher, get_ref_matcher(self.ref_patterns[1:]))
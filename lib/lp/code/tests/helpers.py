@@ -360,6 +360,9 @@ class GitHostingFixture(fixtures.Fixture):
         self.delete = FakeMethod()
         self.disable_memcache = disable_memcache
 
+    def iterRefs(self, path, exclude_prefixes=None):
+        return self.getRefs(path, exclude_prefixes=exclude_prefixes).items()
+
     def _setUp(self):
         self.useFixture(ZopeUtilityFixture(self, IGitHostingClient))
         if self.disable_memcache:
@@ -32,10 +32,10 @@ from lp.xmlrpc.helpers import return_fault
 class CodeImportSchedulerAPI(LaunchpadXMLRPCView):
     """See `ICodeImportScheduler`."""
 
-    def getJobForMachine(self, hostname, worker_limit):
+    def getJobForMachine(self, hostname, worker_limit, capacity=None):
         """See `ICodeImportScheduler`."""
         job = getUtility(ICodeImportJobSet).getJobForMachine(
-            hostname, worker_limit)
+            hostname, worker_limit, capacity=capacity)
         if job is not None:
             return job.id
         else:
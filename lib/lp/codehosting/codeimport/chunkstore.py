@@ -0,0 +1,376 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Store directory trees incrementally as content-addressed chunks.
+
+Import workers used to archive foreign trees and caches as whole
+tarballs, so every run moved the whole tree even when little of it had
+changed.  A `ChunkedTreeStore` instead splits each file into chunks
+identified by their SHA-256 digests and describes the tree in a JSON
+manifest.  Chunks that the store already holds are never uploaded again,
+and chunks that a worker already holds in its local cache are never
+downloaded again.
+
+To keep the number of remote files (and hence round trips) low, the new
+chunks from each `putTree` are uploaded as a single pack, and chunks are
+fetched from packs using ranged reads.  Packs that are mostly
+unreferenced are rewritten on the next `putTree`.
+
+The remote layout is::
+
+    <name>.manifest     The manifest for the tree called <name>.
+    packs/<digest>      Concatenated zlib-compressed chunks.
+
+and the local cache layout is::
+
+    <name>.manifest     The manifest most recently fetched or stored.
+    chunks/<digest>     A zlib-compressed chunk.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'ChunkedTreeStore',
+    ]
+
+from collections import defaultdict
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import zlib
+
+from bzrlib.errors import NoSuchFile
+
+
+# The size of the chunks that files are split into.
+CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_FORMAT = 1
+
+# Packs where less than this fraction of the chunks are still referenced
+# are rewritten, so that unreferenced chunks don't accumulate forever.
+REPACK_THRESHOLD = 0.5
+
+
+def _encode_path(path):
+    # Paths are arbitrary byte strings; round-trip them through
+    # ISO-8859-1 so that they survive JSON encoding.
+    return path.decode('ISO-8859-1')
+
+
+def _decode_path(path):
+    return path.encode('ISO-8859-1')
+
+
+def _walk_tree(directory, filenames=None):
+    """Generate (relative path, lstat result) for everything in `directory`.
+
+    Parents are generated before their children, and siblings are sorted
+    by name so that unchanged trees produce identical manifests.
+
+    :param filenames: If not None, only these top-level entries of
+        `directory` are included.
+    """
+    if filenames is None:
+        filenames = os.listdir(directory)
+    pending = [os.path.join(directory, name) for name in sorted(filenames)]
+    pending.reverse()
+    while pending:
+        path = pending.pop()
+        st = os.lstat(path)
+        yield os.path.relpath(path, directory), st
+        if stat.S_ISDIR(st.st_mode):
+            pending.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path), reverse=True))
+
+
+def _read_chunks(path):
+    """Generate the chunks of the file at `path`."""
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def _read_chunk(path, index):
+    """Return chunk number `index` of the file at `path`."""
+    with open(path, 'rb') as f:
+        f.seek(index * CHUNK_SIZE)
+        return f.read(CHUNK_SIZE)
+
+
+def _empty_manifest():
+    return {'format': MANIFEST_FORMAT, 'entries': [], 'chunks': {}}
+
+
+class _PackWriter:
+    """Write chunks to a new pack in a local temporary file."""
+
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.digests = []
+
+    def add(self, digest, compressed):
+        """Add a compressed chunk, returning its (offset, length)."""
+        self.file.write(compressed)
+        self.sha256.update(compressed)
+        location = (self.offset, len(compressed))
+        self.offset += len(compressed)
+        self.digests.append(digest)
+        return location
+
+    def close(self):
+        """Finish the pack and return its name."""
+        self.file.close()
+        return self.sha256.hexdigest()
+
+
+class ChunkedTreeStore:
+    """Stores directory trees on a transport as chunks and manifests."""
+
+    def __init__(self, transport, cache_dir=None):
+        """Construct a `ChunkedTreeStore`.
+
+        :param transport: The transport to store manifests and packs on.
+        :param cache_dir: A local directory in which to cache chunks
+            between runs, or None.  Without a cache, every chunk is
+            fetched from `transport`.
+        """
+        self._transport = transport
+        self.cache_dir = cache_dir
+        # Manifests fetched or stored by this instance, so that `putTree`
+        # can tell which chunks the store already holds.
+        self._manifests = {}
+
+    def _getManifest(self, name):
+        """Return the manifest for `name`, or None if there isn't one."""
+        if name not in self._manifests:
+            try:
+                data = self._transport.get_bytes('%s.manifest' % name)
+            except NoSuchFile:
+                return None
+            manifest = json.loads(data)
+            if manifest.get('format') != MANIFEST_FORMAT:
+                raise AssertionError(
+                    "Unknown manifest format: %r" % manifest.get('format'))
+            self._manifests[name] = manifest
+        return self._manifests[name]
+
+    def _openChunkDir(self):
+        """Return a directory of compressed chunks and whether it's a cache.
+        """
+        if self.cache_dir is None:
+            return tempfile.mkdtemp(), False
+        chunk_dir = os.path.join(self.cache_dir, 'chunks')
+        if not os.path.isdir(chunk_dir):
+            os.makedirs(chunk_dir)
+        return chunk_dir, True
+
+    def _downloadChunks(self, manifest, chunk_dir):
+        """Download any chunks in `manifest` that are not in `chunk_dir`.
+
+        :return: The number of chunks downloaded.
+        """
+        wanted = defaultdict(list)
+        for digest, (pack, offset, length) in manifest['chunks'].items():
+            if not os.path.exists(os.path.join(chunk_dir, digest)):
+                wanted[pack].append((offset, length, digest))
+        count = 0
+        for pack, chunks in sorted(wanted.items()):
+            chunks.sort()
+            digests = dict((offset, digest) for offset, _, digest in chunks)
+            offsets = [(offset, length) for offset, length, _ in chunks]
+            for offset, data in self._transport.readv(
+                    'packs/%s' % pack, offsets):
+                chunk_path = os.path.join(chunk_dir, digests[offset])
+                with open(chunk_path, 'wb') as f:
+                    f.write(data)
+                count += 1
+        return count
+
+    def _saveToCache(self, name, manifest):
+        """Record `manifest` in the cache and prune unreferenced chunks."""
+        manifest_path = os.path.join(self.cache_dir, '%s.manifest' % name)
+        with open(manifest_path + '.new', 'wb') as f:
+            json.dump(manifest, f)
+        os.rename(manifest_path + '.new', manifest_path)
+        referenced = set()
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.manifest'):
+                with open(os.path.join(self.cache_dir, filename)) as f:
+                    referenced.update(json.load(f)['chunks'])
+        chunk_dir = os.path.join(self.cache_dir, 'chunks')
+        for digest in os.listdir(chunk_dir):
+            if digest not in referenced:
+                os.unlink(os.path.join(chunk_dir, digest))
+
+    def fetchTree(self, name, target_path):
+        """Retrieve the tree stored as `name` into `target_path`.
+
+        :param name: The name of the tree.
+        :param target_path: The local directory to create the tree in,
+            which is created if necessary.
+        :return: True if the tree was found and retrieved, False
+            otherwise.
+        """
+        manifest = self._getManifest(name)
+        if manifest is None:
+            return False
+        chunk_dir, cached = self._openChunkDir()
+        try:
+            self._downloadChunks(manifest, chunk_dir)
+            if not os.path.isdir(target_path):
+                os.makedirs(target_path)
+            directories = []
+            for entry in manifest['entries']:
+                path = os.path.join(
+                    target_path, _decode_path(entry['path']))
+                if entry['type'] == 'directory':
+                    if not os.path.isdir(path):
+                        os.mkdir(path)
+                    directories.append((path, entry))
+                elif entry['type'] == 'symlink':
+                    if os.path.lexists(path):
+                        os.unlink(path)
+                    os.symlink(_decode_path(entry['target']), path)
+                else:
+                    with open(path, 'wb') as f:
+                        for digest in entry['chunks']:
+                            chunk_path = os.path.join(chunk_dir, digest)
+                            with open(chunk_path, 'rb') as chunk:
+                                f.write(zlib.decompress(chunk.read()))
+                    os.chmod(path, entry['mode'])
+                    os.utime(path, (entry['mtime'], entry['mtime']))
+            # Set directory metadata last, since creating their contents
+            # changes their modification times.
+            for path, entry in reversed(directories):
+                os.chmod(path, entry['mode'])
+                os.utime(path, (entry['mtime'], entry['mtime']))
+        finally:
+            if not cached:
+                shutil.rmtree(chunk_dir)
+        if cached:
+            self._saveToCache(name, manifest)
+        return True
+
+    def putTree(self, name, source_path, filenames=None):
+        """Store the tree at `source_path` as `name`.
+
+        Only chunks that are not already in the store are uploaded.
+
+        :param name: The name of the tree.
+        :param source_path: The local directory containing the tree.
+        :param filenames: If not None, only store these top-level entries
+            of `source_path`.
+        :return: The number of new chunks uploaded.
+        """
+        old_manifest = self._getManifest(name) or _empty_manifest()
+        old_chunks = old_manifest['chunks']
+        chunk_dir, cached = self._openChunkDir()
+        pack_writer = _PackWriter()
+        try:
+            manifest = _empty_manifest()
+            chunks = manifest['chunks']
+            # Where to find each chunk locally, in case it has to be
+            # repacked.
+            sources = {}
+
+            def add_chunk(digest, data):
+                compressed = zlib.compress(data)
+                chunks[digest] = [None] + list(
+                    pack_writer.add(digest, compressed))
+                if cached:
+                    with open(os.path.join(chunk_dir, digest), 'wb') as f:
+                        f.write(compressed)
+
+            for path, st in _walk_tree(source_path, filenames=filenames):
+                entry = {
+                    'path': _encode_path(path),
+                    'mode': stat.S_IMODE(st.st_mode),
+                    'mtime': st.st_mtime,
+                    }
+                full_path = os.path.join(source_path, path)
+                if stat.S_ISDIR(st.st_mode):
+                    entry['type'] = 'directory'
+                elif stat.S_ISLNK(st.st_mode):
+                    entry['type'] = 'symlink'
+                    entry['target'] = _encode_path(os.readlink(full_path))
+                elif stat.S_ISREG(st.st_mode):
+                    entry['type'] = 'file'
+                    entry['chunks'] = []
+                    for index, data in enumerate(_read_chunks(full_path)):
+                        digest = hashlib.sha256(data).hexdigest()
+                        entry['chunks'].append(digest)
+                        if digest in chunks:
+                            continue
+                        sources[digest] = (full_path, index)
+                        if digest in old_chunks:
+                            chunks[digest] = old_chunks[digest]
+                        else:
+                            add_chunk(digest, data)
+                else:
+                    # Devices, sockets and the like can't be stored.
+                    continue
+                manifest['entries'].append(entry)
+
+            # Rewrite the live chunks of mostly-unreferenced packs into the
+            # new pack.
+            old_pack_sizes = defaultdict(int)
+            live_pack_sizes = defaultdict(int)
+            for digest, (pack, _, length) in old_chunks.items():
+                old_pack_sizes[pack] += length
+                if digest in chunks:
+                    live_pack_sizes[pack] += length
+            for digest, location in sorted(chunks.items()):
+                pack = location[0]
+                if (pack is not None and
+                        live_pack_sizes[pack] <
+                        old_pack_sizes[pack] * REPACK_THRESHOLD):
+                    add_chunk(digest, _read_chunk(*sources[digest]))
+
+            new_pack = pack_writer.close()
+            if pack_writer.digests:
+                for digest in pack_writer.digests:
+                    chunks[digest][0] = new_pack
+                self._transport.create_prefix()
+                self._transport.clone('packs').create_prefix()
+                with open(pack_writer.file.name, 'rb') as f:
+                    self._transport.put_file('packs/%s' % new_pack, f)
+        finally:
+            os.unlink(pack_writer.file.name)
+            if not cached:
+                shutil.rmtree(chunk_dir)
+
+        self._transport.create_prefix()
+        self._transport.put_bytes(
+            '%s.manifest' % name, json.dumps(manifest))
+        self._manifests[name] = manifest
+        live_packs = set(pack for pack, _, _ in chunks.values())
+        for pack in set(pack for pack, _, _ in old_chunks.values()):
+            if pack not in live_packs:
+                self._transport.delete('packs/%s' % pack)
+        if cached:
+            self._saveToCache(name, manifest)
+        return len(pack_writer.digests)
+
+    def deleteTree(self, name):
+        """Delete the tree stored as `name`, if there is one."""
+        manifest = self._getManifest(name)
+        if manifest is None:
+            return
+        self._transport.delete('%s.manifest' % name)
+        del self._manifests[name]
+        for pack in set(pack for pack, _, _ in manifest['chunks'].values()):
+            self._transport.delete('packs/%s' % pack)
+        if self.cache_dir is not None:
+            manifest_path = os.path.join(
+                self.cache_dir, '%s.manifest' % name)
+            if os.path.exists(manifest_path):
+                os.unlink(manifest_path)
@@ -13,6 +13,7 @@ __all__ = [
     'CodeImportDispatcher',
     ]
 
+import multiprocessing
 import os
 import socket
 import subprocess
@@ -33,14 +34,18 @@ class CodeImportDispatcher:
     worker_script = os.path.join(
         config.root, 'scripts', 'code-import-worker-monitor.py')
 
-    def __init__(self, logger, worker_limit, _sleep=time.sleep):
+    def __init__(self, logger, worker_limit, _sleep=time.sleep,
+                 report_capacity=False):
         """Initialize an instance.
 
         :param logger: A `Logger` object.
+        :param report_capacity: If True, report this machine's spare
+            capacity to the scheduler along with each request for a job.
         """
         self.logger = logger
         self.worker_limit = worker_limit
         self._sleep = _sleep
+        self.report_capacity = report_capacity
 
     def getHostname(self):
         """Return the hostname of this machine.
@@ -53,6 +58,44 @@ class CodeImportDispatcher:
         else:
             return socket.gethostname()
 
+    def _getMemoryAvailable(self):
+        """Return the memory available on this machine in MiB, or None."""
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        # The value is in KiB.
+                        return int(line.split()[1]) // 1024
+        except (IOError, ValueError, IndexError):
+            pass
+        return None
+
+    def _getDiskAvailable(self):
+        """Return the free space for import workers in MiB, or None."""
+        path = config.codeimportworker.working_directory_root
+        if not path or not os.path.isdir(path):
+            return None
+        stats = os.statvfs(path)
+        return stats.f_bavail * stats.f_frsize // (1024 * 1024)
+
+    def getHostCapacity(self):
+        """Return a description of this machine's spare capacity.
+
+        Sizes are in MiB so that they fit in XML-RPC integers.  Values
+        that can't be determined are omitted.
+        """
+        capacity = {
+            'cpus': multiprocessing.cpu_count(),
+            'load_average': os.getloadavg()[0],
+            }
+        memory_available = self._getMemoryAvailable()
+        if memory_available is not None:
+            capacity['memory_available_mb'] = memory_available
+        disk_available = self._getDiskAvailable()
+        if disk_available is not None:
+            capacity['disk_available_mb'] = disk_available
+        return capacity
+
     def dispatchJob(self, job_id):
         """Start the processing of job `job_id`."""
         # Just launch the process and forget about it.
@@ -70,8 +113,13 @@ class CodeImportDispatcher:
 
         :return: A boolean, true if a job was found and dispatched.
         """
-        job_id = scheduler_client.getJobForMachine(
-            self.getHostname(), self.worker_limit)
+        if self.report_capacity:
+            job_id = scheduler_client.getJobForMachine(
+                self.getHostname(), self.worker_limit,
+                self.getHostCapacity())
+        else:
+            job_id = scheduler_client.getJobForMachine(
+                self.getHostname(), self.worker_limit)
 
         if job_id == 0:
             self.logger.info("No jobs pending.")
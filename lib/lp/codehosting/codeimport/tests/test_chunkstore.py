@@ -0,0 +1,179 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the chunked import data store."""
+
+__metaclass__ = type
+
+import os
+
+from bzrlib.transport import get_transport_from_path
+
+from lp.codehosting.codeimport import chunkstore
+from lp.codehosting.codeimport.chunkstore import ChunkedTreeStore
+from lp.services.osutils import write_file
+from lp.testing import (
+    monkey_patch,
+    TestCase,
+    )
+
+
+class TestChunkedTreeStore(TestCase):
+
+    def setUp(self):
+        super(TestChunkedTreeStore, self).setUp()
+        self.transport = get_transport_from_path(
+            self.makeTemporaryDirectory()).clone('store')
+        # Use small chunks so that files span several of them.
+        self.useContext(monkey_patch(chunkstore, CHUNK_SIZE=16))
+
+    def makeTree(self):
+        tree = self.makeTemporaryDirectory()
+        os.makedirs(os.path.join(tree, 'dir', 'subdir'))
+        write_file(os.path.join(tree, 'dir', 'subdir', 'big'), b'x' * 40)
+        write_file(os.path.join(tree, 'small'), b'small')
+        write_file(os.path.join(tree, 'empty'), b'')
+        os.symlink('small', os.path.join(tree, 'link'))
+        os.chmod(os.path.join(tree, 'small'), 0o600)
+        os.utime(os.path.join(tree, 'small'), (1000000000, 1000000000))
+        os.utime(os.path.join(tree, 'dir'), (1100000000, 1100000000))
+        return tree
+
+    def listPacks(self):
+        return self.transport.list_dir('packs')
+
+    def assertTreesEqual(self, expected, observed):
+        for path, st in chunkstore._walk_tree(expected):
+            expected_path = os.path.join(expected, path)
+            observed_path = os.path.join(observed, path)
+            observed_st = os.lstat(observed_path)
+            self.assertEqual(st.st_mode, observed_st.st_mode, path)
+            if os.path.islink(expected_path):
+                # Symlink modification times are not preserved.
+                self.assertEqual(
+                    os.readlink(expected_path), os.readlink(observed_path))
+                continue
+            self.assertEqual(
+                int(st.st_mtime), int(observed_st.st_mtime), path)
+            if os.path.isfile(expected_path):
+                with open(expected_path) as e, open(observed_path) as o:
+                    self.assertEqual(e.read(), o.read(), path)
+        self.assertEqual(
+            [path for path, _ in chunkstore._walk_tree(expected)],
+            [path for path, _ in chunkstore._walk_tree(observed)])
+
+    def test_fetchTree_missing(self):
+        store = ChunkedTreeStore(self.transport)
+        target = os.path.join(self.makeTemporaryDirectory(), 'target')
+        self.assertFalse(store.fetchTree('tree', target))
+        self.assertFalse(os.path.exists(target))
+
+    def test_round_trip(self):
+        # A stored tree can be fetched with its contents, permissions,
+        # modification times and symlinks intact.
+        tree = self.makeTree()
+        ChunkedTreeStore(self.transport).putTree('tree', tree)
+        target = os.path.join(self.makeTemporaryDirectory(), 'target')
+        self.assertTrue(
+            ChunkedTreeStore(self.transport).fetchTree('tree', target))
+        self.assertTreesEqual(tree, target)
+
+    def test_putTree_deduplicates_chunks(self):
+        # Identical chunks are only stored once.
+        tree = self.makeTree()
+        # 'big' is two identical full chunks and a partial one, plus
+        # 'small'.
+        self.assertEqual(
+            3, ChunkedTreeStore(self.transport).putTree('tree', tree))
+        self.assertEqual(1, len(self.listPacks()))
+
+    def test_putTree_unchanged(self):
+        # Storing an unchanged tree uploads nothing new.
+        tree = self.makeTree()
+        ChunkedTreeStore(self.transport).putTree('tree', tree)
+        packs = self.listPacks()
+        self.assertEqual(
+            0, ChunkedTreeStore(self.transport).putTree('tree', tree))
+        self.assertEqual(packs, self.listPacks())
+
+    def test_putTree_uploads_changed_chunks(self):
+        # Only changed chunks are uploaded, in a new pack.
+        tree = self.makeTree()
+        ChunkedTreeStore(self.transport).putTree('tree', tree)
+        write_file(os.path.join(tree, 'dir', 'subdir', 'big'), b'x' * 39)
+        self.assertEqual(
+            1, ChunkedTreeStore(self.transport).putTree('tree', tree))
+        self.assertEqual(2, len(self.listPacks()))
+        target = self.makeTemporaryDirectory()
+        ChunkedTreeStore(self.transport).fetchTree('tree', target)
+        self.assertTreesEqual(tree, target)
+
+    def test_putTree_repacks(self):
+        # Packs whose chunks are mostly unreferenced are rewritten, and
+        # packs with no referenced chunks are deleted.
+        tree = self.makeTemporaryDirectory()
+        for i in range(4):
+            write_file(os.path.join(tree, 'file%d' % i), b'%d' % i)
+        ChunkedTreeStore(self.transport).putTree('tree', tree)
+        [old_pack] = self.listPacks()
+        for i in range(1, 4):
+            os.unlink(os.path.join(tree, 'file%d' % i))
+        write_file(os.path.join(tree, 'new'), b'new')
+        self.assertEqual(
+            2, ChunkedTreeStore(self.transport).putTree('tree', tree))
+        self.assertNotIn(old_pack, self.listPacks())
+        self.assertEqual(1, len(self.listPacks()))
+        target = self.makeTemporaryDirectory()
+        ChunkedTreeStore(self.transport).fetchTree('tree', target)
+        self.assertTreesEqual(tree, target)
+
+    def test_putTree_filenames(self):
+        # putTree can be restricted to some top-level entries.
+        tree = self.makeTree()
+        ChunkedTreeStore(self.transport).putTree(
+            'tree', tree, filenames=['dir'])
+        target = self.makeTemporaryDirectory()
+        ChunkedTreeStore(self.transport).fetchTree('tree', target)
+        self.assertEqual(['dir'], os.listdir(target))
+
+    def test_fetchTree_uses_cache(self):
+        # A worker with a warm cache doesn't need to download any chunks.
+        cache_dir = self.makeTemporaryDirectory()
+        tree = self.makeTree()
+        ChunkedTreeStore(self.transport, cache_dir=cache_dir).putTree(
+            'tree', tree)
+        for pack in self.listPacks():
+            self.transport.delete('packs/%s' % pack)
+        target = self.makeTemporaryDirectory()
+        self.assertTrue(
+            ChunkedTreeStore(self.transport, cache_dir=cache_dir).fetchTree(
+                'tree', target))
+        self.assertTreesEqual(tree, target)
+
+    def test_cache_is_pruned(self):
+        # Chunks that are no longer referenced are removed from the cache.
+        cache_dir = self.makeTemporaryDirectory()
+        tree = self.makeTree()
+        store = ChunkedTreeStore(self.transport, cache_dir=cache_dir)
+        chunk_dir = os.path.join(cache_dir, 'chunks')
+        store.putTree('tree', tree)
+        self.assertEqual(3, len(os.listdir(chunk_dir)))
+        os.unlink(os.path.join(tree, 'small'))
+        store.putTree('tree', tree)
+        self.assertEqual(2, len(os.listdir(chunk_dir)))
+
+    def test_deleteTree(self):
+        # Deleting a tree removes its manifest and packs.
+        cache_dir = self.makeTemporaryDirectory()
+        store = ChunkedTreeStore(self.transport, cache_dir=cache_dir)
+        store.putTree('tree', self.makeTree())
+        store.deleteTree('tree')
+        self.assertEqual([], self.listPacks())
+        self.assertFalse(self.transport.has('tree.manifest'))
+        self.assertFalse(
+            os.path.exists(os.path.join(cache_dir, 'tree.manifest')))
+        target = self.makeTemporaryDirectory()
+        self.assertFalse(
+            ChunkedTreeStore(self.transport).fetchTree('tree', target))
+        # Deleting a missing tree does nothing.
+        store.deleteTree('tree')
@@ -35,8 +35,8 @@ class MockSchedulerClient:
     def __init__(self):
         self.calls = []
 
-    def getJobForMachine(self, machine, limit):
-        self.calls.append((machine, limit))
+    def getJobForMachine(self, machine, limit, *args):
+        self.calls.append((machine, limit) + args)
         return 0
 
 
@@ -49,10 +49,12 @@ class TestCodeImportDispatcherUnit(TestCase):
         TestCase.setUp(self)
         self.pushConfig('codeimportdispatcher', forced_hostname='none')
 
-    def makeDispatcher(self, worker_limit=10, _sleep=lambda delay: None):
+    def makeDispatcher(self, worker_limit=10, _sleep=lambda delay: None,
+                       report_capacity=False):
         """Make a `CodeImportDispatcher`."""
         return CodeImportDispatcher(
-            BufferLogger(), worker_limit, _sleep=_sleep)
+            BufferLogger(), worker_limit, _sleep=_sleep,
+            report_capacity=report_capacity)
 
     def test_getHostname(self):
         # By default, getHostname return the same as socket.gethostname()
@@ -143,6 +145,29 @@ class TestCodeImportDispatcherUnit(TestCase):
             [(dispatcher.getHostname(), worker_limit)],
             scheduler_client.calls)
 
+    def test_findAndDispatchJob_reports_capacity(self):
+        # If the dispatcher is configured to report capacity, it passes a
+        # description of the machine's capacity to getJobForMachine.
+        dispatcher = self.makeDispatcher(5, report_capacity=True)
+        capacity = {'cpus': 4, 'load_average': 1.0}
+        dispatcher.getHostCapacity = lambda: capacity
+        scheduler_client = MockSchedulerClient()
+        dispatcher.findAndDispatchJob(scheduler_client)
+        self.assertEqual(
+            [(dispatcher.getHostname(), 5, capacity)],
+            scheduler_client.calls)
+
+    def test_getHostCapacity(self):
+        # getHostCapacity reports CPUs, load and the free disk space in
+        # the worker directory.
+        self.pushConfig(
+            'codeimportworker',
+            working_directory_root=self.makeTemporaryDirectory())
+        capacity = self.makeDispatcher().getHostCapacity()
+        self.assertTrue(capacity['cpus'] >= 1)
+        self.assertIn('load_average', capacity)
+        self.assertTrue(capacity['disk_available_mb'] >= 0)
+
     def test_findAndDispatchJobs(self):
         # findAndDispatchJobs calls getJobForMachine on the scheduler_client,
         # dispatching jobs, until it indicates that there are no more jobs to
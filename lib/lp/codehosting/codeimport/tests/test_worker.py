@@ -8,6 +8,7 @@ __metaclass__ = type
 import logging
 import os
 import shutil
+import stat
 import subprocess
 import tempfile
 import time
@@ -519,6 +520,104 @@ class TestImportDataStore(WorkerTest):
         remote_name = '%08x.tar.gz' % (source_details.target_id,)
         self.assertEqual(content, transport.get_bytes(remote_name))
 
+    def makeTree(self, content):
+        tree = self.makeTemporaryDirectory()
+        with open(os.path.join(tree, 'file'), 'w') as f:
+            f.write(content)
+        return tree
+
+    def assertFetchesTree(self, store, content):
+        target = os.path.join(self.makeTemporaryDirectory(), 'target')
+        self.assertTrue(store.fetchTree('tree.tar.gz', target))
+        self.assertEqual(content, open(os.path.join(target, 'file')).read())
+
+    def test_putTree_fetchTree_tarball(self):
+        # By default, trees are stored as tarballs.
+        source_details = self.factory.makeCodeImportSourceDetails()
+        content = self.factory.getUniqueString()
+        transport = self.get_transport()
+        store = ImportDataStore(transport, source_details)
+        store.putTree('tree.tar.gz', self.makeTree(content))
+        self.assertTrue(
+            transport.has('%08x.tar.gz' % source_details.target_id))
+        self.assertFetchesTree(store, content)
+
+    def test_putTree_fetchTree_chunked(self):
+        # If chunked import data is enabled, trees are stored as chunks
+        # with a manifest.
+        self.pushConfig('codeimport', chunked_import_data=True)
+        source_details = self.factory.makeCodeImportSourceDetails()
+        content = self.factory.getUniqueString()
+        transport = self.get_transport()
+        store = ImportDataStore(transport, source_details)
+        store.putTree('tree.tar.gz', self.makeTree(content))
+        self.assertFalse(
+            transport.has('%08x.tar.gz' % source_details.target_id))
+        self.assertTrue(
+            transport.has(
+                '%08x.chunked/tree.manifest' % source_details.target_id))
+        self.assertFetchesTree(
+            ImportDataStore(transport, source_details), content)
+
+    def test_fetchTree_chunked_falls_back_to_tarball(self):
+        # If chunked import data is enabled but the tree was stored as a
+        # tarball, the tarball is used.
+        source_details = self.factory.makeCodeImportSourceDetails()
+        content = self.factory.getUniqueString()
+        transport = self.get_transport()
+        ImportDataStore(transport, source_details).putTree(
+            'tree.tar.gz', self.makeTree(content))
+        self.pushConfig('codeimport', chunked_import_data=True)
+        self.assertFetchesTree(
+            ImportDataStore(transport, source_details), content)
+
+    def test_putTree_chunked_replaces_tarball(self):
+        # Storing a tree in chunks deletes the tarball it replaces, so
+        # that turning chunked import data off again doesn't fetch a
+        # stale tree.
+        source_details = self.factory.makeCodeImportSourceDetails()
+        transport = self.get_transport()
+        ImportDataStore(transport, source_details).putTree(
+            'tree.tar.gz', self.makeTree(self.factory.getUniqueString()))
+        self.pushConfig('codeimport', chunked_import_data=True)
+        content = self.factory.getUniqueString()
+        ImportDataStore(transport, source_details).putTree(
+            'tree.tar.gz', self.makeTree(content))
+        self.assertFalse(
+            transport.has('%08x.tar.gz' % source_details.target_id))
+        self.pushConfig('codeimport', chunked_import_data=False)
+        self.assertFalse(
+            ImportDataStore(transport, source_details).fetchTree(
+                'tree.tar.gz', self.makeTemporaryDirectory()))
+
+    def test_putTree_tarball_replaces_chunked(self):
+        # Storing a tree as a tarball deletes the chunked tree it
+        # replaces, so that turning chunked import data on again doesn't
+        # fetch a stale tree.
+        self.pushConfig('codeimport', chunked_import_data=True)
+        source_details = self.factory.makeCodeImportSourceDetails()
+        transport = self.get_transport()
+        ImportDataStore(transport, source_details).putTree(
+            'tree.tar.gz', self.makeTree(self.factory.getUniqueString()))
+        self.pushConfig('codeimport', chunked_import_data=False)
+        content = self.factory.getUniqueString()
+        ImportDataStore(transport, source_details).putTree(
+            'tree.tar.gz', self.makeTree(content))
+        self.assertFalse(
+            transport.has(
+                '%08x.chunked/tree.manifest' % source_details.target_id))
+        self.pushConfig('codeimport', chunked_import_data=True)
+        self.assertFetchesTree(
+            ImportDataStore(transport, source_details), content)
+
+    def test_fetchTree_missing(self):
+        # fetchTree returns False if there is no stored tree.
+        self.pushConfig('codeimport', chunked_import_data=True)
+        source_details = self.factory.makeCodeImportSourceDetails()
+        store = ImportDataStore(self.get_transport(), source_details)
+        self.assertFalse(
+            store.fetchTree('tree.tar.gz', self.makeTemporaryDirectory()))
+
 
 class MockForeignWorkingTree:
     """Working tree that records calls to checkout and update."""
@@ -778,7 +877,10 @@ def clean_up_default_stores_for_import(source_details):
     if tree_transport.has('.'):
         for filename in tree_transport.list_dir('.'):
             if filename.startswith(prefix):
-                tree_transport.delete(filename)
+                if stat.S_ISDIR(tree_transport.stat(filename).st_mode):
+                    tree_transport.delete_tree(filename)
+                else:
+                    tree_transport.delete(filename)
     branchstore = get_default_bazaar_branch_store()
     branch_name = '%08x' % source_details.target_id
     if branchstore.transport.has(branch_name):
@@ -75,6 +75,7 @@ from pymacaroons import Macaroon
 import SCM
 
 from lp.code.interfaces.branch import get_blacklisted_hostnames
+from lp.codehosting.codeimport.chunkstore import ChunkedTreeStore
 from lp.codehosting.codeimport.foreigntree import CVSWorkingTree
 from lp.codehosting.codeimport.tarball import (
     create_tarball,
@@ -364,6 +365,13 @@ class ImportDataStore:
     files are stored at ``<BRANCH ID IN HEX>.<EXT>`` where BRANCH ID comes
     from the CodeImportSourceDetails used to construct the instance and EXT
     comes from the local name passed to `put` or `fetch`.
+
+    Directory trees can be stored using `putTree()` and `fetchTree()`.  If
+    `config.codeimport.chunked_import_data` is set, these are stored
+    incrementally in a `ChunkedTreeStore` at ``<BRANCH ID IN HEX>.chunked``
+    rather than as tarballs, falling back to any existing tarball when
+    fetching.  Storing a tree either way deletes any copy stored the other
+    way, so that the setting can be changed in both directions.
     """
 
     def __init__(self, transport, source_details):
@@ -417,6 +425,67 @@ class ImportDataStore:
         else:
             return False
 
+    @cachedproperty
+    def chunked_store(self):
+        """The `ChunkedTreeStore` for this import's trees."""
+        cache_root = config.codeimportworker.import_data_cache_root
+        if cache_root:
+            cache_dir = os.path.join(cache_root, '%08x' % self._target_id)
+        else:
+            cache_dir = None
+        return ChunkedTreeStore(
+            self._transport.clone('%08x.chunked' % self._target_id),
+            cache_dir=cache_dir)
+
+    def _getTreeName(self, local_name):
+        """Return the name of the tree stored as the tarball `local_name`.
+        """
+        return local_name.split('.', 1)[0]
+
+    def fetchTree(self, local_name, target_path):
+        """Retrieve the directory tree stored as `local_name`.
+
+        :param local_name: The name of the tarball that the tree is (or
+            would be) stored as, such as 'foreign_tree.tar.gz'.
+        :param target_path: The directory to retrieve the tree to, which is
+            created if necessary.
+        :return: A boolean, true if the tree was found and retrieved, false
+            otherwise.
+        """
+        if config.codeimport.chunked_import_data:
+            if self.chunked_store.fetchTree(
+                    self._getTreeName(local_name), target_path):
+                return True
+        if not self.fetch(local_name):
+            return False
+        if not os.path.isdir(target_path):
+            os.makedirs(target_path)
+        extract_tarball(local_name, target_path)
+        return True
+
+    def putTree(self, local_name, source_path, filenames=None):
+        """Store the directory tree at `source_path` as `local_name`.
+
+        :param local_name: The name of the tarball to store the tree as,
+            such as 'foreign_tree.tar.gz'.
+        :param source_path: The directory containing the tree.
+        :param filenames: If not None, only store these directory entries
+            under `source_path`.
+        """
+        if config.codeimport.chunked_import_data:
+            self.chunked_store.putTree(
+                self._getTreeName(local_name), source_path,
+                filenames=filenames)
+            # The tarball is out of date now.
+            remote_name = self._getRemoteName(local_name)
+            if self._transport.has(remote_name):
+                self._transport.delete(remote_name)
+        else:
+            create_tarball(source_path, local_name, filenames=filenames)
+            self.put(local_name)
+            # The chunked tree is out of date now.
+            self.chunked_store.deleteTree(self._getTreeName(local_name))
+
     def put(self, filename, source_transport=None):
         """Put `filename` into the store.
 
@@ -470,9 +539,8 @@ class ForeignTreeStore:
 
     def archive(self, foreign_tree):
         """Archive the foreign tree."""
-        local_name = 'foreign_tree.tar.gz'
-        create_tarball(foreign_tree.local_path, 'foreign_tree.tar.gz')
-        self.import_data_store.put(local_name)
+        self.import_data_store.putTree(
+            'foreign_tree.tar.gz', foreign_tree.local_path)
 
     def fetch(self, target_path):
         """Fetch the foreign branch for `source_details` to `target_path`.
@@ -495,9 +563,8 @@ class ForeignTreeStore:
     def fetchFromArchive(self, target_path):
         """Fetch the foreign tree for `source_details` from the archive."""
         local_name = 'foreign_tree.tar.gz'
-        if not self.import_data_store.fetch(local_name):
+        if not self.import_data_store.fetchTree(local_name, target_path):
             raise NoSuchFile(local_name)
-        extract_tarball(local_name, target_path)
         tree = self._getForeignTree(target_path)
         tree.update()
         return tree
@@ -833,14 +900,10 @@ class GitImportWorker(PullingImportWorker):
         # Fetch the legacy cache from the store, if present.
         self.import_data_store.fetch(
             'git.db', branch.repository._transport)
-        # The cache dir from newer bzr-gits is stored as a tarball.
-        local_name = 'git-cache.tar.gz'
-        if self.import_data_store.fetch(local_name):
-            repo_transport = branch.repository._transport
-            repo_transport.mkdir('git')
-            git_db_dir = os.path.join(
-                local_path_from_url(repo_transport.base), 'git')
-            extract_tarball(local_name, git_db_dir)
+        # The cache dir from newer bzr-gits is stored as a tree.
+        repo_base = branch.repository._transport.base
+        git_db_dir = os.path.join(local_path_from_url(repo_base), 'git')
+        self.import_data_store.fetchTree('git-cache.tar.gz', git_db_dir)
         return branch
 
     def pushBazaarBranch(self, bazaar_branch, remote_branch=None):
@@ -853,9 +916,7 @@ class GitImportWorker(PullingImportWorker):
             self, bazaar_branch)
         repo_base = bazaar_branch.repository._transport.base
         git_db_dir = os.path.join(local_path_from_url(repo_base), 'git')
-        local_name = 'git-cache.tar.gz'
-        create_tarball(git_db_dir, local_name)
-        self.import_data_store.put(local_name)
+        self.import_data_store.putTree('git-cache.tar.gz', git_db_dir)
         return non_trivial
 
 
@@ -902,9 +963,8 @@ class BzrSvnImportWorker(PullingImportWorker):
         """
         from bzrlib.plugins.svn.cache import create_cache_dir
         branch = super(BzrSvnImportWorker, self).getBazaarBranch()
-        local_name = 'svn-cache.tar.gz'
-        if self.import_data_store.fetch(local_name):
-            extract_tarball(local_name, create_cache_dir())
+        self.import_data_store.fetchTree(
+            'svn-cache.tar.gz', create_cache_dir())
         return branch
 
     def pushBazaarBranch(self, bazaar_branch, remote_branch=None):
@@ -919,11 +979,9 @@ class BzrSvnImportWorker(PullingImportWorker):
         if remote_branch is not None:
             cache = get_cache(remote_branch.repository.uuid)
             cache_dir = cache.create_cache_dir()
-            local_name = 'svn-cache.tar.gz'
-            create_tarball(
-                os.path.dirname(cache_dir), local_name,
+            self.import_data_store.putTree(
+                'svn-cache.tar.gz', os.path.dirname(cache_dir),
                 filenames=[os.path.basename(cache_dir)])
-            self.import_data_store.put(local_name)
             # XXX cjwatson 2019-02-06: Once this is behaving well on
             # production, consider removing the local cache after pushing a
             # copy of it to the import data store.
@@ -16,6 +16,7 @@ __all__ = [
 
 import logging
 
+from bzrlib.errors import RevisionNotPresent
 from bzrlib.graph import DictParentsProvider
 from bzrlib.revision import NULL_REVISION
 import pytz
@@ -89,6 +90,12 @@ class BzrSync:
         """
         self.logger.info("Scanning branch: %s", self.db_branch.unique_name)
         self.logger.info("    from %s", bzr_branch.base)
+        if config.branchscanner.incremental_scan:
+            added_history = self.getAddedHistory(bzr_branch)
+            if added_history is not None:
+                self.syncBranchIncrementally(bzr_branch, added_history)
+                return
+            self.logger.info("Cannot scan incrementally; doing a full scan.")
         # Get the history and ancestry from the branch first, to fail early
         # if something is wrong with the branch.
         self.logger.info("Retrieving history from bzrlib.")
@@ -111,6 +118,20 @@ class BzrSync:
         self.deleteBranchRevisions(branchrevisions_to_delete)
         self.insertBranchRevisions(bzr_branch, revids_to_insert)
         transaction.commit()
+        self.finishSync(
+            bzr_branch, len(db_history) == 0, len(bzr_history),
+            bzr_history[-1] if bzr_history else None, new_ancestry)
+
+    def finishSync(self, bzr_branch, initial_scan, revision_count,
+                   last_revision_id, new_ancestry):
+        """Finish a scan once the revision data is in the database.
+
+        :param initial_scan: True if the branch had not been scanned before.
+        :param revision_count: The number of mainline revisions.
+        :param last_revision_id: The tip revision ID, or None if the branch
+            is empty.
+        :param new_ancestry: The set of revision IDs added to the ancestry.
+        """
         # Synchronize the RevisionCache for this branch.
         self.logger.info("Updating revision cache.")
         getUtility(IRevisionSet).updateRevisionCacheForBranch(self.db_branch)
@@ -119,7 +140,6 @@ class BzrSync:
         # Notify any listeners that the tip of the branch has changed, but
         # before we've actually updated the database branch.
         self.logger.info("Firing tip change event.")
-        initial_scan = (len(db_history) == 0)
         notify(events.TipChanged(self.db_branch, bzr_branch, initial_scan))
 
         # The Branch table is modified by other systems, including the web UI,
@@ -130,13 +150,105 @@ class BzrSync:
         # the pessimistic side (tell the user the data has not yet been
         # updated although it has), the race is acceptable.
         self.logger.info("Updating branch status.")
-        self.updateBranchStatus(bzr_history)
+        self.updateBranchStatus(revision_count, last_revision_id)
         self.logger.info("Firing scan completion event.")
         notify(
             events.ScanCompleted(
                 self.db_branch, bzr_branch, self.logger, new_ancestry))
         transaction.commit()
 
+    def getAddedHistory(self, bzr_branch):
+        """Return the mainline revisions added since the last scan.
+
+        Only the new part of the mainline is walked, so this is cheap even
+        for branches with very long histories.
+
+        :return: A list of revision IDs in parent-to-child order, or None if
+            the last scanned revision is not on the branch's mainline at the
+            position recorded in the database (for instance because the
+            branch was overwritten), in which case a full scan is needed.
+        """
+        db_last = self.db_branch.last_scanned_id
+        if db_last is None:
+            return None
+        repository = bzr_branch.repository
+        last_revno, bzr_last = bzr_branch.last_revision_info()
+        new_count = last_revno - self.db_branch.revision_count
+        if new_count < 0 or not repository.has_revision(db_last):
+            return None
+        added_history = []
+        try:
+            for revision_id in repository.get_graph().iter_lefthand_ancestry(
+                    bzr_last):
+                if len(added_history) == new_count:
+                    if revision_id != db_last:
+                        return None
+                    added_history.reverse()
+                    return added_history
+                added_history.append(revision_id)
+        except RevisionNotPresent:
+            # There is a ghost on the mainline.
+            pass
+        return None
+
+    def syncBranchIncrementally(self, bzr_branch, added_history):
+        """Synchronize a branch whose mainline has only grown.
+
+        Unlike a full scan, this never loads the branch's whole history or
+        ancestry: only the revisions added since the last scan are walked,
+        and they are written in batches of
+        `config.branchscanner.incremental_batch_size`, each in its own
+        transaction.  If a scan is interrupted, the next one removes any
+        BranchRevisions left behind before inserting them again.
+
+        :param added_history: The mainline revisions added since the last
+            scan, as returned by `getAddedHistory`.
+        """
+        self.logger.info(
+            "Scanning incrementally from %s.", self.db_branch.last_scanned_id)
+        initial_scan = self.db_branch.revision_count == 0
+        added_ancestry, removed_ancestry = self.getAncestryDelta(bzr_branch)
+        # The old tip is a mainline ancestor of the new one, so nothing can
+        # have been removed.
+        assert not removed_ancestry, (
+            "Revisions removed from the ancestry of a branch whose mainline "
+            "only grew.")
+        notify(events.RevisionsRemoved(self.db_branch, bzr_branch, []))
+
+        revision_count = self.db_branch.revision_count + len(added_history)
+        revids_to_insert = dict(
+            self.revisionsToInsert(
+                added_history, revision_count, added_ancestry))
+        self.logger.info(
+            "Adding %d revisions to the ancestry.", len(added_ancestry))
+        store = Store.of(self.db_branch)
+        batch_size = config.branchscanner.incremental_batch_size
+        for revids in iter_chunks(sorted(added_ancestry), batch_size):
+            new_db_revs = (
+                set(revids) - self.revision_set.onlyPresent(revids))
+            if new_db_revs:
+                revisions = self.getBazaarRevisions(bzr_branch, new_db_revs)
+                self.syncRevisions(bzr_branch, revisions, revids_to_insert)
+            # Remove any BranchRevisions left behind by an interrupted scan.
+            stray = list(store.find(
+                Revision.revision_id,
+                BranchRevision.branch == self.db_branch,
+                BranchRevision.revision_id == Revision.id,
+                Revision.revision_id.is_in(revids)))
+            if stray:
+                self.deleteBranchRevisions(stray)
+            self.db_branch.createBranchRevisionFromIDs(
+                [(revid, revids_to_insert[revid]) for revid in revids])
+            transaction.commit()
+
+        if added_history:
+            last_revision_id = added_history[-1]
+        else:
+            last_revision_id = self.db_branch.last_scanned_id
+        self.finishSync(
+            bzr_branch, initial_scan, revision_count, last_revision_id,
+            added_ancestry)
+
     def retrieveDatabaseAncestry(self):
         """Efficiently retrieve ancestry from the database."""
         self.logger.info("Retrieving ancestry from database.")
@@ -302,13 +414,17 @@ class BzrSync:
         for revid_seq_pair_chunk in iter_chunks(revid_seq_pairs, 10000):
             self.db_branch.createBranchRevisionFromIDs(revid_seq_pair_chunk)
 
-    def updateBranchStatus(self, bzr_history):
-        """Update the branch-scanner status in the database Branch table."""
+    def updateBranchStatus(self, revision_count, last_revision_id):
+        """Update the branch-scanner status in the database Branch table.
+
+        :param revision_count: The number of mainline revisions.
+        :param last_revision_id: The tip revision ID, or None if the branch
+            is empty.
+        """
         # Record that the branch has been updated.
-        revision_count = len(bzr_history)
         if revision_count > 0:
-            last_revision = bzr_history[-1]
-            revision = getUtility(IRevisionSet).getByRevisionId(last_revision)
+            revision = getUtility(IRevisionSet).getByRevisionId(
+                last_revision_id)
         else:
             revision = None
         self.logger.info(
@@ -585,6 +585,80 @@ class TestPlanDatabaseChanges(BzrSyncTestCase):
         self.assertIn(merge_id, branchrevisions_to_delete)
 
 
+class TestIncrementalBzrSync(BzrSyncTestCase):
+    """Tests for incremental scanning."""
+
+    def setUp(self):
+        super(TestIncrementalBzrSync, self).setUp()
+        self.pushConfig(
+            'branchscanner', incremental_scan=True, incremental_batch_size=2)
+
+    def getAddedHistory(self):
+        self.useContext(read_locked(self.bzr_branch))
+        return BzrSync(self.db_branch).getAddedHistory(self.bzr_branch)
+
+    def test_getAddedHistory_never_scanned(self):
+        self.commitRevision()
+        self.assertIsNone(self.getAddedHistory())
+
+    def test_getAddedHistory(self):
+        # Only the mainline revisions added since the last scan are
+        # returned.
+        self.commitRevision()
+        self.makeBzrSync(self.db_branch).syncBranchAndClose()
+        rev2_id = self.commitRevision()
+        rev3_id = self.commitRevision()
+        self.assertEqual([rev2_id, rev3_id], self.getAddedHistory())
+
+    def test_getAddedHistory_unchanged(self):
+        self.commitRevision()
+        self.makeBzrSync(self.db_branch).syncBranchAndClose()
+        self.assertEqual([], self.getAddedHistory())
+
+    def test_getAddedHistory_rewritten(self):
+        # If the last scanned revision is no longer on the mainline, a full
+        # scan is needed.
+        self.commitRevision()
+        self.commitRevision()
+        self.makeBzrSync(self.db_branch).syncBranchAndClose()
+        self.uncommitRevision()
+        self.commitRevision()
+        self.assertIsNone(self.getAddedHistory())
+
+    def test_sync_incrementally(self):
+        # An incremental scan records the same revisions as a full scan
+        # would.
+        rev1_id = self.commitRevision()
+        self.syncAndCount(new_revisions=1, new_numbers=1, new_authors=1)
+        merge_tree = self.bzr_tree.bzrdir.sprout('merge').open_workingtree()
+        merge_id = merge_tree.commit(
+            'mergeable commit', committer='me@example.org')
+        self.bzr_tree.merge_from_branch(merge_tree.branch)
+        rev2_id = self.commitRevision(committer='me@example.org')
+        rev3_id = self.commitRevision(committer='me@example.org')
+        self.syncAndCount(
+            new_revisions=3, new_numbers=3, new_parents=4, new_authors=1)
+        self.assertEqual(
+            set([(1, rev1_id), (2, rev2_id), (3, rev3_id),
+                 (None, merge_id)]),
+            self.getBranchRevisions(self.db_branch))
+        self.assertEqual(rev3_id, self.db_branch.last_scanned_id)
+        self.assertEqual(3, self.db_branch.revision_count)
+
+    def test_sync_rewritten_history(self):
+        # Branches whose history was rewritten get a full scan.
+        self.commitRevision()
+        rev2_id = self.commitRevision()
+        self.makeBzrSync(self.db_branch).syncBranchAndClose()
+        self.uncommitRevision()
+        new_rev2_id = self.commitRevision()
+        self.makeBzrSync(self.db_branch).syncBranchAndClose()
+        self.assertNotIn(
+            rev2_id,
+            [revid for _, revid in self.getBranchRevisions(self.db_branch)])
+        self.assertEqual(new_rev2_id, self.db_branch.last_scanned_id)
+
+
 class TestBzrSyncRevisions(BzrSyncTestCase):
     """Tests for `BzrSync.syncRevisions`."""
 
@@ -755,7 +755,7 @@ class DistributionPPASearchView(LaunchpadView):
             text=self.name_filter, show_inactive=show_inactive,
             user=self.user)
 
-        self.batchnav = BatchNavigator(ppas, self.request)
+        self.batchnav = BatchNavigator(ppas, self.request, keyset=True)
         return self.batchnav.currentBatch()
 
     @property
@@ -3,6 +3,7 @@
 
 __metaclass__ = type
 
+import simplejson
 import soupmatchers
 from testtools.matchers import MatchesStructure
 from zope.component import getUtility
@@ -17,6 +18,7 @@ from lp.registry.interfaces.distributionmirror import (
     )
 from lp.services.webapp.servers import LaunchpadTestRequest
 from lp.services.worlddata.interfaces.country import ICountrySet
+from lp.soyuz.enums import ArchivePurpose
 from lp.testing import (
     login,
     login_celebrity,
@@ -292,6 +294,30 @@ class TestDistributionAdminView(TestCaseWithFactory):
                 supports_mirrors=False))
 
 
+class TestDistributionPPASearchView(TestCaseWithFactory):
+    """Test the +ppas page for a distribution."""
+
+    layer = DatabaseFunctionalLayer
+
+    def test_batches_by_sort_keys(self):
+        # PPA searches are batched by their sort keys, even if keyset
+        # batching is turned off elsewhere.
+        self.pushConfig('launchpad', keyset_batching=False)
+        distribution = self.factory.makeDistribution()
+        first, second = [
+            self.factory.makeArchive(
+                distribution=distribution, purpose=ArchivePurpose.PPA,
+                displayname=displayname)
+            for displayname in (u'PPA A', u'PPA B')]
+        view = create_initialized_view(
+            distribution, '+ppas',
+            form={'name_filter': '', 'show_inactive': 'on', 'batch': '1'})
+        self.assertEqual([first], list(view.search_results))
+        self.assertEqual(
+            [first.displayname, first.id],
+            simplejson.loads(view.batchnav.batch.nextBatch().range_memo))
+
+
 class TestDistroReassignView(TestCaseWithFactory):
     """Test the +reassign page for a new distribution."""
 
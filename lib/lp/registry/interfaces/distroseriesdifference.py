@@ -311,6 +311,24 @@ class IDistroSeriesDifferenceSource(Interface):
         :return: A new `DistroSeriesDifference` object.
         """
 
+    def updateMultiple(requests, manual=False):
+        """Create or update many `IDistroSeriesDifference`s at once.
+
+        This has the same effect as calling `new` for each missing
+        difference and `IDistroSeriesDifference.update` for each existing
+        one, but uses a constant number of queries for each pair of series
+        rather than several for each package.
+
+        :param requests: An iterable of (derived_series, parent_series,
+            source_package_names) tuples, where `source_package_names` is
+            an iterable of `ISourcePackageName`s.
+        :param manual: Boolean, True if this is a user-requested change.
+            This overrides auto-blacklisting.
+        :raises NotADerivedSeriesError: When a derived series is not
+            derived from its parent series.
+        :return: A list of the `IDistroSeriesDifference`s.
+        """
+
     def getForDistroSeries(distro_series, difference_type=None,
                            name_filter=None, status=None,
                            child_version_higher=False, parent_series=None,
@@ -138,6 +138,7 @@ from lp.services.database.datetimecol import UtcDateTimeCol
 from lp.services.database.decoratedresultset import DecoratedResultSet
 from lp.services.database.enumcol import EnumCol
 from lp.services.database.interfaces import IStore
+from lp.services.database.objectcache import cached_lookup
 from lp.services.database.sqlbase import (
     SQLBase,
     sqlvalues,
@@ -146,7 +147,10 @@ from lp.services.database.stormexpr import (
     fti_search,
     rank_by_fti,
     )
-from lp.services.helpers import shortlist
+from lp.services.helpers import (
+    ensure_unicode,
+    shortlist,
+    )
 from lp.services.propertycache import (
     cachedproperty,
     get_property_cache,
@@ -772,11 +776,29 @@ class Distribution(SQLBase, BugTargetBase, MakesAnnouncements,
             return self.series[0]
         return None
 
+    def _getCachedSeries(self, key, *clauses):
+        """Return the series matching `clauses`, or None.
+
+        :param key: A hashable key identifying `clauses` in the shared
+            object cache.
+        """
+        store = Store.of(self)
+        distroseries_id = cached_lookup(
+            store, 'DistroSeries', (self.id,) + key,
+            lambda: store.find(
+                DistroSeries.id, DistroSeries.distribution == self,
+                *clauses).one())
+        if distroseries_id is None:
+            return None
+        return store.get(DistroSeries, distroseries_id)
+
     def __getitem__(self, name):
-        for series in self.series:
-            if series.name == name:
-                return series
-        raise NotFoundError(name)
+        name = ensure_unicode(name)
+        series = self._getCachedSeries(
+            ('name', name), DistroSeries.name == name)
+        if series is None:
+            raise NotFoundError(name)
+        return series
 
     def __iter__(self):
         return iter(self.series)
@@ -796,11 +818,11 @@ class Distribution(SQLBase, BugTargetBase, MakesAnnouncements,
 
     def getSeries(self, name_or_version, follow_aliases=False):
         """See `IDistribution`."""
-        distroseries = Store.of(self).find(DistroSeries,
-               Or(DistroSeries.name == name_or_version,
-               DistroSeries.version == name_or_version),
-            DistroSeries.distribution == self).one()
-        if distroseries:
+        distroseries = self._getCachedSeries(
+            ('name_or_version', name_or_version),
+            Or(DistroSeries.name == name_or_version,
+               DistroSeries.version == name_or_version))
+        if distroseries is not None:
             return distroseries
         if follow_aliases:
             return self.resolveSeriesAlias(name_or_version)
@@ -1201,29 +1223,30 @@ class Distribution(SQLBase, BugTargetBase, MakesAnnouncements,
 
     def searchPPAs(self, text=None, show_inactive=False, user=None):
         """See `IDistribution`."""
-        clauses = ["""
-        Archive.purpose = %s AND
-        Archive.distribution = %s AND
-        Archive.owner = ValidPersonOrTeamCache.id
-        """ % sqlvalues(ArchivePurpose.PPA, self)]
+        clauses = [
+            Archive.purpose == ArchivePurpose.PPA,
+            Archive.distribution == self,
+            SQL("Archive.owner IN (SELECT id FROM ValidPersonOrTeamCache)"),
+            ]
 
-        clauseTables = ['ValidPersonOrTeamCache']
-        orderBy = ['Archive.displayname']
+        # The Archive.id tie-breaker makes the order deterministic, so
+        # that the results can be batched by their sort keys.
+        order_by = [Archive.displayname, Archive.id]
 
         if not show_inactive:
-            clauses.append("""
+            clauses.append(SQL("""
             Archive.id IN (
                 SELECT archive FROM SourcepackagePublishingHistory
                 WHERE status IN %s)
-            """ % sqlvalues(active_publishing_status))
+            """ % sqlvalues(active_publishing_status)))
 
         if text:
-            orderBy.insert(0, rank_by_fti(Archive, text))
+            order_by.insert(0, rank_by_fti(Archive, text))
             clauses.append(fti_search(Archive, text))
 
         if user is not None:
             if not user.inTeam(getUtility(ILaunchpadCelebrities).admin):
-                clauses.append("""
+                clauses.append(SQL("""
                 ((Archive.private = FALSE AND Archive.enabled = TRUE) OR
                  Archive.owner = %s OR
                  %s IN (SELECT TeamParticipation.person
@@ -1231,13 +1254,12 @@ class Distribution(SQLBase, BugTargetBase, MakesAnnouncements,
                         WHERE TeamParticipation.person = %s AND
                               TeamParticipation.team = Archive.owner)
                 )
-                """ % sqlvalues(user, user, user))
+                """ % sqlvalues(user, user, user)))
         else:
             clauses.append(
-                "Archive.private = FALSE AND Archive.enabled = TRUE")
+                SQL("Archive.private = FALSE AND Archive.enabled = TRUE"))
 
-        return Archive.select(
-            And(*clauses), orderBy=orderBy, clauseTables=clauseTables)
+        return IStore(Archive).find(Archive, *clauses).order_by(*order_by)
 
     def getPendingAcceptancePPAs(self):
         """See `IDistribution`."""
@@ -7,6 +7,7 @@ __metaclass__ = type
 
 __all__ = [
     'DistroSeriesDifference',
+    'update_dsds',
     ]
 
 from collections import defaultdict
@@ -29,6 +30,7 @@ from storm.expr import (
     Table,
     )
 from storm.locals import (
+    ClassAlias,
     Int,
     Reference,
     )
@@ -74,6 +76,11 @@ from lp.services.database.interfaces import (
     IStore,
     )
 from lp.services.database.stormbase import StormBase
+from lp.services.database.stormexpr import (
+    BulkUpdate,
+    Values,
+    )
+from lp.services.librarian.model import LibraryFileAlias
 from lp.services.messages.model.message import (
     Message,
     MessageChunk,
@@ -345,6 +352,196 @@ def eager_load_dsds(dsds):
         SourcePackageName, dsds, ("source_package_name_id",))
 
 
+def _load_for_update(dsds):
+    """Preload what `DistroSeriesDifference._getUpdates` needs.
+
+    :param dsds: A concrete sequence of `DistroSeriesDifference`s.
+    """
+    bulk.load_related(
+        DistroSeries, dsds, ("derived_series_id", "parent_series_id"))
+    # most_recent_publications returns one publication per package name,
+    # so query each pair of series separately.
+    by_series = defaultdict(list)
+    for dsd in dsds:
+        clear_property_cache(dsd)
+        by_series[dsd.derived_series_id, dsd.parent_series_id].append(dsd)
+    pubs = []
+    for series_dsds in by_series.values():
+        source_pubs = dict(
+            most_recent_publications(
+                series_dsds, statuses=active_publishing_status,
+                in_parent=False))
+        parent_source_pubs = dict(
+            most_recent_publications(
+                series_dsds, statuses=active_publishing_status,
+                in_parent=True))
+        for dsd in series_dsds:
+            cache = get_property_cache(dsd)
+            cache.source_pub = source_pubs.get(dsd.source_package_name_id)
+            cache.parent_source_pub = parent_source_pubs.get(
+                dsd.source_package_name_id)
+        pubs.extend(source_pubs.itervalues())
+        pubs.extend(parent_source_pubs.itervalues())
+    sprs = bulk.load_related(
+        SourcePackageRelease, pubs, ("sourcepackagereleaseID",))
+    # Changelogs are needed to work out base versions.
+    bulk.load_related(LibraryFileAlias, sprs, ("changelogID",))
+
+
+def _find_base_releases(base_versions):
+    """Find the `SourcePackageRelease`s for some base versions.
+
+    As with `DistroSeriesDifference.base_source_pub`, each base version is
+    looked for in the parent series' main archive and then in the derived
+    series' main archive.
+
+    :param base_versions: A dict mapping `DistroSeriesDifference`s to their
+        base versions.
+    :return: A dict mapping `DistroSeriesDifference`s to base releases.
+    """
+    dsds = [dsd for dsd, version in base_versions.items() if version]
+    if len(dsds) == 0:
+        return {}
+    archive_ids = set()
+    for dsd in dsds:
+        archive_ids.add(dsd.parent_series.main_archive.id)
+        archive_ids.add(dsd.derived_series.main_archive.id)
+    rows = IStore(SourcePackagePublishingHistory).find(
+        (SourcePackagePublishingHistory.archiveID, SourcePackageRelease),
+        SourcePackagePublishingHistory.archiveID.is_in(archive_ids),
+        SourcePackagePublishingHistory.sourcepackagereleaseID ==
+            SourcePackageRelease.id,
+        SourcePackageRelease.sourcepackagenameID.is_in(
+            set(dsd.source_package_name_id for dsd in dsds)),
+        SourcePackageRelease.version.is_in(
+            set(base_versions[dsd] for dsd in dsds))).order_by(
+                Desc(SourcePackagePublishingHistory.id))
+    releases = {}
+    for archive_id, spr in rows:
+        releases.setdefault(
+            (archive_id, spr.sourcepackagenameID, spr.version), spr)
+    base_releases = {}
+    for dsd in dsds:
+        for series in (dsd.parent_series, dsd.derived_series):
+            spr = releases.get((
+                series.main_archive.id, dsd.source_package_name_id,
+                base_versions[dsd]))
+            if spr is not None:
+                base_releases[dsd] = spr
+                break
+    return base_releases
+
+
+def _find_package_diffs(base_versions):
+    """Find the package diffs that `_setPackageDiffs` would set.
+
+    :param base_versions: A dict mapping `DistroSeriesDifference`s to their
+        new base versions.
+    :return: A dict mapping `DistroSeriesDifference`s to tuples of the IDs
+        of their package diff and parent package diff (or None).
+    """
+    base_releases = _find_base_releases(base_versions)
+    to_sprs = set()
+    for dsd in base_releases:
+        for pub in (dsd.source_pub, dsd.parent_source_pub):
+            if pub is not None:
+                to_sprs.add(pub.sourcepackagerelease)
+    diff_ids = {}
+    for diff in getUtility(IPackageDiffSet).getDiffsToReleases(
+            list(to_sprs)):
+        diff_ids.setdefault((diff.from_sourceID, diff.to_sourceID), diff.id)
+
+    def find_diff(base_spr, pub):
+        if pub is None:
+            return None
+        return diff_ids.get((base_spr.id, pub.sourcepackagereleaseID))
+
+    package_diffs = {}
+    for dsd in base_versions:
+        base_spr = base_releases.get(dsd)
+        if base_spr is None:
+            package_diffs[dsd] = (None, None)
+        else:
+            package_diffs[dsd] = (
+                find_diff(base_spr, dsd.source_pub),
+                find_diff(base_spr, dsd.parent_source_pub))
+    return package_diffs
+
+
+def update_dsds(dsds, manual=False):
+    """Update many `DistroSeriesDifference`s at once.
+
+    This has the same effect as calling `DistroSeriesDifference.update` on
+    each of `dsds`, but loads the publications, releases and package diffs
+    involved in a few queries and writes all the changes in one statement.
+
+    :param dsds: An iterable of `DistroSeriesDifference`s.
+    :param manual: Boolean, True if this is a user-requested change.
+    :return: A list of the differences that were updated.
+    """
+    dsds = list(dsds)
+    if len(dsds) == 0:
+        return []
+    store = IMasterStore(DistroSeriesDifference)
+    store.flush()
+    _load_for_update(dsds)
+
+    all_changes = {}
+    updated = []
+    for dsd in dsds:
+        changes, dsd_updated = dsd._getUpdates(manual)
+        all_changes[dsd] = changes
+        if dsd_updated:
+            updated.append(dsd)
+    package_diffs = _find_package_diffs(dict(
+        (dsd, all_changes[dsd].get('base_version', dsd.base_version))
+        for dsd in updated))
+    for dsd, (package_diff_id, parent_package_diff_id) in (
+            package_diffs.items()):
+        if package_diff_id != dsd.package_diff_id:
+            all_changes[dsd]['package_diff_id'] = package_diff_id
+        if parent_package_diff_id != dsd.parent_package_diff_id:
+            all_changes[dsd]['parent_package_diff_id'] = (
+                parent_package_diff_id)
+
+    changed = [dsd for dsd in dsds if all_changes[dsd]]
+    if len(changed) == 0:
+        return updated
+    column_types = [
+        ("id", "integer"),
+        ("status", "integer"),
+        ("difference_type", "integer"),
+        ("source_version", "debversion"),
+        ("parent_source_version", "debversion"),
+        ("base_version", "debversion"),
+        ("package_diff", "integer"),
+        ("parent_package_diff", "integer"),
+        ]
+    attributes = [
+        "id", "status", "difference_type", "source_version",
+        "parent_source_version", "base_version", "package_diff_id",
+        "parent_package_diff_id",
+        ]
+    columns = [getattr(DistroSeriesDifference, name) for name in attributes]
+    values = [
+        list(chain.from_iterable(
+            bulk.dbify_value(
+                column, all_changes[dsd].get(name, getattr(dsd, name)))
+            for column, name in zip(columns, attributes)))
+        for dsd in changed]
+    new_dsds = ClassAlias(DistroSeriesDifference, "new_dsds")
+    store.execute(BulkUpdate(
+        dict(
+            (column, getattr(new_dsds, name))
+            for column, name in zip(columns, attributes) if name != "id"),
+        table=DistroSeriesDifference,
+        values=Values("new_dsds", column_types, values),
+        where=DistroSeriesDifference.id == new_dsds.id))
+    for dsd in changed:
+        store.invalidate(dsd)
+    return updated
+
+
 def get_comment_with_status_change(status, new_status, comment):
     # Create a new comment string with the description of the status
     # change and the given comment string.
@@ -417,6 +614,56 @@ class DistroSeriesDifference(StormBase):
 
         return store.add(diff)
 
+    @staticmethod
+    def updateMultiple(requests, manual=False):
+        """See `IDistroSeriesDifferenceSource`."""
+        wanted = defaultdict(set)
+        series = {}
+        for derived_series, parent_series, source_package_names in requests:
+            key = (derived_series.id, parent_series.id)
+            series[key] = (derived_series, parent_series)
+            wanted[key].update(spn.id for spn in source_package_names)
+        wanted = dict((key, spn_ids) for key, spn_ids in wanted.items()
+                      if spn_ids)
+        if len(wanted) == 0:
+            return []
+        dsps = getUtility(IDistroSeriesParentSet)
+        for derived_series, parent_series in series.values():
+            if dsps.getByDerivedAndParentSeries(
+                    derived_series, parent_series) is None:
+                raise NotADerivedSeriesError()
+
+        store = IMasterStore(DistroSeriesDifference)
+        dsds = list(store.find(
+            DistroSeriesDifference,
+            Or(*(
+                And(DistroSeriesDifference.derived_series_id == derived_id,
+                    DistroSeriesDifference.parent_series_id == parent_id,
+                    DistroSeriesDifference.source_package_name_id.is_in(
+                        spn_ids))
+                for (derived_id, parent_id), spn_ids in wanted.items()))))
+        for dsd in dsds:
+            wanted[dsd.derived_series_id, dsd.parent_series_id].discard(
+                dsd.source_package_name_id)
+        # As in new(), the status and type start off with default values
+        # that are corrected by the update.
+        new_values = [
+            (derived_id, parent_id, spn_id,
+             DistroSeriesDifferenceStatus.NEEDS_ATTENTION,
+             DistroSeriesDifferenceType.DIFFERENT_VERSIONS)
+            for (derived_id, parent_id), spn_ids in sorted(wanted.items())
+            for spn_id in sorted(spn_ids)]
+        if new_values:
+            dsds.extend(bulk.create(
+                (DistroSeriesDifference.derived_series_id,
+                 DistroSeriesDifference.parent_series_id,
+                 DistroSeriesDifference.source_package_name_id,
+                 DistroSeriesDifference.status,
+                 DistroSeriesDifference.difference_type),
+                new_values, get_objects=True))
+        update_dsds(dsds, manual=manual)
+        return dsds
+
     @staticmethod
     def getForDistroSeries(distro_series, difference_type=None,
                            name_filter=None, status=None,
@@ -469,7 +716,7 @@ class DistroSeriesDifference(StormBase):
             conditions.append(Or(*name_matches))
 
         if packagesets is not None:
-            set_ids = [packageset.id for packageset in packagesets]
+            set_ids = [package_set.id for package_set in packagesets]
             conditions.append(
                 DSD.source_package_name_id.is_in(
                     Select(PSS.sourcepackagename_id,
@@ -714,17 +961,46 @@ class DistroSeriesDifference(StormBase):
         # difference, copies/publishes a new version and then calls
         # update() (like the tests for this method do).
         clear_property_cache(self)
-        self._updateType()
-        updated = self._updateVersionsAndStatus(manual=manual)
+        changes, updated = self._getUpdates(manual)
+        for name, value in changes.items():
+            setattr(self, name, value)
         if updated is True:
             self._setPackageDiffs()
         return updated
 
-    def _updateType(self):
+    def _getUpdates(self, manual):
+        """Work out how `update` should change this difference.
+
+        The difference itself is left untouched, so that `update_dsds` can
+        apply the changes for many differences at once.
+
+        :param manual: Boolean, True if this is a user-requested change.
+            This overrides auto-blacklisting.
+        :return: A tuple of a dict mapping attribute names to their new
+            values, and whether the difference counts as updated (in which
+            case its package diffs must be refreshed).
+        """
+        new = {
+            'difference_type': self.difference_type,
+            'source_version': self.source_version,
+            'parent_source_version': self.parent_source_version,
+            'status': self.status,
+            'base_version': self.base_version,
+            }
+        self._updateType(new)
+        updated = self._updateVersionsAndStatus(new, manual)
+        changes = dict(
+            (name, value) for name, value in new.items()
+            if value != getattr(self, name))
+        return changes, updated
+
+    def _updateType(self, new):
         """Helper for update() interface method.
 
         Check whether the presence of a source in the derived or parent
         series has changed (which changes the type of difference).
+
+        :param new: A dict of new attribute values to update.
         """
         if self.source_pub is None:
             new_type = DistroSeriesDifferenceType.MISSING_FROM_DERIVED_SERIES
@@ -733,14 +1009,14 @@ class DistroSeriesDifference(StormBase):
         else:
             new_type = DistroSeriesDifferenceType.DIFFERENT_VERSIONS
 
-        if new_type != self.difference_type:
-            self.difference_type = new_type
+        new['difference_type'] = new_type
 
-    def _updateVersionsAndStatus(self, manual):
+    def _updateVersionsAndStatus(self, new, manual):
         """Helper for the update() interface method.
 
         Check whether the status of this difference should be updated.
 
+        :param new: A dict of new attribute values to update.
         :param manual: Boolean, True if this is a user-requested change.
             This overrides auto-blacklisting.
         """
@@ -753,22 +1029,24 @@ class DistroSeriesDifference(StormBase):
         new_source_version = new_parent_source_version = None
         if self.source_pub:
             new_source_version = self.source_pub.source_package_version
-            if self.source_version is None or apt_pkg.version_compare(
-                    self.source_version, new_source_version) != 0:
-                self.source_version = new_source_version
+            if new['source_version'] is None or apt_pkg.version_compare(
+                    new['source_version'], new_source_version) != 0:
+                new['source_version'] = new_source_version
                 updated = True
                 # If the derived version has change and the previous version
                 # was blacklisted, then we remove the blacklist now.
-                if self.status == (
+                if new['status'] == (
                     DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT):
-                    self.status = DistroSeriesDifferenceStatus.NEEDS_ATTENTION
+                    new['status'] = (
+                        DistroSeriesDifferenceStatus.NEEDS_ATTENTION)
         if self.parent_source_pub:
             new_parent_source_version = (
                 self.parent_source_pub.source_package_version)
-            if self.parent_source_version is None or apt_pkg.version_compare(
-                    self.parent_source_version,
-                    new_parent_source_version) != 0:
-                self.parent_source_version = new_parent_source_version
+            if (new['parent_source_version'] is None or
+                    apt_pkg.version_compare(
+                        new['parent_source_version'],
+                        new_parent_source_version) != 0):
+                new['parent_source_version'] = new_parent_source_version
                 updated = True
 
         if not self.source_pub or not self.parent_source_pub:
@@ -776,52 +1054,49 @@ class DistroSeriesDifference(StormBase):
             # that bad data cannot make us OOPS.
             return updated
 
+        comparison = apt_pkg.version_compare(
+            new['source_version'], new['parent_source_version'])
         # If this difference was resolved but now the versions don't match
         # then we re-open the difference.
-        if self.status == DistroSeriesDifferenceStatus.RESOLVED:
-            if apt_pkg.version_compare(
-                self.source_version, self.parent_source_version) < 0:
+        if new['status'] == DistroSeriesDifferenceStatus.RESOLVED:
+            if comparison < 0:
                 # Higher parent version.
                 updated = True
-                self.status = DistroSeriesDifferenceStatus.NEEDS_ATTENTION
-            elif (
-                apt_pkg.version_compare(
-                    self.source_version, self.parent_source_version) > 0
-                and not manual):
+                new['status'] = DistroSeriesDifferenceStatus.NEEDS_ATTENTION
+            elif comparison > 0 and not manual:
                 # The child was updated with a higher version so it's
                 # auto-blacklisted.
                 updated = True
-                self.status = DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT
+                new['status'] = (
+                    DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT)
         # If this difference was needing attention, or the current version
         # was blacklisted and the versions now match we resolve it. Note:
         # we don't resolve it if this difference was blacklisted for all
         # versions.
-        elif self.status in (
+        elif new['status'] in (
             DistroSeriesDifferenceStatus.NEEDS_ATTENTION,
             DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT):
-            if apt_pkg.version_compare(
-                    self.source_version, self.parent_source_version) == 0:
+            if comparison == 0:
                 updated = True
-                self.status = DistroSeriesDifferenceStatus.RESOLVED
-            elif (
-                apt_pkg.version_compare(
-                    self.source_version, self.parent_source_version) > 0
-                and not manual):
+                new['status'] = DistroSeriesDifferenceStatus.RESOLVED
+            elif comparison > 0 and not manual:
                 # If the derived version is lower than the parent's, we
                 # ensure the diff status is blacklisted.
-                self.status = DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT
+                new['status'] = (
+                    DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT)
 
-        if self._updateBaseVersion():
+        if self._updateBaseVersion(new):
             updated = True
 
         return updated
 
-    def _updateBaseVersion(self):
+    def _updateBaseVersion(self, new):
         """Check for the most-recently published common version.
 
-        Return whether the record was updated or not.
+        :param new: A dict of new attribute values to update.
+        :return: Whether the record was updated or not.
         """
-        if self.difference_type != (
+        if new['difference_type'] != (
             DistroSeriesDifferenceType.DIFFERENT_VERSIONS):
             return False
 
@@ -835,7 +1110,7 @@ class DistroSeriesDifference(StormBase):
         if ancestry is not None and parent_ancestry is not None:
             intersection = ancestry.intersection(parent_ancestry)
             if len(intersection) > 0:
-                self.base_version = unicode(max(intersection))
+                new['base_version'] = unicode(max(intersection))
                 return True
         return False
 
@@ -50,6 +50,7 @@ from lp.services.config import config
 from lp.services.database.bulk import load_related
 from lp.services.database.decoratedresultset import DecoratedResultSet
 from lp.services.database.interfaces import IStore
+from lp.services.database.objectcache import cached_lookup
 from lp.services.database.sqlbase import (
     SQLBase,
     sqlvalues,
@@ -135,8 +136,10 @@ class PillarNameSet:
         else:
             query %= ""
         name = ensure_unicode(name)
-        result = IStore(PillarName).execute(query, [name, name])
-        row = result.get_one()
+        store = IStore(PillarName)
+        row = cached_lookup(
+            store, 'PillarName', ('getByName', name, ignore_inactive),
+            lambda: store.execute(query, [name, name]).get_one())
         if row is None:
             return None
 
@@ -607,6 +607,41 @@ def _mergeKarmaCache(cur, from_id, to_id, from_karma):
     cur.execute('''
         DELETE FROM KarmaCache WHERE person = %(from_id)d
         ''' % params)
+    # The karma itself moves to the remaining user, so the running totals
+    # used for incremental karma cache updates have to move with it.
+    cur.execute('''
+        UPDATE KarmaDecayTotal
+        SET
+            karma_count = KarmaDecayTotal.karma_count + old.karma_count,
+            points = KarmaDecayTotal.points + old.points,
+            points_epoch = KarmaDecayTotal.points_epoch + old.points_epoch
+        FROM KarmaDecayTotal AS old
+        WHERE
+            KarmaDecayTotal.person = %(to_id)d
+            AND old.person = %(from_id)d
+            AND old.category = KarmaDecayTotal.category
+            AND old.product IS NOT DISTINCT FROM KarmaDecayTotal.product
+            AND old.distribution IS NOT DISTINCT FROM
+                KarmaDecayTotal.distribution
+        ''' % params)
+    cur.execute('''
+        DELETE FROM KarmaDecayTotal AS old
+        WHERE
+            old.person = %(from_id)d
+            AND EXISTS (
+                SELECT 1 FROM KarmaDecayTotal
+                WHERE
+                    KarmaDecayTotal.person = %(to_id)d
+                    AND old.category = KarmaDecayTotal.category
+                    AND old.product IS NOT DISTINCT FROM
+                        KarmaDecayTotal.product
+                    AND old.distribution IS NOT DISTINCT FROM
+                        KarmaDecayTotal.distribution)
+        ''' % params)
+    cur.execute('''
+        UPDATE KarmaDecayTotal SET person = %(to_id)d
+        WHERE person = %(from_id)d
+        ''' % params)
 
 
 def _mergeDateCreated(cur, from_id, to_id):
@@ -878,6 +913,7 @@ def merge_people(from_person, to_person, reviewer, delete=False):
 
     _mergeKarmaCache(cur, from_id, to_id, from_person.karma)
     skip.append(('karmacache', 'person'))
+    skip.append(('karmadecaytotal', 'person'))
     skip.append(('karmatotalcache', 'person'))
 
     _mergeDateCreated(cur, from_id, to_id)
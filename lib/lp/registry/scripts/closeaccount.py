@@ -283,6 +283,7 @@ def close_account(username, log):
         # Karma
         ('Karma', 'person'),
         ('KarmaCache', 'person'),
+        ('KarmaDecayTotal', 'person'),
         ('KarmaTotalCache', 'person'),
 
         # Team memberships
@@ -34,7 +34,10 @@ from lp.registry.interfaces.distribution import IDistributionSet
 from lp.registry.interfaces.distroseriesparent import IDistroSeriesParentSet
 from lp.registry.interfaces.pocket import PackagePublishingPocket
 from lp.registry.model.distroseries import DistroSeries
-from lp.registry.model.distroseriesdifference import DistroSeriesDifference
+from lp.registry.model.distroseriesdifference import (
+    DistroSeriesDifference,
+    update_dsds,
+    )
 from lp.registry.model.distroseriesparent import DistroSeriesParent
 from lp.services.database.interfaces import IStore
 from lp.services.database.sqlbase import (
@@ -240,7 +243,7 @@ def find_derived_series():
 
 
 class DSDUpdater(TunableLoop):
-    """Call `DistroSeriesDifference.update()` where appropriate.
+    """Update `DistroSeriesDifference`s in batches using `update_dsds`.
 
     The `DistroSeriesDifference` records we create don't have their
     details filled out, such as base version or their diffs.
@@ -286,8 +289,7 @@ class DSDUpdater(TunableLoop):
 
     def __call__(self, chunk_size):
         """See `ITunableLoop`."""
-        for dsd in self._getBatch(self._cutChunk(int(chunk_size))):
-            dsd.update()
+        update_dsds(self._getBatch(self._cutChunk(int(chunk_size))))
         self.commit()
 
 
@@ -11,13 +11,9 @@ __all__ = [
     "fix_teamparticipation_consistency",
     ]
 
-from collections import (
-    defaultdict,
-    namedtuple,
-    )
+from collections import namedtuple
 from functools import partial
 from itertools import (
-    chain,
     count,
     imap,
     izip,
@@ -27,6 +23,10 @@ import transaction
 
 from lp.registry.interfaces.teammembership import ACTIVE_STATES
 from lp.registry.model.teammembership import TeamParticipation
+from lp.registry.teamgraph import (
+    CompactAdjacency,
+    TeamGraph,
+    )
 from lp.services.database.interfaces import (
     IMasterStore,
     ISlaveStore,
@@ -104,17 +104,19 @@ def fetch_team_participation_info(log):
             "SELECT id, name FROM Person"
             " WHERE teamowner IS NOT NULL"
             "   AND merged IS NULL"))
-    team_memberships = defaultdict(set)
-    results = slurp(
-        "SELECT team, person FROM TeamMembership"
-        " WHERE status in %s" % quote(ACTIVE_STATES))
-    for (team, person) in results:
-        team_memberships[team].add(person)
-    team_participations = defaultdict(set)
-    results = slurp(
-        "SELECT team, person FROM TeamParticipation")
-    for (team, person) in results:
-        team_participations[team].add(person)
+    # Stream the rows in order straight into compact arrays, rather than
+    # building dicts of sets that take gigabytes for the whole site.
+    team_memberships = CompactAdjacency.from_pairs(
+        slurp(
+            "SELECT team, person FROM TeamMembership"
+            " WHERE status in %s"
+            " ORDER BY team, person" % quote(ACTIVE_STATES)),
+        presorted=True)
+    team_participations = CompactAdjacency.from_pairs(
+        slurp(
+            "SELECT team, person FROM TeamParticipation"
+            " ORDER BY team, person"),
+        presorted=True)
 
     # Don't hold any locks.
     transaction.commit()
@@ -130,43 +132,17 @@ def check_teamparticipation_consistency(log, info):
     """
     people, teams, team_memberships, team_participations = info
 
-    # set.intersection() with a dict is slow.
-    people_set = frozenset(people)
-    teams_set = frozenset(teams)
-
-    def get_participants(team):
-        """Recurse through membership records to get participants."""
-        member_people = team_memberships[team].intersection(people_set)
-        member_people.add(team)  # Teams always participate in themselves.
-        member_teams = team_memberships[team].intersection(teams_set)
-        return member_people.union(
-            chain.from_iterable(imap(get_participants, member_teams)))
-
-    def check_participants(person, expected, observed):
-        spurious = observed - expected
-        missing = expected - observed
+    log.debug(
+        "Checking consistency of %d people and %d teams",
+        len(people), len(teams))
+    graph = TeamGraph(people, teams, team_memberships)
+    errors = []
+    for person, missing, spurious in graph.getParticipationDelta(
+            team_participations):
         if len(spurious) > 0:
-            yield ConsistencyError("spurious", person, sorted(spurious))
+            errors.append(ConsistencyError("spurious", person, spurious))
         if len(missing) > 0:
-            yield ConsistencyError("missing", person, sorted(missing))
-
-    errors = []
-
-    log.debug("Checking consistency of %d people", len(people))
-    for person in report_progress(log, 50000, people, "people"):
-        participants_expected = set((person,))
-        participants_observed = team_participations[person]
-        errors.extend(
-            check_participants(
-                person, participants_expected, participants_observed))
-
-    log.debug("Checking consistency of %d teams", len(teams))
-    for team in report_progress(log, 1000, teams, "teams"):
-        participants_expected = get_participants(team)
-        participants_observed = team_participations[team]
-        errors.extend(
-            check_participants(
-                team, participants_expected, participants_observed))
+            errors.append(ConsistencyError("missing", person, missing))
 
     def get_repr(id):
         if id in people:
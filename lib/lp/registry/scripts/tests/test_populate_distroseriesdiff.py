@@ -15,6 +15,9 @@ from lp.registry.enums import (
     )
 from lp.registry.interfaces.pocket import PackagePublishingPocket
 from lp.registry.model.distroseriesdifference import DistroSeriesDifference
+from lp.registry.scripts import (
+    populate_distroseriesdiff as populate_distroseriesdiff_module,
+    )
 from lp.registry.scripts.populate_distroseriesdiff import (
     compose_sql_difference_type,
     compose_sql_find_differences,
@@ -40,6 +43,7 @@ from lp.soyuz.interfaces.publishing import (
     )
 from lp.soyuz.model.archive import Archive
 from lp.testing import (
+    monkey_patch,
     TestCase,
     TestCaseWithFactory,
     )
@@ -502,14 +506,14 @@ class TestPopulateDistroSeriesDiff(TestCaseWithFactory, FactoryHelper):
         self.assertEqual(existing_versions['derived'], dsd.source_version)
 
 
-class FakeDSD:
-    update = FakeMethod()
-
-
 class TestDSDUpdater(TestCase):
     """Test the poignant parts of `BaseVersionFixer`."""
 
     def makeFixer(self, ids):
+        self.update_dsds = FakeMethod()
+        self.useContext(monkey_patch(
+            populate_distroseriesdiff_module,
+            update_dsds=self.update_dsds))
         fixer = DSDUpdater(DevNullLogger(), None, FakeMethod(), ids)
         fixer._getBatch = FakeMethod()
         return fixer
@@ -533,14 +537,15 @@ class TestDSDUpdater(TestCase):
         self.assertEqual([], fixer.ids)
 
     def test_updatesBaseVersion(self):
-        fake_dsd = FakeDSD()
-        fixer = self.makeFixer([fake_dsd])
-        fixer._getBatch.result = fixer.ids
-        fixer(1)
-        self.assertNotEqual(0, fake_dsd.update.call_count)
+        # Each batch of DSDs is updated in bulk.
+        fixer = self.makeFixer([1, 2])
+        fixer._getBatch.result = ["dsd1", "dsd2"]
+        fixer(2)
+        self.assertEqual(
+            [((["dsd1", "dsd2"],), {})], self.update_dsds.calls)
 
     def test_loop_commits(self):
-        fixer = self.makeFixer([FakeDSD()])
+        fixer = self.makeFixer([1])
         fixer._getBatch = FakeMethod(result=fixer.ids)
         fixer(1)
         self.assertNotEqual(0, fixer.commit.call_count)
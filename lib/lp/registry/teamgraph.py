@@ -0,0 +1,276 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Compact in-memory representation of the team membership graph.
+
+Launchpad has millions of people and tens of thousands of teams, so
+holding memberships and participations as dicts of Python sets takes
+gigabytes.  The structures here store them as integer arrays instead:
+`CompactAdjacency` maps each key to a sorted array of values in
+compressed sparse row form, and `TeamGraph` computes the transitive
+closure of team membership (i.e. the expected `TeamParticipation`) with
+a single strongly-connected-components pass.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'CompactAdjacency',
+    'diff_sorted',
+    'TeamGraph',
+    ]
+
+from array import array
+from bisect import bisect_left
+
+
+def _sorted_array(values):
+    """Return a sorted, de-duplicated integer array of `values`."""
+    return array('i', sorted(set(values)))
+
+
+def _contains(sorted_values, value):
+    """Is `value` in the sorted array `sorted_values`?"""
+    index = bisect_left(sorted_values, value)
+    return index < len(sorted_values) and sorted_values[index] == value
+
+
+def diff_sorted(expected, observed):
+    """Compare two sorted sequences of integers in a single pass.
+
+    :return: A (missing, spurious) tuple of lists: the values only in
+        `expected` and the values only in `observed` respectively.
+    """
+    missing = []
+    spurious = []
+    i = j = 0
+    while i < len(expected) and j < len(observed):
+        if expected[i] == observed[j]:
+            i += 1
+            j += 1
+        elif expected[i] < observed[j]:
+            missing.append(expected[i])
+            i += 1
+        else:
+            spurious.append(observed[j])
+            j += 1
+    missing.extend(expected[i:])
+    spurious.extend(observed[j:])
+    return missing, spurious
+
+
+class CompactAdjacency:
+    """A read-only mapping from integers to sorted arrays of integers.
+
+    This behaves like a `defaultdict` of sets for lookups: a key with no
+    values maps to an empty array.  Keys and values are stored in three
+    flat arrays, so each entry costs a few bytes rather than the ~70 bytes
+    of a Python set entry.
+    """
+
+    def __init__(self, keys, offsets, values):
+        assert len(offsets) == len(keys) + 1
+        self.keys = keys
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_pairs(cls, pairs, presorted=False):
+        """Build from an iterable of (key, value) pairs.
+
+        :param presorted: If True, `pairs` is already sorted, for example
+            by an ORDER BY clause, and is consumed as a stream without
+            holding it all in memory.
+        """
+        if not presorted:
+            pairs = sorted(pairs)
+        keys = array('i')
+        offsets = array('i', [0])
+        values = array('i')
+        last_key = last_value = None
+        for key, value in pairs:
+            if key != last_key:
+                if last_key is not None:
+                    offsets.append(len(values))
+                keys.append(key)
+                last_key = key
+                last_value = None
+            if value != last_value:
+                values.append(value)
+                last_value = value
+        if last_key is not None:
+            offsets.append(len(values))
+        return cls(keys, offsets, values)
+
+    def _index(self, key):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def __getitem__(self, key):
+        index = self._index(key)
+        if index is None:
+            return array('i')
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def __contains__(self, key):
+        return self._index(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def items(self):
+        for index, key in enumerate(self.keys):
+            yield key, self.values[
+                self.offsets[index]:self.offsets[index + 1]]
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, CompactAdjacency) and
+            self.keys == other.keys and
+            self.offsets == other.offsets and
+            self.values == other.values)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class TeamGraph:
+    """The team membership graph, indexed by team position.
+
+    :param people: The IDs of all people (not teams).
+    :param teams: The IDs of all teams.
+    :param memberships: A `CompactAdjacency` mapping each team ID to the
+        IDs of its active direct members.  Members that are neither in
+        `people` nor in `teams` (e.g. merged accounts) are ignored.
+    """
+
+    def __init__(self, people, teams, memberships):
+        self.people = _sorted_array(people)
+        self.teams = _sorted_array(teams)
+        self.memberships = memberships
+
+    def _teamIndex(self, team):
+        index = bisect_left(self.teams, team)
+        if index < len(self.teams) and self.teams[index] == team:
+            return index
+        return None
+
+    def _memberTeamIndexes(self, index):
+        member_indexes = []
+        for member in self.memberships[self.teams[index]]:
+            member_index = self._teamIndex(member)
+            if member_index is not None:
+                member_indexes.append(member_index)
+        return member_indexes
+
+    def _components(self):
+        """Generate the strongly connected components of the team graph.
+
+        This is an iterative version of Tarjan's algorithm, so deeply
+        nested teams can't exhaust the stack.  Components are generated in
+        reverse topological order: every component reachable from a given
+        component is generated before it.
+        """
+        count = len(self.teams)
+        order = array('i', [-1]) * count
+        lowlink = array('i', [0]) * count
+        on_stack = bytearray(count)
+        stack = []
+        counter = 0
+        for root in xrange(count):
+            if order[root] != -1:
+                continue
+            order[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [(root, iter(self._memberTeamIndexes(root)))]
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if order[successor] == -1:
+                        order[successor] = lowlink[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack[successor] = 1
+                        work.append(
+                            (successor,
+                             iter(self._memberTeamIndexes(successor))))
+                        break
+                    elif on_stack[successor]:
+                        lowlink[node] = min(lowlink[node], order[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == order[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = 0
+                            component.append(member)
+                            if member == node:
+                                break
+                        yield component
+
+    def getParticipations(self):
+        """Compute the participants of every team.
+
+        A team's participants are the team itself, its direct members
+        and, transitively, the participants of its member teams.  Teams
+        that are members of each other share the same participants.
+
+        :return: A `CompactAdjacency` mapping each team ID to the sorted
+            IDs of its participants.
+        """
+        component_of = array('i', [-1]) * len(self.teams)
+        closures = []
+        for component in self._components():
+            component_index = len(closures)
+            participants = set()
+            for index in component:
+                component_of[index] = component_index
+                participants.add(self.teams[index])
+            for index in component:
+                for member in self.memberships[self.teams[index]]:
+                    member_index = self._teamIndex(member)
+                    if member_index is None:
+                        if _contains(self.people, member):
+                            participants.add(member)
+                    elif component_of[member_index] != component_index:
+                        # Member teams in other components have already
+                        # been closed over.
+                        participants.update(
+                            closures[component_of[member_index]])
+            closures.append(array('i', sorted(participants)))
+
+        offsets = array('i', [0])
+        values = array('i')
+        for index in xrange(len(self.teams)):
+            values.extend(closures[component_of[index]])
+            offsets.append(len(values))
+        return CompactAdjacency(array('i', self.teams), offsets, values)
+
+    def getParticipationDelta(self, observed):
+        """Compare the computed participations with `observed` ones.
+
+        :param observed: A `CompactAdjacency` (or mapping of sorted
+            sequences) of the current team participations, keyed by team.
+        :return: A generator of (team, missing, spurious) tuples for each
+            team or person whose participations differ, where `missing`
+            and `spurious` are sorted lists of person IDs.  Applying these
+            deltas is the minimal change to make `observed` consistent.
+        """
+        for person in self.people:
+            missing, spurious = diff_sorted([person], observed[person])
+            if missing or spurious:
+                yield person, missing, spurious
+        for team, expected in self.getParticipations().items():
+            missing, spurious = diff_sorted(expected, observed[team])
+            if missing or spurious:
+                yield team, missing, spurious
@@ -29,6 +29,7 @@ from lp.registry.model.distroseriesdifference import (
     get_comment_with_status_change,
     most_recent_comments,
     most_recent_publications,
+    update_dsds,
     )
 from lp.services.propertycache import get_property_cache
 from lp.services.webapp.authorization import check_permission
@@ -38,6 +39,7 @@ from lp.soyuz.model.packagesetsources import PackagesetSources
 from lp.testing import (
     celebrity_logged_in,
     person_logged_in,
+    StormStatementRecorder,
     TestCaseWithFactory,
     verifyObject,
     )
@@ -1408,3 +1410,154 @@ class TestMostRecentPublications(TestCaseWithFactory):
             [], most_recent_publications(
                 [dsd], in_parent=False, match_version=True,
                 statuses=(PackagePublishingStatus.PUBLISHED,)))
+
+
+class TestUpdateMultiple(TestCaseWithFactory):
+
+    layer = LaunchpadFunctionalLayer
+
+    def publish(self, dsd, version, in_parent=False):
+        series = dsd.parent_series if in_parent else dsd.derived_series
+        self.factory.makeSourcePackagePublishingHistory(
+            sourcepackagename=dsd.source_package_name, distroseries=series,
+            status=PackagePublishingStatus.PENDING, version=version)
+
+    def test_update_dsds_matches_update(self):
+        # update_dsds makes the same changes as update() would.
+        dsp = self.factory.makeDistroSeriesParent()
+        resolved = self.factory.makeDistroSeriesDifference(
+            derived_series=dsp.derived_series,
+            versions={'parent': '1.0', 'derived': '0.9'})
+        self.publish(resolved, '1.0')
+        reopened = self.factory.makeDistroSeriesDifference(
+            derived_series=dsp.derived_series,
+            versions={'parent': '1.0', 'derived': '1.0'},
+            status=DistroSeriesDifferenceStatus.RESOLVED)
+        self.publish(reopened, '1.1', in_parent=True)
+        blacklisted = self.factory.makeDistroSeriesDifference(
+            derived_series=dsp.derived_series,
+            versions={'parent': '1.0', 'derived': '1.0'},
+            status=DistroSeriesDifferenceStatus.RESOLVED)
+        self.publish(blacklisted, '1.1')
+        unchanged = self.factory.makeDistroSeriesDifference(
+            derived_series=dsp.derived_series,
+            versions={'parent': '1.0', 'derived': '0.9'})
+        dsds = [
+            removeSecurityProxy(dsd)
+            for dsd in (resolved, reopened, blacklisted, unchanged)]
+
+        updated = update_dsds(dsds)
+
+        self.assertContentEqual(dsds[:3], updated)
+        self.assertEqual(
+            [DistroSeriesDifferenceStatus.RESOLVED,
+             DistroSeriesDifferenceStatus.NEEDS_ATTENTION,
+             DistroSeriesDifferenceStatus.BLACKLISTED_CURRENT,
+             DistroSeriesDifferenceStatus.NEEDS_ATTENTION],
+            [dsd.status for dsd in dsds])
+        self.assertEqual(
+            ['1.0', '1.0', '1.1', '0.9'],
+            [dsd.source_version for dsd in dsds])
+        self.assertEqual(
+            ['1.0', '1.1', '1.0', '1.0'],
+            [dsd.parent_source_version for dsd in dsds])
+
+    def test_update_dsds_changes_type(self):
+        dsd = removeSecurityProxy(self.factory.makeDistroSeriesDifference(
+            difference_type=(
+                DistroSeriesDifferenceType.MISSING_FROM_DERIVED_SERIES)))
+        self.publish(dsd, '1.0')
+        update_dsds([dsd])
+        self.assertEqual(
+            DistroSeriesDifferenceType.DIFFERENT_VERSIONS,
+            dsd.difference_type)
+        self.assertEqual('1.0', dsd.source_version)
+
+    def test_update_dsds_sets_base_version_and_package_diffs(self):
+        derived_changelog = self.factory.makeChangelog(
+            versions=['1.0', '1.2'])
+        parent_changelog = self.factory.makeChangelog(
+            versions=['1.0', '1.3'])
+        transaction.commit()  # Yay, librarian.
+        dsd = self.factory.makeDistroSeriesDifference(
+            versions={'derived': '1.2', 'parent': '1.3', 'base': '1.0'},
+            changelogs={
+                'derived': derived_changelog,
+                'parent': parent_changelog,
+            })
+        person = self.factory.makePerson()
+        with person_logged_in(person):
+            dsd.requestPackageDiffs(person)
+        naked_dsd = removeSecurityProxy(dsd)
+        package_diff = naked_dsd.package_diff
+        parent_package_diff = naked_dsd.parent_package_diff
+        naked_dsd.base_version = None
+        naked_dsd.package_diff = None
+        naked_dsd.parent_package_diff = None
+
+        self.assertEqual([naked_dsd], update_dsds([naked_dsd]))
+
+        self.assertEqual('1.0', naked_dsd.base_version)
+        self.assertEqual(package_diff, naked_dsd.package_diff)
+        self.assertEqual(parent_package_diff, naked_dsd.parent_package_diff)
+
+    def test_update_dsds_query_count(self):
+        # The number of queries doesn't depend on the number of differences
+        # between a pair of series.
+        dsp = self.factory.makeDistroSeriesParent()
+
+        def make_dsds(count):
+            dsds = []
+            for _ in range(count):
+                dsd = self.factory.makeDistroSeriesDifference(
+                    derived_series=dsp.derived_series,
+                    versions={'parent': '1.0', 'derived': '0.9'})
+                self.publish(dsd, '1.0')
+                dsds.append(removeSecurityProxy(dsd))
+            Store.of(dsds[0]).flush()
+            return dsds
+
+        def count_queries(dsds):
+            with StormStatementRecorder() as recorder:
+                update_dsds(dsds)
+            return recorder.count
+
+        self.assertEqual(
+            count_queries(make_dsds(2)), count_queries(make_dsds(5)))
+
+    def test_updateMultiple_creates_and_updates(self):
+        # updateMultiple creates any missing differences, and updates the
+        # existing ones.
+        existing = removeSecurityProxy(
+            self.factory.makeDistroSeriesDifference(
+                versions={'parent': '1.0', 'derived': '0.9'}))
+        self.publish(existing, '1.0')
+        spn = self.factory.makeSourcePackageName()
+        for series, version in (
+                (existing.derived_series, '2.0'),
+                (existing.parent_series, '2.1')):
+            self.factory.makeSourcePackagePublishingHistory(
+                sourcepackagename=spn, distroseries=series,
+                status=PackagePublishingStatus.PENDING, version=version)
+
+        dsds = getUtility(IDistroSeriesDifferenceSource).updateMultiple([
+            (existing.derived_series, existing.parent_series,
+             [existing.source_package_name, spn])])
+
+        self.assertEqual(2, len(dsds))
+        self.assertEqual(
+            DistroSeriesDifferenceStatus.RESOLVED, existing.status)
+        dsd_source = getUtility(IDistroSeriesDifferenceSource)
+        new = dsd_source.getByDistroSeriesNameAndParentSeries(
+            existing.derived_series, spn.name, existing.parent_series)
+        self.assertEqual(
+            ('2.0', '2.1', DistroSeriesDifferenceStatus.NEEDS_ATTENTION),
+            (new.source_version, new.parent_source_version, new.status))
+
+    def test_updateMultiple_not_derived(self):
+        series = self.factory.makeDistroSeries()
+        self.assertRaises(
+            NotADerivedSeriesError,
+            getUtility(IDistroSeriesDifferenceSource).updateMultiple,
+            [(series, self.factory.makeDistroSeries(),
+              [self.factory.makeSourcePackageName()])])
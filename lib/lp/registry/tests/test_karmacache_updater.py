@@ -9,7 +9,9 @@ import unittest
 
 import transaction
 from zope.component import getUtility
+from zope.security.proxy import removeSecurityProxy
 
+from lp.registry.interfaces.karma import IKarmaActionSet
 from lp.registry.interfaces.person import IPersonSet
 from lp.registry.interfaces.product import IProductSet
 from lp.registry.model.karma import KarmaCache
@@ -38,9 +40,10 @@ class TestKarmaCacheUpdater(unittest.TestCase):
     def _getCacheEntriesByPerson(self, person):
         return KarmaCache.selectBy(person=person)
 
-    def _runScript(self):
+    def _runScript(self, *args):
         process = subprocess.Popen(
-            'cronscripts/foaf-update-karma-cache.py', shell=True,
+            ' '.join(('cronscripts/foaf-update-karma-cache.py',) + args),
+            shell=True,
             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
             stderr=subprocess.PIPE)
         (out, err) = process.communicate()
@@ -103,3 +106,72 @@ class TestKarmaCacheUpdater(unittest.TestCase):
 
         # And finally, ensure that No Priv got some new KarmaCache entries.
         self.assertFalse(self._getCacheEntriesByPerson(nopriv).is_empty())
+
+    def _getAllCacheEntries(self):
+        flush_database_caches()
+        return dict(
+            ((cache.personID, cache.categoryID, cache.productID,
+              cache.distributionID, cache.projectgroupID), cache.karmavalue)
+            for cache in KarmaCache.select())
+
+    def assertCacheEntriesMatch(self, expected, observed):
+        # The runs happen at slightly different times, so the decayed
+        # values may be off by rounding.
+        self.assertEqual(sorted(expected), sorted(observed))
+        for key, value in expected.items():
+            self.assertTrue(
+                abs(value - observed[key]) <= max(1, value // 100),
+                (key, value, observed[key]))
+
+    def test_incremental_matches_full(self):
+        # An incremental update produces the same entries as a full one,
+        # both when starting afresh and when building on an earlier run.
+        firefox = getUtility(IProductSet)['firefox']
+        foobar = self.personset.getByName('name16')
+        foobar.assignKarma('bugcreated', firefox)
+        transaction.commit()
+        self._runScript()
+        full = self._getAllCacheEntries()
+        self._runScript('--incremental', '--lag=0')
+        self.assertCacheEntriesMatch(full, self._getAllCacheEntries())
+
+        nopriv = self.personset.getByName('no-priv')
+        nopriv.assignKarma('bugcreated', firefox)
+        foobar.assignKarma('bugcreated', firefox)
+        transaction.commit()
+        self._runScript('--incremental', '--lag=0')
+        incremental = self._getAllCacheEntries()
+        self._runScript()
+        self.assertCacheEntriesMatch(self._getAllCacheEntries(), incremental)
+
+    def test_incremental_after_points_change(self):
+        # The running totals are rebuilt if an action's points change,
+        # since karma that expires later must be subtracted at the value
+        # it was added with.
+        firefox = getUtility(IProductSet)['firefox']
+        foobar = self.personset.getByName('name16')
+        foobar.assignKarma('bugcreated', firefox)
+        transaction.commit()
+        self._runScript('--incremental', '--lag=0')
+        action = getUtility(IKarmaActionSet).getByName('bugcreated')
+        removeSecurityProxy(action).points += 10
+        foobar.assignKarma('bugcreated', firefox)
+        transaction.commit()
+        self._runScript('--incremental', '--lag=0')
+        incremental = self._getAllCacheEntries()
+        self._runScript()
+        self.assertCacheEntriesMatch(self._getAllCacheEntries(), incremental)
+
+    def test_incremental_lag(self):
+        # Incremental runs only count karma created some time ago, in case
+        # transactions that created earlier karma are still in progress.
+        firefox = getUtility(IProductSet)['firefox']
+        nopriv = self.personset.getByName('no-priv')
+        nopriv.assignKarma('bugcreated', firefox)
+        transaction.commit()
+        self._runScript('--incremental')
+        flush_database_caches()
+        self.assertTrue(self._getCacheEntriesByPerson(nopriv).is_empty())
+        self._runScript('--incremental', '--lag=0')
+        flush_database_caches()
+        self.assertFalse(self._getCacheEntriesByPerson(nopriv).is_empty())
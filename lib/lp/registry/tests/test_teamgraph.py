@@ -0,0 +1,107 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the compact team membership graph."""
+
+__metaclass__ = type
+
+import pickle
+
+from lp.registry.teamgraph import (
+    CompactAdjacency,
+    diff_sorted,
+    TeamGraph,
+    )
+from lp.testing import TestCase
+
+
+class TestDiffSorted(TestCase):
+
+    def test_diff(self):
+        self.assertEqual(
+            ([1, 5], [2, 6, 7]), diff_sorted([1, 3, 5], [2, 3, 6, 7]))
+
+    def test_equal(self):
+        self.assertEqual(([], []), diff_sorted([1, 2], [1, 2]))
+
+
+class TestCompactAdjacency(TestCase):
+
+    def test_from_pairs(self):
+        adjacency = CompactAdjacency.from_pairs(
+            [(3, 1), (1, 5), (1, 2), (3, 1), (1, 5)])
+        self.assertEqual([1, 3], list(adjacency))
+        self.assertEqual([2, 5], list(adjacency[1]))
+        self.assertEqual([1], list(adjacency[3]))
+        self.assertIn(3, adjacency)
+        self.assertNotIn(2, adjacency)
+
+    def test_missing_key_is_empty(self):
+        adjacency = CompactAdjacency.from_pairs([(1, 2)])
+        self.assertEqual([], list(adjacency[2]))
+
+    def test_presorted_stream(self):
+        pairs = iter([(1, 2), (1, 3), (2, 1)])
+        adjacency = CompactAdjacency.from_pairs(pairs, presorted=True)
+        self.assertEqual(
+            [(1, [2, 3]), (2, [1])],
+            [(key, list(values)) for key, values in adjacency.items()])
+
+    def test_pickle(self):
+        adjacency = CompactAdjacency.from_pairs([(1, 2), (2, 3)])
+        self.assertEqual(
+            adjacency,
+            pickle.loads(pickle.dumps(adjacency, pickle.HIGHEST_PROTOCOL)))
+
+
+class TestTeamGraph(TestCase):
+
+    def makeGraph(self, people, teams, memberships):
+        return TeamGraph(
+            people, teams, CompactAdjacency.from_pairs(memberships))
+
+    def getParticipations(self, graph):
+        return dict(
+            (team, list(participants))
+            for team, participants in graph.getParticipations().items())
+
+    def test_nested_teams(self):
+        # Participation is transitive through member teams.
+        graph = self.makeGraph(
+            [1, 2, 3], [10, 11, 12],
+            [(10, 1), (10, 11), (11, 2), (11, 12), (12, 3)])
+        self.assertEqual(
+            {10: [1, 2, 3, 10, 11, 12], 11: [2, 3, 11, 12], 12: [3, 12]},
+            self.getParticipations(graph))
+
+    def test_cycle(self):
+        # Teams that are members of each other share their participants,
+        # rather than causing infinite recursion.
+        graph = self.makeGraph(
+            [1, 2], [10, 11], [(10, 1), (10, 11), (11, 2), (11, 10)])
+        self.assertEqual(
+            {10: [1, 2, 10, 11], 11: [1, 2, 10, 11]},
+            self.getParticipations(graph))
+
+    def test_unknown_members_ignored(self):
+        # Members that are neither known people nor teams, such as merged
+        # accounts, don't participate.
+        graph = self.makeGraph([1], [10], [(10, 1), (10, 99)])
+        self.assertEqual({10: [1, 10]}, self.getParticipations(graph))
+
+    def test_deep_nesting(self):
+        # Long chains of teams don't exhaust the stack.
+        teams = range(1000, 3000)
+        graph = self.makeGraph(
+            [1], teams,
+            [(team, team + 1) for team in teams[:-1]] + [(teams[-1], 1)])
+        participations = graph.getParticipations()
+        self.assertEqual([1] + teams, list(participations[teams[0]]))
+
+    def test_participation_delta(self):
+        graph = self.makeGraph([1, 2], [10], [(10, 1)])
+        observed = CompactAdjacency.from_pairs(
+            [(1, 1), (2, 2), (2, 1), (10, 2), (10, 10)])
+        self.assertEqual(
+            [(2, [], [1]), (10, [1], [2])],
+            list(graph.getParticipationDelta(observed)))
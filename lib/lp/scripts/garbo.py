@@ -132,9 +132,14 @@ from lp.soyuz.model.publishing import SourcePackagePublishingHistory
 from lp.soyuz.model.reporting import LatestPersonSourcePackageReleaseCache
 from lp.soyuz.model.sourcepackagerelease import SourcePackageRelease
 from lp.translations.interfaces.potemplate import IPOTemplateSet
+from lp.translations.model.pomsgid import POMsgID
 from lp.translations.model.potmsgset import POTMsgSet
 from lp.translations.model.potranslation import POTranslation
 from lp.translations.model.translationmessage import TranslationMessage
+from lp.translations.model.translationsuggestion import (
+    rebuild_translation_suggestions,
+    TranslationSuggestion,
+    )
 from lp.translations.model.translationtemplateitem import (
     TranslationTemplateItem,
     )
@@ -1429,6 +1434,42 @@ class SuggestiveTemplatesCacheUpdater(TunableLoop):
         self.done = True
 
 
+class TranslationSuggestionRebuilder(TunableLoop):
+    """Rebuild the TranslationSuggestion index.
+
+    The index is rebuilt a range of English strings at a time, carrying
+    on from where the previous run stopped.  Once it reaches the last
+    string, the next run starts again from the first.
+    """
+    maximum_chunk_size = 10000
+
+    def __init__(self, log, abort_time=None):
+        super(TranslationSuggestionRebuilder, self).__init__(log, abort_time)
+        self.store = IMasterStore(TranslationSuggestion)
+        self.job_name = self.__class__.__name__
+        self.max_msgid = self.store.find(Max(POMsgID.id)).one() or 0
+        self.next_msgid = 1
+        job_data = load_garbo_job_state(self.job_name)
+        if job_data:
+            self.next_msgid = job_data.get('next_msgid', 1)
+        if self.next_msgid > self.max_msgid:
+            self.next_msgid = 1
+
+    def isDone(self):
+        """See `TunableLoop`."""
+        return self.next_msgid > self.max_msgid
+
+    def __call__(self, chunk_size):
+        """See `TunableLoop`."""
+        last_msgid = self.next_msgid + int(chunk_size + 0.5) - 1
+        rebuild_translation_suggestions(
+            self.store, self.next_msgid, last_msgid)
+        self.next_msgid = last_msgid + 1
+        save_garbo_job_state(
+            self.job_name, {'next_msgid': self.next_msgid})
+        transaction.commit()
+
+
 class UnusedPOTMsgSetPruner(TunableLoop):
     """Cleans up unused POTMsgSets."""
 
@@ -1905,6 +1946,7 @@ class DailyDatabaseGarbageCollector(BaseDatabaseGarbageCollector):
         SnapFilePruner,
         SuggestiveTemplatesCacheUpdater,
         TeamMembershipPruner,
+        TranslationSuggestionRebuilder,
         UnlinkedAccountPruner,
         UnusedAccessPolicyPruner,
         UnusedPOTMsgSetPruner,
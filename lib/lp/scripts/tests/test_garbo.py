@@ -44,7 +44,10 @@ from zope.component import getUtility
 from zope.security.proxy import removeSecurityProxy
 
 from lp.answers.model.answercontact import AnswerContact
-from lp.app.enums import InformationType
+from lp.app.enums import (
+    InformationType,
+    ServiceUsage,
+    )
 from lp.bugs.model.bugnotification import (
     BugNotification,
     BugNotificationRecipient,
@@ -149,6 +152,9 @@ from lp.testing.layers import (
     )
 from lp.translations.model.pofile import POFile
 from lp.translations.model.potmsgset import POTMsgSet
+from lp.translations.model.translationsuggestion import (
+    TranslationSuggestion,
+    )
 from lp.translations.model.translationtemplateitem import (
     TranslationTemplateItem,
     )
@@ -1128,6 +1134,30 @@ class TestGarbo(FakeAdapterMixin, TestCaseWithFactory):
 
         self.assertEqual(1, count)
 
+    def test_TranslationSuggestionRebuilder(self):
+        switch_dbuser('testadmin')
+        product = self.factory.makeProduct(
+            translations_usage=ServiceUsage.LAUNCHPAD)
+        template = self.factory.makePOTemplate(
+            self.factory.makeProductSeries(product=product))
+        pofile = self.factory.makePOFile('nl', potemplate=template)
+        message_id = self.factory.makeCurrentTranslationMessage(
+            pofile=pofile).id
+        # The template wasn't suggestive yet, so the trigger ignored the
+        # message.
+        self.assertTrue(IMasterStore(TranslationSuggestion).find(
+            TranslationSuggestion,
+            translationmessage_id=message_id).is_empty())
+        transaction.commit()
+
+        self.runDaily()
+
+        switch_dbuser('testadmin')
+        suggestion = IMasterStore(TranslationSuggestion).find(
+            TranslationSuggestion, translationmessage_id=message_id).one()
+        self.assertIsNot(None, suggestion)
+        self.assertTrue(suggestion.in_use)
+
     def test_BugSummaryJournalRollup(self):
         switch_dbuser('testadmin')
         store = IMasterStore(CommercialSubscription)
@@ -0,0 +1,246 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""A cache of slowly-changing rows shared between requests.
+
+Appserver threads reset their Storm stores at the end of every request,
+so every request loads the same distributions, series, processors and so
+on again.  When `config.database.shared_object_cache` is set,
+`Store.get` for classes whose tables are listed in
+`config.database.shared_object_cache_tables` first looks for a snapshot
+of the row in a cache shared by all threads, and builds the object from
+that without a query.  Snapshots hold the row's database representation
+rather than objects, so each store gets its own objects.
+
+Statement-level triggers increment a per-table counter in
+SharedObjectCacheGeneration whenever one of those tables changes.  Each
+request reads the counters once per store and transaction, and only uses
+snapshots taken at the current generation of their table.  Once a store
+has written anything in a transaction, the cache is bypassed until the
+transaction ends, since its writes are not visible to other stores yet
+and may still be rolled back.
+
+`cached_lookup` caches the results of other queries on those tables, such
+as looking up rows by name, in the same way.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'cached_lookup',
+    'shared_object_cache',
+    'SharedObjectCache',
+    ]
+
+import threading
+
+from lazr.restful.utils import get_current_browser_request
+from storm.expr import (
+    Delete,
+    Insert,
+    Update,
+    )
+from storm.info import (
+    get_cls_info,
+    get_obj_info,
+    )
+
+from lp.services.config import config
+
+
+# The request annotation holding the generations read by the request.
+GENERATIONS_KEY = 'lp.services.database.objectcache.generations'
+
+
+def is_write(statement):
+    """Might executing `statement` change the database?"""
+    if isinstance(statement, basestring):
+        return not statement.lstrip().upper().startswith('SELECT')
+    return isinstance(statement, (Insert, Update, Delete))
+
+
+class _SnapshotResult:
+    """Enough of a Storm `Result` to load objects from snapshots."""
+
+    @staticmethod
+    def set_variable(variable, value):
+        variable.set(value, from_db=True)
+
+
+class SharedObjectCache:
+    """Snapshots of rows keyed by store name, class and primary key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (store name, class, primary key) -> (generation, values)
+        self._snapshots = {}
+        # (store name, table, lookup key) -> (generation, result)
+        self._lookups = {}
+
+    def install(self, store, store_name):
+        """Make `store.get` and `cached_lookup` use this cache."""
+        original_get = store.get
+        original_commit = store.commit
+        original_rollback = store.rollback
+        connection = store._connection
+        original_execute = connection.execute
+
+        def get(cls, key):
+            return self.get(store, store_name, original_get, cls, key)
+
+        # Flushes and `ResultSet.set` bypass `store.execute`, so watch the
+        # connection instead.
+        def execute(statement, *args, **kwargs):
+            if is_write(statement):
+                store._shared_object_cache_written = True
+            return original_execute(statement, *args, **kwargs)
+
+        def commit(*args, **kwargs):
+            try:
+                return original_commit(*args, **kwargs)
+            finally:
+                self._endTransaction(store, store_name)
+
+        def rollback(*args, **kwargs):
+            try:
+                return original_rollback(*args, **kwargs)
+            finally:
+                self._endTransaction(store, store_name)
+
+        store.get = get
+        store.commit = commit
+        store.rollback = rollback
+        connection.execute = execute
+        store._shared_object_cache = (self, store_name)
+        store._shared_object_cache_written = False
+
+    def _endTransaction(self, store, store_name):
+        """Forget what `store` did in the transaction that just ended."""
+        store._shared_object_cache_written = False
+        request = get_current_browser_request()
+        if request is not None:
+            request.annotations.get(GENERATIONS_KEY, {}).pop(
+                store_name, None)
+
+    def _getTable(self, cls):
+        """Return the lower-cased table of `cls` if it may be cached."""
+        table = getattr(cls, '__storm_table__', None)
+        if not isinstance(table, basestring):
+            return None
+        table = table.lower()
+        if table not in config.database.shared_object_cache_tables.split():
+            return None
+        return table
+
+    def _getGeneration(self, store, store_name, table):
+        """Return the current generation of `table`.
+
+        The generations are read once per request, store and transaction.
+        None is returned outside a request, since there is nothing to tell
+        us when to read them again, and once `store` has written in the
+        current transaction.
+        """
+        if store._shared_object_cache_written:
+            return None
+        request = get_current_browser_request()
+        if request is None:
+            return None
+        generations = request.annotations.setdefault(GENERATIONS_KEY, {})
+        if store_name not in generations:
+            generations[store_name] = dict(store.execute(
+                "SELECT table_name, generation "
+                "FROM SharedObjectCacheGeneration"))
+        return generations[store_name].get(table)
+
+    def _count(self, name, outcome):
+        # Avoid circular imports.
+        from lp.services.webapp.opstats import OpStats
+
+        stat_key = 'objectcache %s %s' % (name, outcome)
+        OpStats.stats[stat_key] = OpStats.stats.get(stat_key, 0) + 1
+
+    def get(self, store, store_name, original_get, cls, key):
+        """Get an object from `store`, using a snapshot if possible.
+
+        :param original_get: The `get` method that `store` had before
+            this cache was installed.
+        """
+        if not isinstance(key, (int, long)):
+            return original_get(cls, key)
+        table = self._getTable(cls)
+        if table is None:
+            return original_get(cls, key)
+        cls_info = get_cls_info(cls)
+        if (cls_info.cls, (key,)) in store._alive:
+            # The store's own object may have unflushed changes.
+            return original_get(cls, key)
+        generation = self._getGeneration(store, store_name, table)
+        if generation is None:
+            return original_get(cls, key)
+
+        snapshot_key = (store_name, cls_info.cls, key)
+        snapshot = self._snapshots.get(snapshot_key)
+        if snapshot is not None and snapshot[0] == generation:
+            self._count(cls.__name__, 'hits')
+            return store._load_object(cls_info, _SnapshotResult, snapshot[1])
+
+        self._count(cls.__name__, 'misses')
+        obj = original_get(cls, key)
+        if obj is not None:
+            variables = get_obj_info(obj).variables
+            values = tuple(
+                variables[column].get(to_db=True)
+                for column in cls_info.columns)
+            with self._lock:
+                if (len(self._snapshots) >=
+                        config.database.shared_object_cache_size):
+                    self._snapshots.clear()
+                self._snapshots[snapshot_key] = (generation, values)
+        return obj
+
+    def lookup(self, store, store_name, table, key, find):
+        """See `cached_lookup`."""
+        if table.lower() not in (
+                config.database.shared_object_cache_tables.split()):
+            return find()
+        generation = self._getGeneration(store, store_name, table.lower())
+        if generation is None:
+            return find()
+
+        lookup_key = (store_name, table.lower(), key)
+        cached = self._lookups.get(lookup_key)
+        if cached is not None and cached[0] == generation:
+            self._count(table, 'lookup hits')
+            return cached[1]
+
+        self._count(table, 'lookup misses')
+        result = find()
+        with self._lock:
+            if len(self._lookups) >= config.database.shared_object_cache_size:
+                self._lookups.clear()
+            self._lookups[lookup_key] = (generation, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._lookups.clear()
+
+
+shared_object_cache = SharedObjectCache()
+
+
+def cached_lookup(store, table, key, find):
+    """Return `find()`, cached until `table` next changes.
+
+    :param store: The store that `find` queries.
+    :param table: The only table that `find` reads.
+    :param key: A hashable key identifying the query and its arguments.
+    :param find: A callable running the query.  It must return an
+        immutable value such as a tuple of column values or an id, never a
+        Storm object.
+    """
+    installed = getattr(store, '_shared_object_cache', None)
+    if installed is None:
+        return find()
+    cache, store_name = installed
+    return cache.lookup(store, store_name, table, key, find)
@@ -51,6 +51,7 @@ from lp.services.database.interfaces import (
     MASTER_FLAVOR,
     SLAVE_FLAVOR,
     )
+from lp.services.database.objectcache import shared_object_cache
 from lp.services.database.sqlbase import StupidCache
 
 
@@ -155,6 +156,9 @@ class BaseDatabasePolicy:
             # available to change the default. Instead, we monkey patch.
             store._cache = storm_cache_factory()
 
+            if config.database.shared_object_cache:
+                shared_object_cache.install(store, '%s-%s' % (name, flavor))
+
             # Attach our marker interfaces so our adapters don't lie.
             if flavor == MASTER_FLAVOR:
                 alsoProvides(store, IMasterStore)
@@ -237,7 +241,8 @@ def LaunchpadDatabasePolicyFactory(request):
     # to sniff the request this way.  Even though PATH_INFO is always
     # present in real requests, we need to tread carefully (``get``) because
     # of test requests in our automated tests.
-    if request.get('PATH_INFO') in [u'/+opstats', u'/+haproxy']:
+    if request.get('PATH_INFO') in [
+            u'/+opstats', u'/+pagestats', u'/+haproxy']:
         return DatabaseBlockedPolicy(request)
     else:
         return LaunchpadDatabasePolicy(request)
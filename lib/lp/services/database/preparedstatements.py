@@ -0,0 +1,233 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Server-side prepared statements for hot parameterized queries.
+
+Storm sends every statement to PostgreSQL as fresh text, so the same
+lookups are parsed and planned over and over again.  When
+`config.database.prepared_statement_cache_size` is non-zero, each
+connection keeps up to that many statements prepared on the server.  The
+second time a parameterized statement is executed on a connection it is
+prepared with PREPARE, and from then on it is run with EXECUTE, letting
+PostgreSQL reuse its plan.  Statements are keyed by their text with
+whitespace outside quoted literals collapsed, and the least recently used
+statement is deallocated when the cache is full.
+
+The rewriting happens inside the cursor's `execute`, so Storm's tracers
+still see the original statement and parameters: the statement timeout
+applies as usual, and the timeline and OOPS reports show the SQL that was
+asked for, timed including any PREPARE it needed.
+
+Prepared statements belong to the database session, so this must not be
+used through a connection pooler that shares sessions between clients.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'normalize_statement',
+    'PreparedStatementCache',
+    'PreparingCursor',
+    ]
+
+from itertools import count
+import re
+
+from bzrlib.lru_cache import LRUCache
+from psycopg2 import (
+    DataError,
+    ProgrammingError,
+    )
+from psycopg2.extensions import (
+    cursor,
+    ISOLATION_LEVEL_AUTOCOMMIT,
+    )
+
+
+# Statements that PREPARE accepts.
+_preparable_re = re.compile(
+    r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b', re.I)
+
+_literal_or_space_re = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|\s+""")
+
+# psycopg2's placeholders.  Anything but %s and %% (such as named
+# parameters) makes the statement unpreparable.
+_placeholder_re = re.compile(r'%(.)', re.S)
+
+SAVEPOINT = 'lp_prepare'
+
+
+def normalize_statement(statement):
+    """Return the cache key for `statement`.
+
+    Returns None if the statement can't be prepared, or if it contains
+    comments, escapes or several statements that would make normalizing
+    it unsafe.
+    """
+    if _preparable_re.match(statement) is None:
+        return None
+    for unsafe in (';', '\\', '--', '/*'):
+        if unsafe in statement:
+            return None
+    return _literal_or_space_re.sub(
+        lambda match: match.group(1) or ' ', statement).strip()
+
+
+def _number_placeholders(statement):
+    """Replace psycopg2's placeholders in `statement` with $1, $2, ....
+
+    :return: The new statement and the number of parameters, or
+        (None, None) if the statement has other placeholders.
+    """
+    numbers = count(1)
+
+    def replace(match):
+        if match.group(1) == '%':
+            return '%'
+        elif match.group(1) == 's':
+            return '$%d' % next(numbers)
+        else:
+            raise ValueError(match.group(0))
+
+    try:
+        statement = _placeholder_re.sub(replace, statement)
+    except ValueError:
+        return None, None
+    return statement, next(numbers) - 1
+
+
+def _execute_statement(name, param_count):
+    return 'EXECUTE %s (%s)' % (name, ', '.join(['%s'] * param_count))
+
+
+class PreparedStatementCache:
+    """The statements prepared on one raw connection."""
+
+    def __init__(self, raw_connection, size):
+        self.raw_connection = raw_connection
+        # Normalized statement -> (name, number of parameters).
+        self._statements = LRUCache()
+        # Normalized statement -> name, for every statement prepared on
+        # the server, so that those evicted from _statements can be
+        # deallocated.
+        self._names = {}
+        # Normalized statement -> whether it may be prepared, for
+        # statements executed once.
+        self._seen = LRUCache()
+        self._name_counter = count(1)
+        self.size = size
+
+    def __len__(self):
+        return len(self._statements)
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self._size = size
+        if size > 0:
+            # Evicting just the least recently used entry keeps as many
+            # statements prepared as possible.
+            self._statements.resize(size, size)
+            self._seen.resize(size, size)
+            self._deallocateEvicted()
+
+    def _control(self, statement):
+        """Execute a statement managing prepared statements.
+
+        This uses its own cursor to leave the results of the cursor that
+        is executing the query alone.
+        """
+        self.raw_connection.cursor().execute(statement)
+
+    def _deallocateEvicted(self):
+        """Deallocate statements that have been evicted from the cache."""
+        if len(self._names) > len(self._statements):
+            for evicted in set(self._names) - set(self._statements.keys()):
+                self._control('DEALLOCATE %s' % self._names.pop(evicted))
+
+    def _add(self, key, name, param_count):
+        """Record a prepared statement, deallocating any it evicts."""
+        self._statements[key] = (name, param_count)
+        self._names[key] = name
+        self._deallocateEvicted()
+
+    def _inAutocommit(self):
+        if getattr(self.raw_connection, 'autocommit', False):
+            return True
+        return (
+            self.raw_connection.isolation_level == ISOLATION_LEVEL_AUTOCOMMIT)
+
+    def _prepare(self, key, statement, params):
+        """Prepare `statement`, returning its name or None on failure.
+
+        The PREPARE is wrapped in a savepoint because a failure, such as
+        a parameter whose type can't be inferred, would otherwise abort
+        the transaction.
+        """
+        numbered, param_count = _number_placeholders(statement)
+        if numbered is None or param_count != len(params):
+            self._seen[key] = False
+            return None
+        name = 'lp_prepared_%d' % next(self._name_counter)
+        self._control('SAVEPOINT %s' % SAVEPOINT)
+        try:
+            self._control('PREPARE %s AS %s' % (name, numbered))
+        except (DataError, ProgrammingError):
+            self._control('ROLLBACK TO SAVEPOINT %s' % SAVEPOINT)
+            self._seen[key] = False
+            return None
+        return name
+
+    def execute(self, execute, statement, params):
+        """Execute `statement`, preparing it if it has been seen before.
+
+        :param execute: The `execute` method of the underlying cursor.
+        """
+        key = normalize_statement(statement)
+        if (key is None or not isinstance(params, (tuple, list)) or
+                self.size <= 0 or self._inAutocommit()):
+            return execute(statement, params)
+
+        prepared = self._statements.get(key)
+        if prepared is not None:
+            name, param_count = prepared
+            return execute(_execute_statement(name, param_count), params)
+
+        preparable = self._seen.get(key)
+        if preparable is None:
+            # Only statements executed more than once are worth
+            # preparing.
+            self._seen[key] = True
+            return execute(statement, params)
+        elif not preparable:
+            return execute(statement, params)
+
+        name = self._prepare(key, statement, params)
+        if name is None:
+            return execute(statement, params)
+        try:
+            result = execute(_execute_statement(name, len(params)), params)
+        except (DataError, ProgrammingError):
+            # The parameters don't fit the types PREPARE inferred.  Run
+            # the statement as it was, which raises any genuine error.
+            self._control('ROLLBACK TO SAVEPOINT %s' % SAVEPOINT)
+            self._control('DEALLOCATE %s' % name)
+            self._seen[key] = False
+            return execute(statement, params)
+        self._control('RELEASE SAVEPOINT %s' % SAVEPOINT)
+        self._add(key, name, len(params))
+        return result
+
+
+class PreparingCursor(cursor):
+    """A cursor that executes statements via a `PreparedStatementCache`."""
+
+    prepared_statements = None
+
+    def execute(self, statement, params=None):
+        execute = super(PreparingCursor, self).execute
+        if self.prepared_statements is None or not params:
+            return execute(statement, params)
+        return self.prepared_statements.execute(execute, statement, params)
@@ -0,0 +1,208 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the shared object cache."""
+
+__metaclass__ = type
+
+import re
+
+from testtools.matchers import Equals
+import transaction
+
+from lp.buildmaster.model.processor import Processor
+from lp.registry.model.distribution import Distribution
+from lp.services.database.interfaces import IStore
+from lp.services.database.objectcache import (
+    cached_lookup,
+    SharedObjectCache,
+    )
+from lp.services.webapp.opstats import OpStats
+from lp.services.webapp.servers import LaunchpadTestRequest
+from lp.testing import (
+    ANONYMOUS,
+    login,
+    logout,
+    StormStatementRecorder,
+    TestCaseWithFactory,
+    )
+from lp.testing.layers import DatabaseFunctionalLayer
+from lp.testing.matchers import HasQueryCount
+from lp.testing.publication import test_traverse
+
+
+def uninstall(store):
+    """Undo `SharedObjectCache.install`."""
+    for name in (
+            'get', 'commit', 'rollback', '_shared_object_cache',
+            '_shared_object_cache_written'):
+        delattr(store, name)
+    del store._connection.execute
+
+
+class TestSharedObjectCache(TestCaseWithFactory):
+
+    layer = DatabaseFunctionalLayer
+
+    def setUp(self):
+        super(TestSharedObjectCache, self).setUp()
+        self.pushConfig('database', shared_object_cache_tables='processor')
+        self.store = IStore(Processor)
+        SharedObjectCache().install(self.store, 'main-master')
+        self.addCleanup(uninstall, self.store)
+        self.processor_id = self.factory.makeProcessor(
+            name='cached', title='Cached').id
+        transaction.commit()
+        OpStats.resetStats()
+        self.addCleanup(OpStats.resetStats)
+        self.addCleanup(logout)
+
+    def startRequest(self):
+        login(ANONYMOUS, LaunchpadTestRequest())
+        # Appservers end their transaction and reset their stores between
+        # requests.
+        transaction.commit()
+        self.store.reset()
+
+    def getStats(self):
+        return (
+            OpStats.stats.get('objectcache Processor hits', 0),
+            OpStats.stats.get('objectcache Processor misses', 0))
+
+    def test_snapshot_used_by_later_requests(self):
+        self.startRequest()
+        self.assertEqual(
+            'cached', self.store.get(Processor, self.processor_id).name)
+        self.startRequest()
+        # Reading the generations is the only query.
+        with StormStatementRecorder() as recorder:
+            processor = self.store.get(Processor, self.processor_id)
+        self.assertThat(recorder, HasQueryCount(Equals(1)))
+        self.assertEqual('cached', processor.name)
+        self.startRequest()
+        self.store.get(Processor, self.processor_id)
+        with StormStatementRecorder() as recorder:
+            self.store.get(Processor, self.processor_id)
+        self.assertThat(recorder, HasQueryCount(Equals(0)))
+        self.assertEqual((2, 1), self.getStats())
+
+    def test_changes_invalidate_snapshots(self):
+        self.startRequest()
+        self.store.get(Processor, self.processor_id)
+        self.store.execute(
+            "UPDATE Processor SET title = 'Changed' WHERE id = ?",
+            (self.processor_id,))
+        self.startRequest()
+        self.assertEqual(
+            'Changed', self.store.get(Processor, self.processor_id).title)
+        self.assertEqual((0, 2), self.getStats())
+
+    def test_not_used_outside_requests(self):
+        self.store.flush()
+        self.store.reset()
+        self.store.get(Processor, self.processor_id)
+        self.store.reset()
+        self.store.get(Processor, self.processor_id)
+        self.assertEqual((0, 0), self.getStats())
+
+    def test_writes_bypass_cache(self):
+        # Rows read after the store has written are not snapshotted, since
+        # the writes may be rolled back.
+        self.startRequest()
+        self.store.execute(
+            "UPDATE Processor SET title = 'Uncommitted' WHERE id = ?",
+            (self.processor_id,))
+        self.assertEqual(
+            'Uncommitted', self.store.get(Processor, self.processor_id).title)
+        transaction.abort()
+        self.startRequest()
+        self.assertEqual(
+            'Cached', self.store.get(Processor, self.processor_id).title)
+        self.assertEqual((0, 1), self.getStats())
+
+    def test_flushes_bypass_cache(self):
+        # Changes flushed by the store, and so not visible to the
+        # generations it read, bypass snapshots too.
+        self.startRequest()
+        self.store.get(Processor, self.processor_id)
+        self.startRequest()
+        self.store.find(Processor, id=self.processor_id).set(
+            title=u'Changed')
+        self.store.reset()
+        self.assertEqual(
+            'Changed', self.store.get(Processor, self.processor_id).title)
+        self.assertEqual((0, 1), self.getStats())
+
+    def test_cached_lookup(self):
+        def find():
+            return self.store.find(Processor.id, name=u'cached').one()
+
+        self.startRequest()
+        self.assertEqual(
+            self.processor_id,
+            cached_lookup(self.store, 'Processor', ('name', 'cached'), find))
+        self.startRequest()
+        with StormStatementRecorder() as recorder:
+            self.assertEqual(
+                self.processor_id,
+                cached_lookup(
+                    self.store, 'Processor', ('name', 'cached'), find))
+        # Reading the generations is the only query.
+        self.assertThat(recorder, HasQueryCount(Equals(1)))
+        self.store.execute(
+            "UPDATE Processor SET name = 'renamed' WHERE id = ?",
+            (self.processor_id,))
+        self.startRequest()
+        self.assertIsNone(
+            cached_lookup(self.store, 'Processor', ('name', 'cached'), find))
+        self.assertEqual(
+            (1, 2),
+            (OpStats.stats.get('objectcache Processor lookup hits', 0),
+             OpStats.stats.get('objectcache Processor lookup misses', 0)))
+
+    def test_other_tables_not_cached(self):
+        self.pushConfig('database', shared_object_cache_tables='component')
+        self.startRequest()
+        self.store.get(Processor, self.processor_id)
+        self.startRequest()
+        self.store.get(Processor, self.processor_id)
+        self.assertEqual((0, 0), self.getStats())
+
+
+class TestSharedObjectCacheTraversal(TestCaseWithFactory):
+
+    layer = DatabaseFunctionalLayer
+
+    def setUp(self):
+        super(TestSharedObjectCacheTraversal, self).setUp()
+        self.pushConfig(
+            'database',
+            shared_object_cache_tables='distribution distroseries pillarname')
+        distroseries = self.factory.makeDistroSeries()
+        self.distroseries_id = distroseries.id
+        self.url = 'http://launchpad.dev/%s/%s' % (
+            distroseries.distribution.name, distroseries.name)
+        self.store = IStore(Distribution)
+        SharedObjectCache().install(self.store, 'main-master')
+        self.addCleanup(uninstall, self.store)
+        transaction.commit()
+
+    def traverse(self):
+        # Appservers end their transaction and reset their stores between
+        # requests.
+        transaction.commit()
+        self.store.reset()
+        with StormStatementRecorder() as recorder:
+            context, _, _ = test_traverse(self.url)
+        self.assertEqual(self.distroseries_id, context.id)
+        return [
+            statement for statement in recorder.statements
+            if re.search(
+                r'\b(FROM|JOIN)\s+(Distribution|DistroSeries|PillarName)\b',
+                statement, re.I)]
+
+    def test_series_page_traversal_cached(self):
+        # Traversing to a series page queries the distribution, the series
+        # and the pillar name the first time, but not on later requests.
+        self.assertNotEqual([], self.traverse())
+        self.assertEqual([], self.traverse())
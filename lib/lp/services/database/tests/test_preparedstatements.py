@@ -0,0 +1,102 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for server-side prepared statements."""
+
+__metaclass__ = type
+
+from lp.services.database.interfaces import IMasterStore
+from lp.services.database.preparedstatements import normalize_statement
+from lp.services.features.model import FeatureFlag
+from lp.testing import (
+    StormStatementRecorder,
+    TestCase,
+    )
+from lp.testing.layers import DatabaseFunctionalLayer
+
+
+class TestNormalizeStatement(TestCase):
+
+    def test_collapses_whitespace(self):
+        self.assertEqual(
+            "SELECT id FROM Person WHERE name = %s",
+            normalize_statement(
+                "  SELECT id\n  FROM Person\n\tWHERE name =  %s\n"))
+
+    def test_keeps_literals(self):
+        self.assertEqual(
+            "SELECT 'a  b', \"Odd  Name\" FROM Person",
+            normalize_statement("SELECT 'a  b',  \"Odd  Name\"  FROM Person"))
+
+    def test_unpreparable(self):
+        for statement in (
+                "SET statement_timeout TO 1000",
+                "SELECT 1; SELECT 2",
+                "SELECT E'\\n'",
+                "SELECT 1 -- comment",
+                "SELECT /* comment */ 1"):
+            self.assertIsNone(normalize_statement(statement))
+
+
+class TestPreparedStatementCache(TestCase):
+
+    layer = DatabaseFunctionalLayer
+
+    def setUp(self):
+        super(TestPreparedStatementCache, self).setUp()
+        self.pushConfig('database', prepared_statement_cache_size=2)
+        self.store = IMasterStore(FeatureFlag)
+
+    def query(self, alias, value=1):
+        # Each test uses its own statements, since the statements
+        # prepared on a connection outlive the test.
+        return self.store.execute(
+            "SELECT ?::integer + 1 AS %s" % alias, (value,)).get_one()[0]
+
+    def getPrepared(self, alias):
+        return [
+            statement for statement, in self.store.execute(
+                "SELECT statement FROM pg_prepared_statements "
+                "WHERE statement LIKE '%%%s%%'" % alias)]
+
+    def test_prepared_on_second_execution(self):
+        self.assertEqual(2, self.query('second'))
+        self.assertEqual([], self.getPrepared('second'))
+        self.assertEqual(3, self.query('second', 2))
+        self.assertEqual(1, len(self.getPrepared('second')))
+        self.assertEqual(4, self.query('second', 3))
+        self.assertEqual(1, len(self.getPrepared('second')))
+
+    def test_least_recently_used_deallocated(self):
+        for alias in ('lru_a', 'lru_b', 'lru_a', 'lru_b', 'lru_a'):
+            self.query(alias)
+        self.query('lru_c')
+        self.query('lru_c')
+        self.assertEqual(1, len(self.getPrepared('lru_a')))
+        self.assertEqual([], self.getPrepared('lru_b'))
+        self.assertEqual(1, len(self.getPrepared('lru_c')))
+
+    def test_unpreparable_statement_falls_back(self):
+        # PREPARE can't infer the type of this parameter.  The failure
+        # leaves the transaction usable.
+        statement = "SELECT 1 AS unpreparable WHERE ? IS NOT NULL"
+        for _ in range(3):
+            self.assertEqual(
+                [(1,)], list(self.store.execute(statement, (u'x',))))
+        self.assertEqual([], self.getPrepared('unpreparable'))
+        self.assertEqual(2, self.query('after_unpreparable'))
+
+    def test_tracers_see_original_statement(self):
+        self.query('traced')
+        with StormStatementRecorder() as recorder:
+            self.query('traced')
+            self.query('traced')
+        self.assertEqual(2, recorder.count)
+        for statement in recorder.statements:
+            self.assertEqual("SELECT 1::integer + 1 AS traced", statement)
+
+    def test_disabled(self):
+        self.pushConfig('database', prepared_statement_cache_size=0)
+        for _ in range(3):
+            self.query('disabled')
+        self.assertEqual([], self.getPrepared('disabled'))
@@ -227,6 +227,13 @@ flag_info = sorted([
      'disabled',
      'Named authorization tokens for archives',
      ''),
+    ('soyuz.publisher.bulk_domination',
+     'boolean',
+     ('If true, the publisher applies domination supersessions in bulk '
+      'rather than one publication at a time.'),
+     'disabled',
+     'Bulk domination',
+     ''),
     ('sitesearch.engine.name',
      'space delimited',
      'Name of the site search engine backend (only "bing" is available).',
@@ -19,8 +19,11 @@ __all__ = [
     'format_address',
     'format_address_for_person',
     'get_msgid',
+    'get_pooled_smtp_delivery',
     'MailController',
+    'PooledSMTPDelivery',
     'sendmail',
+    'sendmail_many',
     'set_immediate_mail_delivery',
     'simple_sendmail',
     'simple_sendmail_from_person',
@@ -42,8 +45,13 @@ from email.utils import (
     make_msgid,
     )
 import hashlib
-from smtplib import SMTP
+from smtplib import (
+    SMTP,
+    SMTPException,
+    SMTPServerDisconnected,
+    )
 import sys
+import threading
 
 from lazr.restful.utils import get_current_browser_request
 from zope.component import getUtility
@@ -390,6 +398,53 @@ def sendmail(message, to_addrs=None, bulk=True):
 
     Returns the Message-Id
     """
+    to_addrs, raw_message, message_detail = _prepare_message(
+        message, to_addrs=to_addrs, bulk=bulk)
+    if _immediate_mail_delivery:
+        # Immediate email delivery is not unit tested, and won't be.
+        # The immediate-specific stuff is pretty simple though so this
+        # should be fine.
+        # TODO: Store a timeline action for immediate mail.
+
+        if config.isTestRunner():
+            # when running in the testing environment, store emails
+            TestMailer().send(
+                config.canonical.bounce_address, to_addrs, raw_message)
+        elif getattr(config, 'sendmail_to_stdout', False):
+            # For debugging, from process-one-mail, just print it.
+            sys.stdout.write(raw_message)
+        else:
+            if config.immediate_mail.send_email:
+                # Note that we simply throw away dud recipients. This is fine,
+                # as it emulates the Z3 API which doesn't report this either
+                # (because actual delivery is done later).
+                smtp = SMTP(
+                    config.immediate_mail.smtp_host,
+                    config.immediate_mail.smtp_port)
+
+                # The "MAIL FROM" is set to the bounce address, to behave in a
+                # way similar to mailing list software.
+                smtp.sendmail(
+                    config.canonical.bounce_address, to_addrs, raw_message)
+                smtp.quit()
+        # Strip the angle brackets to the return a Message-Id consistent with
+        # raw_sendmail (which doesn't include them).
+        return message['message-id'][1:-1]
+    else:
+        # The "MAIL FROM" is set to the bounce address, to behave in a way
+        # similar to mailing list software.
+        return raw_sendmail(
+            config.canonical.bounce_address,
+            to_addrs,
+            raw_message,
+            message_detail)
+
+
+def _prepare_message(message, to_addrs=None, bulk=True):
+    """Validate a message and add the headers that `sendmail` promises.
+
+    :return: A (to_addrs, raw_message, message_detail) tuple.
+    """
     validate_message(message)
     if to_addrs is None:
         to_addrs = get_addresses_from_header(message['to'])
@@ -450,44 +505,155 @@ def sendmail(message, to_addrs=None, bulk=True):
     if not isinstance(message_detail, basestring):
         # Might be a Header object; can be squashed.
         message_detail = unicode(message_detail)
-    if _immediate_mail_delivery:
-        # Immediate email delivery is not unit tested, and won't be.
-        # The immediate-specific stuff is pretty simple though so this
-        # should be fine.
-        # TODO: Store a timeline action for immediate mail.
+    return to_addrs, raw_message, message_detail
 
-        if config.isTestRunner():
-            # when running in the testing environment, store emails
-            TestMailer().send(
-                config.canonical.bounce_address, to_addrs, raw_message)
-        elif getattr(config, 'sendmail_to_stdout', False):
-            # For debugging, from process-one-mail, just print it.
-            sys.stdout.write(raw_message)
-        else:
-            if config.immediate_mail.send_email:
-                # Note that we simply throw away dud recipients. This is fine,
-                # as it emulates the Z3 API which doesn't report this either
-                # (because actual delivery is done later).
-                smtp = SMTP(
-                    config.immediate_mail.smtp_host,
-                    config.immediate_mail.smtp_port)
 
-                # The "MAIL FROM" is set to the bounce address, to behave in a
-                # way similar to mailing list software.
-                smtp.sendmail(
-                    config.canonical.bounce_address, to_addrs, raw_message)
-                smtp.quit()
-        # Strip the angle brackets to the return a Message-Id consistent with
-        # raw_sendmail (which doesn't include them).
-        return message['message-id'][1:-1]
+class PooledSMTPDelivery:
+    """Deliver many messages over a pool of persistent SMTP connections.
+
+    Each of the `size` connections is opened when it is first needed and
+    kept open across calls to `send` until `close` is called, so a script
+    sending many batches of mail pays the connection set-up and teardown
+    once per connection rather than once per batch.  Messages for the same
+    set of recipients always go over the same connection, so they are
+    delivered in the order they were given.
+    """
+
+    def __init__(self, host, port, size=1, smtp_factory=None):
+        assert size >= 1, "At least one SMTP connection is needed."
+        self.host = host
+        self.port = port
+        self.size = size
+        self.smtp_factory = smtp_factory
+        self._connections = [None] * size
+
+    def _connect(self):
+        smtp_factory = self.smtp_factory
+        if smtp_factory is None:
+            smtp_factory = SMTP
+        return smtp_factory(self.host, self.port)
+
+    def _deliver(self, slot, envelopes, failures):
+        """Send `envelopes` in order over the connection in `slot`."""
+        smtp = self._connections[slot]
+        try:
+            for index, (from_addr, to_addrs, raw_message) in envelopes:
+                try:
+                    if smtp is None:
+                        smtp = self._connect()
+                    try:
+                        smtp.sendmail(from_addr, to_addrs, raw_message)
+                    except SMTPServerDisconnected:
+                        # The server may drop idle connections; reconnect
+                        # once and retry.
+                        smtp = self._connect()
+                        smtp.sendmail(from_addr, to_addrs, raw_message)
+                except SMTPException:
+                    failures[index] = sys.exc_info()
+                except IOError:
+                    # The connection is in an unknown state; start afresh
+                    # for the next message.
+                    failures[index] = sys.exc_info()
+                    smtp = None
+        finally:
+            self._connections[slot] = smtp
+
+    def send(self, envelopes):
+        """Send a sequence of (from_addr, to_addrs, raw_message) tuples.
+
+        :return: A dictionary mapping the index of each envelope that
+            could not be delivered to the `sys.exc_info()` of its failure.
+        """
+        partitions = [[] for i in range(self.size)]
+        for index, envelope in enumerate(envelopes):
+            to_addrs = envelope[1]
+            bucket = hash(tuple(sorted(to_addrs))) % self.size
+            partitions[bucket].append((index, envelope))
+        partitions = [
+            (slot, partition) for slot, partition in enumerate(partitions)
+            if partition]
+        failures = {}
+        if len(partitions) <= 1:
+            for slot, partition in partitions:
+                self._deliver(slot, partition, failures)
+            return failures
+        threads = [
+            threading.Thread(
+                target=self._deliver, args=(slot, partition, failures))
+            for slot, partition in partitions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return failures
+
+    def close(self):
+        """Close all the open connections."""
+        for slot, smtp in enumerate(self._connections):
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except (SMTPException, IOError):
+                    pass
+            self._connections[slot] = None
+
+
+def get_pooled_smtp_delivery():
+    """Return a `PooledSMTPDelivery` for the configured SMTP server.
+
+    Pass it to each `sendmail_many` call and `close` it when done to reuse
+    the same connections for all the messages.
+    """
+    return PooledSMTPDelivery(
+        config.immediate_mail.smtp_host, config.immediate_mail.smtp_port,
+        size=config.immediate_mail.smtp_connections)
+
+
+def sendmail_many(messages, bulk=True, delivery=None):
+    """Send several email.message.Message objects.
+
+    This behaves like calling `sendmail` for each message in turn, except
+    that when immediate mail delivery is enabled the messages are sent
+    concurrently over a pool of persistent SMTP connections (see
+    `PooledSMTPDelivery`), and that a failure to send one message does not
+    prevent the others from being sent.
+
+    :param bulk: By default, a Precedence: bulk header is added to each
+        message. Pass False to disable this.
+    :param delivery: A `PooledSMTPDelivery` to send the messages with, as
+        returned by `get_pooled_smtp_delivery`.  By default, a new one is
+        used and closed again once the messages are sent.
+    :return: A list of (message, exc_info) tuples, one for each message
+        that could not be sent, in the order the messages were given.
+    """
+    messages = list(messages)
+    if (not _immediate_mail_delivery or config.isTestRunner() or
+            getattr(config, 'sendmail_to_stdout', False) or
+            not config.immediate_mail.send_email):
+        failures = []
+        for message in messages:
+            try:
+                sendmail(message, bulk=bulk)
+            except SMTPException:
+                failures.append((message, sys.exc_info()))
+        return failures
+
+    envelopes = []
+    for message in messages:
+        to_addrs, raw_message, message_detail = _prepare_message(
+            message, bulk=bulk)
+        envelopes.append(
+            (config.canonical.bounce_address, to_addrs, raw_message))
+    if delivery is None:
+        delivery = get_pooled_smtp_delivery()
+        try:
+            failures = delivery.send(envelopes)
+        finally:
+            delivery.close()
     else:
-        # The "MAIL FROM" is set to the bounce address, to behave in a way
-        # similar to mailing list software.
-        return raw_sendmail(
-            config.canonical.bounce_address,
-            to_addrs,
-            raw_message,
-            message_detail)
+        failures = delivery.send(envelopes)
+    return [
+        (messages[index], failures[index]) for index in sorted(failures)]
 
 
 def get_msgid():
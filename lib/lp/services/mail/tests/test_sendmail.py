@@ -6,6 +6,10 @@ __metaclass__ = type
 from doctest import DocTestSuite
 import email.header
 from email.message import Message
+from smtplib import (
+    SMTPRecipientsRefused,
+    SMTPServerDisconnected,
+    )
 import unittest
 
 from zope.interface import implementer
@@ -13,7 +17,10 @@ from zope.sendmail.interfaces import IMailDelivery
 
 from lp.services.encoding import is_ascii_only
 from lp.services.mail import sendmail
-from lp.services.mail.sendmail import MailController
+from lp.services.mail.sendmail import (
+    MailController,
+    PooledSMTPDelivery,
+    )
 from lp.testing import TestCase
 from lp.testing.fixture import (
     CaptureTimeline,
@@ -312,6 +319,103 @@ class RecordingMailer(object):
         self.raw_message = raw_message
 
 
+class FakeSMTP:
+    """An SMTP connection that records what is sent over it."""
+
+    connections = []
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.sent = []
+        self.closed = False
+        self.connections.append(self)
+
+    def sendmail(self, from_addr, to_addrs, raw_message):
+        if self.closed:
+            raise SMTPServerDisconnected()
+        if 'refused@example.com' in to_addrs:
+            raise SMTPRecipientsRefused({'refused@example.com': (550, '')})
+        self.sent.append((from_addr, to_addrs, raw_message))
+
+    def quit(self):
+        self.closed = True
+
+
+class TestPooledSMTPDelivery(TestCase):
+
+    def setUp(self):
+        super(TestPooledSMTPDelivery, self).setUp()
+        FakeSMTP.connections = []
+
+    def makeEnvelopes(self, recipients):
+        return [
+            ('bounces@example.com', [recipient], 'message %d' % i)
+            for i, recipient in enumerate(recipients)]
+
+    def test_reuses_connections(self):
+        # Each connection is opened once and kept open for later sends
+        # until the delivery is closed.
+        envelopes = self.makeEnvelopes(
+            ['%d@example.com' % (i % 5) for i in range(50)])
+        delivery = PooledSMTPDelivery(
+            'localhost', 25, size=3, smtp_factory=FakeSMTP)
+        self.assertEqual({}, delivery.send(envelopes[:25]))
+        self.assertEqual({}, delivery.send(envelopes[25:]))
+        self.assertTrue(len(FakeSMTP.connections) <= 3)
+        sent = sum(
+            (connection.sent for connection in FakeSMTP.connections), [])
+        self.assertContentEqual(envelopes, sent)
+        self.assertFalse(
+            any(connection.closed for connection in FakeSMTP.connections))
+        delivery.close()
+        self.assertTrue(
+            all(connection.closed for connection in FakeSMTP.connections))
+
+    def test_preserves_order_per_recipient(self):
+        envelopes = self.makeEnvelopes(
+            ['%d@example.com' % (i % 4) for i in range(40)])
+        delivery = PooledSMTPDelivery(
+            'localhost', 25, size=4, smtp_factory=FakeSMTP)
+        delivery.send(envelopes)
+        for connection in FakeSMTP.connections:
+            for recipient in set(to for _, to, _ in connection.sent):
+                self.assertEqual(
+                    [envelope for envelope in envelopes
+                     if envelope[1] == recipient],
+                    [envelope for envelope in connection.sent
+                     if envelope[1] == recipient])
+
+    def test_reports_failures(self):
+        # A message that fails to send is reported without affecting the
+        # others.
+        envelopes = self.makeEnvelopes(
+            ['a@example.com', 'refused@example.com', 'b@example.com'])
+        delivery = PooledSMTPDelivery(
+            'localhost', 25, size=2, smtp_factory=FakeSMTP)
+        failures = delivery.send(envelopes)
+        self.assertEqual([1], failures.keys())
+        self.assertIsInstance(failures[1][1], SMTPRecipientsRefused)
+        sent = sum(
+            (connection.sent for connection in FakeSMTP.connections), [])
+        self.assertContentEqual([envelopes[0], envelopes[2]], sent)
+
+    def test_reconnects_when_disconnected(self):
+        # A connection dropped by the server is replaced transparently.
+        envelopes = self.makeEnvelopes(['a@example.com'] * 2)
+
+        def connect(host, port):
+            connection = FakeSMTP(host, port)
+            if len(FakeSMTP.connections) == 1:
+                connection.closed = True
+            return connection
+
+        delivery = PooledSMTPDelivery('localhost', 25, smtp_factory=connect)
+        self.assertEqual({}, delivery.send(envelopes))
+        self.assertEqual(2, len(FakeSMTP.connections))
+        self.assertEqual(envelopes, FakeSMTP.connections[1].sent)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(DocTestSuite('lp.services.mail.sendmail'))
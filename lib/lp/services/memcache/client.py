@@ -65,3 +65,14 @@ class TimelineRecordingClient(memcache.Client):
             return success
         finally:
             action.finish()
+
+    def get_multi(self, keys, key_prefix=''):
+        if not self._enabled:
+            return {}
+        action = self.__get_timeline_action(
+            "get_multi", "%s%s" % (key_prefix, " ".join(keys)))
+        try:
+            return memcache.Client.get_multi(
+                self, keys, key_prefix=key_prefix)
+        finally:
+            action.finish()
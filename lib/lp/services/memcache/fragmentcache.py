@@ -0,0 +1,155 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Caching of rendered page fragments in memcache.
+
+Listings render the same rows for the same objects over and over again.
+A `FragmentCache` keeps the HTML of each row in memcache, keyed by:
+
+ * the name and version of the fragment, and the revision of the code;
+ * the class and ID of the object;
+ * a stamp supplied by the caller that changes when anything shown in the
+   fragment changes, such as the object's date_last_modified;
+ * the kind of viewer (anonymous, logged in or developer) and their
+   time zone;
+ * any options of the listing that affect the fragment;
+ * a generation token per object that `invalidate_fragments` replaces
+   whenever the object is modified.
+
+Fragments for private objects are never cached.  Fragments that show
+other objects (people's names, for instance) may be stale for up to
+`config.launchpad.fragment_cache_expiry` seconds, so fragments must not
+show times relative to now; render those in the browser instead.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'FragmentCache',
+    'get_viewer_class',
+    'get_viewer_time_zone',
+    'invalidate_fragments',
+    ]
+
+import hashlib
+from uuid import uuid4
+
+from zope.component import getUtility
+from zope.security.proxy import removeSecurityProxy
+
+from lp.app.versioninfo import revision
+from lp.services.config import config
+from lp.services.memcache.interfaces import IMemcacheClient
+from lp.services.webapp.interfaces import ILaunchBag
+
+
+def _object_key(obj):
+    naked = removeSecurityProxy(obj)
+    return '%s:%s' % (naked.__class__.__name__, naked.id)
+
+
+def _generation_key(obj):
+    return '%s:fragment-generation:%s' % (
+        config.instance_name, _object_key(obj))
+
+
+def get_viewer_class():
+    """Return the kind of viewer of the current request."""
+    launchbag = getUtility(ILaunchBag)
+    if launchbag.user is None:
+        return 'anonymous'
+    elif launchbag.developer:
+        return 'developer'
+    else:
+        return 'user'
+
+
+def get_viewer_time_zone():
+    """Return the name of the time zone dates are shown in."""
+    return getUtility(ILaunchBag).time_zone.zone
+
+
+def invalidate_fragments(obj, event=None):
+    """Discard any cached fragments for `obj`.
+
+    This is registered as a subscriber to `IObjectModifiedEvent`s.
+    """
+    if not config.launchpad.fragment_cache:
+        return
+    getUtility(IMemcacheClient).set(
+        _generation_key(obj), uuid4().hex,
+        time=config.launchpad.fragment_cache_expiry)
+
+
+class FragmentCache:
+    """Rendered fragments of one kind, such as the rows of a listing."""
+
+    def __init__(self, name, version):
+        """Create a cache.
+
+        :param name: The name of the fragment.
+        :param version: Increment this when changing the fragment's
+            template in ways that the code revision doesn't capture.
+        """
+        self.name = name
+        self.version = version
+
+    def _getKey(self, obj, stamp, variant, viewer, generation):
+        digest = hashlib.sha1(
+            repr((stamp, variant, viewer, generation))).hexdigest()
+        return '%s:fragment:%s:%s:%s:%s:%s' % (
+            config.instance_name, self.name, self.version, revision,
+            _object_key(obj), digest)
+
+    def renderMany(self, items, renderer, get_object=None, get_stamp=None,
+                   variant=()):
+        """Render each of `items`, using cached fragments where possible.
+
+        This makes two memcache requests however many items there are.
+
+        :param items: The items to render.
+        :param renderer: A function that renders an item.
+        :param get_object: A function that returns the database object
+            shown by an item.  By default, items are database objects.
+        :param get_stamp: A function that returns a value that changes
+            whenever anything shown for an item changes.  By default, this
+            is the object's date_last_modified.
+        :param variant: Any options that affect all the fragments.
+        :return: A list of the rendered fragments, in the order of `items`.
+        """
+        items = list(items)
+        if not config.launchpad.fragment_cache or not items:
+            return [renderer(item) for item in items]
+        if get_object is None:
+            get_object = lambda item: item
+        if get_stamp is None:
+            get_stamp = lambda item: get_object(item).date_last_modified
+        memcache_client = getUtility(IMemcacheClient)
+        viewer = (get_viewer_class(), get_viewer_time_zone())
+
+        objects = [get_object(item) for item in items]
+        cacheable = [
+            not getattr(removeSecurityProxy(obj), 'private', False)
+            for obj in objects]
+        generations = memcache_client.get_multi([
+            _generation_key(obj)
+            for obj, cache in zip(objects, cacheable) if cache])
+        keys = [
+            self._getKey(
+                obj, get_stamp(item), variant, viewer,
+                generations.get(_generation_key(obj)))
+            if cache else None
+            for item, obj, cache in zip(items, objects, cacheable)]
+        fragments = memcache_client.get_multi(
+            [key for key in keys if key is not None])
+
+        rendered = []
+        for item, key in zip(items, keys):
+            fragment = fragments.get(key) if key is not None else None
+            if fragment is None:
+                fragment = renderer(item)
+                if key is not None:
+                    memcache_client.set(
+                        key, fragment,
+                        time=config.launchpad.fragment_cache_expiry)
+            rendered.append(fragment)
+        return rendered
@@ -24,7 +24,11 @@ class MemcacheFixture(fixtures.Fixture):
     def get(self, key):
         return self._cache.get(key)
 
-    def set(self, key, val):
+    def get_multi(self, keys):
+        return dict(
+            (key, self._cache[key]) for key in keys if key in self._cache)
+
+    def set(self, key, val, time=0):
         self._cache[key] = val
         return 1
 
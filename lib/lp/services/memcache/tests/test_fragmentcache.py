@@ -0,0 +1,112 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the fragment cache."""
+
+__metaclass__ = type
+
+from datetime import timedelta
+
+from lazr.lifecycle.event import ObjectModifiedEvent
+from lazr.lifecycle.snapshot import Snapshot
+from zope.component import getUtility
+from zope.event import notify
+from zope.security.proxy import removeSecurityProxy
+
+from lp.app.enums import InformationType
+from lp.code.interfaces.branch import IBranch
+from lp.services.memcache.fragmentcache import FragmentCache
+from lp.services.memcache.testing import MemcacheFixture
+from lp.services.webapp.interfaces import IOpenLaunchBag
+from lp.testing import (
+    person_logged_in,
+    TestCaseWithFactory,
+    )
+from lp.testing.layers import DatabaseFunctionalLayer
+
+
+class TestFragmentCache(TestCaseWithFactory):
+
+    layer = DatabaseFunctionalLayer
+
+    def setUp(self):
+        super(TestFragmentCache, self).setUp()
+        self.pushConfig('launchpad', fragment_cache=True)
+        self.memcache_fixture = self.useFixture(MemcacheFixture())
+        self.cache = FragmentCache('test-fragment', 1)
+        self.rendered = []
+
+    def render(self, branch):
+        self.rendered.append(branch)
+        return '<p>%s %d</p>' % (branch.name, len(self.rendered))
+
+    def renderMany(self, branches, variant=()):
+        self.rendered = []
+        return self.cache.renderMany(branches, self.render, variant=variant)
+
+    def test_fragments_are_cached(self):
+        branches = [self.factory.makeBranch(name='one'),
+                    self.factory.makeBranch(name='two')]
+        self.assertEqual(
+            ['<p>one 1</p>', '<p>two 2</p>'], self.renderMany(branches))
+        self.assertEqual(
+            ['<p>one 1</p>', '<p>two 2</p>'], self.renderMany(branches))
+        self.assertEqual([], self.rendered)
+
+    def test_keyed_by_stamp_and_variant(self):
+        branch = self.factory.makeBranch()
+        self.renderMany([branch])
+        self.renderMany([branch], variant=('other',))
+        self.assertEqual([branch], self.rendered)
+        removeSecurityProxy(branch).date_last_modified += timedelta(days=1)
+        self.renderMany([branch])
+        self.assertEqual([branch], self.rendered)
+
+    def test_keyed_by_viewer(self):
+        branch = self.factory.makeBranch()
+        self.renderMany([branch])
+        with person_logged_in(self.factory.makePerson()):
+            self.renderMany([branch])
+        self.assertEqual([branch], self.rendered)
+
+    def test_keyed_by_time_zone(self):
+        branch = self.factory.makeBranch()
+        rendered = []
+        for time_zone in ('UTC', 'UTC', 'Asia/Kolkata'):
+            person = self.factory.makePerson(time_zone=time_zone)
+            # Forget the previous viewer's time zone.
+            getUtility(IOpenLaunchBag).clear()
+            with person_logged_in(person):
+                self.renderMany([branch])
+            rendered.append(self.rendered)
+        self.assertEqual([[branch], [], [branch]], rendered)
+
+    def test_modified_event_invalidates(self):
+        branch = self.factory.makeBranch()
+        self.renderMany([branch])
+        with person_logged_in(branch.owner):
+            before = Snapshot(branch, providing=IBranch)
+            branch.description = u'Changed'
+            notify(ObjectModifiedEvent(branch, before, ['description']))
+        # The listing would still have the branch's old stamp.
+        removeSecurityProxy(branch).date_last_modified = (
+            before.date_last_modified)
+        self.renderMany([branch])
+        self.assertEqual([branch], self.rendered)
+
+    def test_private_objects_not_cached(self):
+        branch = self.factory.makeBranch(
+            information_type=InformationType.USERDATA)
+        with person_logged_in(branch.owner):
+            self.renderMany([branch])
+            self.renderMany([branch])
+        self.assertEqual([branch], self.rendered)
+        self.assertEqual({}, self.memcache_fixture._cache)
+
+    def test_disabled(self):
+        self.pushConfig('launchpad', fragment_cache=False)
+        branch = self.factory.makeBranch()
+        self.renderMany([branch])
+        self.renderMany([branch])
+        self.assertEqual([branch], self.rendered)
+        self.assertEqual({}, self.memcache_fixture._cache)
@@ -0,0 +1,207 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Continuous statistical profiling of requests.
+
+Unlike the profilers in `lp.services.profile.profile`, which trace every
+call made by a single request, the sampler is cheap enough to leave on in
+production.  When `config.profiling.sampling_enabled` is set, a background
+thread wakes up `config.profiling.sample_hz` times a second, looks at the
+stack of every thread that is handling a request, and counts the stack
+under the request's page ID.
+
+The counts are served to administrators by +profile-samples in the
+"collapsed" format read by flamegraph.pl and similar tools: one line per
+distinct stack, with the page ID and the frames from the outermost
+inwards separated by semicolons, followed by a space and the number of
+samples.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'get_sampler',
+    'SampledStacksView',
+    'StackSampler',
+    ]
+
+import random
+import re
+import sys
+import thread
+import threading
+
+from zope.component import adapter
+from zope.publisher.interfaces import (
+    IEndRequestEvent,
+    IStartRequestEvent,
+    )
+
+from lp.services.config import config
+
+
+# Frames deeper than this are left out of the sampled stack.
+MAX_DEPTH = 128
+
+# Recorded in place of the stack once the number of distinct stacks has
+# reached config.profiling.max_sampled_stacks.
+TRUNCATED_STACK = '[truncated]'
+
+# Pages whose ID couldn't be determined, such as 404s during traversal.
+UNKNOWN_PAGE_ID = 'Unknown'
+
+_unsafe_frame_chars = re.compile(r'[;\s]')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'), code.co_name)
+
+
+class StackSampler:
+    """Count the stacks of threads handling requests, by page ID."""
+
+    def __init__(self, hz, max_stacks):
+        self.interval = 1.0 / hz
+        self.max_stacks = max_stacks
+        # Thread ident -> request being handled by that thread.
+        self.requests = {}
+        # (page ID, collapsed stack) -> number of samples.
+        self.counts = {}
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='StackSampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            # Jitter the interval so that we don't sample in lockstep with
+            # any periodic activity in the threads being sampled.
+            if self._stopped.wait(self.interval * random.uniform(0.5, 1.5)):
+                return
+            self.sample()
+
+    def addRequest(self, request):
+        """Sample the current thread while it handles `request`."""
+        self.requests[thread.get_ident()] = request
+
+    def removeRequest(self):
+        """Stop sampling the current thread."""
+        self.requests.pop(thread.get_ident(), None)
+
+    def sample(self):
+        """Record the stack of each thread that is handling a request."""
+        requests = self.requests.copy()
+        if not requests:
+            return
+        frames = sys._current_frames()
+        for ident, request in requests.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            orig_env = getattr(request, '_orig_env', None) or {}
+            pageid = orig_env.get('launchpad.pageid') or UNKNOWN_PAGE_ID
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.reverse()
+            self.record(pageid, ';'.join(names))
+        del frames
+
+    def record(self, pageid, stack):
+        """Count a sample of `stack` while serving `pageid`."""
+        key = (_unsafe_frame_chars.sub('_', pageid), stack)
+        with self._lock:
+            if key not in self.counts and len(self.counts) >= self.max_stacks:
+                key = (key[0], TRUNCATED_STACK)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def dump(self):
+        """Return the counted stacks in the collapsed stack format."""
+        with self._lock:
+            counts = sorted(self.counts.items())
+        return ''.join(
+            '%s;%s %d\n' % (pageid, stack, count)
+            for (pageid, stack), count in counts)
+
+    def reset(self):
+        """Forget the stacks counted so far."""
+        with self._lock:
+            self.counts = {}
+            self.samples = 0
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Return the process's `StackSampler`, starting it if necessary.
+
+    Returns None if sampling is disabled.
+    """
+    global _sampler
+    if not config.profiling.sampling_enabled:
+        return None
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                sampler = StackSampler(
+                    config.profiling.sample_hz,
+                    config.profiling.max_sampled_stacks)
+                sampler.start()
+                _sampler = sampler
+    return _sampler
+
+
+def stop_sampler():
+    """Stop the process's `StackSampler`, if it is running."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is not None:
+            _sampler.stop()
+            _sampler = None
+
+
+@adapter(IStartRequestEvent)
+def start_request(event):
+    """Start sampling the thread handling this request."""
+    sampler = get_sampler()
+    if sampler is not None:
+        sampler.addRequest(event.request)
+
+
+@adapter(IEndRequestEvent)
+def end_request(event):
+    """Stop sampling the thread that handled this request."""
+    if _sampler is not None:
+        _sampler.removeRequest()
+
+
+class SampledStacksView:
+    """The stacks counted by the sampler, ready for flamegraph.pl."""
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def __call__(self):
+        self.request.response.setHeader(
+            'Content-Type', 'text/plain; charset=US-ASCII')
+        sampler = get_sampler()
+        if sampler is None:
+            return ''
+        return sampler.dump()
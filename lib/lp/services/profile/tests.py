@@ -14,6 +14,7 @@ import os
 import random
 import unittest
 
+from fixtures import FakeLogger
 from zope.component import (
     getSiteManager,
     queryUtility,
@@ -23,10 +24,14 @@ from zope.publisher.interfaces import (
     EndRequestEvent,
     StartRequestEvent,
     )
+from zope.security.interfaces import Unauthorized
 from zope.traversing.interfaces import BeforeTraverseEvent
 
 from lp.services.features.testing import FeatureFixture
-from lp.services.profile import profile
+from lp.services.profile import (
+    profile,
+    sampler,
+    )
 import lp.services.webapp.adapter as da
 from lp.services.webapp.errorlog import ErrorReportingUtility
 from lp.services.webapp.servers import LaunchpadTestRequest
@@ -792,6 +797,96 @@ class TestSqlLogging(TestCaseWithFactory, BaseRequestEndHandlerTest):
         self.assertIn(__file__.replace('.pyc', '.py'), response)
 
 
+class TestStackSampler(BaseTest):
+
+    def setUp(self):
+        super(TestStackSampler, self).setUp()
+        self.addCleanup(sampler.stop_sampler)
+
+    def makeRequest(self, pageid='Foo:+bar'):
+        request = self._get_request()
+        request.setInWSGIEnvironment('launchpad.pageid', pageid)
+        return request
+
+    def test_sample(self):
+        # Only threads handling requests are sampled, and their stacks are
+        # recorded outermost first under the request's page ID.
+        stack_sampler = sampler.StackSampler(hz=100, max_stacks=100)
+        stack_sampler.sample()
+        self.assertEqual({}, stack_sampler.counts)
+        stack_sampler.addRequest(self.makeRequest())
+        stack_sampler.sample()
+        [(pageid, stack)] = stack_sampler.counts.keys()
+        self.assertEqual('Foo:+bar', pageid)
+        self.assertTrue(stack.endswith(
+            ';lp.services.profile.tests:test_sample'
+            ';lp.services.profile.sampler:sample'))
+        stack_sampler.removeRequest()
+        stack_sampler.sample()
+        self.assertEqual(1, stack_sampler.samples)
+
+    def test_record_truncates(self):
+        stack_sampler = sampler.StackSampler(hz=100, max_stacks=2)
+        for stack in ('a;b', 'a;c', 'a;d', 'a;b'):
+            stack_sampler.record('Foo:+bar', stack)
+        stack_sampler.record('Foo bar;baz', 'a;e')
+        self.assertEqual(
+            'Foo:+bar;[truncated] 1\n'
+            'Foo:+bar;a;b 2\n'
+            'Foo:+bar;a;c 1\n'
+            'Foo_bar_baz;[truncated] 1\n',
+            stack_sampler.dump())
+        stack_sampler.reset()
+        self.assertEqual('', stack_sampler.dump())
+
+    def test_disabled(self):
+        self.pushConfig('profiling', sampling_enabled='False')
+        sampler.start_request(StartRequestEvent(self.makeRequest()))
+        self.assertIs(None, sampler._sampler)
+        view = sampler.SampledStacksView(None, self._get_request())
+        self.assertEqual('', view())
+
+    def test_request_subscribers(self):
+        self.pushConfig(
+            'profiling', sampling_enabled='True', sample_hz='1000')
+        request = self.makeRequest()
+        sampler.start_request(StartRequestEvent(request))
+        stack_sampler = sampler.get_sampler()
+        self.assertEqual([request], stack_sampler.requests.values())
+        # Give the sampler thread a chance to run.
+        for _ in range(500):
+            if stack_sampler.samples:
+                break
+            stack_sampler._stopped.wait(0.01)
+        sampler.end_request(EndRequestEvent(None, request))
+        self.assertEqual({}, stack_sampler.requests)
+        view = sampler.SampledStacksView(None, self._get_request())
+        self.assertTrue(view().startswith('Foo:+bar;'))
+        self.assertEqual(
+            'text/plain; charset=US-ASCII',
+            view.request.response.getHeader('Content-Type'))
+
+
+class TestSampledStacksPage(TestCaseWithFactory):
+
+    layer = layers.DatabaseFunctionalLayer
+
+    url = 'http://launchpad.test/+profile-samples'
+
+    def test_unprivileged_users(self):
+        # Stacks can reveal details of the code and the requests being
+        # served, so only administrators may see them.
+        self.useFixture(FakeLogger())
+        browser = self.getUserBrowser()
+        self.assertRaises(Unauthorized, browser.open, self.url)
+
+    def test_administrators(self):
+        self.pushConfig('profiling', sampling_enabled='False')
+        browser = self.getUserBrowser(user=self.factory.makeAdministrator())
+        browser.open(self.url)
+        self.assertEqual('', browser.contents)
+
+
 def test_suite():
     """Return the `IBugTarget` TestSuite."""
     suite = unittest.TestSuite()
@@ -34,6 +34,7 @@ from lp.services.osutils import write_file
 from lp.services.timeout import (
     default_timeout,
     get_default_timeout_function,
+    make_url_session,
     override_timeout,
     reduced_timeout,
     set_default_timeout_function,
@@ -376,6 +377,21 @@ class TestTimeout(TestCase):
         urlfetch('http://example.com/')
         self.assertEqual({}, fake_send.calls[0][1]['proxies'])
 
+    def test_urlfetch_reuses_session(self):
+        """urlfetch uses a persistent session if one is passed."""
+        session = make_url_session()
+        fake_make_url_session = FakeMethod(result=make_url_session())
+        self.useFixture(MonkeyPatch(
+            'lp.services.timeout.make_url_session', fake_make_url_session))
+        self.useFixture(MonkeyPatch(
+            'requests.adapters.HTTPAdapter.send',
+            FakeMethod(result=Response())))
+        urlfetch('http://example.com/', session=session)
+        urlfetch('http://example.com/', session=session)
+        self.assertEqual(0, fake_make_url_session.call_count)
+        urlfetch('http://example.com/')
+        self.assertEqual(1, fake_make_url_session.call_count)
+
     def test_urlfetch_uses_proxies_if_requested(self):
         """urlfetch uses proxies if explicitly requested."""
         proxy = 'http://proxy.example:3128/'
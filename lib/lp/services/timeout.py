@@ -7,6 +7,7 @@ __metaclass__ = type
 __all__ = [
     "default_timeout",
     "get_default_timeout_function",
+    "make_url_session",
     "override_timeout",
     "reduced_timeout",
     "SafeTransportWithTimeout",
@@ -328,11 +329,41 @@ class CleanableHTTPAdapter(HTTPAdapter):
             **pool_kwargs)
 
 
+def make_url_session(pool_maxsize=None):
+    """Make a `requests.Session` suitable for use by `URLFetcher`.
+
+    Callers that make many requests to the same host can keep the returned
+    session and pass it to `urlfetch` to reuse keep-alive connections.
+
+    :param pool_maxsize: The maximum number of connections to keep open to
+        each host, if not the `requests` default.
+    """
+    session = Session()
+    # Always ignore proxy/authentication settings in the environment; we
+    # configure that sort of thing explicitly.
+    session.trust_env = False
+    # Mount our custom adapters.
+    adapter_kwargs = {}
+    if pool_maxsize is not None:
+        adapter_kwargs["pool_maxsize"] = pool_maxsize
+    session.mount("https://", CleanableHTTPAdapter(**adapter_kwargs))
+    session.mount("http://", CleanableHTTPAdapter(**adapter_kwargs))
+    return session
+
+
 class URLFetcher:
     """Object fetching remote URLs with a time out."""
 
-    def __init__(self):
-        self.session = None
+    def __init__(self, session=None):
+        """Initialise the fetcher.
+
+        :param session: If not None, a persistent session (see
+            `make_url_session`) to use instead of a fresh one.  The session
+            is closed if the request times out, so callers must then stop
+            using it.
+        """
+        self.session = session
+        self.persistent = session is not None
 
     @with_timeout(cleanup='cleanup')
     def fetch(self, url, use_proxy=False, allow_ftp=False, allow_file=False,
@@ -347,15 +378,12 @@ class URLFetcher:
         :param output_file: If not None, download the response content to
             this file object or path.
         :param request_kwargs: Additional keyword arguments passed on to
-            `Session.request`.
+            `Session.request`.  If this includes `stream=True` and
+            `output_file` is None, then the response content is not
+            consumed, and the caller must iterate over it.
         """
-        self.session = Session()
-        # Always ignore proxy/authentication settings in the environment; we
-        # configure that sort of thing explicitly.
-        self.session.trust_env = False
-        # Mount our custom adapters.
-        self.session.mount("https://", CleanableHTTPAdapter())
-        self.session.mount("http://", CleanableHTTPAdapter())
+        if not self.persistent:
+            self.session = make_url_session()
         # We can do FTP, but currently only via an HTTP proxy.
         if allow_ftp and use_proxy:
             self.session.mount("ftp://", CleanableHTTPAdapter())
@@ -373,12 +401,12 @@ class URLFetcher:
             request_kwargs["stream"] = True
         response = self.session.request(url=url, **request_kwargs)
         response.raise_for_status()
-        if output_file is None:
-            # Make sure the content has been consumed before returning.
-            response.content
-        else:
+        if output_file is not None:
             # Download the content to the given file.
             stream.stream_response_to_file(response, path=output_file)
+        elif not request_kwargs.get("stream"):
+            # Make sure the content has been consumed before returning.
+            response.content
         # The responses library doesn't persist cookies in the session
         # (https://github.com/getsentry/responses/issues/80).  Work around
         # this.
@@ -394,10 +422,14 @@ class URLFetcher:
         self.session = None
 
 
-def urlfetch(url, **request_kwargs):
-    """Wrapper for `requests.get()` that times out."""
+def urlfetch(url, session=None, **request_kwargs):
+    """Wrapper for `requests.get()` that times out.
+
+    :param session: If not None, a persistent session to use; see
+        `URLFetcher`.
+    """
     with default_timeout(config.launchpad.urlfetch_timeout):
-        return URLFetcher().fetch(url, **request_kwargs)
+        return URLFetcher(session=session).fetch(url, **request_kwargs)
 
 
 class TransportWithTimeout(Transport):
@@ -31,6 +31,7 @@ from six import reraise
 from storm.database import register_scheme
 from storm.databases.postgres import (
     Postgres,
+    PostgresConnection,
     PostgresTimeoutTracer,
     )
 from storm.exceptions import TimeoutError
@@ -65,6 +66,10 @@ from lp.services.database.interfaces import (
     )
 from lp.services.database.policy import MasterDatabasePolicy
 from lp.services.database.postgresql import ConnectionString
+from lp.services.database.preparedstatements import (
+    PreparedStatementCache,
+    PreparingCursor,
+    )
 from lp.services.log.loglevels import DEBUG2
 from lp.services.stacktrace import (
     extract_stack,
@@ -491,8 +496,34 @@ isolation_level_map = {
     }
 
 
+class LaunchpadConnection(PostgresConnection):
+    """A Storm connection that may use server-side prepared statements.
+
+    See `lp.services.database.preparedstatements`.
+    """
+
+    _prepared_statements = None
+
+    def build_raw_cursor(self):
+        size = config.database.prepared_statement_cache_size
+        if not size:
+            return super(LaunchpadConnection, self).build_raw_cursor()
+        cache = self._prepared_statements
+        if cache is None or cache.raw_connection is not self._raw_connection:
+            # Prepared statements don't survive reconnection.
+            cache = PreparedStatementCache(self._raw_connection, size)
+            self._prepared_statements = cache
+        cache.size = size
+        raw_cursor = self._raw_connection.cursor(
+            cursor_factory=PreparingCursor)
+        raw_cursor.prepared_statements = cache
+        return raw_cursor
+
+
 class LaunchpadDatabase(Postgres):
 
+    connection_factory = LaunchpadConnection
+
     _dsn_user_re = re.compile('user=[^ ]*')
 
     def __init__(self, uri):
@@ -13,8 +13,10 @@ from iso8601 import (
     )
 import lazr.batchnavigator
 from lazr.batchnavigator.interfaces import IRangeFactory
+from lazr.enum import DBItem
 import simplejson
 from storm import Undef
+from storm.exceptions import NoneError
 from storm.expr import (
     And,
     compile,
@@ -22,8 +24,19 @@ from storm.expr import (
     Or,
     SQL,
     )
+from storm.info import get_cls_info
 from storm.properties import PropertyColumn
-from storm.store import EmptyResultSet
+from storm.store import (
+    EmptyResultSet,
+    ResultSet,
+    )
+from storm.variables import (
+    BoolVariable,
+    DateTimeVariable,
+    FloatVariable,
+    IntVariable,
+    UnicodeVariable,
+    )
 from storm.zope.interfaces import IResultSet
 from zope.component import adapter
 from zope.interface import implementer
@@ -37,6 +50,7 @@ from zope.security.proxy import (
 from lp.app.browser.launchpad import iter_view_registrations
 from lp.services.config import config
 from lp.services.database.decoratedresultset import DecoratedResultSet
+from lp.services.database.enumcol import DBEnumVariable
 from lp.services.database.interfaces import ISlaveStore
 from lp.services.database.sqlbase import (
     convert_storm_clause_to_string,
@@ -111,6 +125,93 @@ class BoundReferenceSetAdapter:
         return self.context.count()
 
 
+@implementer(IFiniteSequence)
+class EstimatedLengthResultSet:
+    """A result set whose length may be estimated by the query planner.
+
+    Counting all the rows of a large result set is often as slow as
+    fetching them.  If the planner expects more than
+    `config.launchpad.batch_count_estimate_threshold` rows, we use its
+    estimate instead.
+    """
+
+    def __init__(self, results, range_factory):
+        self.results = results
+        self.range_factory = range_factory
+
+    def __getitem__(self, ix):
+        return self.results[ix]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    @cachedproperty
+    def _length(self):
+        threshold = config.launchpad.batch_count_estimate_threshold
+        if threshold:
+            estimate = self.range_factory.rough_length
+            if estimate > threshold:
+                return estimate
+        return self.results.count()
+
+    def __len__(self):
+        return self._length
+
+
+# Sort columns of these types can be used in memos.
+KEYSET_VARIABLE_TYPES = (
+    BoolVariable,
+    DateTimeVariable,
+    DBEnumVariable,
+    FloatVariable,
+    IntVariable,
+    UnicodeVariable,
+    )
+
+
+def get_keyset_range_factory(results, error_cb=None):
+    """Return a `StormRangeFactory` for `results` if it can batch them.
+
+    That is the case for Storm result sets (possibly decorated) that are
+    ordered by columns of the classes they return, where one of the sort
+    columns is a primary key, so that the order is deterministic, and
+    the others can't be NULL.
+
+    :param error_cb: See `StormRangeFactory`.
+    :return: A `StormRangeFactory`, or None.
+    """
+    naked = removeSecurityProxy(results)
+    if isinstance(naked, DecoratedResultSet):
+        naked = removeSecurityProxy(naked.get_plain_result_set())
+    if type(naked) is not ResultSet:
+        return None
+    if (naked._order_by is Undef or naked._group_by is not Undef or
+            naked._select is not Undef or naked._offset is not Undef or
+            naked._limit is not Undef):
+        return None
+    result_classes = [
+        info.cls for is_expr, info in naked._find_spec._cls_spec_info
+        if not is_expr]
+    has_primary_key = False
+    for expression in naked._order_by:
+        column = plain_expression(expression)
+        if not isinstance(column, PropertyColumn):
+            return None
+        if not any(issubclass(cls, column.cls) for cls in result_classes):
+            return None
+        variable = column.variable_factory()
+        if not isinstance(variable, KEYSET_VARIABLE_TYPES):
+            return None
+        primary_key = get_cls_info(column.cls).primary_key
+        if len(primary_key) == 1 and primary_key[0] is column:
+            has_primary_key = True
+        elif variable._allow_none:
+            return None
+    if not has_primary_key:
+        return None
+    return StormRangeFactory(results, error_cb=error_cb)
+
+
 class UpperBatchNavigationView(LaunchpadView):
     """Only render navigation links if there is a batch."""
 
@@ -128,14 +229,42 @@ class LowerBatchNavigationView(UpperBatchNavigationView):
 
 class BatchNavigator(lazr.batchnavigator.BatchNavigator):
 
+    # Whether the results are batched by a StormRangeFactory.
+    _keyset_batching = False
+
     def __init__(self, results, request, start=0, size=None, callback=None,
                  transient_parameters=None, force_start=False,
-                 range_factory=None, hide_counts=False):
+                 range_factory=None, hide_counts=False, keyset=None):
+        """See `lazr.batchnavigator.BatchNavigator`.
+
+        :param keyset: If True, batch Storm result sets that
+            `get_keyset_range_factory` accepts by their sort keys rather
+            than by OFFSET.  If None, do so if
+            `config.launchpad.keyset_batching` is set.
+        """
+        if keyset is None:
+            keyset = config.launchpad.keyset_batching
+        if range_factory is None and keyset:
+            memo_errors = []
+            range_factory = get_keyset_range_factory(
+                results, error_cb=memo_errors.append)
+            if range_factory is not None:
+                memo = request.get('memo')
+                if memo:
+                    range_factory.parseMemo(memo)
+                if memo_errors:
+                    # The memo comes from an OFFSET batching URL, such as
+                    # a bookmark made before this view was keyset batched.
+                    range_factory = None
+                else:
+                    results = EstimatedLengthResultSet(
+                        results, range_factory)
         super(BatchNavigator, self).__init__(results, request,
             start=start, size=size, callback=callback,
             transient_parameters=transient_parameters,
             force_start=force_start, range_factory=range_factory)
         self.hide_counts = hide_counts
+        self._keyset_batching = isinstance(range_factory, StormRangeFactory)
 
     @property
     def default_batch_size(self):
@@ -153,7 +282,13 @@ class BatchNavigator(lazr.batchnavigator.BatchNavigator):
         pages, and a navigation heading should be included above and below the
         table.
         """
-        return self.batch.total() > self.batch.size
+        batch = self.batch
+        if self._keyset_batching:
+            # Avoid counting the results.
+            return (
+                batch.prevBatch() is not None or
+                batch.nextBatch() is not None)
+        return batch.total() > batch.size
 
 
 class ActiveBatchNavigator(BatchNavigator):
@@ -177,8 +312,9 @@ class TableBatchNavigator(BatchNavigator):
     """See lp.services.webapp.interfaces.ITableBatchNavigator."""
 
     def __init__(self, results, request, start=0, size=None,
-                 columns_to_show=None, callback=None):
-        BatchNavigator.__init__(self, results, request, start, size, callback)
+                 columns_to_show=None, callback=None, keyset=None):
+        BatchNavigator.__init__(
+            self, results, request, start, size, callback, keyset=keyset)
 
         self.show_column = {}
         if columns_to_show:
@@ -187,13 +323,16 @@ class TableBatchNavigator(BatchNavigator):
 
 
 class DateTimeJSONEncoder(simplejson.JSONEncoder):
-    """A JSON encoder that understands datetime objects.
+    """A JSON encoder that understands datetime objects and enum items.
 
-    Datetime objects are formatted according to ISO 1601.
+    Datetime objects are formatted according to ISO 1601, and enum items
+    are represented by their database values.
     """
     def default(self, obj):
         if isinstance(obj, datetime):
             return obj.isoformat()
+        if isinstance(obj, DBItem):
+            return obj.value
         return simplejson.JSONEncoder.default(self, obj)
 
 
@@ -406,6 +545,16 @@ class StormRangeFactory:
         converted_memo = []
         for expression, value in zip(sort_expressions, parsed_memo):
             expression = plain_expression(expression)
+            if isinstance(expression.variable_factory(), DBEnumVariable):
+                # Enum items are represented by their database values.
+                try:
+                    value = expression.variable_factory(
+                        value=value, from_db=True).get()
+                except (KeyError, NoneError, TypeError):
+                    self.reportError('Invalid parameter: %r' % value)
+                    return None
+                converted_memo.append(value)
+                continue
             try:
                 expression.variable_factory(value=value)
             except TypeError as error:
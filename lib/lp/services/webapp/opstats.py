@@ -4,12 +4,17 @@
 """XML-RPC interface for extracting real time stats from the appserver."""
 
 __metaclass__ = type
-__all__ = ["OpStats"]
+__all__ = ["OpStats", "PageStatsView"]
 
 from cStringIO import StringIO
 from time import time
 
 from lp.services.webapp import LaunchpadXMLRPCView
+from lp.services.webapp.pagestats import (
+    get_page_stats,
+    METRICS,
+    reset_page_stats,
+    )
 
 
 class OpStats(LaunchpadXMLRPCView):
@@ -21,6 +26,11 @@ class OpStats(LaunchpadXMLRPCView):
     @classmethod
     def resetStats(cls):
         """Reset the collected stats to 0."""
+        reset_page_stats()
+        # Some stats, such as the shared object cache's, are only added
+        # once they are first counted.
+        for stat_key in OpStats.stats:
+            OpStats.stats[stat_key] = 0
         OpStats.stats.update({
             # Global
             'requests': 0,       # Requests, all protocols, all statuses
@@ -63,6 +73,29 @@ class OpStats(LaunchpadXMLRPCView):
         """
         return OpStats.stats
 
+    def pagestats(self):
+        """Return a summary of the statistics recorded for each page.
+
+        The result maps page IDs to dictionaries mapping each metric
+        (duration_ms, sql_time_ms, sql_statements and remote_time_ms) to
+        a dictionary of its count, sum, max, p50, p90 and p99.
+        Quantiles are accurate to within about 6%.
+        """
+        summary = {}
+        for pageid, metrics in get_page_stats().items():
+            summary[pageid] = dict(
+                (metric, {
+                    'count': histogram.count,
+                    # Sums can easily exceed XML-RPC's 32-bit integers.
+                    'sum': float(histogram.total),
+                    'max': histogram.max,
+                    'p50': histogram.quantile(0.5),
+                    'p90': histogram.quantile(0.9),
+                    'p99': histogram.quantile(0.99),
+                    })
+                for metric, histogram in metrics.items())
+        return summary
+
     def __call__(self):
         now = time()
         out = StringIO()
@@ -79,3 +112,34 @@ class OpStats(LaunchpadXMLRPCView):
 
 
 OpStats.resetStats()  # Initialize the statistics
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+class PageStatsView(LaunchpadXMLRPCView):
+    """Per-page histograms in the Prometheus text exposition format."""
+
+    def __call__(self):
+        stats = sorted(get_page_stats().items())
+        out = StringIO()
+        for metric in METRICS:
+            name = 'launchpad_page_%s' % metric
+            print >> out, '# TYPE %s histogram' % name
+            for pageid, metrics in stats:
+                histogram = metrics[metric]
+                label = 'pageid="%s"' % _escape_label(pageid)
+                for upper, cumulative in histogram.buckets():
+                    print >> out, '%s_bucket{%s,le="%d"} %d' % (
+                        name, label, upper, cumulative)
+                print >> out, '%s_bucket{%s,le="+Inf"} %d' % (
+                    name, label, histogram.count)
+                print >> out, '%s_sum{%s} %d' % (
+                    name, label, histogram.total)
+                print >> out, '%s_count{%s} %d' % (
+                    name, label, histogram.count)
+        self.request.response.setHeader(
+            'Content-Type', 'text/plain; version=0.0.4; charset=US-ASCII')
+        return out.getvalue()
@@ -0,0 +1,197 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Per-page latency and SQL statistics.
+
+At the end of each request, the publication records how long it took, how
+long it spent in SQL, how many SQL statements it issued and how long it
+spent waiting for other services, taken from the request timeline.  The
+values are counted in a histogram per page ID and metric.
+
+Each thread records into its own histograms, so recording takes no locks;
+readers merge the histograms of all threads.  The number of page IDs that
+each thread tracks is limited by `config.launchpad.page_stats_max_pages`,
+with any further pages counted under `OVERFLOW_PAGE_ID`.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'get_page_stats',
+    'Histogram',
+    'METRICS',
+    'record_page_stats',
+    'reset_page_stats',
+    ]
+
+from collections import defaultdict
+import threading
+
+from lp.services.config import config
+from lp.services.timeline.requesttimeline import get_request_timeline
+
+
+# The metrics recorded for each page, in the order they are reported.
+METRICS = (
+    'duration_ms',
+    'sql_time_ms',
+    'sql_statements',
+    'remote_time_ms',
+    )
+
+# The page ID under which pages beyond a thread's limit are counted.
+OVERFLOW_PAGE_ID = 'Other'
+
+# Pages whose ID couldn't be determined, such as 404s during traversal.
+UNKNOWN_PAGE_ID = 'Unknown'
+
+
+class Histogram:
+    """A log-linear histogram of non-negative integers.
+
+    As in HdrHistogram, small values are counted exactly and larger values
+    are counted in buckets whose width is a fixed fraction of their
+    magnitude.  Memory use is therefore logarithmic in the largest value
+    recorded, while quantiles are accurate to within 1 / SUB_BUCKETS.
+    """
+
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        # Lower bound of bucket -> count.
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def bucketBounds(cls, value):
+        """Return the inclusive (lower, upper) bounds of value's bucket."""
+        if value < cls.SUB_BUCKETS:
+            return value, value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        lower = (value >> shift) << shift
+        return lower, lower + (1 << shift) - 1
+
+    def record(self, value):
+        value = max(int(round(value)), 0)
+        lower, _ = self.bucketBounds(value)
+        self.counts[lower] = self.counts.get(lower, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the values recorded by `other` to this histogram."""
+        for lower, count in list(other.counts.items()):
+            self.counts[lower] = self.counts.get(lower, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def buckets(self):
+        """Return a sorted list of (upper bound, cumulative count)."""
+        buckets = []
+        cumulative = 0
+        for lower in sorted(self.counts):
+            cumulative += self.counts[lower]
+            buckets.append((self.bucketBounds(lower)[1], cumulative))
+        return buckets
+
+    def quantile(self, q):
+        """Return an upper bound for the `q` quantile of the values."""
+        if self.count == 0:
+            return 0
+        rank = q * self.count
+        for upper, cumulative in self.buckets():
+            if cumulative >= rank:
+                return min(upper, self.max)
+        return self.max
+
+
+_registry_lock = threading.Lock()
+# The per-thread attribute dicts of _thread_stats.  These are kept even
+# after their threads exit so that their statistics aren't lost.
+_registry = []
+
+
+class _ThreadPageStats(threading.local):
+    """The histograms recorded by the current thread."""
+
+    def __init__(self):
+        # Page ID -> metric -> Histogram.
+        self.pages = {}
+        with _registry_lock:
+            _registry.append(self.__dict__)
+
+
+_thread_stats = _ThreadPageStats()
+
+
+def _milliseconds(duration):
+    return duration.total_seconds() * 1000
+
+
+def record_page_stats(request, duration):
+    """Record statistics for the current request.
+
+    :param request: The request being finished.
+    :param duration: The duration of the request in seconds.
+    """
+    max_pages = config.launchpad.page_stats_max_pages
+    if not max_pages or duration < 0:
+        return
+    orig_env = getattr(request, '_orig_env', None) or {}
+    pageid = orig_env.get('launchpad.pageid') or UNKNOWN_PAGE_ID
+
+    sql_time = 0
+    sql_statements = 0
+    remote_time = 0
+    for action in get_request_timeline(request).actions:
+        if action.duration is None:
+            continue
+        if action.category == 'SQL-nostore':
+            # Transaction boundaries, not statements.
+            continue
+        elif action.category.startswith('SQL-'):
+            sql_statements += 1
+            sql_time += _milliseconds(action.duration)
+        else:
+            remote_time += _milliseconds(action.duration)
+
+    pages = _thread_stats.pages
+    if pageid not in pages and len(pages) >= max_pages:
+        pageid = OVERFLOW_PAGE_ID
+    metrics = pages.get(pageid)
+    if metrics is None:
+        metrics = pages[pageid] = dict(
+            (metric, Histogram()) for metric in METRICS)
+    metrics['duration_ms'].record(duration * 1000)
+    metrics['sql_time_ms'].record(sql_time)
+    metrics['sql_statements'].record(sql_statements)
+    metrics['remote_time_ms'].record(remote_time)
+
+
+def get_page_stats():
+    """Return the statistics recorded by all threads.
+
+    :return: A dict mapping page IDs to dicts mapping each of `METRICS` to
+        a `Histogram`.
+    """
+    merged = defaultdict(lambda: dict(
+        (metric, Histogram()) for metric in METRICS))
+    with _registry_lock:
+        thread_stats = list(_registry)
+    for stats in thread_stats:
+        for pageid, metrics in list(stats.get('pages', {}).items()):
+            for metric, histogram in metrics.items():
+                merged[pageid][metric].merge(histogram)
+    return dict(merged)
+
+
+def reset_page_stats():
+    """Forget all recorded statistics."""
+    with _registry_lock:
+        for stats in _registry:
+            stats['pages'] = {}
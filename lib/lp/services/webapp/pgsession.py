@@ -1,17 +1,34 @@
 # Copyright 2009 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
-"""PostgreSQL server side session storage for Zope3."""
+"""PostgreSQL server side session storage for Zope3.
+
+Normally every request that uses the session updates its last access
+time, reads the data for each session package it uses, and writes each
+change to the database as soon as it is made.  If
+`config.launchpad_session.write_behind` is set then instead:
+
+ * session packages are cached in each appserver, keyed by the session's
+   version, so that a request only has to read the version to use them;
+ * last access updates are queued and written in batches;
+ * changes are collected during the request and written back in a single
+   call when its transaction is committed.
+"""
 
 __metaclass__ = type
 
+from collections import OrderedDict
 import cPickle as pickle
 import hashlib
+import threading
 import time
 from UserDict import DictMixin
 
+from bzrlib.lru_cache import LRUCache
 from lazr.restful.utils import get_current_browser_request
+from psycopg2 import Binary
 from storm.zope.interfaces import IZStorm
+import transaction
 from zope.authentication.interfaces import IUnauthenticatedPrincipal
 from zope.component import getUtility
 from zope.interface import implementer
@@ -22,6 +39,7 @@ from zope.session.interfaces import (
     ISessionPkgData,
     )
 
+from lp.services.config import config
 from lp.services.helpers import ensure_unicode
 
 
@@ -30,6 +48,9 @@ MINUTES = 60 * SECONDS
 HOURS = 60 * MINUTES
 DAYS = 24 * HOURS
 
+# The request annotation holding the sessions with deferred writes.
+PENDING_SESSIONS_KEY = 'lp.services.webapp.pgsession.pending'
+
 
 class PGSessionBase:
     store_name = 'session'
@@ -39,6 +60,172 @@ class PGSessionBase:
         return getUtility(IZStorm).get(self.store_name)
 
 
+class SessionPkgCache:
+    """A least-recently-used cache of pickled session package data.
+
+    Entries are keyed by (hashed client id, product id), and are only
+    returned if they were cached at the session's current version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = LRUCache()
+        self._size = None
+
+    def _resize(self):
+        """Match the size of the cache to the configuration.
+
+        The caller must hold the lock.
+        """
+        size = config.launchpad_session.cache_size
+        if size != self._size:
+            self._entries.resize(size)
+            self._size = size
+
+    def get(self, key, version):
+        """Return the cached pickles for `key` at `version`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            return entry[1]
+
+    def set(self, key, version, pickles):
+        """Cache `pickles`, a dict of key to pickle, for `key`."""
+        with self._lock:
+            self._resize()
+            self._entries[key] = (version, pickles)
+
+    def discard(self, key):
+        # LRUCache can't remove entries, so leave one that matches no
+        # version in its place.
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (None, None)
+
+    def __len__(self):
+        with self._lock:
+            return len([
+                entry for entry in self._entries.as_dict().values()
+                if entry[0] is not None])
+
+
+class SessionTouchQueue:
+    """Last access updates waiting to be written to the database."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pending_since = None
+        # When each recently-seen session was last queued, so that a
+        # busy session is only touched once per resolution period.
+        self._queued = {}
+
+    def add(self, hashed_client_id, now, resolution):
+        with self._lock:
+            queued = self._queued.get(hashed_client_id)
+            if queued is not None and now - queued < resolution:
+                return
+            self._queued[hashed_client_id] = now
+            if not self._pending:
+                self._pending_since = now
+            self._pending.add(hashed_client_id)
+
+    def isDue(self, now):
+        """Should the pending updates be written now?"""
+        config_section = config.launchpad_session
+        return bool(self._pending) and (
+            len(self._pending) >= config_section.touch_batch_size or
+            now - self._pending_since >=
+                config_section.touch_flush_interval)
+
+    def take(self, now, resolution):
+        """Return and forget the pending updates."""
+        with self._lock:
+            pending = sorted(self._pending)
+            self._pending = set()
+            self._pending_since = None
+            for hashed_client_id, queued in list(self._queued.items()):
+                if now - queued >= resolution:
+                    del self._queued[hashed_client_id]
+            return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class SessionWriteBuffer:
+    """Session data read and changed in write-behind mode.
+
+    During a request this is kept in the request's annotations, so that
+    every `PGSessionData` and `PGSessionPkgData` for the same session
+    shares it, and it is flushed just before the request's transaction
+    is committed.  So, as with other database changes, session changes
+    made during a read-only request are only kept if the view commits.
+    """
+
+    def __init__(self):
+        self.containers = set()
+        # (container, hashed client id) -> version
+        self.versions = {}
+        # (container, hashed client id, product id) ->
+        #     (dict of key to pickle, set of changed keys)
+        self.packages = OrderedDict()
+        # The transaction that will flush this buffer when committed.
+        self._transaction = None
+
+    def join(self):
+        """Flush this buffer when the current transaction is committed.
+
+        Views may commit part way through a request, so this must be
+        called again after every change.
+        """
+        txn = transaction.get()
+        if txn is not self._transaction:
+            txn.addBeforeCommitHook(self.flush)
+            self._transaction = txn
+
+    def flush(self):
+        """Write back all changed session data, in one call per session."""
+        sessions = OrderedDict()
+        for (container, hashed_client_id, product_id), (pickles, dirty) in (
+                self.packages.items()):
+            if dirty:
+                sessions.setdefault((container, hashed_client_id), []).append(
+                    (product_id, pickles, dirty))
+        for (container, hashed_client_id), packages in sessions.items():
+            product_ids = []
+            keys = []
+            values = []
+            for product_id, pickles, dirty in packages:
+                for key in sorted(dirty):
+                    product_ids.append(product_id)
+                    keys.append(key)
+                    value = pickles.get(key)
+                    values.append(None if value is None else Binary(value))
+            old_version, new_version = container.store.execute("""
+                SELECT * FROM set_session_pkg_data_multi(
+                    ?, ?::text[], ?::text[], ?::bytea[])
+                """, (hashed_client_id, product_ids, keys, values)).get_one()
+            # Our copy of the session is only known to be complete if
+            # nobody else changed it since we read it.
+            version_key = (container, hashed_client_id)
+            up_to_date = old_version == self.versions.get(version_key)
+            for product_id, pickles, dirty in packages:
+                cache_key = (hashed_client_id, product_id)
+                if up_to_date:
+                    container.cache.set(cache_key, new_version, dict(pickles))
+                else:
+                    container.cache.discard(cache_key)
+                dirty.clear()
+            if up_to_date:
+                self.versions[version_key] = new_version
+            else:
+                self.versions.pop(version_key, None)
+        for container in self.containers:
+            container.flushTouches()
+
+
 @implementer(ISessionDataContainer)
 class PGSessionDataContainer(PGSessionBase):
     """An ISessionDataContainer that stores data in PostgreSQL
@@ -48,7 +235,9 @@ class PGSessionDataContainer(PGSessionBase):
     CREATE TABLE SessionData (
         client_id     text PRIMARY KEY,
         last_accessed timestamp with time zone
-            NOT NULL DEFAULT CURRENT_TIMESTAMP
+            NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        version       bigint NOT NULL
+            DEFAULT nextval('sessiondata_version_seq')
         );
     CREATE INDEX sessiondata_last_accessed_idx ON SessionData(last_accessed);
     CREATE TABLE SessionPkgData (
@@ -70,6 +259,30 @@ class PGSessionDataContainer(PGSessionBase):
     session_data_table_name = 'SessionData'
     session_pkg_data_table_name = 'SessionPkgData'
 
+    def __init__(self):
+        # Only used in write-behind mode.
+        self.cache = SessionPkgCache()
+        self.touches = SessionTouchQueue()
+
+    def flushTouches(self, force=False):
+        """Write any deferred last access updates.
+
+        :param force: If False, only write them if enough are pending or
+            they have been pending for long enough.
+        """
+        now = time.time()
+        if not force and not self.touches.isDue(now):
+            return
+        hashed_client_ids = self.touches.take(now, self.resolution)
+        if not hashed_client_ids:
+            return
+        query = """
+            UPDATE %s SET last_accessed = CURRENT_TIMESTAMP
+            WHERE client_id = ANY(?)
+                AND last_accessed < CURRENT_TIMESTAMP - '%d seconds'::interval
+            """ % (self.session_data_table_name, self.resolution)
+        self.store.execute(query, (hashed_client_ids,), noresult=True)
+
     def __getitem__(self, client_id):
         """See zope.session.interfaces.ISessionDataContainer"""
         return PGSessionData(self, client_id)
@@ -90,6 +303,13 @@ class PGSessionData(PGSessionBase):
 
     _have_ensured_client_id = False
 
+    write_behind = False
+
+    # The SessionWriteBuffer used in write-behind mode, and whether it
+    # belongs to the current request rather than just to this object.
+    _write_buffer = None
+    _deferred = False
+
     def __init__(self, session_data_container, client_id):
         self.session_data_container = session_data_container
         self.client_id = ensure_unicode(client_id)
@@ -97,6 +317,23 @@ class PGSessionData(PGSessionBase):
             self.client_id.encode('utf-8')).hexdigest().decode('ascii')
         self.lastAccessTime = time.time()
 
+        if config.launchpad_session.write_behind:
+            self.write_behind = True
+            session_data_container.touches.add(
+                self.hashed_client_id, self.lastAccessTime,
+                session_data_container.resolution)
+            request = get_current_browser_request()
+            if request is not None:
+                self._write_buffer = request.annotations.setdefault(
+                    PENDING_SESSIONS_KEY, SessionWriteBuffer())
+                self._write_buffer.join()
+                self._deferred = True
+            else:
+                self._write_buffer = SessionWriteBuffer()
+                session_data_container.flushTouches()
+            self._write_buffer.containers.add(session_data_container)
+            return
+
         # Update the last access time in the db if it is out of date
         table_name = session_data_container.session_data_table_name
         query = """
@@ -112,10 +349,12 @@ class PGSessionData(PGSessionBase):
             return
         # We want to make sure the browser cookie and the database both know
         # about our client id. We're doing it lazily to try and keep anonymous
-        # users from having a session.
-        self.store.execute(
-            "SELECT ensure_session_client_id(?)", (self.hashed_client_id,),
-            noresult=True)
+        # users from having a session.  In write-behind mode the session
+        # is created when its data is written back.
+        if not self.write_behind:
+            self.store.execute(
+                "SELECT ensure_session_client_id(?)",
+                (self.hashed_client_id,), noresult=True)
         request = get_current_browser_request()
         if request is not None:
             client_id_manager = getUtility(IClientIdManager)
@@ -149,6 +388,66 @@ class PGSessionData(PGSessionBase):
                 client_id_manager.setRequestId(request, self.client_id)
         self._have_ensured_client_id = True
 
+    def loadPickles(self, product_id):
+        """Return a dict of key to pickled value for `product_id`."""
+        query = """
+            SELECT key, pickle FROM %s WHERE client_id = ?
+                AND product_id = ?
+            """ % self.session_data_container.session_pkg_data_table_name
+        result = self.store.execute(
+            query, (self.hashed_client_id, product_id))
+        return dict(
+            (key, str(pickled_value)) for key, pickled_value in result)
+
+    def _getVersion(self):
+        """Return the session's version, or None if it doesn't exist."""
+        version_key = (self.session_data_container, self.hashed_client_id)
+        versions = self._write_buffer.versions
+        if version_key not in versions:
+            row = self.store.execute(
+                "SELECT version FROM %s WHERE client_id = ?" % (
+                    self.session_data_container.session_data_table_name),
+                (self.hashed_client_id,)).get_one()
+            versions[version_key] = None if row is None else row[0]
+        return versions[version_key]
+
+    def getBufferedPackage(self, product_id):
+        """Return the pickles and changed keys for `product_id`.
+
+        Only used in write-behind mode.  The returned dict of key to
+        pickle and set of changed keys are shared by every
+        `PGSessionPkgData` for this package in the same request; callers
+        must update both when changing the package and then call
+        `changed`.
+        """
+        package_key = (
+            self.session_data_container, self.hashed_client_id, product_id)
+        packages = self._write_buffer.packages
+        if package_key not in packages:
+            version = self._getVersion()
+            if version is None:
+                pickles = {}
+            else:
+                cache = self.session_data_container.cache
+                cache_key = (self.hashed_client_id, product_id)
+                pickles = cache.get(cache_key, version)
+                if pickles is None:
+                    pickles = self.loadPickles(product_id)
+                    cache.set(cache_key, version, pickles)
+            packages[package_key] = (dict(pickles), set())
+        return packages[package_key]
+
+    def changed(self):
+        """Note that some of this session's packages have changed.
+
+        Outside a request the changes are written back immediately, and
+        otherwise when the current transaction is committed.
+        """
+        if self._deferred:
+            self._write_buffer.join()
+        else:
+            self._write_buffer.flush()
+
     def __getitem__(self, product_id):
         """Return an ISessionPkgData"""
         return PGSessionPkgData(self, product_id)
@@ -177,16 +476,21 @@ class PGSessionPkgData(DictMixin, PGSessionBase):
 
     _data_cache = None
 
+    # In write-behind mode, the pickles and changed keys shared with the
+    # session's SessionWriteBuffer.
+    _pickles = None
+    _dirty = None
+
     def _populate(self):
         self._data_cache = {}
-        query = """
-            SELECT key, pickle FROM %s WHERE client_id = ?
-                AND product_id = ?
-            """ % self.table_name
-        result = self.store.execute(
-            query, (self.session_data.hashed_client_id, self.product_id))
-        for key, pickled_value in result:
-            value = pickle.loads(str(pickled_value))
+        if self.session_data.write_behind:
+            self._pickles, self._dirty = (
+                self.session_data.getBufferedPackage(self.product_id))
+            pickles = self._pickles
+        else:
+            pickles = self.session_data.loadPickles(self.product_id)
+        for key, pickled_value in pickles.items():
+            value = pickle.loads(pickled_value)
             self._data_cache[key] = value
 
     def __getitem__(self, key):
@@ -197,11 +501,16 @@ class PGSessionPkgData(DictMixin, PGSessionBase):
         pickled_value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
 
         self.session_data._ensureClientId()
-        self.store.execute(
-            "SELECT set_session_pkg_data(?, ?, ?, ?)",
-            (self.session_data.hashed_client_id,
-                self.product_id, key, pickled_value),
-            noresult=True)
+        if self.session_data.write_behind:
+            self._pickles[key] = pickled_value
+            self._dirty.add(key)
+            self.session_data.changed()
+        else:
+            self.store.execute(
+                "SELECT set_session_pkg_data(?, ?, ?, ?)",
+                (self.session_data.hashed_client_id,
+                    self.product_id, key, pickled_value),
+                noresult=True)
 
         # Store the value in the cache too
         self._data_cache[key] = value
@@ -219,14 +528,28 @@ class PGSessionPkgData(DictMixin, PGSessionBase):
             # another process has inserted it and we should keep our grubby
             # fingers out of it.
             return
+        key = ensure_unicode(key)
+        if self.session_data.write_behind:
+            self._pickles.pop(key, None)
+            self._dirty.add(key)
+            self.session_data.changed()
+            return
+        # Change the session's version too, so that appservers in
+        # write-behind mode notice.
         query = """
-            DELETE FROM %s
-            WHERE client_id = ? AND product_id = ? AND key = ?
-            """ % self.table_name
+            WITH deleted AS (
+                DELETE FROM %s
+                WHERE client_id = ? AND product_id = ? AND key = ?
+                RETURNING client_id)
+            UPDATE %s SET version = nextval('sessiondata_version_seq')
+            WHERE client_id IN (SELECT client_id FROM deleted)
+            """ % (
+                self.table_name,
+                self.session_data.session_data_container
+                    .session_data_table_name)
         self.store.execute(
             query,
-            (self.session_data.hashed_client_id, self.product_id,
-             ensure_unicode(key)),
+            (self.session_data.hashed_client_id, self.product_id, key),
             noresult=True)
 
     def keys(self):
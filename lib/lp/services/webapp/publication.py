@@ -84,6 +84,7 @@ from lp.services.webapp.interfaces import (
     OffsiteFormPostError,
     )
 from lp.services.webapp.opstats import OpStats
+from lp.services.webapp.pagestats import record_page_stats
 from lp.services.webapp.vhosts import allvhosts
 
 
@@ -288,14 +289,15 @@ class LaunchpadBrowserPublication(
         """
         auth_utility = getUtility(IPlacelessAuthUtility)
         principal = None
-        # +opstats and +haproxy are status URLs that must not query the DB at
-        # all.  This is enforced by webapp/dbpolicy.py. If the request is for
-        # one of those two pages, don't even try to authenticate, because it
-        # may fail.  We haven't traversed yet, so we have to sniff the request
-        # this way.  Even though PATH_INFO is always present in real requests,
-        # we need to tread carefully (``get``) because of test requests in our
-        # automated tests.
-        if request.get('PATH_INFO') not in [u'/+opstats', u'/+haproxy']:
+        # +opstats, +pagestats and +haproxy are status URLs that must not
+        # query the DB at all.  This is enforced by webapp/dbpolicy.py. If
+        # the request is for one of those pages, don't even try to
+        # authenticate, because it may fail.  We haven't traversed yet, so
+        # we have to sniff the request this way.  Even though PATH_INFO is
+        # always present in real requests, we need to tread carefully
+        # (``get``) because of test requests in our automated tests.
+        if request.get('PATH_INFO') not in [
+                u'/+opstats', u'/+pagestats', u'/+haproxy']:
             principal = auth_utility.authenticate(request)
         if principal is not None:
             assert principal.person is not None
@@ -437,7 +439,7 @@ class LaunchpadBrowserPublication(
         # at all, ensure that all flag lookups will stop early.
         if pageid in (
             'RootObject:OpStats', 'RootObject:+opstats',
-            'RootObject:+haproxy'):
+            'RootObject:+pagestats', 'RootObject:+haproxy'):
             request.features = NullFeatureController()
             features.install_feature_controller(request.features)
 
@@ -690,6 +692,7 @@ class LaunchpadBrowserPublication(
         superclass = zope.app.publication.browser.BrowserPublication
         superclass.endRequest(self, request, object)
 
+        record_page_stats(request, da.get_request_duration())
         da.clear_request_started()
 
         getUtility(IOpenLaunchBag).clear()
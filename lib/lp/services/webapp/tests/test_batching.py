@@ -4,6 +4,10 @@
 __metaclass__ = type
 
 from datetime import datetime
+from urlparse import (
+    parse_qsl,
+    urlsplit,
+    )
 
 from lazr.batchnavigator.interfaces import IRangeFactory
 import pytz
@@ -17,15 +21,21 @@ from testtools.matchers import (
     LessThan,
     Not,
     )
-from zope.security.proxy import isinstance as zope_isinstance
+from zope.security.proxy import (
+    isinstance as zope_isinstance,
+    removeSecurityProxy,
+    )
 
 from lp.bugs.model.bugtask import BugTaskSet
+from lp.registry.interfaces.person import PersonalStanding
 from lp.registry.model.person import Person
 from lp.services.database.decoratedresultset import DecoratedResultSet
+from lp.services.database.interfaces import IStore
 from lp.services.librarian.model import LibraryFileAlias
 from lp.services.webapp.batching import (
     BatchNavigator,
     DateTimeJSONEncoder,
+    get_keyset_range_factory,
     ShadowedList,
     StormRangeFactory,
     )
@@ -33,6 +43,7 @@ from lp.services.webapp.interfaces import StormRangeFactoryError
 from lp.services.webapp.servers import LaunchpadTestRequest
 from lp.testing import (
     person_logged_in,
+    StormStatementRecorder,
     TestCaseWithFactory,
     verifyObject,
     )
@@ -823,3 +834,134 @@ class TestStormRangeFactory(TestCaseWithFactory):
         # is not always precise.
         self.assertThat(range_factory.rough_length, LessThan(10))
         self.assertEmptyResultSetsWorking(range_factory)
+
+
+class TestKeysetBatching(TestCaseWithFactory):
+    """Tests for batching result sets by their sort keys by default."""
+
+    layer = LaunchpadFunctionalLayer
+
+    def setUp(self):
+        super(TestKeysetBatching, self).setUp()
+        self.pushConfig(
+            'launchpad', keyset_batching=True,
+            batch_count_estimate_threshold=0)
+        self.people = [self.factory.makePerson() for i in range(5)]
+
+    def makeResultSet(self, *order_by):
+        resultset = IStore(Person).find(
+            Person, Person.id.is_in([person.id for person in self.people]))
+        return resultset.order_by(*order_by)
+
+    def test_get_keyset_range_factory(self):
+        for order_by in (
+                (Person.id,),
+                (Desc(Person.id),),
+                (Person.display_name, Person.id),
+                (Desc(Person.datecreated), Person.id)):
+            self.assertIsInstance(
+                get_keyset_range_factory(self.makeResultSet(*order_by)),
+                StormRangeFactory)
+
+    def test_get_keyset_range_factory_decorated(self):
+        resultset = DecoratedResultSet(self.makeResultSet(Person.id))
+        self.assertIsInstance(
+            get_keyset_range_factory(resultset), StormRangeFactory)
+
+    def test_get_keyset_range_factory_unsuitable(self):
+        # Result sets whose order isn't deterministic, or that are
+        # ordered by something other than non-NULL columns, are batched
+        # by OFFSET.
+        for order_by in (
+                (),
+                (Person.name,),
+                ('Person.id',),
+                (Person.homepage_content, Person.id),
+                (LibraryFileAlias.id,)):
+            self.assertIsNone(
+                get_keyset_range_factory(self.makeResultSet(*order_by)))
+        self.assertIsNone(get_keyset_range_factory(list(self.people)))
+        self.assertIsNone(get_keyset_range_factory(
+            self.makeResultSet(Person.id).config(offset=1)))
+
+    def getNextBatchForm(self, batchnav):
+        return dict(parse_qsl(urlsplit(batchnav.nextBatchURL()).query))
+
+    def isKeysetMemo(self, batchnav):
+        # Keyset memos are JSON lists of sort key values; OFFSET memos
+        # are indexes.
+        return self.getNextBatchForm(batchnav).get('memo', '').startswith('[')
+
+    def test_batches_by_memo(self):
+        resultset = self.makeResultSet(Person.id)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        self.assertTrue(batchnav.has_multiple_pages)
+        self.assertEqual(self.people[:2], list(batchnav.currentBatch()))
+        form = self.getNextBatchForm(batchnav)
+        self.assertEqual('[%d]' % self.people[1].id, form['memo'])
+        with StormStatementRecorder() as recorder:
+            batchnav = BatchNavigator(
+                resultset, LaunchpadTestRequest(form=form), size=2)
+            self.assertEqual(self.people[2:4], list(batchnav.currentBatch()))
+        for statement in recorder.statements:
+            self.assertNotIn('OFFSET', statement)
+
+    def test_batches_by_enum_memo(self):
+        # Enum items are represented in memos by their database values.
+        for person in (self.people[0], self.people[3]):
+            removeSecurityProxy(person).personal_standing = (
+                PersonalStanding.GOOD)
+        resultset = self.makeResultSet(Person.personal_standing, Person.id)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        form = self.getNextBatchForm(batchnav)
+        self.assertEqual(
+            '[%d, %d]' % (PersonalStanding.UNKNOWN.value, self.people[2].id),
+            form['memo'])
+        batchnav = BatchNavigator(
+            resultset, LaunchpadTestRequest(form=form), size=2)
+        self.assertEqual(
+            [self.people[4], self.people[0]], list(batchnav.currentBatch()))
+
+    def test_opt_in_and_out(self):
+        # Keyset batching is on by default, but views can opt out, and
+        # opt in if it is turned off.
+        resultset = self.makeResultSet(Person.id)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        self.assertTrue(self.isKeysetMemo(batchnav))
+        batchnav = BatchNavigator(
+            resultset, LaunchpadTestRequest(), size=2, keyset=False)
+        self.assertFalse(self.isKeysetMemo(batchnav))
+        self.pushConfig('launchpad', keyset_batching=False)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        self.assertFalse(self.isKeysetMemo(batchnav))
+        batchnav = BatchNavigator(
+            resultset, LaunchpadTestRequest(), size=2, keyset=True)
+        self.assertTrue(self.isKeysetMemo(batchnav))
+
+    def test_offset_memo(self):
+        # URLs from OFFSET batching, such as old bookmarks, are still
+        # batched by OFFSET rather than taken to the first page.
+        resultset = self.makeResultSet(Person.id)
+        request = LaunchpadTestRequest(form={'memo': '2', 'start': '2'})
+        batchnav = BatchNavigator(resultset, request, size=2)
+        self.assertEqual(self.people[2:4], list(batchnav.currentBatch()))
+        self.assertFalse(self.isKeysetMemo(batchnav))
+
+    def test_single_page_not_counted(self):
+        resultset = self.makeResultSet(Person.id)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=5)
+        with StormStatementRecorder() as recorder:
+            self.assertFalse(batchnav.has_multiple_pages)
+        for statement in recorder.statements:
+            self.assertNotIn('COUNT', statement.upper())
+
+    def test_estimated_total(self):
+        resultset = self.makeResultSet(Person.id)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        self.assertEqual(5, batchnav.batch.total())
+        # Large result sets report the planner's estimate.
+        self.pushConfig('launchpad', batch_count_estimate_threshold=1)
+        range_factory = StormRangeFactory(resultset)
+        batchnav = BatchNavigator(resultset, LaunchpadTestRequest(), size=2)
+        self.assertEqual(
+            range_factory.rough_length, batchnav.batch.total())
@@ -0,0 +1,154 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for per-page statistics."""
+
+__metaclass__ = type
+
+import threading
+
+from timeline import Timeline
+
+from lp.services.timeline.requesttimeline import set_request_timeline
+from lp.services.webapp.opstats import (
+    OpStats,
+    PageStatsView,
+    )
+from lp.services.webapp.pagestats import (
+    get_page_stats,
+    Histogram,
+    record_page_stats,
+    reset_page_stats,
+    )
+from lp.services.webapp.servers import LaunchpadTestRequest
+from lp.testing import TestCase
+from lp.testing.layers import FunctionalLayer
+
+
+class TestHistogram(TestCase):
+
+    def test_small_values_exact(self):
+        histogram = Histogram()
+        for value in range(16):
+            histogram.record(value)
+        self.assertEqual(
+            [(value, value + 1) for value in range(16)],
+            histogram.buckets())
+
+    def test_bucket_bounds(self):
+        # Buckets are never wider than 1/16 of their lower bound.
+        for value in (16, 17, 100, 1000, 12345, 10 ** 9):
+            lower, upper = Histogram.bucketBounds(value)
+            self.assertTrue(lower <= value <= upper)
+            self.assertTrue(upper - lower < lower / 16.0)
+        self.assertEqual((96, 99), Histogram.bucketBounds(99))
+        self.assertEqual((96, 99), Histogram.bucketBounds(96))
+        self.assertEqual((100, 103), Histogram.bucketBounds(100))
+
+    def test_quantiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+        self.assertEqual(1000, histogram.count)
+        self.assertEqual(500500, histogram.total)
+        self.assertEqual(1000, histogram.max)
+        self.assertTrue(500 <= histogram.quantile(0.5) <= 500 * 17 / 16)
+        self.assertTrue(990 <= histogram.quantile(0.99) <= 1000)
+        self.assertEqual(1000, histogram.quantile(1))
+        self.assertEqual(0, Histogram().quantile(0.5))
+
+    def test_merge(self):
+        first = Histogram()
+        second = Histogram()
+        first.record(3)
+        second.record(3)
+        second.record(5000)
+        first.merge(second)
+        self.assertEqual(3, first.count)
+        self.assertEqual(5006, first.total)
+        self.assertEqual(5000, first.max)
+        self.assertEqual([(3, 2), (5119, 3)], first.buckets())
+
+
+class TestRecordPageStats(TestCase):
+
+    layer = FunctionalLayer
+
+    def setUp(self):
+        super(TestRecordPageStats, self).setUp()
+        reset_page_stats()
+        self.addCleanup(reset_page_stats)
+
+    def makeRequest(self, pageid='Foo:+bar'):
+        request = LaunchpadTestRequest()
+        request.setInWSGIEnvironment('launchpad.pageid', pageid)
+        timeline = Timeline()
+        for category in ('SQL-main-slave', 'SQL-main-slave', 'SQL-nostore',
+                         'librarian-connection'):
+            timeline.start(category, 'detail').finish()
+        set_request_timeline(request, timeline)
+        self.addCleanup(set_request_timeline, request, Timeline())
+        return request
+
+    def test_records_metrics(self):
+        record_page_stats(self.makeRequest(), 0.25)
+        stats = get_page_stats()
+        self.assertEqual(['Foo:+bar'], stats.keys())
+        metrics = stats['Foo:+bar']
+        self.assertEqual(250, metrics['duration_ms'].max)
+        self.assertEqual(2, metrics['sql_statements'].max)
+        self.assertEqual(1, metrics['sql_time_ms'].count)
+        self.assertEqual(1, metrics['remote_time_ms'].count)
+
+    def test_merges_threads(self):
+        request = self.makeRequest()
+        record_page_stats(request, 0.1)
+        thread = threading.Thread(
+            target=record_page_stats, args=(request, 0.2))
+        thread.start()
+        thread.join()
+        self.assertEqual(2, get_page_stats()['Foo:+bar']['duration_ms'].count)
+
+    def test_page_limit(self):
+        self.pushConfig('launchpad', page_stats_max_pages=1)
+        record_page_stats(self.makeRequest('Foo:+bar'), 0.1)
+        record_page_stats(self.makeRequest('Foo:+baz'), 0.1)
+        self.assertEqual(['Foo:+bar', 'Other'], sorted(get_page_stats()))
+
+    def test_disabled(self):
+        self.pushConfig('launchpad', page_stats_max_pages=0)
+        record_page_stats(self.makeRequest(), 0.1)
+        self.assertEqual({}, get_page_stats())
+
+    def test_reset_by_opstats(self):
+        record_page_stats(self.makeRequest(), 0.1)
+        OpStats.resetStats()
+        self.assertEqual({}, get_page_stats())
+
+    def test_xmlrpc_summary(self):
+        record_page_stats(self.makeRequest(), 0.1)
+        record_page_stats(self.makeRequest(), 0.3)
+        summary = OpStats(None, LaunchpadTestRequest()).pagestats()
+        duration = summary['Foo:+bar']['duration_ms']
+        self.assertEqual(2, duration['count'])
+        self.assertEqual(400.0, duration['sum'])
+        self.assertEqual(300, duration['max'])
+        self.assertTrue(96 <= duration['p50'] <= 103)
+
+    def test_prometheus_view(self):
+        record_page_stats(self.makeRequest('Foo:+"bar"'), 0.005)
+        request = LaunchpadTestRequest()
+        lines = PageStatsView(None, request)().splitlines()
+        self.assertIn('# TYPE launchpad_page_duration_ms histogram', lines)
+        self.assertIn(
+            'launchpad_page_duration_ms_bucket'
+            '{pageid="Foo:+\\"bar\\"",le="5"} 1', lines)
+        self.assertIn(
+            'launchpad_page_duration_ms_bucket'
+            '{pageid="Foo:+\\"bar\\"",le="+Inf"} 1', lines)
+        self.assertIn(
+            'launchpad_page_sql_statements_count{pageid="Foo:+\\"bar\\""} 1',
+            lines)
+        self.assertEqual(
+            'text/plain; version=0.0.4; charset=US-ASCII',
+            request.response.getHeader('Content-Type'))
@@ -5,9 +5,12 @@
 
 __metaclass__ = type
 
+import cPickle as pickle
 import hashlib
 from unittest import TestCase
 
+import tickcount
+import transaction
 from zope.publisher.browser import TestRequest
 from zope.security.management import (
     endInteraction,
@@ -18,10 +21,13 @@ from zope.session.interfaces import (
     ISessionDataContainer,
     )
 
+from lp.services.config import config
 from lp.services.webapp.pgsession import (
     PGSessionData,
     PGSessionDataContainer,
     )
+from lp.services.webapp.publication import LaunchpadBrowserPublication
+from lp.services.webapp.servers import LaunchpadTestRequest
 from lp.testing.layers import (
     LaunchpadFunctionalLayer,
     LaunchpadLayer,
@@ -166,3 +172,146 @@ class TestPgSession(TestCase):
 
         # also see the page test xx-no-anonymous-session-cookies for tests of
         # the cookie behaviour.
+
+
+class TestPgSessionWriteBehind(TestCase):
+    layer = LaunchpadFunctionalLayer
+
+    def setUp(self):
+        config.push('write-behind', """
+            [launchpad_session]
+            write_behind: True
+            touch_batch_size: 2
+            """)
+        self.addCleanup(config.pop, 'write-behind')
+        self.sdc = PGSessionDataContainer()
+        LaunchpadLayer.resetSessionDb()
+        self.startRequest()
+        self.addCleanup(endInteraction)
+        # Don't leave changes to be written back by another test.
+        self.addCleanup(transaction.abort)
+
+    def startRequest(self, request=None):
+        endInteraction()
+        self.request = request if request is not None else TestRequest()
+        newInteraction(self.request)
+
+    def endRequest(self):
+        transaction.commit()
+
+    def countRows(self, table_name):
+        return self.sdc.store.execute(
+            "SELECT COUNT(*) FROM %s" % table_name).get_one()[0]
+
+    def test_writes_deferred_until_commit(self):
+        pkgdata = self.sdc['Client Id']['Product Id']
+        pkgdata['key1'] = 'value1'
+        pkgdata['key2'] = 'value2'
+        self.assertEqual(0, self.countRows('SessionData'))
+        self.assertEqual(0, self.countRows('SessionPkgData'))
+        # Later in the same request the changes are visible.
+        self.assertEqual(
+            'value1', self.sdc['Client Id']['Product Id']['key1'])
+        self.endRequest()
+        self.assertEqual(1, self.countRows('SessionData'))
+        self.assertEqual(2, self.countRows('SessionPkgData'))
+
+        self.startRequest()
+        pkgdata = self.sdc['Client Id']['Product Id']
+        del pkgdata['key1']
+        self.endRequest()
+        self.assertEqual(1, self.countRows('SessionPkgData'))
+
+    def test_writes_discarded_on_abort(self):
+        self.sdc['Client Id']['Product Id']['key'] = 'value'
+        transaction.abort()
+        self.assertEqual(0, self.countRows('SessionData'))
+
+    def test_writes_after_commit_part_way_through_request(self):
+        # Views may commit part way through a request.  Changes made
+        # after that are written back by the next commit.
+        pkgdata = self.sdc['Client Id']['Product Id']
+        pkgdata['key1'] = 'value1'
+        transaction.commit()
+        pkgdata['key2'] = 'value2'
+        transaction.commit()
+        self.assertEqual(2, self.countRows('SessionPkgData'))
+
+    def test_written_back_by_publication(self):
+        # Publishing a POST request commits the changes made during it,
+        # so they survive the next request starting a new transaction.
+        self.startRequest(LaunchpadTestRequest(method='POST'))
+        self.sdc['Client Id']['Product Id']['key'] = 'value'
+        self.request._publicationticks_start = tickcount.tickcount()
+        LaunchpadBrowserPublication(None).afterCall(self.request, None)
+        transaction.abort()
+        transaction.begin()
+        self.startRequest()
+        self.assertEqual(1, self.countRows('SessionPkgData'))
+        self.assertEqual('value', self.sdc['Client Id']['Product Id']['key'])
+
+    def test_writes_immediately_outside_request(self):
+        endInteraction()
+        self.sdc['Client Id']['Product Id']['key'] = 'value'
+        self.assertEqual(1, self.countRows('SessionPkgData'))
+
+    def test_cache_validated_by_version(self):
+        self.sdc['Client Id']['Product Id']['key'] = 'value'
+        self.endRequest()
+        self.assertEqual(1, len(self.sdc.cache))
+
+        # Changing the data without changing the version isn't noticed,
+        # since the cached copy is used.
+        store = self.sdc.store
+        store.execute(
+            "UPDATE SessionPkgData SET pickle = ?",
+            (pickle.dumps('other', pickle.HIGHEST_PROTOCOL),),
+            noresult=True)
+        self.startRequest()
+        self.assertEqual('value', self.sdc['Client Id']['Product Id']['key'])
+
+        # Once the version changes the data is read again.
+        store.execute(
+            "UPDATE SessionData "
+            "SET version = nextval('sessiondata_version_seq')",
+            noresult=True)
+        self.startRequest()
+        self.assertEqual('other', self.sdc['Client Id']['Product Id']['key'])
+
+    def test_concurrent_change_not_cached(self):
+        # If somebody else changed the session since it was read, the
+        # written-back data isn't cached since it may be incomplete.
+        pkgdata = self.sdc['Client Id']['Product Id']
+        self.sdc.store.execute(
+            "SELECT ensure_session_client_id(?)",
+            (hashlib.sha256('Client Id').hexdigest(),), noresult=True)
+        pkgdata['key'] = 'value'
+        self.endRequest()
+        self.assertEqual(0, len(self.sdc.cache))
+
+    def test_touches_batched(self):
+        store = self.sdc.store
+        for client_id in ('Client Id #1', 'Client Id #2'):
+            store.execute("""
+                INSERT INTO SessionData (client_id, last_accessed)
+                VALUES (?, CURRENT_TIMESTAMP - '1 day'::interval)
+                """, (hashlib.sha256(client_id).hexdigest(),),
+                noresult=True)
+
+        def count_stale():
+            return store.execute("""
+                SELECT COUNT(*) FROM SessionData
+                WHERE last_accessed < CURRENT_TIMESTAMP - '1 hour'::interval
+                """).get_one()[0]
+
+        self.sdc['Client Id #1']
+        self.sdc['Client Id #1']
+        self.assertEqual(1, len(self.sdc.touches))
+        self.endRequest()
+        self.assertEqual(2, count_stale())
+
+        self.startRequest()
+        self.sdc['Client Id #2']
+        self.endRequest()
+        self.assertEqual(0, len(self.sdc.touches))
+        self.assertEqual(0, count_stale())
@@ -55,6 +55,9 @@ from lp.translations.interfaces.translationimporter import (
 from lp.translations.interfaces.translationimportqueue import (
     ITranslationImportQueue,
     )
+from lp.translations.interfaces.translationmessage import (
+    ITranslationMessageSet,
+    )
 from lp.translations.interfaces.translationsperson import ITranslationsPerson
 
 
@@ -613,6 +616,7 @@ class POFileTranslateView(BaseTranslationView, POFileMetadataViewMixin):
     def _buildTranslationMessageViews(self, for_potmsgsets):
         """Build translation message views for all potmsgsets given."""
         can_edit = self.context.canEditTranslations(self.user)
+        views = []
         for potmsgset in for_potmsgsets:
             translationmessage = (
                 potmsgset.getCurrentTranslationMessageOrDummy(self.context))
@@ -622,7 +626,26 @@ class POFileTranslateView(BaseTranslationView, POFileMetadataViewMixin):
                 CurrentTranslationMessageView, translationmessage,
                 pofile=self.context, can_edit=can_edit, error=error)
             view.zoomed_in_view = False
-            self.translationmessage_views.append(view)
+            views.append(view)
+        self.translationmessage_views.extend(views)
+
+        # Suggestions are only shown to those who can submit them.  With
+        # the suggestion index, find the external ones for the whole page
+        # in one query.
+        if (views and self.form_is_writeable and
+                config.rosetta.suggestion_index_enabled):
+            used_languages = [self.context.language]
+            if views[0].sec_lang is not None:
+                used_languages.append(views[0].sec_lang)
+            message_set = getUtility(ITranslationMessageSet)
+            suggestions = (
+                message_set.getExternallySuggestedOrUsedTranslationMessages(
+                    [message_view.context.potmsgset for message_view in views],
+                    suggested_languages=[self.context.language],
+                    used_languages=used_languages))
+            for view in views:
+                view.external_suggestions = suggestions[
+                    view.context.potmsgset]
 
     def _submitTranslations(self):
         """See BaseTranslationView._submitTranslations."""
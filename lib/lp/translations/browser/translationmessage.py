@@ -970,6 +970,11 @@ class CurrentTranslationMessageView(LaunchpadView):
     template = ViewPageTemplateFile(
         '../templates/currenttranslationmessage-translate-one.pt')
 
+    # The result of getExternallySuggestedOrUsedTranslationMessages for
+    # this message, if the parent view fetched it along with those of the
+    # other messages on the page.
+    external_suggestions = None
+
     def __init__(self, current_translation_message, request,
                  plural_indices_to_store, translations, force_suggestion,
                  force_diverge, error, second_lang_code, form_is_writeable,
@@ -1267,10 +1272,13 @@ class CurrentTranslationMessageView(LaunchpadView):
             used_languages = [language]
             if self.sec_lang is not None:
                 used_languages.append(self.sec_lang)
-            translations = (
-                potmsgset.getExternallySuggestedOrUsedTranslationMessages(
-                    suggested_languages=[language],
-                    used_languages=used_languages))
+            if self.external_suggestions is not None:
+                translations = self.external_suggestions
+            else:
+                translations = (
+                    potmsgset.getExternallySuggestedOrUsedTranslationMessages(
+                        suggested_languages=[language],
+                        used_languages=used_languages))
 
             # Suggestions from other templates need full preloading,
             # including picking a POFile. preloadDetails requires that
@@ -344,6 +344,17 @@ class ITranslationMessageSet(Interface):
         :param order_by: An SQL ORDER BY clause.
         """
 
+    def getExternallySuggestedOrUsedTranslationMessages(
+        potmsgsets, suggested_languages=(), used_languages=()):
+        """Find external suggestions for several messages at once.
+
+        :param potmsgsets: The `POTMsgSet`s to find suggestions for.
+        :param suggested_languages: Languages we want suggestions for.
+        :param used_languages: Languages we want used messages for.
+        :return: A dict mapping each of `potmsgsets` to the result of its
+            `IPOTMsgSet.getExternallySuggestedOrUsedTranslationMessages`.
+        """
+
     def preloadDetails(messages, pofile=None, need_pofile=False,
                        need_potemplate=False, need_potemplate_context=False,
                        need_potranslation=False, need_potmsgset=False,
@@ -4,6 +4,7 @@
 __metaclass__ = type
 __all__ = [
     'credits_message_str',
+    'group_suggested_or_used',
     'POTMsgSet',
     ]
 
@@ -107,6 +108,25 @@ credits_message_str = (u'This is a dummy translation so that the '
 # Marker for "no incumbent message found yet."
 incumbent_unknown = object()
 
+SuggestedOrUsed = namedtuple('SuggestedOrUsed', 'suggested used')
+
+
+def group_suggested_or_used(messages):
+    """Group external suggestions by language and whether they are used.
+
+    :return: A mapping of language -> `SuggestedOrUsed`, as returned by
+        `IPOTMsgSet.getExternallySuggestedOrUsedTranslationMessages`.
+    """
+    result = defaultdict(lambda: SuggestedOrUsed([], []))
+    for message in messages:
+        in_use = message.is_current_ubuntu or message.is_current_upstream
+        language_result = result[message.language]
+        if in_use:
+            language_result.used.append(message)
+        else:
+            language_result.suggested.append(message)
+    return result
+
 
 def dictify_translations(translations):
     """Represent `translations` as a normalized dict.
@@ -381,6 +401,15 @@ class POTMsgSet(SQLBase):
         # because they are automatically translated.
         if self.is_translation_credit:
             return []
+        if config.rosetta.suggestion_index_enabled:
+            # Avoid circular imports.
+            from lp.translations.model.translationsuggestion import (
+                find_external_suggestions,
+                )
+
+            return find_external_suggestions(
+                [self], suggested_languages=suggested_languages,
+                used_languages=used_languages)[self.id]
         # Watch out when changing this condition: make sure it's done in
         # a way so that indexes are indeed hit when the query is executed.
         # Also note that there is a NOT(in_use_clause) index.
@@ -463,18 +492,9 @@ class POTMsgSet(SQLBase):
         # temp table and query twice, but as the list length is capped at
         # 2000, doing a single pass in python should be insignificantly
         # slower.
-        result_type = namedtuple('SuggestedOrUsed', 'suggested used')
-        result = defaultdict(lambda: result_type([], []))
-        for message in self._getExternalTranslationMessages(
+        return group_suggested_or_used(self._getExternalTranslationMessages(
             suggested_languages=suggested_languages,
-            used_languages=used_languages):
-            in_use = message.is_current_ubuntu or message.is_current_upstream
-            language_result = result[message.language]
-            if in_use:
-                language_result.used.append(message)
-            else:
-                language_result.suggested.append(message)
-        return result
+            used_languages=used_languages))
 
     @property
     def flags(self):
@@ -30,6 +30,7 @@ from lp.registry.interfaces.person import (
     IPersonSet,
     validate_public_person,
     )
+from lp.services.config import config
 from lp.services.database.bulk import (
     load,
     load_related,
@@ -545,6 +546,29 @@ class TranslationMessageSet:
         """See `ITranslationMessageSet`."""
         return TranslationMessage.select(where, orderBy=order_by)
 
+    def getExternallySuggestedOrUsedTranslationMessages(
+            self, potmsgsets, suggested_languages=(), used_languages=()):
+        """See `ITranslationMessageSet`."""
+        from lp.translations.model.potmsgset import group_suggested_or_used
+        from lp.translations.model.translationsuggestion import (
+            find_external_suggestions,
+            )
+
+        if not (config.rosetta.global_suggestions_enabled and
+                config.rosetta.suggestion_index_enabled):
+            return dict(
+                (potmsgset,
+                 potmsgset.getExternallySuggestedOrUsedTranslationMessages(
+                    suggested_languages=suggested_languages,
+                    used_languages=used_languages))
+                for potmsgset in potmsgsets)
+        suggestions = find_external_suggestions(
+            potmsgsets, suggested_languages=suggested_languages,
+            used_languages=used_languages)
+        return dict(
+            (potmsgset, group_suggested_or_used(suggestions[potmsgset.id]))
+            for potmsgset in potmsgsets)
+
     def preloadDetails(self, messages, pofile=None, need_pofile=False,
                        need_potemplate=False, need_potemplate_context=False,
                        need_potranslation=False, need_potmsgset=False,
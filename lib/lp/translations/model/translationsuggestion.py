@@ -0,0 +1,218 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""An index of translations to suggest from other templates.
+
+Finding external suggestions for a message used to mean finding every
+`POTMsgSet` in a suggestive template with the same English string, and
+then every distinct translation of those.  The TranslationSuggestion
+table holds the result of that search: for each English string, language
+and distinct set of translations, the most recent `TranslationMessage`
+that is in use and the most recent one that isn't.
+
+A trigger on TranslationMessage records new messages and changes to
+whether they are in use.  Templates starting or ceasing to be suggestive
+aren't tracked, and neither are older messages that become the most
+recent of their kind, so the garbo periodically rebuilds the index a
+range of English strings at a time.  Until a rebuild, suggestions whose
+message is no longer in a suggestive template, or no longer in the same
+use, are left out rather than replaced.  So are translations whose latest
+message belongs to the `POTMsgSet` asking for suggestions, which already
+shows its own messages.
+"""
+
+__metaclass__ = type
+__all__ = [
+    'find_external_suggestions',
+    'rebuild_translation_suggestions',
+    'TranslationSuggestion',
+    ]
+
+from collections import defaultdict
+
+import pytz
+from storm.expr import (
+    Join,
+    SQL,
+    )
+from storm.locals import (
+    Bool,
+    DateTime,
+    Int,
+    )
+from zope.security.proxy import removeSecurityProxy
+
+from lp.services.database.bulk import load_related
+from lp.services.database.interfaces import IStore
+from lp.services.database.sqlbase import quote
+from lp.services.database.stormbase import StormBase
+from lp.services.helpers import shortlist
+from lp.translations.interfaces.translations import TranslationConstants
+from lp.translations.model.pomsgid import POMsgID
+from lp.translations.model.potmsgset import POTMsgSet
+from lp.translations.model.translationmessage import TranslationMessage
+
+
+# The translations of a TranslationMessage, as stored in msgstrs.
+MSGSTRS_SQL = 'ARRAY[%s]' % ', '.join(
+    'COALESCE(TranslationMessage.msgstr%d, -1)' % form
+    for form in range(TranslationConstants.MAX_PLURAL_FORMS))
+
+IN_USE_SQL = (
+    "(TranslationMessage.is_current_ubuntu OR "
+    "TranslationMessage.is_current_upstream)")
+
+# Like `IPOTMsgSet.getExternallySuggestedOrUsedTranslationMessages`
+# without the index, warn about messages with more suggestions than
+# expected and refuse to return more than the hard limit.
+SUGGESTIONS_LONGEST_EXPECTED = 100
+SUGGESTIONS_HARD_LIMIT = 2000
+
+IN_SUGGESTIVE_TEMPLATE_SQL = """
+    EXISTS (
+        SELECT 1
+        FROM TranslationTemplateItem
+        JOIN SuggestivePOTemplate ON
+            SuggestivePOTemplate.potemplate =
+                TranslationTemplateItem.potemplate
+        WHERE
+            TranslationTemplateItem.potmsgset =
+                TranslationMessage.potmsgset)
+    """
+
+
+class TranslationSuggestion(StormBase):
+    """A distinct translation of an English string."""
+
+    __storm_table__ = 'TranslationSuggestion'
+
+    id = Int(primary=True)
+    msgid_singular_id = Int(name='msgid_singular', allow_none=False)
+    language_id = Int(name='language', allow_none=False)
+    in_use = Bool(allow_none=False)
+    translationmessage_id = Int(
+        name='translationmessage', allow_none=False)
+    date_created = DateTime(tzinfo=pytz.UTC, allow_none=False)
+
+
+def _language_clause(suggested_languages, used_languages):
+    """Match suggestions in the given languages and uses.
+
+    See `IPOTMsgSet.getExternallySuggestedOrUsedTranslationMessages`.
+    """
+    suggested = set(language.id for language in suggested_languages)
+    used = set(language.id for language in used_languages)
+    both = suggested & used
+    clauses = []
+    if both:
+        clauses.append(
+            'TranslationSuggestion.language IN %s' % quote(both))
+    if used - both:
+        clauses.append(
+            '(TranslationSuggestion.language IN %s AND '
+            'TranslationSuggestion.in_use)' % quote(used - both))
+    if suggested - both:
+        clauses.append(
+            '(TranslationSuggestion.language IN %s AND '
+            'NOT TranslationSuggestion.in_use)' % quote(suggested - both))
+    if not clauses:
+        return None
+    return '(%s)' % ' OR '.join(clauses)
+
+
+def find_external_suggestions(potmsgsets, suggested_languages=(),
+                              used_languages=()):
+    """Find the external suggestions for several messages at once.
+
+    :param potmsgsets: The `POTMsgSet`s to find suggestions for.
+    :param suggested_languages: Languages that unused suggestions should
+        be found for.
+    :param used_languages: Languages that used suggestions should be
+        found for.
+    :return: A dict mapping the ID of each `POTMsgSet` to a list of
+        `TranslationMessage`s from other `POTMsgSet`s.
+    :raises ShortListTooBigError: if a `POTMsgSet` has more than
+        `SUGGESTIONS_HARD_LIMIT` suggestions.
+    """
+    potmsgsets = [removeSecurityProxy(potmsgset) for potmsgset in potmsgsets]
+    # Translation credits are translated automatically.  Checking for them
+    # needs the English strings.
+    load_related(POMsgID, potmsgsets, ['msgid_singularID'])
+    potmsgset_ids = [
+        potmsgset.id for potmsgset in potmsgsets
+        if not potmsgset.is_translation_credit]
+    language_clause = _language_clause(suggested_languages, used_languages)
+    suggestions = defaultdict(list)
+    if not potmsgset_ids or language_clause is None:
+        return suggestions
+    origin = [
+        POTMsgSet,
+        Join(
+            TranslationSuggestion,
+            TranslationSuggestion.msgid_singular_id ==
+                POTMsgSet.msgid_singularID),
+        Join(
+            TranslationMessage,
+            TranslationMessage.id ==
+                TranslationSuggestion.translationmessage_id),
+        ]
+    rows = IStore(TranslationMessage).using(*origin).find(
+        (POTMsgSet.id, TranslationMessage),
+        POTMsgSet.id.is_in(potmsgset_ids),
+        TranslationMessage.potmsgsetID != POTMsgSet.id,
+        SQL(language_clause),
+        SQL('%s = TranslationSuggestion.in_use' % IN_USE_SQL),
+        SQL(IN_SUGGESTIVE_TEMPLATE_SQL))
+    # If there are more rows than this, at least one message is over the
+    # limit.
+    for potmsgset_id, message in rows[
+            :SUGGESTIONS_HARD_LIMIT * len(potmsgset_ids) + 1]:
+        suggestions[potmsgset_id].append(message)
+    for potmsgset_id, messages in suggestions.items():
+        suggestions[potmsgset_id] = shortlist(
+            messages, longest_expected=SUGGESTIONS_LONGEST_EXPECTED,
+            hardlimit=SUGGESTIONS_HARD_LIMIT)
+    return suggestions
+
+
+def rebuild_translation_suggestions(store, first_msgid, last_msgid):
+    """Rebuild the index for a range of English strings.
+
+    :param first_msgid: The lowest `POMsgID` ID to rebuild.
+    :param last_msgid: The highest `POMsgID` ID to rebuild.
+    """
+    store.execute(
+        "DELETE FROM TranslationSuggestion "
+        "WHERE msgid_singular BETWEEN ? AND ?", (first_msgid, last_msgid))
+    # Messages may be created or change use while we rebuild, so the
+    # trigger may already have recorded newer ones.
+    store.execute("""
+        INSERT INTO TranslationSuggestion (
+            msgid_singular, language, in_use, msgstrs, translationmessage,
+            date_created)
+        SELECT DISTINCT ON (
+                POTMsgSet.msgid_singular, TranslationMessage.language,
+                %(in_use)s, %(msgstrs)s)
+            POTMsgSet.msgid_singular, TranslationMessage.language,
+            %(in_use)s, %(msgstrs)s, TranslationMessage.id,
+            TranslationMessage.date_created
+        FROM POTMsgSet
+        JOIN TranslationMessage ON
+            TranslationMessage.potmsgset = POTMsgSet.id
+        WHERE
+            POTMsgSet.msgid_singular BETWEEN ? AND ?
+            AND %(suggestive)s
+        ORDER BY
+            POTMsgSet.msgid_singular, TranslationMessage.language,
+            %(in_use)s, %(msgstrs)s, TranslationMessage.date_created DESC
+        ON CONFLICT (msgid_singular, language, in_use, msgstrs) DO UPDATE
+            SET
+                translationmessage = EXCLUDED.translationmessage,
+                date_created = EXCLUDED.date_created
+            WHERE
+                TranslationSuggestion.date_created <= EXCLUDED.date_created
+        """ % {
+            'in_use': IN_USE_SQL,
+            'msgstrs': MSGSTRS_SQL,
+            'suggestive': IN_SUGGESTIVE_TEMPLATE_SQL,
+            }, (first_msgid, last_msgid))
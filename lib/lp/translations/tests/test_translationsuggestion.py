@@ -0,0 +1,146 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the TranslationSuggestion index."""
+
+__metaclass__ = type
+
+from testtools.matchers import Equals
+from zope.component import getUtility
+from zope.security.proxy import removeSecurityProxy
+
+from lp.app.enums import ServiceUsage
+from lp.services.database.interfaces import IStore
+from lp.services.helpers import ShortListTooBigError
+from lp.services.worlddata.interfaces.language import ILanguageSet
+from lp.testing import (
+    monkey_patch,
+    StormStatementRecorder,
+    TestCaseWithFactory,
+    )
+from lp.testing.layers import LaunchpadZopelessLayer
+from lp.testing.matchers import HasQueryCount
+from lp.translations.interfaces.potemplate import IPOTemplateSet
+from lp.translations.interfaces.translationmessage import (
+    ITranslationMessageSet,
+    )
+from lp.translations.model import translationsuggestion
+from lp.translations.model.translationsuggestion import (
+    rebuild_translation_suggestions,
+    TranslationSuggestion,
+    )
+
+
+class TestTranslationSuggestionIndex(TestCaseWithFactory):
+
+    layer = LaunchpadZopelessLayer
+
+    def setUp(self):
+        super(TestTranslationSuggestionIndex, self).setUp()
+        self.pushConfig('rosetta', suggestion_index_enabled=True)
+        self.nl = getUtility(ILanguageSet).getLanguageByCode('nl')
+        self.foo_nl = self.makePOFile()
+        self.bar_nl = self.makePOFile()
+        getUtility(IPOTemplateSet).populateSuggestivePOTemplatesCache()
+
+    def makePOFile(self):
+        product = self.factory.makeProduct(
+            translations_usage=ServiceUsage.LAUNCHPAD)
+        template = self.factory.makePOTemplate(
+            self.factory.makeProductSeries(product=product))
+        return self.factory.makePOFile('nl', potemplate=template)
+
+    def makePOTMsgSets(self, text):
+        return (
+            self.factory.makePOTMsgSet(self.foo_nl.potemplate, text),
+            self.factory.makePOTMsgSet(self.bar_nl.potemplate, text))
+
+    def getSuggestions(self, potmsgset):
+        return potmsgset.getExternallySuggestedOrUsedTranslationMessages(
+            suggested_languages=[self.nl], used_languages=[self.nl])[self.nl]
+
+    def test_used_and_suggested(self):
+        foomsg, barmsg = self.makePOTMsgSets("error message 936")
+        used = self.factory.makeCurrentTranslationMessage(
+            pofile=self.bar_nl, potmsgset=barmsg)
+        suggested = self.factory.makeSuggestion(
+            pofile=self.bar_nl, potmsgset=barmsg)
+        self.assertEqual(
+            ([suggested], [used]), self.getSuggestions(foomsg))
+        self.assertEqual(
+            [used], foomsg.getExternallyUsedTranslationMessages(self.nl))
+
+    def test_own_messages_excluded(self):
+        foomsg, barmsg = self.makePOTMsgSets("error message 937")
+        self.factory.makeCurrentTranslationMessage(
+            pofile=self.foo_nl, potmsgset=foomsg)
+        self.assertEqual(([], []), self.getSuggestions(foomsg))
+
+    def test_identical_translations_deduplicated(self):
+        # Only the latest of identical translations is offered.
+        foomsg, barmsg = self.makePOTMsgSets("error message 938")
+        other_nl = self.makePOFile()
+        getUtility(IPOTemplateSet).populateSuggestivePOTemplatesCache()
+        othermsg = self.factory.makePOTMsgSet(
+            other_nl.potemplate, "error message 938")
+        old = self.factory.makeSuggestion(
+            pofile=self.bar_nl, potmsgset=barmsg, translations=[u'fout'])
+        new = self.factory.makeSuggestion(
+            pofile=other_nl, potmsgset=othermsg, translations=[u'fout'])
+        self.assertNotEqual(old, new)
+        self.assertEqual(([new], []), self.getSuggestions(foomsg))
+
+    def test_change_of_use(self):
+        foomsg, barmsg = self.makePOTMsgSets("error message 939")
+        suggestion = self.factory.makeSuggestion(
+            pofile=self.bar_nl, potmsgset=barmsg)
+        removeSecurityProxy(suggestion).is_current_upstream = True
+        IStore(suggestion).flush()
+        self.assertEqual(([], [suggestion]), self.getSuggestions(foomsg))
+
+    def test_rebuild(self):
+        foomsg, barmsg = self.makePOTMsgSets("error message 940")
+        used = self.factory.makeCurrentTranslationMessage(
+            pofile=self.bar_nl, potmsgset=barmsg)
+        store = IStore(TranslationSuggestion)
+        msgid = foomsg.msgid_singular.id
+        store.find(
+            TranslationSuggestion, msgid_singular_id=msgid).remove()
+        self.assertEqual(([], []), self.getSuggestions(foomsg))
+        rebuild_translation_suggestions(store, msgid, msgid)
+        self.assertEqual(([], [used]), self.getSuggestions(foomsg))
+
+    def test_batch_fetch(self):
+        potmsgsets = []
+        expected = {}
+        for text in ("error message 941", "error message 942"):
+            foomsg, barmsg = self.makePOTMsgSets(text)
+            potmsgsets.append(foomsg)
+            used = self.factory.makeCurrentTranslationMessage(
+                pofile=self.bar_nl, potmsgset=barmsg)
+            expected[foomsg] = ([], [used])
+        message_set = getUtility(ITranslationMessageSet)
+        with StormStatementRecorder() as recorder:
+            suggestions = (
+                message_set.getExternallySuggestedOrUsedTranslationMessages(
+                    potmsgsets, suggested_languages=[self.nl],
+                    used_languages=[self.nl]))
+        # One query for the English strings and one for the suggestions.
+        self.assertThat(recorder, HasQueryCount(Equals(2)))
+        for potmsgset in potmsgsets:
+            self.assertEqual(
+                expected[potmsgset], suggestions[potmsgset][self.nl])
+
+    def test_hard_limit(self):
+        # As without the index, a message with too many suggestions is an
+        # error rather than an unbounded list.
+        foomsg, barmsg = self.makePOTMsgSets("error message 943")
+        for translation in (u'fout', u'fouten'):
+            self.factory.makeSuggestion(
+                pofile=self.bar_nl, potmsgset=barmsg,
+                translations=[translation])
+        with monkey_patch(translationsuggestion, SUGGESTIONS_HARD_LIMIT=2):
+            self.assertEqual(2, len(self.getSuggestions(foomsg)[0]))
+        with monkey_patch(translationsuggestion, SUGGESTIONS_HARD_LIMIT=1):
+            self.assertRaises(
+                ShortListTooBigError, self.getSuggestions, foomsg)
@@ -0,0 +1,127 @@
+#!/usr/bin/python -S
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Compare OFFSET batching with keyset batching on deep pages.
+
+This fetches the first page and a deep page of a large table ordered by
+descending ID, as a listing's `BatchNavigator` would, first using OFFSET
+and then using the sort key memos of `StormRangeFactory`.  It also times
+counting the rows against the planner's estimate.
+"""
+
+__metaclass__ = type
+
+import _pythonpath
+
+import time
+
+import simplejson
+from storm.expr import Desc
+
+from lp.bugs.model.bug import Bug
+from lp.code.model.branch import Branch
+from lp.services.database.interfaces import IStore
+from lp.services.scripts.base import (
+    LaunchpadScript,
+    LaunchpadScriptFailure,
+    )
+from lp.services.webapp.batching import (
+    BatchNavigator,
+    StormRangeFactory,
+    )
+from lp.services.webapp.servers import LaunchpadTestRequest
+from lp.soyuz.model.archive import Archive
+
+
+TABLES = {
+    'archive': Archive,
+    'branch': Branch,
+    'bug': Bug,
+    }
+
+
+class BenchmarkBatching(LaunchpadScript):
+
+    description = "Benchmark OFFSET and keyset batching."
+
+    def add_my_options(self):
+        self.parser.add_option(
+            "-t", "--table", default="bug", choices=sorted(TABLES),
+            help="Table to list (default: %default).")
+        self.parser.add_option(
+            "-s", "--size", type="int", default=75,
+            help="Batch size (default: %default).")
+        self.parser.add_option(
+            "-p", "--page", type="int", default=1000,
+            help="Deep page to fetch (default: %default).")
+        self.parser.add_option(
+            "--repeat", type="int", default=3,
+            help="Report the best of this many runs (default: %default).")
+
+    def timeIt(self, function):
+        best = None
+        for _ in range(self.options.repeat):
+            start = time.time()
+            result = function()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, result
+
+    def makeResultSet(self):
+        cls = TABLES[self.options.table]
+        return IStore(cls).find(cls).order_by(Desc(cls.id))
+
+    def fetchPage(self, form, keyset):
+        resultset = self.makeResultSet()
+        if keyset:
+            range_factory = StormRangeFactory(resultset)
+        else:
+            range_factory = None
+        form = dict(form, batch=str(self.options.size))
+        batchnav = BatchNavigator(
+            resultset, LaunchpadTestRequest(form=form),
+            range_factory=range_factory, keyset=False)
+        return [item.id for item in batchnav.currentBatch()]
+
+    def main(self):
+        size = self.options.size
+        start = (self.options.page - 1) * size
+        deep_offset = {'start': str(start)}
+        previous = self.fetchPage(
+            {'start': str(start - size)}, keyset=False)
+        if not previous:
+            raise LaunchpadScriptFailure(
+                "%s has fewer than %d pages" % (
+                    self.options.table, self.options.page))
+        deep_keyset = dict(
+            deep_offset, memo=simplejson.dumps([previous[-1]]))
+
+        results = {}
+        for name, form, keyset in (
+                ('page 1, OFFSET', {}, False),
+                ('page 1, keyset', {}, True),
+                ('page %d, OFFSET' % self.options.page, deep_offset, False),
+                ('page %d, keyset' % self.options.page, deep_keyset, True)):
+            elapsed, ids = self.timeIt(
+                lambda: self.fetchPage(form, keyset))
+            results[name] = ids
+            self.logger.info("%-20s %8.3fs", name + ":", elapsed)
+        if (results['page %d, OFFSET' % self.options.page] !=
+                results['page %d, keyset' % self.options.page]):
+            raise LaunchpadScriptFailure("Keyset batch disagrees with OFFSET")
+
+        resultset = self.makeResultSet()
+        count_time, count = self.timeIt(resultset.count)
+        estimate_time, estimate = self.timeIt(
+            lambda: StormRangeFactory(resultset).rough_length)
+        self.logger.info(
+            "%-20s %8.3fs (%d rows)", "COUNT(*):", count_time, count)
+        self.logger.info(
+            "%-20s %8.3fs (%d rows)", "Planner estimate:", estimate_time,
+            estimate)
+
+
+if __name__ == '__main__':
+    BenchmarkBatching('benchmark-batching').run()
@@ -0,0 +1,82 @@
+#!/usr/bin/python -S
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Compare read_deb with 'ar t' plus apt_inst for inspecting .debs.
+
+This times the work that the upload processor does to check each binary
+package: listing its members, extracting the control file and walking
+the control and data tarballs for timestamps.
+"""
+
+__metaclass__ = type
+
+import _pythonpath
+
+from optparse import OptionParser
+import subprocess
+import time
+
+import apt_inst
+
+from lp.archiveuploader.debreader import read_deb
+
+
+def inspect_with_apt_inst(path):
+    members = subprocess.check_output(["ar", "t", path]).strip().split("\n")
+    deb_file = apt_inst.DebFile(path)
+    control = deb_file.control.extractdata("control")
+    timestamps = {}
+
+    def callback(member, data):
+        timestamps[member.name] = member.mtime
+
+    deb_file.control.go(callback)
+    deb_file.data.go(callback)
+    return members, control, timestamps
+
+
+def inspect_with_read_deb(path):
+    timestamps = {}
+
+    def callback(name, mtime):
+        timestamps[name] = mtime
+
+    contents = read_deb(path, tar_member_callback=callback)
+    return contents.members, contents.control, timestamps
+
+
+def time_it(function, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        results = [function(path) for path in paths]
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, results
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] DEB...")
+    parser.add_option(
+        "--repeat", type="int", default=3,
+        help="Report the best of this many runs (default: %default).")
+    options, paths = parser.parse_args()
+    if not paths:
+        parser.error("No .debs given.")
+
+    apt_time, apt_results = time_it(
+        inspect_with_apt_inst, paths, options.repeat)
+    reader_time, reader_results = time_it(
+        inspect_with_read_deb, paths, options.repeat)
+    if apt_results != reader_results:
+        raise AssertionError("read_deb disagrees with apt_inst")
+    print("%d packages" % len(paths))
+    print("ar t + apt_inst: %8.3fs" % apt_time)
+    print("read_deb:        %8.3fs (%.1fx)" % (
+        reader_time, apt_time / max(reader_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python -S
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Compare GitRefMatcher with per-rule fnmatch over a large ref set.
+
+This approximates a push to a large mirror: by default 10000 ref paths
+are checked against 50 rules, a mix of exact and wildcard patterns.
+"""
+
+__metaclass__ = type
+
+import _pythonpath
+
+from fnmatch import fnmatch
+from optparse import OptionParser
+import random
+import time
+
+from lp.code.model.gitrule import GitRefMatcher
+
+
+def make_ref_patterns(count):
+    ref_patterns = [u"refs/heads/master", u"refs/tags/*"]
+    while len(ref_patterns) < count:
+        n = len(ref_patterns)
+        ref_patterns.extend([
+            u"refs/heads/team-%d/*" % n,
+            u"refs/heads/release-%d.?" % n,
+            u"refs/heads/branch-%d" % n,
+            ])
+    return ref_patterns[:count]
+
+
+def make_ref_paths(count, seed):
+    rng = random.Random(seed)
+    ref_paths = []
+    for i in range(count):
+        kind = rng.choice(["team-%d/topic-%d", "release-%d.%d", "branch-%d"])
+        if kind.count("%d") == 2:
+            name = kind % (rng.randint(0, 60), i % 10)
+        else:
+            name = kind % rng.randint(0, 60)
+        if rng.random() < 0.1:
+            ref_paths.append(b"refs/tags/v%d" % i)
+        else:
+            ref_paths.append(b"refs/heads/" + name)
+    return ref_paths
+
+
+def time_it(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--refs", type="int", default=10000,
+        help="Number of ref paths to check (default: %default).")
+    parser.add_option(
+        "--rules", type="int", default=50,
+        help="Number of rules to check against (default: %default).")
+    parser.add_option(
+        "--repeat", type="int", default=3,
+        help="Report the best of this many runs (default: %default).")
+    parser.add_option(
+        "--seed", type="int", default=0,
+        help="Random seed for generating ref paths (default: %default).")
+    options, _ = parser.parse_args()
+
+    ref_patterns = make_ref_patterns(options.rules)
+    ref_paths = make_ref_paths(options.refs, options.seed)
+    encoded_patterns = [
+        ref_pattern.encode("UTF-8") for ref_pattern in ref_patterns]
+
+    def naive():
+        return [
+            tuple(
+                index for index, pattern in enumerate(encoded_patterns)
+                if fnmatch(ref_path, pattern))
+            for ref_path in ref_paths]
+
+    def compiled():
+        matcher = GitRefMatcher(ref_patterns)
+        return [matcher.match(ref_path) for ref_path in ref_paths]
+
+    naive_time, naive_result = time_it(naive, options.repeat)
+    compiled_time, compiled_result = time_it(compiled, options.repeat)
+    if naive_result != compiled_result:
+        raise AssertionError("GitRefMatcher disagrees with fnmatch")
+    print("%d refs x %d rules" % (len(ref_paths), len(ref_patterns)))
+    print("fnmatch:       %8.3fs" % naive_time)
+    print("GitRefMatcher: %8.3fs (%.1fx)" % (
+        compiled_time, naive_time / max(compiled_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/python -S
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Compare sorting publications by version key with sorting by comparison.
+
+This sorts the publications that the dominator would consider for a
+distroseries and pocket, grouped by package name as `_sortPackages`
+does, first with the old `apt_pkg.version_compare` comparison function
+and then with `GeneralizedPublication.sortPublications`.
+"""
+
+__metaclass__ = type
+
+import _pythonpath
+
+from collections import defaultdict
+import time
+
+import apt_pkg
+from zope.component import getUtility
+
+from lp.archivepublisher.domination import (
+    Dominator,
+    GeneralizedPublication,
+    )
+from lp.registry.interfaces.distribution import IDistributionSet
+from lp.registry.interfaces.pocket import PackagePublishingPocket
+from lp.services.scripts.base import (
+    LaunchpadScript,
+    LaunchpadScriptFailure,
+    )
+
+
+def compare_by_apt(generalization):
+    """The comparison function that the dominator used to sort with."""
+    def compare(pub1, pub2):
+        version_comparison = apt_pkg.version_compare(
+            generalization.getPackageVersion(pub1),
+            generalization.getPackageVersion(pub2))
+        if version_comparison == 0:
+            return cmp(pub1.datecreated, pub2.datecreated)
+        else:
+            return version_comparison
+    return compare
+
+
+class BenchmarkVersionSortKey(LaunchpadScript):
+
+    description = "Benchmark sorting publications for domination."
+
+    def add_my_options(self):
+        self.parser.add_option(
+            "-d", "--distribution", default="ubuntu",
+            help="Distribution to use (default: %default).")
+        self.parser.add_option(
+            "-s", "--series", help="Series to use (default: current).")
+        self.parser.add_option(
+            "-p", "--pocket", default="RELEASE",
+            help="Pocket to use (default: %default).")
+        self.parser.add_option(
+            "--repeat", type="int", default=3,
+            help="Report the best of this many runs (default: %default).")
+
+    def findPublications(self, distroseries, pocket):
+        dominator = Dominator(self.logger, distroseries.main_archive)
+        groups = []
+        for is_source, pubs in [
+                (True, dominator.findSourcesForDomination(
+                    distroseries, pocket))] + [
+                (False, dominator.findBinariesForDomination(das, pocket))
+                for das in distroseries.architectures]:
+            generalization = GeneralizedPublication(is_source=is_source)
+            by_name = defaultdict(list)
+            for pub in pubs:
+                by_name[generalization.getPackageName(pub)].append(pub)
+            groups.extend(
+                (is_source, group) for group in by_name.itervalues())
+        return groups
+
+    def timeIt(self, function):
+        best = None
+        for _ in range(self.options.repeat):
+            start = time.time()
+            result = function()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, result
+
+    def main(self):
+        distribution = getUtility(IDistributionSet).getByName(
+            self.options.distribution)
+        if distribution is None:
+            raise LaunchpadScriptFailure(
+                "No such distribution: %s" % self.options.distribution)
+        if self.options.series is None:
+            distroseries = distribution.currentseries
+        else:
+            distroseries = distribution.getSeries(self.options.series)
+        pocket = PackagePublishingPocket.items[self.options.pocket]
+        apt_pkg.init_system()
+
+        groups = self.findPublications(distroseries, pocket)
+
+        def by_cmp():
+            return [
+                sorted(
+                    group,
+                    cmp=compare_by_apt(
+                        GeneralizedPublication(is_source=is_source)),
+                    reverse=True)
+                for is_source, group in groups]
+
+        def by_key():
+            return [
+                GeneralizedPublication(
+                    is_source=is_source).sortPublications(group)
+                for is_source, group in groups]
+
+        cmp_time, cmp_result = self.timeIt(by_cmp)
+        key_time, key_result = self.timeIt(by_key)
+        if cmp_result != key_result:
+            raise LaunchpadScriptFailure(
+                "sortPublications disagrees with apt_pkg")
+        self.logger.info(
+            "%d packages, %d publications", len(groups),
+            sum(len(group) for _, group in groups))
+        self.logger.info("apt_pkg.version_compare: %8.3fs", cmp_time)
+        self.logger.info(
+            "sortPublications:        %8.3fs (%.1fx)", key_time,
+            cmp_time / max(key_time, 1e-9))
+
+
+if __name__ == '__main__':
+    BenchmarkVersionSortKey('benchmark-version-sort-key').run()